@@ -0,0 +1,51 @@
+import os
+import tempfile
+from os.path import join
+
+import numpy
+import yaml
+from click.testing import CliRunner
+
+from dexp.cli.dexp_commands.pipeline import pipeline
+from dexp.datasets import ZDataset
+from dexp.processing.registration.model.sequence_registration_model import (
+    SequenceRegistrationModel,
+)
+from dexp.processing.registration.model.translation_registration_model import (
+    TranslationRegistrationModel,
+)
+
+
+def test_pipeline_cli_output_path_override(n=3):
+    images = numpy.random.default_rng(0).uniform(0, 1, size=(n, 16, 24, 24)).astype(numpy.float32)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        input_path = join(tmpdir, "dataset.zarr")
+        dataset = ZDataset(path=input_path, mode="w", store="dir")
+        dataset.add_channel(name="channel", shape=images.shape, chunks=(1, 16, 24, 24), dtype=images.dtype)
+        dataset.write_array(channel="channel", array=images)
+        dataset.close()
+
+        model = SequenceRegistrationModel(
+            model_list=[TranslationRegistrationModel(shift_vector=[0, tp, -tp]) for tp in range(n)]
+        )
+        model_path = join(tmpdir, "model.json")
+        with open(model_path, "w") as f:
+            f.write(model.to_json())
+
+        # the spec has its own output path, overridden on the command line:
+        spec = dict(output_path=join(tmpdir, "spec_output.zarr"), steps=[dict(stabilize=dict(model=model_path))])
+        spec_path = join(tmpdir, "pipeline.yaml")
+        with open(spec_path, "w") as f:
+            yaml.safe_dump(spec, f)
+
+        output_path = join(tmpdir, "output.zarr")
+        result = CliRunner().invoke(
+            pipeline, [input_path, "-p", spec_path, "-o", output_path, "-c", "channel", "-d", "cpu"]
+        )
+
+        assert result.exit_code == 0, result.output
+        assert os.path.exists(output_path)
+        assert not os.path.exists(spec["output_path"])
+        output_array = ZDataset(path=output_path, mode="r").get_array("channel")
+        assert output_array.shape == (n,) + model.padded_shape(images.shape[1:])
@@ -21,7 +21,14 @@ from dexp.datasets.open_dataset import glob_datasets
 @click.option(
     "--projection", "-p/-np", is_flag=True, default=True, help="If flags should be copied.", show_default=True
 )
-def add(input_paths, output_path, channels, rename, store, overwrite, projection):
+@click.option(
+    "--workers",
+    "-wk",
+    default=-4,
+    help="Number of worker threads to copy chunks with. Negative numbers n correspond to: number_of _cores / |n| ",
+    show_default=True,
+)  #
+def add(input_paths, output_path, channels, rename, store, overwrite, projection, workers):
     """Adds the channels selected from INPUT_PATHS to the given output dataset (created if not existing)."""
 
     input_dataset, input_paths = glob_datasets(input_paths)
@@ -41,6 +48,7 @@ def add(input_paths, output_path, channels, rename, store, overwrite, projection
             store=store,
             overwrite=overwrite,
             add_projections=projection,
+            workers=workers,
         )
 
         input_dataset.close()
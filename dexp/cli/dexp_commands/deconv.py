@@ -15,6 +15,7 @@ from dexp.cli.parsing import (
 )
 from dexp.datasets.open_dataset import glob_datasets
 from dexp.datasets.operations.deconv import dataset_deconv
+from dexp.utils.work_queue import WorkQueue
 
 
 @click.command()
@@ -37,7 +38,30 @@ from dexp.datasets.operations.deconv import dataset_deconv
 )
 @click.option("--clevel", "-l", type=int, default=_default_clevel, help="Compression level", show_default=True)
 @click.option("--overwrite", "-w", is_flag=True, help="to force overwrite of target", show_default=True)
-@click.option("--tilesize", "-ts", type=int, default=512, help="Tile size for tiled computation", show_default=True)
+@click.option(
+    "--tilesize",
+    "-ts",
+    type=int,
+    default=None,
+    help="Tile size for tiled computation, tiles are planned to fit in memory and to be FFT-friendly when ommited.",
+)
+@click.option(
+    "--tileworkers",
+    "-tw",
+    type=int,
+    default=1,
+    help="Number of tiles processed concurrently, negative numbers n correspond to: number_of_cores / |n|",
+    show_default=True,
+)
+@click.option(
+    "--tilebatchsize",
+    "-tbs",
+    type=int,
+    default=1,
+    help="Number of tiles of the same shape deconvolved together with batched FFTs (Lucy-Richardson only), "
+    "speeds up the deconvolution of many small tiles.",
+    show_default=True,
+)
 @click.option(
     "--method",
     "-m",
@@ -55,6 +79,21 @@ from dexp.datasets.operations.deconv import dataset_deconv
     "The default number of iterations depends on the other parameters, in particular it depends on the choice of backprojection operator. For ‘wb’ as little as 3 iterations suffice. ",
     show_default=True,
 )
+@click.option(
+    "--accelerate",
+    "-acc",
+    is_flag=True,
+    help="Accelerates Lucy-Richardson deconvolution with Biggs-Andrews vector extrapolation, fewer iterations are "
+    "then needed for the same result.",
+)
+@click.option(
+    "--tolerance",
+    "-tol",
+    type=float,
+    default=None,
+    help="Stops Lucy-Richardson iterations, independently for each tile, once the relative change of the estimate "
+    "drops below this value (e.g. 1e-3). The number of iterations is then a maximum.",
+)
 @click.option(
     "--maxcorrection",
     "-mc",
@@ -101,7 +140,9 @@ from dexp.datasets.operations.deconv import dataset_deconv
     "-obj",
     type=str,
     default="nikon16x08na",
-    help="Microscope objective to use for computing psf, can be: nikon16x08na, olympus20x10na, or path to file",
+    help="Microscope objective to use for computing psf, can be: nikon16x08na, olympus20x10na, or path to file. "
+    "The file can hold a single PSF, or a grid of PSFs for a spatially varying PSF (see 'dexp extract-psf --grid'), "
+    "each tile is then deconvolved with the PSF interpolated at its center and tiles are blended.",
     show_default=True,
 )
 @click.option("--numape", "-na", type=float, default=None, help="Overrides NA value for objective.", show_default=True)
@@ -135,8 +176,22 @@ from dexp.datasets.operations.deconv import dataset_deconv
     show_default=True,
 )  #
 @click.option(
-    "--devices", "-d", type=str, default="0", help="Sets the CUDA devices id, e.g. 0,1,2 or ‘all’", show_default=True
+    "--devices",
+    "-d",
+    type=str,
+    default="0",
+    help="Sets the CUDA devices id, e.g. 0,1,2, ‘all’, or ‘cpu’ for CPU processing",
+    show_default=True,
 )  #
+@click.option(
+    "--multinode",
+    "-mn",
+    is_flag=True,
+    help="Shares time points with other dexp processes, e.g. on other nodes, started with the same command. "
+    "Tasks are claimed from a work queue stored next to the output dataset (folder with the '.queue' extension) on a "
+    "shared filesystem, and an interrupted command resumes where it stopped. Not supported with the ‘zip’ store.",
+    show_default=True,
+)
 @click.option("--check", "-ck", default=True, help="Checking integrity of written file.", show_default=True)  #
 def deconv(
     input_paths,
@@ -148,8 +203,12 @@ def deconv(
     clevel,
     overwrite,
     tilesize,
+    tileworkers,
+    tilebatchsize,
     method,
     iterations,
+    accelerate,
+    tolerance,
     maxcorrection,
     power,
     blindspot,
@@ -166,6 +225,7 @@ def deconv(
     workers,
     workersbackend,
     devices,
+    multinode,
     check,
 ):
     """Deconvolves all or selected channels of a dataset."""
@@ -180,6 +240,8 @@ def deconv(
     if "," in scaling:
         scaling = tuple(float(v) for v in scaling.split(","))
 
+    queue = WorkQueue.next_to(output_path) if multinode else None
+
     with asection(
         f"Deconvolving dataset: {input_paths}, saving it at: {output_path}, for channels: {channels}, slicing: {slicing} "
     ):
@@ -193,8 +255,12 @@ def deconv(
             compression_level=clevel,
             overwrite=overwrite,
             tilesize=tilesize,
+            tile_workers=tileworkers,
+            tile_batch_size=tilebatchsize,
             method=method,
             num_iterations=iterations,
+            accelerate=accelerate,
+            tolerance=tolerance,
             max_correction=maxcorrection,
             power=power,
             blind_spot=blindspot,
@@ -212,7 +278,10 @@ def deconv(
             workersbackend=workersbackend,
             devices=devices,
             check=check,
+            queue=queue,
         )
+        if queue is not None:
+            queue.close()
 
         input_dataset.close()
         aprint("Done!")
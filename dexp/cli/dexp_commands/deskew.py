@@ -15,6 +15,7 @@ from dexp.cli.parsing import (
 )
 from dexp.datasets.open_dataset import glob_datasets
 from dexp.datasets.operations.deskew import dataset_deskew
+from dexp.utils.work_queue import WorkQueue
 
 
 @click.command()
@@ -100,6 +101,15 @@ from dexp.datasets.operations.deskew import dataset_deskew
 @click.option(
     "--devices", "-d", type=str, default="0", help="Sets the CUDA devices id, e.g. 0,1,2 or ‘all’", show_default=True
 )  #
+@click.option(
+    "--multinode",
+    "-mn",
+    is_flag=True,
+    help="Shares time points with other dexp processes, e.g. on other nodes, started with the same command. "
+    "Tasks are claimed from a work queue stored next to the output dataset (folder with the '.queue' extension) on a "
+    "shared filesystem, and an interrupted command resumes where it stopped. Not supported with the ‘zip’ store.",
+    show_default=True,
+)
 @click.option("--check", "-ck", default=True, help="Checking integrity of written file.", show_default=True)  #
 def deskew(
     input_paths,
@@ -121,6 +131,7 @@ def deskew(
     workers,
     workersbackend,
     devices,
+    multinode,
     check,
 ):
     """Deskews all or selected channels of a dataset."""
@@ -137,6 +148,8 @@ def deskew(
     else:
         flips = tuple(bool(s) for s in flips.split(","))
 
+    queue = WorkQueue.next_to(output_path) if multinode else None
+
     with asection(
         f"Deskewing dataset: {input_paths}, saving it at: {output_path}, for channels: {channels}, slicing: {slicing} "
     ):
@@ -162,7 +175,10 @@ def deskew(
             workersbackend=workersbackend,
             devices=devices,
             check=check,
+            queue=queue,
         )
+        if queue is not None:
+            queue.close()
 
         input_dataset.close()
         aprint("Done!")
@@ -38,6 +38,14 @@ from dexp.datasets.operations.extract_psf import dataset_extract_psf
     help="Threshold of PSF selection given the similarity (cosine distance) to median PSF.",
 )
 @click.option("--psf_size", "-ps", type=int, default=35, show_default=True, help="Size (shape) of the PSF")
+@click.option(
+    "--grid",
+    "-g",
+    type=str,
+    default=None,
+    help="Grid of regions with their own PSF for spatially varying deconvolution, e.g. 1,3,3 (ZYX). "
+    "A single PSF is extracted for the whole volume when ommited.",
+)
 @click.option(
     "--device",
     "-d",
@@ -55,12 +63,15 @@ def extract_psf(
     peak_threshold,
     similarity_threshold,
     psf_size,
+    grid,
     device,
     verbose,
 ):
     """Extracts the PSF from beads."""
     input_dataset, input_paths = glob_datasets(input_paths)
     slicing = _parse_slicing(slicing)
+    if grid is not None:
+        grid = tuple(int(n) for n in grid.split(","))
     channels = _parse_channels(input_dataset, channels)
 
     with asection(
@@ -75,6 +86,7 @@ def extract_psf(
             peak_threshold=peak_threshold,
             similarity_threshold=similarity_threshold,
             psf_size=psf_size,
+            grid=grid,
             verbose=verbose,
             device=device,
         )
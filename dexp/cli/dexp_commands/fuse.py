@@ -10,6 +10,7 @@ from dexp.cli.parsing import (
 )
 from dexp.datasets.open_dataset import glob_datasets
 from dexp.datasets.operations.fuse import dataset_fuse
+from dexp.utils.work_queue import WorkQueue
 
 
 @click.command()
@@ -187,6 +188,15 @@ from dexp.datasets.operations.fuse import dataset_fuse
 @click.option(
     "--white-top-hat-sampling", "-wths", default=4, type=int, help="Down sampling size to compute the area opening"
 )
+@click.option(
+    "--multinode",
+    "-mn",
+    is_flag=True,
+    help="Shares time points with other dexp processes, e.g. on other nodes, started with the same command. "
+    "Tasks are claimed from a work queue stored next to the output dataset (folder with the '.queue' extension) on a "
+    "shared filesystem, and an interrupted command resumes where it stopped. Not supported with the ‘zip’ store.",
+    show_default=True,
+)
 @click.option("--check", "-ck", default=True, help="Checking integrity of written file.", show_default=True)  #
 def fuse(
     input_paths,
@@ -219,6 +229,7 @@ def fuse(
     pad,
     white_top_hat_size,
     white_top_hat_sampling,
+    multinode,
     check,
 ):
     """Fuses the views of a multi-view light-sheet microscope dataset (available: simview and mvsols)"""
@@ -230,6 +241,8 @@ def fuse(
     channels = _parse_channels(input_dataset, channels)
     devices = _parse_devices(devices)
 
+    queue = WorkQueue.next_to(output_path) if multinode else None
+
     with asection(
         f"Fusing dataset: {input_paths}, saving it at: {output_path}, for channels: {channels}, slicing: {slicing} "
     ):
@@ -268,7 +281,10 @@ def fuse(
             white_top_hat_size=white_top_hat_size,
             white_top_hat_sampling=white_top_hat_sampling,
             check=check,
+            queue=queue,
         )
+        if queue is not None:
+            queue.close()
 
         input_dataset.close()
         aprint("Done!")
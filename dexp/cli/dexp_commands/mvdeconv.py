@@ -0,0 +1,266 @@
+import click
+from arbol.arbol import aprint, asection
+
+from dexp.cli.defaults import (
+    _default_clevel,
+    _default_codec,
+    _default_store,
+    _default_workers_backend,
+)
+from dexp.cli.parsing import (
+    _get_output_path,
+    _parse_channels,
+    _parse_devices,
+    _parse_slicing,
+)
+from dexp.datasets.open_dataset import glob_datasets
+from dexp.datasets.operations.multiview_deconv import dataset_multiview_deconv
+
+
+@click.command()
+@click.argument("input_paths", nargs=-1)  # ,  help='input path'
+@click.option("--output_path", "-o")  # , help='output path'
+@click.option(
+    "--channels",
+    "-c",
+    default=None,
+    help="list of channels for the view in standard order for the microscope type (C0L0, C0L1, C1L0, C1L1)",
+)
+@click.option(
+    "--slicing",
+    "-s",
+    default=None,
+    help="dataset slice (TZYX), e.g. [0:5] (first five stacks) [:,0:100] (cropping in z) ",
+)
+@click.option("--store", "-st", default=_default_store, help="Zarr store: ‘dir’, ‘ndir’, or ‘zip’", show_default=True)
+@click.option(
+    "--codec",
+    "-z",
+    default=_default_codec,
+    help="compression codec: ‘zstd’, ‘blosclz’, ‘lz4’, ‘lz4hc’, ‘zlib’ or ‘snappy’ ",
+    show_default=True,
+)
+@click.option("--clevel", "-l", type=int, default=_default_clevel, help="Compression level", show_default=True)
+@click.option("--overwrite", "-w", is_flag=True, help="to force overwrite of target", show_default=True)
+@click.option(
+    "--model-filename",
+    "-mf",
+    help="Registration models file computed with 'dexp register'.",
+    default="registration_models.txt",
+    show_default=True,
+)
+@click.option(
+    "--equalise/--no-equalise",
+    "-eq/-neq",
+    default=True,
+    help="Equalise intensity of views before deconvolution, or not.",
+    show_default=True,
+)
+@click.option(
+    "--equalisemode",
+    "-eqm",
+    default="first",
+    help="Equalisation modes: compute correction ratios only for first time point: ‘first’ or for all time points: ‘all’.",
+    show_default=True,
+)
+@click.option(
+    "--zerolevel",
+    "-zl",
+    type=int,
+    default=0,
+    help="‘zero-level’ i.e. the pixel values in the restoration (to be substracted)",
+    show_default=True,
+)
+@click.option(
+    "--cliphigh",
+    "-ch",
+    type=int,
+    default=0,
+    help="Clips voxel values above the given value, if zero no clipping is done",
+    show_default=True,
+)
+@click.option(
+    "--fusion_bias_strength",
+    "-fbs",
+    type=float,
+    default=0.5,
+    help="Fusion bias strength for the illumination views of each camera, set to 0 if processing a cropped region",
+    show_default=True,
+)
+@click.option(
+    "--dehaze_size",
+    "-dhs",
+    type=int,
+    default=65,
+    help="Filter size (scale) for dehazing the views to reduce effect of scattered and out-of-focus light. Set to zero to deactivate.",
+    show_default=True,
+)
+@click.option(
+    "--white-top-hat-size",
+    "-wth",
+    default=0,
+    type=float,
+    help="Area opening value after down sampling for white top hat transform transform. Larger values will keep larger components. Recommended value of 1e5.",
+)
+@click.option(
+    "--white-top-hat-sampling", "-wths", default=4, type=int, help="Down sampling size to compute the area opening"
+)
+@click.option(
+    "--pad", "-p", is_flag=True, default=False, help="Use this flag to pad views according to the registration models."
+)
+@click.option(
+    "--tilesize",
+    "-ts",
+    type=int,
+    default=None,
+    help="Tile size for tiled computation, tiles are planned to fit in memory and to be FFT-friendly when ommited.",
+)
+@click.option(
+    "--iterations",
+    "-i",
+    type=int,
+    default=8,
+    help="Number of deconvolution iterations, each iteration corrects the estimate once per view.",
+    show_default=True,
+)
+@click.option(
+    "--maxcorrection",
+    "-mc",
+    type=int,
+    default=None,
+    help="Max correction in folds per iteration. By default there is no limit",
+    show_default=True,
+)
+@click.option(
+    "--tolerance",
+    "-tol",
+    type=float,
+    default=None,
+    help="Stops iterations, independently for each tile, once the relative change of the estimate "
+    "drops below this value (e.g. 1e-3). The number of iterations is then a maximum.",
+)
+@click.option(
+    "--objective",
+    "-obj",
+    type=str,
+    default="nikon16x08na",
+    help="Microscope objective to use for computing the PSFs, can be: nikon16x08na, olympus20x10na, or path to file. "
+    "Two comma separated values give the PSFs of camera 0 and camera 1.",
+    show_default=True,
+)
+@click.option("--numape", "-na", type=float, default=None, help="Overrides NA value for objective.", show_default=True)
+@click.option("--dxy", "-dxy", type=float, default=0.485, help="Voxel size along x and y in microns", show_default=True)
+@click.option("--dz", "-dz", type=float, default=4 * 0.485, help="Voxel size along z in microns", show_default=True)
+@click.option("--xysize", "-sxy", type=int, default=31, help="PSF size along xy in voxels", show_default=True)
+@click.option("--zsize", "-sz", type=int, default=31, help="PSF size along z in voxels", show_default=True)
+@click.option(
+    "--workers",
+    "-k",
+    type=int,
+    default=-1,
+    help="Number of worker threads to spawn, if -1 then num workers = num devices",
+    show_default=True,
+)
+@click.option(
+    "--workersbackend",
+    "-wkb",
+    type=str,
+    default=_default_workers_backend,
+    help="What backend to spawn workers with, can be ‘loky’ (multi-process) or ‘threading’ (multi-thread) ",
+    show_default=True,
+)
+@click.option(
+    "--devices",
+    "-d",
+    type=str,
+    default="0",
+    help="Sets the CUDA devices id, e.g. 0,1,2, ‘all’, or ‘cpu’ for CPU processing",
+    show_default=True,
+)
+@click.option("--check", "-ck", default=True, help="Checking integrity of written file.", show_default=True)
+def mvdeconv(
+    input_paths,
+    output_path,
+    channels,
+    slicing,
+    store,
+    codec,
+    clevel,
+    overwrite,
+    model_filename,
+    equalise,
+    equalisemode,
+    zerolevel,
+    cliphigh,
+    fusion_bias_strength,
+    dehaze_size,
+    white_top_hat_size,
+    white_top_hat_sampling,
+    pad,
+    tilesize,
+    iterations,
+    maxcorrection,
+    tolerance,
+    objective,
+    numape,
+    dxy,
+    dz,
+    xysize,
+    zsize,
+    workers,
+    workersbackend,
+    devices,
+    check,
+):
+    """Jointly deconvolves the registered views of a SimView dataset into a single fused channel."""
+
+    input_dataset, input_paths = glob_datasets(input_paths)
+    output_path = _get_output_path(input_paths[0], output_path, "_mvdeconv")
+
+    slicing = _parse_slicing(slicing)
+    channels = _parse_channels(input_dataset, channels)
+    devices = _parse_devices(devices)
+
+    with asection(
+        f"Deconvolving views of dataset: {input_paths}, saving it at: {output_path}, for channels: {channels}, "
+        f"slicing: {slicing} "
+    ):
+        aprint(f"Registration models: {model_filename}, PSFs: {objective}")
+        aprint(f"Devices used: {devices}")
+        dataset_multiview_deconv(
+            input_dataset,
+            output_path,
+            channels=channels,
+            slicing=slicing,
+            model_list_filename=model_filename,
+            store=store,
+            compression=codec,
+            compression_level=clevel,
+            overwrite=overwrite,
+            equalise=equalise,
+            equalise_mode=equalisemode,
+            zero_level=zerolevel,
+            clip_too_high=cliphigh,
+            fusion_bias_strength_i=fusion_bias_strength,
+            dehaze_size=dehaze_size,
+            white_top_hat_size=white_top_hat_size,
+            white_top_hat_sampling=white_top_hat_sampling,
+            pad=pad,
+            tilesize=tilesize,
+            num_iterations=iterations,
+            max_correction=maxcorrection,
+            tolerance=tolerance,
+            psf_objectives=tuple(objective.split(",")),
+            psf_na=numape,
+            psf_dxy=dxy,
+            psf_dz=dz,
+            psf_xy_size=xysize,
+            psf_z_size=zsize,
+            workers=workers,
+            workersbackend=workersbackend,
+            devices=devices,
+            check=check,
+        )
+
+        input_dataset.close()
+        aprint("Done!")
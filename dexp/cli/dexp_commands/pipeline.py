@@ -0,0 +1,123 @@
+import click
+from arbol.arbol import aprint, asection
+
+from dexp.cli.defaults import (
+    _default_clevel,
+    _default_codec,
+    _default_store,
+    _default_workers_backend,
+)
+from dexp.cli.parsing import _parse_channels, _parse_devices, _parse_slicing
+from dexp.datasets.open_dataset import glob_datasets
+from dexp.datasets.operations.pipeline import dataset_pipeline, load_pipeline
+
+
+@click.command()
+@click.argument("input_paths", nargs=-1)  # ,  help='input path'
+@click.option(
+    "--spec",
+    "-p",
+    required=True,
+    help="YAML file listing the steps of the pipeline (fuse, deconv, stabilize, projrender) and their parameters.",
+)
+@click.option(
+    "--output_path",
+    "-o",
+    default=None,
+    help="Dataset in which the output of the last step is saved, overrides the 'output_path' entry of the spec. "
+    "Only checkpoints and renderings are saved when neither is given.",
+)
+@click.option("--channels", "-c", default=None, help="list of channels, all channels when ommited.")
+@click.option(
+    "--slicing",
+    "-s",
+    default=None,
+    help="dataset slice (TZYX), e.g. [0:5] (first five stacks) [:,0:100] (cropping in z) ",
+)
+@click.option("--store", "-st", default=_default_store, help="Zarr store: ‘dir’, ‘ndir’, or ‘zip’", show_default=True)
+@click.option(
+    "--codec",
+    "-z",
+    default=_default_codec,
+    help="compression codec: ‘zstd’, ‘blosclz’, ‘lz4’, ‘lz4hc’, ‘zlib’ or ‘snappy’ ",
+    show_default=True,
+)
+@click.option("--clevel", "-l", type=int, default=_default_clevel, help="Compression level", show_default=True)
+@click.option("--overwrite", "-w", is_flag=True, help="to force overwrite of targets", show_default=True)
+@click.option(
+    "--workers",
+    "-k",
+    type=int,
+    default=-1,
+    help="Number of time points processed concurrently, if -1 then one per device",
+    show_default=True,
+)
+@click.option(
+    "--workersbackend",
+    "-wkb",
+    type=str,
+    default=_default_workers_backend,
+    help="What backend to spawn workers with, only ‘threading’ (multi-thread) is supported by all steps",
+    show_default=True,
+)
+@click.option(
+    "--devices",
+    "-d",
+    type=str,
+    default="0",
+    help="Sets the CUDA devices id, e.g. 0,1,2, ‘all’, or ‘cpu’ for CPU processing",
+    show_default=True,
+)
+@click.option("--check", "-ck", default=True, help="Checking integrity of written files.", show_default=True)
+def pipeline(
+    input_paths,
+    spec,
+    output_path,
+    channels,
+    slicing,
+    store,
+    codec,
+    clevel,
+    overwrite,
+    workers,
+    workersbackend,
+    devices,
+    check,
+):
+    """Chains processing steps (e.g. fuse, deconv, stabilize, projrender) per time point, without
+    saving intermediate datasets."""
+
+    input_dataset, input_paths = glob_datasets(input_paths)
+
+    steps, options = load_pipeline(spec)
+    spec_output_path = options.pop("output_path", None)
+    output_path = output_path or spec_output_path
+    if options:
+        raise click.BadParameter(f"Unknown entries in pipeline spec: {list(options)}", param_hint="spec")
+
+    slicing = _parse_slicing(slicing)
+    channels = _parse_channels(input_dataset, channels)
+    devices = _parse_devices(devices)
+
+    with asection(
+        f"Running pipeline {spec} on dataset: {input_paths}, saving it at: {output_path}, for channels: {channels}, "
+        f"slicing: {slicing} "
+    ):
+        dataset_pipeline(
+            input_dataset,
+            steps,
+            output_path,
+            channels=channels,
+            slicing=slicing,
+            store=store,
+            compression=codec,
+            compression_level=clevel,
+            overwrite=overwrite,
+            workers=workers,
+            workersbackend=workersbackend,
+            devices=devices,
+            check=check,
+        )
+
+        input_dataset.close()
+        aprint("Done!")
@@ -85,7 +85,28 @@ from dexp.datasets.operations.register import dataset_register
     show_default=True,
 )
 @click.option(
-    "--devices", "-d", type=str, default="0", help="Sets the CUDA devices id, e.g. 0,1,2 or ‘all’", show_default=True
+    "--pyramid-factor",
+    "-pf",
+    type=int,
+    default=1,
+    help="Estimates the registration on views downsampled by this factor before refining it at full resolution.",
+    show_default=True,
+)
+@click.option(
+    "--upsample-factor",
+    "-uf",
+    type=int,
+    default=1,
+    help="Refines the registration to a precision of 1/upsample-factor voxel, 1 for voxel precision.",
+    show_default=True,
+)
+@click.option(
+    "--devices",
+    "-d",
+    type=str,
+    default="0",
+    help="Sets the CUDA devices id, e.g. 0,1,2, ‘all’, or ‘cpu’ for CPU processing",
+    show_default=True,
 )
 @click.option(
     "--white-top-hat-size",
@@ -111,6 +132,8 @@ def register(
     dehaze_size,
     edge_filter,
     max_proj,
+    pyramid_factor,
+    upsample_factor,
     white_top_hat_size,
     white_top_hat_sampling,
     devices,
@@ -145,4 +168,6 @@ def register(
             white_top_hat_sampling=white_top_hat_sampling,
             max_proj=max_proj,
             devices=devices,
+            registration_pyramid_factor=pyramid_factor,
+            registration_upsample_factor=upsample_factor,
         )
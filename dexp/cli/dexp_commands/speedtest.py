@@ -1,10 +1,55 @@
 import click
+from arbol.arbol import aprint, asection
 
+from dexp.cli.parsing import _parse_chunks
 from dexp.utils.speed_test import perform_speed_test
 
 
 @click.command()
-def speedtest():
-    """Estimates storage medium speed."""
+@click.option("--path", "-p", default=None, help="Path at which to measure speed, current directory when ommited.")
+@click.option("--shape", "-sh", default="(64, 512, 512)", help="Shape of synthetic stacks (ZYX).", show_default=True)
+@click.option("--timepoints", "-t", type=int, default=4, help="Number of stacks per configuration.", show_default=True)
+@click.option(
+    "--chunks",
+    "-chk",
+    default=None,
+    help="Chunk shapes to test separated by ';', e.g. '(1, 32, 512, 512);(1, 64, 256, 256)', default chunks when ommited.",
+)
+@click.option("--codecs", "-z", default="zstd,lz4", help="Compression codecs to test.", show_default=True)
+@click.option("--clevels", "-l", default="3", help="Compression levels to test.", show_default=True)
+@click.option(
+    "--bloscthreads",
+    "-bt",
+    default="0",
+    help="Numbers of blosc threads to test, 0 for dexp's default.",
+    show_default=True,
+)
+@click.option("--workers", "-wk", default="1", help="Numbers of concurrent workers to test.", show_default=True)
+@click.option(
+    "--repeats", "-r", type=int, default=5, help="Number of timings of encoding and decoding.", show_default=True
+)
+@click.option("--output", "-o", default=None, help="Saves results as JSON to this file.")
+def speedtest(path, shape, timepoints, chunks, codecs, clevels, bloscthreads, workers, repeats, output):
+    """Estimates zarr read/write throughput (encode, decode and storage, cold and warm) through dexp datasets."""
 
-    perform_speed_test()
+    shape = _parse_chunks(shape)
+    chunks = (None,) if chunks is None else tuple(_parse_chunks(chunk) for chunk in chunks.split(";"))
+    codecs = tuple(codec.strip() for codec in codecs.split(","))
+    clevels = tuple(int(clevel) for clevel in clevels.split(","))
+    bloscthreads = tuple(int(n) for n in bloscthreads.split(","))
+    workers = tuple(int(n) for n in workers.split(","))
+
+    with asection(f"Speed test for stacks of shape {shape} at {path if path else 'current directory'}"):
+        perform_speed_test(
+            path=path,
+            shape=shape,
+            nb_time_points=timepoints,
+            chunks=chunks,
+            codecs=codecs,
+            clevels=clevels,
+            blosc_threads=bloscthreads,
+            workers=workers,
+            repeats=repeats,
+            output_path=output,
+        )
+        aprint("Done!")
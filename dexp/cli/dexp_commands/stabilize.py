@@ -113,6 +113,22 @@ from dexp.datasets.operations.stabilize import dataset_stabilize
     help="Applies sobel edge filter to input images.",
     show_default=True,
 )
+@click.option(
+    "--pyramid-factor",
+    "-pf",
+    type=int,
+    default=1,
+    help="Estimates pairwise shifts on correlograms downsampled by this factor before refining them at full resolution.",
+    show_default=True,
+)
+@click.option(
+    "--upsample-factor",
+    "-uf",
+    type=int,
+    default=1,
+    help="Estimates pairwise shifts with a precision of 1/upsample-factor pixel, 1 for pixel precision.",
+    show_default=True,
+)
 @click.option(
     "--detrend",
     "-dt",
@@ -163,6 +179,15 @@ from dexp.datasets.operations.stabilize import dataset_stabilize
 )  #
 @click.option("--device", "-d", type=int, default=0, help="Sets the CUDA devices id, e.g. 0,1,2", show_default=True)  #
 @click.option("--check", "-ck", default=True, help="Checking integrity of written file.", show_default=True)  #
+@click.option(
+    "--incremental",
+    "-inc",
+    is_flag=True,
+    default=False,
+    help="Only stabilizes the time points added since the last incremental run, extending the saved models and "
+    "appending to the output dataset, e.g. during an acquisition.",
+    show_default=True,
+)
 def stabilize(
     input_paths,
     output_path,
@@ -185,6 +210,8 @@ def stabilize(
     dsigma,
     logcomp,
     edgefilter,
+    pyramid_factor,
+    upsample_factor,
     detrend,
     maxproj,
     model_input_path,
@@ -193,6 +220,7 @@ def stabilize(
     workersbackend,
     device,
     check,
+    incremental,
 ):
     """Stabilises dataset against translations across time."""
 
@@ -229,6 +257,8 @@ def stabilize(
             denoise_input_sigma=dsigma,
             log_compression=logcomp,
             edge_filter=edgefilter,
+            pyramid_factor=pyramid_factor,
+            upsample_factor=upsample_factor,
             detrend=detrend,
             maxproj=maxproj,
             workers=workers,
@@ -236,6 +266,7 @@ def stabilize(
             device=device,
             check=check,
             debug_output="stabilization",
+            incremental=incremental,
         )
 
         input_dataset.close()
@@ -13,6 +13,8 @@ from dexp.cli.dexp_commands.fuse import fuse
 from dexp.cli.dexp_commands.histogram import histogram
 from dexp.cli.dexp_commands.info import info
 from dexp.cli.dexp_commands.isonet import isonet
+from dexp.cli.dexp_commands.mvdeconv import mvdeconv
+from dexp.cli.dexp_commands.pipeline import pipeline
 from dexp.cli.dexp_commands.projrender import projrender
 from dexp.cli.dexp_commands.register import register
 from dexp.cli.dexp_commands.serve import serve
@@ -30,7 +32,22 @@ CONTEXT_SETTINGS = dict(help_option_names=["-h", "--help"])
 
 
 @click.group()
-def cli():
+@click.option(
+    "--trace",
+    "-tr",
+    default=None,
+    help="Records timings of all processing stages, saves them as a Chrome/Perfetto trace to this JSON file and "
+    "prints per-stage totals.",
+)
+@click.option(
+    "--dryrun",
+    "-dr",
+    is_flag=True,
+    help="Processes only the first time point, and reports its measured memory footprint and how many time points "
+    "can be processed concurrently.",
+)
+@click.pass_context
+def cli(ctx, trace, dryrun):
     aprint("__________________________________________")
     aprint("  DEXP -- Data EXploration & Processing   ")
     aprint("  Dataset processing dexp_commands             ")
@@ -55,6 +72,16 @@ def cli():
     except (ModuleNotFoundError, NotImplementedError):
         aprint("'cupy' module not found! ignored!")
 
+    if dryrun:
+        from dexp.utils.scheduler import set_dry_run
+
+        set_dry_run(True)
+
+    if trace is not None:
+        from dexp.utils.tracing import tracing
+
+        ctx.with_resource(tracing(path=trace))
+
 
 cli.add_command(info)
 cli.add_command(check)
@@ -72,6 +99,8 @@ cli.add_command(fuse)
 cli.add_command(register)
 cli.add_command(stabilize)
 cli.add_command(deconv)
+cli.add_command(mvdeconv)
+cli.add_command(pipeline)
 cli.add_command(isonet)
 cli.add_command(histogram)
 
@@ -54,6 +54,8 @@ def _parse_devices(devices):
         from dexp.utils.backends import CupyBackend
 
         devices = tuple(range(len(CupyBackend.available_devices())))
+    elif devices.strip() == "cpu":
+        devices = ()
     else:
         devices = tuple(int(device.strip()) for device in devices.split(","))
 
@@ -104,6 +104,39 @@ def test_zarr_integrity():
         assert zdataset.check_integrity()
 
 
+def test_zarr_resize_timepoints():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        zdataset = ZDataset(path=join(tmpdir, "test.zarr"), mode="w", store="dir")
+        zdataset.add_channel(name="first", shape=(3, 10, 20, 30), dtype="u2", value=0)
+        zdataset.write_stack("first", 2, numpy.ones((10, 20, 30), dtype=numpy.uint16))
+
+        # time points are appended, existing ones are kept:
+        zdataset.resize_timepoints("first", 5)
+        zdataset.write_stack("first", 4, 2 * numpy.ones((10, 20, 30), dtype=numpy.uint16))
+
+        assert zdataset.shape("first") == (5, 10, 20, 30)
+        assert zdataset.get_projection_array("first", axis=0).shape == (5, 20, 30)
+        assert zdataset.get_stack("first", 2).max() == 1
+        assert zdataset.get_stack("first", 4).max() == 2
+        assert zdataset.get_projection_array("first", axis=1)[4].max() == 2
+
+
+def test_zarr_reload():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = join(tmpdir, "test.zarr")
+        zdataset = ZDataset(path=path, mode="w", store="dir")
+        zdataset.add_channel(name="first", shape=(3, 10, 20, 30), dtype="u2", value=0)
+
+        # channels added by another process are only seen once reloaded:
+        other = ZDataset(path=path, mode="a", store="dir")
+        other.add_channel(name="second", shape=(3, 10, 20, 30), dtype="u2", value=0)
+        assert "second" not in zdataset.channels()
+
+        zdataset.reload()
+        assert set(zdataset.channels()) == {"first", "second"}
+        assert zdataset.shape("second") == (3, 10, 20, 30)
+
+
 def test_add_channels_to():
     with tempfile.TemporaryDirectory() as tmpdir:
         print("created temporary directory", tmpdir)
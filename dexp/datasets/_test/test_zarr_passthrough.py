@@ -0,0 +1,77 @@
+import tempfile
+from os.path import join
+
+import numpy
+
+from dexp.datasets import ZDataset
+from dexp.datasets.operations.copy import dataset_copy
+from dexp.datasets.zarr_passthrough import (
+    is_full_volume_slicing,
+    raw_copy_array,
+    raw_copy_compatible,
+)
+
+
+def _make_dataset(path: str) -> ZDataset:
+    dataset = ZDataset(path=path, mode="w", store="dir")
+    dataset.add_channel(name="channel", shape=(6, 16, 20, 24), chunks=(1, 8, 10, 12), dtype="u2")
+    rng = numpy.random.default_rng(0)
+    for tp in range(5):  # last time point left uninitialised on purpose
+        dataset.write_stack("channel", tp, rng.integers(0, 1000, size=(16, 20, 24), dtype=numpy.uint16))
+    return dataset
+
+
+def test_is_full_volume_slicing():
+    assert is_full_volume_slicing(...)
+    assert is_full_volume_slicing((...,))
+    assert is_full_volume_slicing((slice(None), slice(None)))
+    assert not is_full_volume_slicing((slice(0, 4), ...))
+
+
+def test_copy_passthrough():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dataset = _make_dataset(join(tmpdir, "source.zarr"))
+        source = dataset.get_array("channel")
+
+        output_path = join(tmpdir, "copy.zarr")
+        dataset_copy(dataset, output_path, channels=("channel",), slicing=numpy.s_[1::2], workers=2)
+
+        copied = ZDataset(output_path).get_array("channel")
+        assert copied.chunks == source.chunks
+        assert raw_copy_compatible(source, copied)
+        assert numpy.array_equal(copied[...], source[1::2])
+
+        copied_dataset = ZDataset(output_path)
+        for axis in range(3):
+            assert numpy.array_equal(
+                copied_dataset.get_projection_array("channel", axis=axis)[...],
+                dataset.get_projection_array("channel", axis=axis)[1::2],
+            )
+
+
+def test_copy_with_transform_is_not_passthrough():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dataset = _make_dataset(join(tmpdir, "source.zarr"))
+        source = dataset.get_array("channel")
+
+        output_path = join(tmpdir, "copy.zarr")
+        dataset_copy(dataset, output_path, channels=("channel",), slicing=numpy.s_[0:2, 2:10], compression_level=5)
+
+        copied = ZDataset(output_path).get_array("channel")
+        assert not raw_copy_compatible(source, copied)
+        assert numpy.array_equal(copied[...], source[0:2, 2:10])
+
+
+def test_raw_copy_array():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        dataset = _make_dataset(join(tmpdir, "source.zarr"))
+        source = dataset.get_array("channel")
+
+        dest_dataset = ZDataset(path=join(tmpdir, "dest.zarr"), mode="w", store="ndir")
+        dest = dest_dataset.add_channel(name="channel", shape=source.shape, chunks=source.chunks, dtype=source.dtype)
+
+        nb_bytes = raw_copy_array(source, dest, workers=2)
+
+        assert nb_bytes > 0
+        assert dest.nchunks_initialized == source.nchunks_initialized
+        assert numpy.array_equal(dest[...], source[...])
@@ -1,12 +1,20 @@
+import tempfile
+from os.path import join
+
+import numpy
+import pytest
 from arbol import aprint
 
+from dexp.datasets import ZDataset
+from dexp.datasets.operations import deconv
+from dexp.datasets.operations.deconv import _slicing_offsets, dataset_deconv
 from dexp.datasets.operations.demo.demo_deconv import _demo_deconv
-from dexp.utils.backends import CupyBackend
+from dexp.utils.backends import CupyBackend, NumpyBackend
+
 
-# deconv CLI only available for cuda
-# def test_deconv_numpy():
-#     with NumpyBackend():
-#         _demo_deconv(display=False)
+def test_deconv_numpy():
+    with NumpyBackend():
+        _demo_deconv(display=False)
 
 
 def test_deconv_cupy():
@@ -16,3 +24,56 @@ def test_deconv_cupy():
 
     except ModuleNotFoundError:
         aprint("Cupy module not found! demo ignored")
+
+
+def test_slicing_offsets():
+    shape = (50, 300, 400)
+    assert _slicing_offsets(..., shape) == (0, 0, 0)
+    assert _slicing_offsets((slice(5, 10),), shape) == (5, 0, 0)
+    assert _slicing_offsets((..., slice(100, 200)), shape) == (0, 0, 100)
+    assert _slicing_offsets((slice(1, 3), ..., slice(-100, None)), shape) == (1, 0, 300)
+
+    for slicing in ((slice(0, 10, 2),), (3,), (..., ...), (slice(None),) * 4):
+        with pytest.raises(ValueError):
+            _slicing_offsets(slicing, shape)
+
+
+def test_deconv_psf_grid_cache(monkeypatch):
+    convolvers = []
+
+    class RecordingConvolver(deconv.FFTConvolver):
+        def __init__(self, *args, **kwargs):
+            super().__init__(*args, **kwargs)
+            convolvers.append(self)
+
+    monkeypatch.setattr(deconv, "FFTConvolver", RecordingConvolver)
+    # time points are processed by threads of this process, so that they share the convolver:
+    monkeypatch.setattr(deconv, "resolve_devices", lambda devices: (0,))
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rng = numpy.random.default_rng(0)
+        dataset = ZDataset(path=join(tmpdir, "input.zarr"), mode="w")
+        dataset.add_channel("channel", shape=(2, 16, 64, 64), dtype=numpy.float32)
+        dataset.write_array("channel", rng.random((2, 16, 64, 64), dtype=numpy.float32))
+
+        # grid of 1x2x2 PSFs, and 16 tiles:
+        psfs = rng.random((1, 2, 2, 5, 5, 5), dtype=numpy.float32)
+        psf_path = join(tmpdir, "psfs.npy")
+        numpy.save(psf_path, psfs)
+
+        dataset_deconv(
+            dataset,
+            join(tmpdir, "output.zarr"),
+            channels=["channel"],
+            slicing=None,
+            tilesize=(16, 16, 16),
+            num_iterations=2,
+            psf_objective=psf_path,
+            workers=1,
+            check=False,
+        )
+
+    # the transfer functions of the PSF and back projector of each tile are computed for the first time point only:
+    (convolver,) = convolvers
+    assert convolver.misses == 2 * 16
+    assert convolver.hits > 0
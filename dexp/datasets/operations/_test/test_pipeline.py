@@ -0,0 +1,67 @@
+import os
+import tempfile
+from os.path import join
+
+import numpy
+from arbol import aprint
+
+from dexp.datasets import ZDataset
+from dexp.datasets.operations.demo.demo_pipeline import _demo_pipeline
+from dexp.datasets.operations.pipeline import dataset_pipeline, load_pipeline
+from dexp.processing.registration.model.sequence_registration_model import (
+    SequenceRegistrationModel,
+)
+from dexp.processing.registration.model.translation_registration_model import (
+    TranslationRegistrationModel,
+)
+from dexp.utils.backends import CupyBackend, NumpyBackend
+
+
+def test_pipeline_numpy():
+    with NumpyBackend():
+        _demo_pipeline(display=False)
+
+
+def test_pipeline_cupy():
+    try:
+        with CupyBackend():
+            _demo_pipeline(display=False)
+
+    except ModuleNotFoundError:
+        aprint("Cupy module not found! demo ignored")
+
+
+def test_pipeline_sliced_time_points(n=6):
+    images = numpy.random.default_rng(0).uniform(0, 1, size=(n, 16, 24, 24)).astype(numpy.float32)
+
+    with NumpyBackend(), tempfile.TemporaryDirectory() as tmpdir:
+        dataset = ZDataset(path=join(tmpdir, "dataset.zarr"), mode="w", store="dir")
+        dataset.add_channel(name="channel", shape=images.shape, chunks=(1, 16, 24, 24), dtype=images.dtype)
+        dataset.write_array(channel="channel", array=images)
+
+        model = SequenceRegistrationModel(
+            model_list=[TranslationRegistrationModel(shift_vector=[0, tp, -tp]) for tp in range(n)]
+        )
+        model_path = join(tmpdir, "model.json")
+        with open(model_path, "w") as f:
+            f.write(model.to_json())
+
+        steps, _ = load_pipeline(
+            dict(
+                steps=[
+                    dict(stabilize=dict(model=model_path)),
+                    dict(projrender=dict(output_path=join(tmpdir, "frames"), legend_size=0)),
+                ]
+            )
+        )
+        output_path = join(tmpdir, "output.zarr")
+        time_points = [1, 3, 5]
+        dataset_pipeline(dataset, steps, output_path, channels=("channel",), slicing=(slice(1, n, 2),), devices=())
+
+        # models are looked up with the time points of the input dataset, outputs are indexed from zero:
+        output_array = ZDataset(path=output_path, mode="r").get_array("channel")
+        assert output_array.shape[0] == len(time_points)
+        for i, tp in enumerate(time_points):
+            expected = model.apply(images[tp], index=tp, pad=True, integral=True)
+            assert numpy.array_equal(output_array[i], expected)
+        assert sorted(os.listdir(join(tmpdir, "frames"))) == [f"frame_{i:05}.png" for i in range(len(time_points))]
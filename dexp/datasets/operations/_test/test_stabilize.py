@@ -1,6 +1,13 @@
+import tempfile
+from os.path import join
+
+import numpy
+import pytest
 from arbol import aprint
 
+from dexp.datasets import ZDataset
 from dexp.datasets.operations.demo.demo_stabilize import _demo_stabilize
+from dexp.datasets.operations.stabilize import dataset_stabilize
 from dexp.utils.backends import CupyBackend
 
 # def test_stabilize_numpy():
@@ -15,3 +22,19 @@ def test_stabilize_cupy():
 
     except ModuleNotFoundError:
         aprint("Cupy module not found! demo ignored")
+
+
+def test_stabilize_incremental_requires_incremental_output():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        rng = numpy.random.default_rng(0)
+        dataset = ZDataset(path=join(tmpdir, "input.zarr"), mode="w")
+        dataset.add_channel("channel", shape=(4, 8, 32, 32), dtype=numpy.uint16)
+        dataset.write_array("channel", rng.integers(0, 1000, size=(4, 8, 32, 32), dtype=numpy.uint16))
+
+        output_path = join(tmpdir, "output.zarr")
+        kwargs = dict(channels=["channel"], model_output_path=join(tmpdir, "model.json"), workers=1)
+        dataset_stabilize(dataset, output_path, **kwargs)
+
+        # the padding of a non-incremental output is unknown, it cannot be extended:
+        with pytest.raises(ValueError, match="incremental"):
+            dataset_stabilize(dataset, output_path, incremental=True, **kwargs)
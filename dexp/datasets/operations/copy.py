@@ -2,10 +2,14 @@ from typing import Optional, Sequence
 
 import numpy
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 
 from dexp.datasets import BaseDataset
-from dexp.utils.misc import compute_num_workers
+from dexp.datasets.zarr_passthrough import (
+    is_full_volume_slicing,
+    raw_copy_compatible,
+    raw_copy_time_point,
+)
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
 from dexp.utils.slicing import slice_from_shape
 
 
@@ -21,10 +25,35 @@ def dataset_copy(
     overwrite: bool = False,
     zerolevel: int = 0,
     workers: int = 1,
-    workersbackend: Optional[str] = None,
+    workersbackend: str = "threading",
     check: bool = True,
     stop_at_exception: bool = True,
 ):
+    """
+    Copies a dataset, channels can be selected, cropping can be performed, compression can be changed, ...
+
+    When the source is a zarr dataset, the slicing is along time only, no zero-level is subtracted, and the
+    destination has the same chunks, dtype and codec as the source, the compressed chunks (and projections)
+    are copied as-is without decoding and re-encoding. If chunks are not specified, the source chunks are kept
+    to allow for that.
+
+    Parameters
+    ----------
+    dataset : source dataset
+    dest_path : destination path
+    channels : channels to copy
+    slicing : slicing to apply (TZYX)
+    store : type of store, can be 'dir', 'ndir', or 'zip'
+    chunks : chunks shape of the destination, if None, the default chunks (or those of the source if possible).
+    compression : compression codec to be used ('zstd', 'blosclz', 'lz4', 'lz4hc', 'zlib' or 'snappy').
+    compression_level : An integer between 0 and 9 specifying the compression level.
+    overwrite : overwrite destination if already exists
+    zerolevel : 'zero-level' to subtract from the pixel values.
+    workers : number of workers, negative numbers n correspond to: number_of_cores / |n|
+    workersbackend : What backend to spawn workers with, can be ‘loky’ (multi-process) or ‘threading’ (multi-thread)
+    check : Checking integrity of written file.
+    stop_at_exception : True to stop as soon as there is an exception during processing.
+    """
 
     # Create destination dataset:
     from dexp.datasets import ZDataset
@@ -41,37 +70,66 @@ def dataset_copy(
             out_shape, volume_slicing, time_points = slice_from_shape(array.shape, slicing)
 
             dtype = array.dtype
-            dest_dataset.add_channel(
-                name=channel, shape=out_shape, dtype=dtype, chunks=chunks, codec=compression, clevel=compression_level
+            passthrough = zerolevel == 0 and is_full_volume_slicing(volume_slicing)
+            channel_chunks = chunks
+            if channel_chunks is None and passthrough and getattr(array, "chunks", (None,))[0] == 1:
+                channel_chunks = array.chunks
+
+            dest_array = dest_dataset.add_channel(
+                name=channel,
+                shape=out_shape,
+                dtype=dtype,
+                chunks=channel_chunks,
+                codec=compression,
+                clevel=compression_level,
             )
 
+            passthrough = passthrough and raw_copy_compatible(array, dest_array)
+            projection_passthrough = []
+            if passthrough:
+                aprint("Source and destination layouts are compatible, copying compressed chunks as-is.")
+                projection_passthrough = [
+                    raw_copy_compatible(
+                        dataset.get_projection_array(channel, axis=axis),
+                        dest_dataset.get_projection_array(channel, axis=axis),
+                    )
+                    for axis in range(array.ndim - 1)
+                ]
+
+            def process_raw(i):
+                tp = time_points[i]
+                nb_bytes = raw_copy_time_point(array, dest_array, tp, i)
+                stack = None
+                for axis, compatible in enumerate(projection_passthrough):
+                    dest_projection = dest_dataset.get_projection_array(channel, axis=axis)
+                    if compatible:
+                        source_projection = dataset.get_projection_array(channel, axis=axis)
+                        nb_bytes += raw_copy_time_point(source_projection, dest_projection, tp, i)
+                    else:
+                        stack = array[tp] if stack is None else stack
+                        dest_projection[i] = numpy.max(stack, axis=axis)
+                aprint(f"Copied {nb_bytes} bytes of compressed data for time point {i}.")
+
             def process(i):
                 tp = time_points[i]
-                try:
-                    aprint(f"Processing time point: {i} ...")
-                    tp_array = array[tp][volume_slicing]
-                    if zerolevel != 0:
-                        tp_array = numpy.array(tp_array)
-                        tp_array = numpy.clip(tp_array, a_min=zerolevel, a_max=None, out=tp_array)
-                        tp_array -= zerolevel
-                    dest_dataset.write_stack(channel=channel, time_point=i, stack_array=tp_array)
-                except Exception as error:
-                    aprint(error)
-                    aprint(f"Error occurred while copying time point {i} !")
-                    import traceback
-
-                    traceback.print_exc()
-                    if stop_at_exception:
-                        raise error
-
-            if workers == 1:
-                for i in range(len(time_points)):
-                    process(i)
-            else:
-                n_jobs = compute_num_workers(workers, len(time_points))
-
-                parallel = Parallel(n_jobs=n_jobs, backend=workersbackend)
-                parallel(delayed(process)(i) for i in range(len(time_points)))
+                aprint(f"Processing time point: {i} ...")
+                if passthrough:
+                    process_raw(i)
+                    return
+                tp_array = array[tp][volume_slicing]
+                if zerolevel != 0:
+                    tp_array = numpy.array(tp_array)
+                    tp_array = numpy.clip(tp_array, a_min=zerolevel, a_max=None, out=tp_array)
+                    tp_array -= zerolevel
+                dest_dataset.write_stack(channel=channel, time_point=i, stack_array=tp_array)
+
+            scheduler = TimePointScheduler(
+                workers=workers,
+                backend=workersbackend,
+                stop_at_exception=stop_at_exception,
+                description=f"Copying channel {channel}",
+            )
+            scheduler.run(process, range(len(time_points)), footprint=estimate_footprint(out_shape[1:], dtype, 2))
 
     # Dataset info:
     aprint(dest_dataset.info())
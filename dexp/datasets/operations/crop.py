@@ -3,14 +3,13 @@ from typing import Optional, Sequence, Tuple
 import numpy as np
 import zarr
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 from numpy.typing import ArrayLike
 from scipy import ndimage as ndi
 
 from dexp.datasets import BaseDataset
 from dexp.processing.filters.fft_convolve import fft_convolve
 from dexp.utils.backends import Backend, BestBackend
-from dexp.utils.misc import compute_num_workers
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
 
 
 def _estimate_crop(array: ArrayLike, quantile: float = 0.99) -> Sequence[Tuple[int]]:
@@ -21,7 +20,7 @@ def _estimate_crop(array: ArrayLike, quantile: float = 0.99) -> Sequence[Tuple[i
         xp = Backend.get_xp_module()
         array = Backend.to_backend(array[::step, ::step, ::step], dtype=xp.float16)
         array = xp.clip(array - xp.mean(array), 0, None)  # removing background noise
-        kernel = xp.ones((window_size, window_size, window_size)) / (window_size ** 3)
+        kernel = xp.ones((window_size, window_size, window_size)) / (window_size**3)
         kernel = kernel.astype(xp.float16)
         array = fft_convolve(array, kernel, in_place=True)
         lower = xp.quantile(array, quantile)
@@ -103,27 +102,17 @@ def dataset_crop(
             )
 
             def process(tp):
-                try:
-                    aprint(f"Processing time point: {tp} ...")
-                    tp_array = array[tp][slicing]
-                    dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=tp_array)
-                except Exception as error:
-                    aprint(error)
-                    aprint(f"Error occurred while copying time point {tp} !")
-                    import traceback
-
-                    traceback.print_exc()
-                    if stop_at_exception:
-                        raise error
-
-            if workers == 1:
-                for i in range(len(array)):
-                    process(i)
-            else:
-                n_jobs = compute_num_workers(workers, len(array))
-
-                parallel = Parallel(n_jobs=n_jobs)
-                parallel(delayed(process)(i) for i in range(len(array)))
+                aprint(f"Processing time point: {tp} ...")
+                tp_array = array[tp][slicing]
+                dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=tp_array)
+
+            scheduler = TimePointScheduler(
+                workers=workers,
+                backend="loky",
+                stop_at_exception=stop_at_exception,
+                description=f"Cropping channel {channel}",
+            )
+            scheduler.run(process, range(len(array)), footprint=estimate_footprint(volume_shape, dtype, 2))
 
     # Dataset info:
     aprint(dest_dataset.info())
@@ -1,24 +1,25 @@
-import functools
 from pathlib import Path
-from typing import List, Optional, Sequence, Tuple
+from typing import Optional, Sequence, Tuple
 
-import dask
 import numpy
 import scipy
 from arbol.arbol import aprint, asection
-from dask.distributed import Client
-from dask_cuda import LocalCUDACluster
 
 from dexp.datasets import BaseDataset
 from dexp.optics.psf.standard_psfs import nikon16x08na, olympus20x10na
 from dexp.processing.deconvolution import (
+    PSFGrid,
     admm_deconvolution,
     lucy_richardson_deconvolution,
 )
-from dexp.processing.filters.fft_convolve import fft_convolve
+from dexp.processing.filters.fft_convolve import FFTConvolver
 from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
-from dexp.utils.backends import Backend, BestBackend
+from dexp.processing.utils.tile_planner import default_tile_memory_budget, plan_tiles
+from dexp.utils.backends import Backend, BestBackend, NumpyBackend
+from dexp.utils.scheduler import TimePointScheduler, resolve_devices
 from dexp.utils.slicing import slice_from_shape
+from dexp.utils.tracing import trace_io
+from dexp.utils.work_queue import WorkQueue
 
 
 def dataset_deconv(
@@ -31,8 +32,12 @@ def dataset_deconv(
     compression_level: int = 3,
     overwrite: bool = False,
     tilesize: Optional[Tuple[int]] = None,
+    tile_workers: int = 1,
+    tile_batch_size: int = 1,
     method: str = "lr",
     num_iterations: int = 16,
+    accelerate: bool = False,
+    tolerance: Optional[float] = None,
     max_correction: int = 16,
     power: float = 1,
     blind_spot: int = 0,
@@ -46,21 +51,23 @@ def dataset_deconv(
     psf_z_size: int = 17,
     psf_show: bool = False,
     scaling: Optional[Tuple[float]] = None,
-    workers: int = 1,
-    workersbackend: str = "",
-    devices: Optional[List[int]] = None,
+    workers: int = -1,
+    workersbackend: str = "threading",
+    devices: Optional[Sequence[int]] = (0,),
     check: bool = True,
     stop_at_exception: bool = True,
+    queue: Optional[WorkQueue] = None,
 ):
 
     from dexp.datasets import ZDataset
 
     mode = "w" + ("" if overwrite else "-")
-    dest_dataset = ZDataset(dest_path, mode, store, parent=dataset)
-
-    # Default tile size:
-    if tilesize is None:
-        tilesize = 320  # very conservative
+    if queue is None:
+        dest_dataset = ZDataset(dest_path, mode, store, parent=dataset)
+    else:
+        # a single process creates the destination dataset, all processes then open it:
+        queue.once("create", lambda: ZDataset(dest_path, mode, store, parent=dataset).close())
+        dest_dataset = ZDataset(dest_path, "a", store, parent=dataset)
 
     # Scaling default value:
     if scaling is None:
@@ -68,12 +75,8 @@ def dataset_deconv(
     sz, sy, sx = scaling
     aprint(f"Input images will be scaled by: (sz,sy,sx)={scaling}")
 
-    # CUDA DASK cluster
-    cluster = LocalCUDACluster(CUDA_VISIBLE_DEVICES=devices)
-    client = Client(cluster)
-    aprint("Dask Client", client)
-
-    lazy_computation = []
+    # CUDA devices, or None to process on CPU with a pool of processes:
+    devices = resolve_devices(devices)
 
     for channel in dataset._selected_channels(channels):
         array = dataset.get_array(channel)
@@ -85,9 +88,18 @@ def dataset_deconv(
         dtype = numpy.float16 if method == "admm" else array.dtype
 
         # Adds destination array channel to dataset
-        dest_array = dest_dataset.add_channel(
-            name=channel, shape=out_shape, dtype=dtype, codec=compression, clevel=compression_level
-        )
+        def add_channel():
+            dest_dataset.add_channel(
+                name=channel, shape=out_shape, dtype=dtype, codec=compression, clevel=compression_level
+            )
+
+        if queue is None:
+            add_channel()
+        else:
+            queue.once(f"add_channel-{channel}", add_channel)
+            # the channel might have been added by another process:
+            dest_dataset.reload()
+        dest_array = dest_dataset.get_array(channel)
 
         # This is not ideal but difficult to avoid right now:
         sxy = (sx + sy) / 2
@@ -115,12 +127,22 @@ def dataset_deconv(
         elif Path(psf_objective).exists():
             psf_kernel = numpy.load(psf_objective)
             if sz != 1.0 or sy != 1.0 or sx != 1.0:
-                psf_kernel = scipy.ndimage.interpolation.zoom(psf_kernel, zoom=(sz, sy, sx), order=1)
-            psf_z_size = psf_kernel.shape[0] + 10
-            psf_xy_size = max(psf_kernel.shape[1:]) + 10
+                # PSFs of a grid are scaled individually:
+                grid_zoom = (1,) * (psf_kernel.ndim - 3)
+                psf_kernel = scipy.ndimage.interpolation.zoom(psf_kernel, zoom=grid_zoom + (sz, sy, sx), order=1)
+            psf_z_size = psf_kernel.shape[-3] + 10
+            psf_xy_size = max(psf_kernel.shape[-2:]) + 10
         else:
             raise RuntimeError(f"Object/path {psf_objective} not found.")
 
+        # Spatially varying PSF, given as a grid of PSFs covering the whole (unsliced) volume:
+        psf_grid = PSFGrid(psf_kernel) if PSFGrid.is_grid(psf_kernel) else None
+        if psf_grid is not None:
+            aprint(f"Using a grid of {psf_grid.grid_shape} PSFs of shape {psf_grid.psf_shape}")
+            if method != "lr" or tile_batch_size > 1:
+                raise ValueError("PSF grids are only supported by Lucy-Richardson deconvolution, without batches.")
+            volume_offsets = _slicing_offsets(volume_slicing, array.shape[1:])
+
         # usefull for debugging:
         if psf_show:
             import napari
@@ -129,22 +151,33 @@ def dataset_deconv(
             viewer.add_image(psf_kernel)
             napari.run()
 
-        margins = max(psf_xy_size, psf_z_size)
+        margins = (psf_z_size, psf_xy_size, psf_xy_size)
+
+        # fft_convolve pads tiles by the PSF size before computing FFTs:
+        fft_padding = tuple(2 * (k // 2) + k - 1 for k in psf_kernel.shape[-3:])
 
         if method == "lr":
             normalize = False
-            convolve = functools.partial(fft_convolve, in_place=False, mode="reflect", internal_dtype=numpy.float32)
-
-            def deconv(image):
-                min_value = image.min()
-                max_value = image.max()
-
+            # shared by all tiles and time points, the PSF transfer functions are computed once per tile shape,
+            # or once per tile with a grid of PSFs, the cache is then sized once tiles are planned:
+            convolve = FFTConvolver(mode="reflect", internal_dtype=numpy.float32)
+
+            def deconv(image, tile_slice=None):
+                psf = psf_kernel
+                if psf_grid is not None:
+                    # PSF at the center of the tile, in the coordinates of the unsliced and unscaled volume:
+                    center = tuple(
+                        (s.start + s.stop - 1) / 2 / scale + offset
+                        for s, scale, offset in zip(tile_slice, (sz, sy, sx), volume_offsets)
+                    )
+                    psf = psf_grid.psf_at(array.shape[1:], center)
+
+                # each tile, or tile of a batch, is normalised between its min and max:
                 return lucy_richardson_deconvolution(
                     image=image,
-                    psf=psf_kernel,
+                    psf=psf,
                     num_iterations=num_iterations,
                     max_correction=max_correction,
-                    normalise_minmax=(min_value, max_value),
                     power=power,
                     blind_spot=blind_spot,
                     blind_spot_mode="median+uniform",
@@ -152,9 +185,13 @@ def dataset_deconv(
                     wb_order=wb_order,
                     back_projection=back_projection,
                     convolve_method=convolve,
+                    accelerate=accelerate,
+                    tolerance=tolerance,
                 )
 
         elif method == "admm":
+            if tile_batch_size > 1:
+                raise ValueError("Batches of tiles are only supported by Lucy-Richardson deconvolution.")
             normalize = True
 
             def deconv(image):
@@ -169,61 +206,91 @@ def dataset_deconv(
         else:
             raise ValueError(f"Unknown deconvolution mode: {method}")
 
-        @dask.delayed
-        def process(i):
+        out_dtype = dest_array.dtype
+
+        def process(i, device=None):
             tp = time_points[i]
-            try:
-                with asection(f"Deconvolving time point for time point {i}/{len(time_points)}"):
-                    with asection(f"Loading channel: {channel}"):
-                        tp_array = numpy.asarray(array[tp][volume_slicing])
-
-                    with BestBackend(exclusive=True, enable_unified_memory=True):
-
-                        if sz != 1.0 or sy != 1.0 or sx != 1.0:
-                            with asection(f"Applying scaling {(sz, sy, sx)} to image."):
-                                sp = Backend.get_sp_module()
-                                tp_array = Backend.to_backend(tp_array)
-                                tp_array = sp.ndimage.interpolation.zoom(tp_array, zoom=(sz, sy, sx), order=1)
-                                tp_array = Backend.to_numpy(tp_array)
-
-                        with asection(
-                            f"Deconvolving image of shape: {tp_array.shape}, with tile size: {tilesize}, "
-                            + "margins: {margins} "
-                        ):
-                            aprint(f"Number of iterations: {num_iterations}, back_projection:{back_projection}, ")
-                            tp_array = scatter_gather_i2i(
-                                deconv,
-                                tp_array,
-                                tiles=tilesize,
-                                margins=margins,
-                                normalise=normalize,
-                                internal_dtype=dtype,
-                            )
-
-                        with asection("Moving array from backend to numpy."):
-                            tp_array = Backend.to_numpy(tp_array, dtype=dest_array.dtype, force_copy=False)
+            with asection(f"Deconvolving time point {i}/{len(time_points)}"):
+                with asection(f"Loading channel: {channel}"):
+                    tp_array = numpy.asarray(array[tp][volume_slicing])
+                    trace_io(read=tp_array.nbytes)
+
+                if device is None:
+                    backend = NumpyBackend()
+                else:
+                    backend = BestBackend(device_id=device, exclusive=True, enable_unified_memory=True)
+
+                with backend:
+
+                    if sz != 1.0 or sy != 1.0 or sx != 1.0:
+                        with asection(f"Applying scaling {(sz, sy, sx)} to image."):
+                            sp = Backend.get_sp_module()
+                            tp_array = Backend.to_backend(tp_array)
+                            tp_array = sp.ndimage.interpolation.zoom(tp_array, zoom=(sz, sy, sx), order=1)
+                            tp_array = Backend.to_numpy(tp_array)
+
+                    if tilesize is None:
+                        tiles, tile_margins = plan_tiles(
+                            tp_array.shape,
+                            margins=margins,
+                            memory_budget=default_tile_memory_budget(tile_workers) // tile_batch_size,
+                            memory_factor=8,
+                            padding=fft_padding,
+                        )
+                    else:
+                        tiles, tile_margins = tilesize, margins
+
+                    if psf_grid is not None:
+                        # a PSF is interpolated at the center of each tile, the transfer functions of all PSFs and
+                        # back projectors are kept so that the next time points reuse them:
+                        nb_transfer_functions = 2 * _nb_tiles(tp_array.shape, tiles)
+                        if convolve.max_cached_transfer_functions < nb_transfer_functions:
+                            convolve.max_cached_transfer_functions = nb_transfer_functions
 
                     with asection(
-                        f"Saving deconvolved stack for time point {i}, shape:{tp_array.shape}, dtype:{array.dtype}"
+                        f"Deconvolving image of shape: {tp_array.shape}, with tile size: {tiles}, "
+                        + f"margins: {tile_margins} "
                     ):
-                        dest_dataset.write_stack(channel=channel, time_point=i, stack_array=tp_array)
-
-                    aprint(f"Done processing time point: {i}/{len(time_points)} .")
-
-            except Exception as error:
-                aprint(error)
-                aprint(f"Error occurred while processing time point {i} !")
-                import traceback
-
-                traceback.print_exc()
-
-                if stop_at_exception:
-                    raise error
-
-        for i in range(len(time_points)):
-            lazy_computation.append(process(i))
-
-    dask.compute(*lazy_computation)
+                        aprint(f"Number of iterations: {num_iterations}, back_projection:{back_projection}, ")
+                        tp_array = scatter_gather_i2i(
+                            deconv,
+                            tp_array,
+                            tiles=tiles,
+                            margins=tile_margins,
+                            normalise=normalize,
+                            internal_dtype=dtype,
+                            workers=tile_workers,
+                            batch_size=tile_batch_size,
+                            pass_tile_slice=psf_grid is not None,
+                            blend_margins=psf_grid is not None,
+                        )
+
+                    with asection("Moving array from backend to numpy."):
+                        tp_array = Backend.to_numpy(tp_array, dtype=out_dtype, force_copy=False)
+
+                aprint(f"Done processing time point: {i}/{len(time_points)} .")
+
+            return tp_array
+
+        def write_back(i, tp_array):
+            with asection(f"Saving deconvolved stack for time point {i}, shape:{tp_array.shape}, dtype:{array.dtype}"):
+                dest_dataset.write_stack(channel=channel, time_point=i, stack_array=tp_array)
+
+        scheduler = TimePointScheduler(
+            workers=workers,
+            backend=workersbackend if devices is not None else "loky",
+            devices=devices,
+            stop_at_exception=stop_at_exception,
+            description=f"Deconvolving channel {channel}",
+            threads_per_worker=None if devices is not None else 0,
+            queue=queue,
+        )
+        scheduler.run(
+            process,
+            range(len(time_points)),
+            footprint="measure",
+            write_back=write_back,
+        )
 
     # Dataset info:
     aprint(dest_dataset.info())
@@ -234,4 +301,26 @@ def dataset_deconv(
 
     # close destination dataset:
     dest_dataset.close()
-    client.close()
+
+
+def _nb_tiles(shape: Tuple[int, ...], tiles) -> int:
+    # Number of tiles scatter_gather_i2i splits a volume into:
+    tiles = (tiles,) * len(shape) if isinstance(tiles, int) else tiles
+    return int(numpy.prod([-(-length // tile) for length, tile in zip(shape, tiles)]))
+
+
+def _slicing_offsets(volume_slicing, shape: Tuple[int, ...]) -> Tuple[int, ...]:
+    # Start of the sliced volume within the whole volume, along each axis:
+    if not isinstance(volume_slicing, tuple):
+        volume_slicing = (volume_slicing,)
+    if volume_slicing.count(Ellipsis) == 1:
+        index = volume_slicing.index(Ellipsis)
+        filling = (slice(None),) * (len(shape) - len(volume_slicing) + 1)
+        volume_slicing = volume_slicing[:index] + filling + volume_slicing[index + 1 :]
+    volume_slicing = volume_slicing + (slice(None),) * (len(shape) - len(volume_slicing))
+
+    if len(volume_slicing) != len(shape) or not all(
+        isinstance(axis_slicing, slice) and axis_slicing.step in (None, 1) for axis_slicing in volume_slicing
+    ):
+        raise ValueError(f"PSF grids require a slicing with a contiguous range along each axis, got: {volume_slicing}")
+    return tuple(axis_slicing.indices(length)[0] for axis_slicing, length in zip(volume_slicing, shape))
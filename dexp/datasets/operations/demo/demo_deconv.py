@@ -55,7 +55,7 @@ def _demo_deconv(length_xy=96, zoom=1, n=8, display=True):
         images = (image + random.uniform(-10, 10) for image in images)
 
         # turn into array:
-        images = xp.stack(images)
+        images = xp.stack(list(images))
 
     with tempfile.TemporaryDirectory() as tmpdir:
         aprint("created temporary directory", tmpdir)
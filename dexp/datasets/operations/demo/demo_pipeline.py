@@ -0,0 +1,110 @@
+import os
+import tempfile
+from os.path import join
+
+import numpy
+import yaml
+from arbol import aprint, asection
+
+from dexp.datasets import ZDataset
+from dexp.datasets.operations.pipeline import dataset_pipeline, load_pipeline
+from dexp.datasets.synthetic_datasets import generate_nuclei_background_data
+from dexp.processing.registration.model.sequence_registration_model import (
+    SequenceRegistrationModel,
+)
+from dexp.processing.registration.model.translation_registration_model import (
+    TranslationRegistrationModel,
+)
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def demo_pipeline_numpy():
+    with NumpyBackend():
+        _demo_pipeline()
+
+
+def demo_pipeline_cupy():
+    try:
+        with CupyBackend():
+            _demo_pipeline()
+            return True
+    except ModuleNotFoundError:
+        aprint("Cupy module not found! demo ignored")
+        return False
+
+
+def _demo_pipeline(length_xy=64, n=3, display=True):
+    xp = Backend.get_xp_module()
+
+    # generate nuclei image:
+    _, _, image = generate_nuclei_background_data(
+        add_noise=False,
+        length_xy=length_xy,
+        length_z_factor=1,
+        independent_haze=True,
+        sphere=True,
+        dtype=xp.float32,
+    )
+    images = numpy.stack([Backend.to_numpy(image)] * n)
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        aprint("created temporary directory", tmpdir)
+
+        with asection("Prepare dataset..."):
+            input_path = join(tmpdir, "dataset.zarr")
+            dataset = ZDataset(path=input_path, mode="w", store="dir")
+            dataset.add_channel(name="channel", shape=images.shape, chunks=(1, 64, 64, 64), dtype=images.dtype)
+            dataset.write_array(channel="channel", array=images)
+
+        with asection("Prepare stabilisation model..."):
+            model = SequenceRegistrationModel(
+                model_list=[TranslationRegistrationModel(shift_vector=[0, tp, -tp]) for tp in range(n)]
+            )
+            model_path = join(tmpdir, "model.json")
+            with open(model_path, "w") as f:
+                f.write(model.to_json())
+
+        with asection("Prepare pipeline..."):
+            spec = dict(
+                output_path=join(tmpdir, "output.zarr"),
+                steps=[
+                    dict(deconv=dict(num_iterations=2, checkpoint=join(tmpdir, "deconv.zarr"))),
+                    dict(stabilize=dict(model=model_path)),
+                    dict(projrender=dict(output_path=join(tmpdir, "frames"), mode="max", legend_size=0)),
+                ],
+            )
+            spec_path = join(tmpdir, "pipeline.yaml")
+            with open(spec_path, "w") as f:
+                yaml.safe_dump(spec, f)
+
+            steps, options = load_pipeline(spec_path)
+            assert [step.name for step in steps] == ["deconv", "stabilize", "projrender"]
+
+        with asection("Run pipeline..."):
+            dataset_pipeline(dataset, steps, options["output_path"], channels=("channel",), devices=())
+
+        deconv_array = ZDataset(path=join(tmpdir, "deconv.zarr"), mode="r").get_array("channel")
+        output_array = ZDataset(path=options["output_path"], mode="r").get_array("channel")
+
+        # only the checkpoint and the final output are saved:
+        assert deconv_array.shape == images.shape
+        assert output_array.shape == (n,) + model.padded_shape(images.shape[1:])
+        assert sorted(os.listdir(join(tmpdir, "frames"))) == [f"frame_{tp:05}.png" for tp in range(n)]
+
+        # stabilisation is applied on the deconvolved stacks:
+        assert numpy.array_equal(output_array[0], model.apply(deconv_array[0], index=0, pad=True, integral=True))
+
+        if display:
+            import napari
+
+            viewer = napari.Viewer(ndisplay=3)
+            viewer.add_image(images, name="images")
+            viewer.add_image(numpy.asarray(deconv_array), name="deconv_array")
+            viewer.add_image(numpy.asarray(output_array), name="output_array")
+            viewer.grid.enabled = True
+            napari.run()
+
+
+if __name__ == "__main__":
+    if not demo_pipeline_cupy():
+        demo_pipeline_numpy()
@@ -1,13 +1,15 @@
+import functools
 from typing import List, Optional, Sequence
 
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 from zarr.errors import ContainsArrayError, ContainsGroupError
 
 from dexp.datasets import BaseDataset
 from dexp.processing.deskew.classic_deskew import classic_deskew
 from dexp.processing.deskew.yang_deskew import yang_deskew
 from dexp.utils.backends import Backend, BestBackend
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
+from dexp.utils.work_queue import WorkQueue
 
 
 def dataset_deskew(
@@ -33,6 +35,7 @@ def dataset_deskew(
     devices: Optional[List[int]] = None,
     check: bool = True,
     stop_at_exception=True,
+    queue: Optional[WorkQueue] = None,
 ):
 
     # Collect arrays for selected channels:
@@ -60,7 +63,12 @@ def dataset_deskew(
     from dexp.datasets import ZDataset
 
     zarr_mode = "w" + ("" if overwrite else "-")
-    dest_dataset = ZDataset(dest_path, zarr_mode, store, parent=dataset)
+    if queue is None:
+        dest_dataset = ZDataset(dest_path, zarr_mode, store, parent=dataset)
+    else:
+        # a single process creates the destination dataset, all processes then open it:
+        queue.once("create", lambda: ZDataset(dest_path, zarr_mode, store, parent=dataset).close())
+        dest_dataset = ZDataset(dest_path, "a", store, parent=dataset)
 
     # Metadata for deskewing:
     metadata = dataset.get_metadata()
@@ -82,83 +90,80 @@ def dataset_deskew(
         nb_timepoints = array.shape[0]
 
         def process(channel, tp, device):
-            try:
-
-                with asection(f"Loading channel {channel} for time point {tp}"):
-                    array_tp = array[tp].compute()
-
-                with BestBackend(device, exclusive=True, enable_unified_memory=True):
-
-                    if "yang" in mode:
-                        deskewed_view_tp = yang_deskew(
-                            image=array_tp,
-                            depth_axis=depth_axis,
-                            lateral_axis=lateral_axis,
-                            flip_depth_axis=flip,
-                            dx=dx,
-                            dz=dz,
-                            angle=angle,
-                            camera_orientation=camera_orientation,
-                        )
-                    elif "classic" in mode:
-                        deskewed_view_tp = classic_deskew(
-                            image=array_tp,
-                            depth_axis=depth_axis,
-                            lateral_axis=lateral_axis,
-                            flip_depth_axis=flip,
-                            dx=dx,
-                            dz=dz,
-                            angle=angle,
-                            camera_orientation=camera_orientation,
-                            padding=padding,
-                        )
-                    else:
-                        raise ValueError(f"Deskew mode: {mode} not supported.")
-
-                    with asection("Moving array from backend to numpy."):
-                        deskewed_view_tp = Backend.to_numpy(deskewed_view_tp, dtype=array.dtype, force_copy=False)
-
-                if channel not in dest_dataset.channels():
+
+            with asection(f"Loading channel {channel} for time point {tp}"):
+                array_tp = array[tp].compute()
+
+            with BestBackend(device, exclusive=True, enable_unified_memory=True):
+
+                if "yang" in mode:
+                    deskewed_view_tp = yang_deskew(
+                        image=array_tp,
+                        depth_axis=depth_axis,
+                        lateral_axis=lateral_axis,
+                        flip_depth_axis=flip,
+                        dx=dx,
+                        dz=dz,
+                        angle=angle,
+                        camera_orientation=camera_orientation,
+                    )
+                elif "classic" in mode:
+                    deskewed_view_tp = classic_deskew(
+                        image=array_tp,
+                        depth_axis=depth_axis,
+                        lateral_axis=lateral_axis,
+                        flip_depth_axis=flip,
+                        dx=dx,
+                        dz=dz,
+                        angle=angle,
+                        camera_orientation=camera_orientation,
+                        padding=padding,
+                    )
+                else:
+                    raise ValueError(f"Deskew mode: {mode} not supported.")
+
+                with asection("Moving array from backend to numpy."):
+                    deskewed_view_tp = Backend.to_numpy(deskewed_view_tp, dtype=array.dtype, force_copy=False)
+
+            def add_channel():
+                dest_dataset.add_channel(
+                    channel,
+                    shape=(array.shape[0],) + deskewed_view_tp.shape,
+                    dtype=deskewed_view_tp.dtype,
+                    codec=compression,
+                    clevel=compression_level,
+                )
+
+            if channel not in dest_dataset.channels():
+                if queue is None:
                     try:
-                        dest_dataset.add_channel(
-                            channel,
-                            shape=(array.shape[0],) + deskewed_view_tp.shape,
-                            dtype=deskewed_view_tp.dtype,
-                            codec=compression,
-                            clevel=compression_level,
-                        )
+                        add_channel()
                     except (ContainsArrayError, ContainsGroupError):
                         aprint("Other thread/process created channel before... ")
-
-                with asection(
-                    f"Saving fused stack for time point {tp}, shape:{deskewed_view_tp.shape}, "
-                    + f"dtype:{deskewed_view_tp.dtype}"
-                ):
-                    dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=deskewed_view_tp)
-
-                aprint(f"Done processing time point: {tp} .")
-
-            except Exception as error:
-                aprint(error)
-                aprint(f"Error occurred while deskewing time point {tp} !")
-                import traceback
-
-                traceback.print_exc()
-
-                if stop_at_exception:
-                    raise error
-
-        if workers == -1:
-            workers = len(devices)
-        aprint(f"Number of workers: {workers}")
-
-        if workers > 1:
-            Parallel(n_jobs=workers, backend=workersbackend)(
-                delayed(process)(channel, tp, devices[tp % len(devices)]) for tp in range(0, shape[0])
-            )
-        else:
-            for tp in range(0, nb_timepoints):
-                process(channel, tp, devices[0])
+                else:
+                    queue.once(f"add_channel-{channel}", add_channel)
+                    # the channel might have been added by another process:
+                    dest_dataset.reload()
+
+            with asection(
+                f"Saving fused stack for time point {tp}, shape:{deskewed_view_tp.shape}, "
+                + f"dtype:{deskewed_view_tp.dtype}"
+            ):
+                dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=deskewed_view_tp)
+
+            aprint(f"Done processing time point: {tp} .")
+
+        scheduler = TimePointScheduler(
+            workers=workers,
+            backend=workersbackend,
+            devices=devices,
+            stop_at_exception=stop_at_exception,
+            description=f"Deskewing channel {channel}",
+            queue=queue,
+        )
+        scheduler.run(
+            functools.partial(process, channel), range(nb_timepoints), footprint=estimate_footprint(shape, "f4", 6)
+        )
 
     # Dataset info:
     aprint(dest_dataset.info())
@@ -1,4 +1,5 @@
-from typing import Sequence, Union
+import itertools
+from typing import Optional, Sequence, Union
 
 import numpy as np
 from arbol import aprint, asection
@@ -17,6 +18,7 @@ def dataset_extract_psf(
     peak_threshold: int = 500,
     similarity_threshold: float = 0.5,
     psf_size: int = 35,
+    grid: Optional[Sequence[int]] = None,
     device: int = 0,
     stop_at_exception: bool = True,
     verbose: bool = True,
@@ -24,6 +26,8 @@ def dataset_extract_psf(
     """
     Computes PSF from beads.
     Additional information at dexp.processing.remove_beads.beadremover documentation.
+    If a grid is given, e.g. (1, 3, 3), the volume is divided in regions of equal size and a PSF is computed for each
+    of them, the saved array then has shape grid + PSF shape, and can be used for spatially varying deconvolution.
     """
     dest_path = dest_path.split(".")[0]
 
@@ -35,7 +39,9 @@ def dataset_extract_psf(
         array = dataset.get_array(channel)
         _, volume_slicing, time_points = slice_from_shape(array.shape, slicing)
 
-        psfs = []
+        volume_shape = np.empty(shape=array.shape[1:], dtype=bool)[volume_slicing].shape
+        cells = list(itertools.product(*(range(n) for n in grid))) if grid is not None else [None]
+        psfs = {cell: [] for cell in cells}
         for i in range(len(time_points)):
             tp = time_points[i]
             try:
@@ -46,7 +52,16 @@ def dataset_extract_psf(
                     with asection("Processing"):
                         with BestBackend(exclusive=True, enable_unified_memory=True, device_id=device) as backend:
                             tp_array = backend.to_backend(tp_array)
-                            estimated_psf = remove_beads.detect_beads(tp_array)
+                            for cell in cells:
+                                if cell is None:
+                                    psfs[cell].append(remove_beads.detect_beads(tp_array))
+                                    continue
+                                region = tuple(
+                                    slice(j * length // n, (j + 1) * length // n)
+                                    for j, n, length in zip(cell, grid, volume_shape)
+                                )
+                                with asection(f"Extracting PSF of region {cell} of grid {tuple(grid)}"):
+                                    psfs[cell].append(remove_beads.detect_beads(tp_array[region]))
 
                 aprint(f"Done extracting PSF from time point: {i}/{len(time_points)} .")
 
@@ -60,8 +75,10 @@ def dataset_extract_psf(
                 if stop_at_exception:
                     raise error
 
-            psfs.append(estimated_psf)
-
-        psfs = np.stack(psfs).mean(axis=0)
-        print(psfs.shape)
+        psfs = np.stack([np.stack(psfs[cell]).mean(axis=0) for cell in cells])
+        if grid is None:
+            psfs = psfs[0]
+        else:
+            psfs = psfs.reshape(tuple(grid) + psfs.shape[1:])
+        aprint(f"PSF shape: {psfs.shape}")
         np.save(dest_path + channel + ".npy", psfs)
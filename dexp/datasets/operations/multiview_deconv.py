@@ -0,0 +1,297 @@
+from pathlib import Path
+from typing import Optional, Sequence, Tuple
+
+import numpy
+from arbol.arbol import aprint, asection
+
+from dexp.datasets import BaseDataset
+from dexp.optics.psf.standard_psfs import nikon16x08na, olympus20x10na
+from dexp.processing.deconvolution import PSFGrid
+from dexp.processing.filters.fft_convolve import FFTConvolver
+from dexp.processing.multiview_lightsheet.deconvolution import (
+    multiview_lucy_richardson_deconvolution,
+)
+from dexp.processing.multiview_lightsheet.fusion.simview import SimViewFusion
+from dexp.processing.registration.model.model_io import model_list_from_file
+from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
+from dexp.processing.utils.tile_planner import default_tile_memory_budget, plan_tiles
+from dexp.utils.backends import Backend, BestBackend, NumpyBackend
+from dexp.utils.memory import measure_footprint
+from dexp.utils.scheduler import TimePointScheduler, resolve_devices
+from dexp.utils.slicing import slice_from_shape
+from dexp.utils.tracing import trace_io
+
+
+def dataset_multiview_deconv(
+    dataset: BaseDataset,
+    dest_path: str,
+    channels: Sequence[str],
+    slicing,
+    model_list_filename: str,
+    store: str = "dir",
+    compression: str = "zstd",
+    compression_level: int = 3,
+    overwrite: bool = False,
+    equalise: bool = True,
+    equalise_mode: str = "first",
+    zero_level: int = 0,
+    clip_too_high: int = 0,
+    fusion_bias_strength_i: float = 0.5,
+    dehaze_size: int = 65,
+    white_top_hat_size: float = 0,
+    white_top_hat_sampling: int = 4,
+    pad: bool = False,
+    tilesize: Optional[Tuple[int]] = None,
+    num_iterations: int = 8,
+    max_correction: int = 16,
+    tolerance: Optional[float] = None,
+    psf_objectives: Sequence[str] = ("nikon16x08na",),
+    psf_na: Optional[float] = None,
+    psf_dxy: float = 0.485,
+    psf_dz: float = 2,
+    psf_xy_size: int = 17,
+    psf_z_size: int = 17,
+    workers: int = -1,
+    workersbackend: str = "threading",
+    devices: Optional[Sequence[int]] = (0,),
+    check: bool = True,
+    stop_at_exception: bool = True,
+):
+    """
+    Jointly deconvolves the two detection views of a SimView dataset into a single 'fused' channel, in a single
+    pass instead of fusing and then deconvolving the fused views. For each time point, the illumination views of
+    each camera are preprocessed and fused as for 'dexp fuse', the camera views C0Lx and C1Lx are registered with
+    the registration models computed by 'dexp register', and are then deconvolved together, tile by tile, each with
+    its own PSF (see multiview_lucy_richardson_deconvolution).
+
+    Parameters
+    ----------
+    dataset : dataset with the views of a SimView acquisition.
+    dest_path : path of the destination dataset.
+    channels : channels of the views in standard order (C0L0, C0L1, C1L0, C1L1).
+    slicing : dataset slicing (TZYX).
+    model_list_filename : registration models file as saved by 'dexp register', a single model or one per time point.
+    store, compression, compression_level, overwrite : destination dataset parameters.
+    equalise, equalise_mode, zero_level, clip_too_high, fusion_bias_strength_i, dehaze_size, white_top_hat_size,
+    white_top_hat_sampling, pad : view preprocessing and registration parameters, see 'dexp fuse'.
+    tilesize : tile size, if None tiles are planned to fit in memory.
+    num_iterations : number of iterations, each one going through all views.
+    max_correction : Lucy-Richardson correction will remain clamped within [1/mc, mc].
+    tolerance : if not None, iterations of a tile stop once the relative change of its estimate drops below.
+    psf_objectives : objective name or path to a PSF saved as a numpy file, per camera. A single one is shared.
+        Camera 1 being flipped along x, so is its PSF.
+    psf_na, psf_dxy, psf_dz, psf_xy_size, psf_z_size : PSF parameters of the objectives, psf_na overrides the NA.
+    workers, workersbackend, devices : time points scheduling, see 'dexp deconv'.
+    check : checking integrity of the written dataset.
+    stop_at_exception : stops as soon as a time point failed.
+    """
+    from dexp.datasets import ZDataset
+
+    views = {channel.split("-")[-1]: dataset.get_array(channel, per_z_slice=False) for channel in channels}
+    views = SimViewFusion.validate_views(views)
+
+    with asection("Views:"):
+        for channel, view in views.items():
+            aprint(f"View: {channel} of shape: {view.shape} and dtype: {view.dtype}")
+
+    key = list(views.keys())[0]
+    dtype = views[key].dtype
+    in_nb_time_points = views[key].shape[0]
+    aprint(f"Slicing with: {slicing}")
+    _, volume_slicing, time_points = slice_from_shape(views[key].shape, slicing)
+
+    # registration models from 'dexp register':
+    with NumpyBackend():
+        aprint(f"Loading registration models from: {model_list_filename}")
+        models = model_list_from_file(model_list_filename)
+        if len(models) == 1:
+            models = [models[0] for _ in range(in_nb_time_points)]
+        elif len(models) != in_nb_time_points:
+            raise ValueError(
+                f"Number of registration models provided ({len(models)}) "
+                f"differs from number of input time points ({in_nb_time_points})"
+            )
+
+    # one PSF per camera, the PSF of camera 1 is flipped like its views:
+    if len(psf_objectives) == 1:
+        psf_objectives = tuple(psf_objectives) * 2
+    psf_kwargs = {"dxy": psf_dxy, "dz": psf_dz, "xy_size": psf_xy_size, "z_size": psf_z_size}
+    if psf_na is not None:
+        aprint(f"Numerical aperture overridden to a value of: {psf_na}")
+        psf_kwargs["NA"] = psf_na
+    psfs = [_load_psf(objective, psf_kwargs) for objective in psf_objectives[:2]]
+    psfs[1] = numpy.flip(psfs[1], -1).copy()
+
+    margins = tuple(max(psf.shape[axis] for psf in psfs) + 10 for axis in range(3))
+    fft_padding = tuple(max(2 * (psf.shape[axis] // 2) + psf.shape[axis] - 1 for psf in psfs) for axis in range(3))
+
+    # shared by all tiles and time points, the transfer functions of each view are computed once per tile shape:
+    convolve = FFTConvolver(mode="reflect", internal_dtype=numpy.float32, max_cached_transfer_functions=8)
+
+    # CUDA devices, or None to process on CPU with a pool of processes:
+    devices = resolve_devices(devices)
+
+    def process(i, equalisation_ratios, device=None):
+        tp = time_points[i]
+        with asection(f"Deconvolving views of time point {i}/{len(time_points)}"):
+            with asection(f"Loading channels {channels}"):
+                views_tp = {k: numpy.asarray(view[tp][volume_slicing]) for k, view in views.items()}
+                trace_io(read=sum(view.nbytes for view in views_tp.values()))
+
+            if device is None:
+                backend = NumpyBackend()
+            else:
+                backend = BestBackend(device_id=device, exclusive=True, enable_unified_memory=True)
+
+            with backend:
+                fuse_obj = SimViewFusion(
+                    registration_model=models[tp],
+                    equalise=equalise,
+                    equalisation_ratios=list(equalisation_ratios),
+                    zero_level=zero_level,
+                    clip_too_high=clip_too_high,
+                    fusion="tg",
+                    fusion_bias_exponent=2,
+                    fusion_bias_strength_i=fusion_bias_strength_i,
+                    fusion_bias_strength_d=0.0,
+                    dehaze_before_fusion=True,
+                    dehaze_size=dehaze_size,
+                    dehaze_correct_max_level=True,
+                    dark_denoise_threshold=0,
+                    dark_denoise_size=0,
+                    white_top_hat_size=white_top_hat_size,
+                    white_top_hat_sampling=white_top_hat_sampling,
+                    butterworth_filter_cutoff=1,
+                    flip_camera1=True,
+                    pad=pad,
+                )
+                C0Lx, C1Lx = fuse_obj.preprocess(**views_tp)
+                del views_tp
+
+                if C1Lx is None:
+                    camera_views, camera_psfs = [], psfs[:1]
+                else:
+                    with asection("Register_stacks C0Lx and C1Lx ..."):
+                        C0Lx, C1Lx = fuse_obj.registration_model.apply_pair(C0Lx, C1Lx, pad=pad)
+                    camera_views, camera_psfs = [C1Lx], psfs
+                Backend.current().clear_memory_pool()
+
+                def deconv(tile, tile_slice):
+                    # the views are normalised jointly within each tile:
+                    return multiview_lucy_richardson_deconvolution(
+                        [tile] + [view[tile_slice] for view in camera_views],
+                        camera_psfs,
+                        num_iterations=num_iterations,
+                        max_correction=max_correction,
+                        convolve_method=convolve,
+                        tolerance=tolerance,
+                    )
+
+                if tilesize is None:
+                    tiles, tile_margins = plan_tiles(
+                        C0Lx.shape,
+                        margins=margins,
+                        memory_budget=default_tile_memory_budget(),
+                        memory_factor=4 + 4 * len(camera_psfs),
+                        padding=fft_padding,
+                    )
+                else:
+                    tiles, tile_margins = tilesize, margins
+
+                with asection(
+                    f"Deconvolving {len(camera_psfs)} views of shape: {C0Lx.shape}, with tile size: {tiles}, "
+                    + f"margins: {tile_margins}, number of iterations: {num_iterations}"
+                ):
+                    tp_array = scatter_gather_i2i(
+                        deconv,
+                        C0Lx,
+                        tiles=tiles,
+                        margins=tile_margins,
+                        internal_dtype=numpy.float32,
+                        pass_tile_slice=True,
+                    )
+
+                with asection("Moving array from backend to numpy."):
+                    tp_array = Backend.to_numpy(tp_array, dtype=dtype, force_copy=False)
+
+                del C0Lx, C1Lx, deconv
+                Backend.current().clear_memory_pool()
+
+                # moving to numpy to allow pickling:
+                new_equalisation_ratios = [
+                    None if v is None else Backend.to_numpy(v) for v in fuse_obj._equalisation_ratios
+                ]
+
+            aprint(f"Done processing time point: {i}/{len(time_points)} .")
+
+        return tp_array, new_equalisation_ratios
+
+    # the first time point gives the output shape, its memory footprint and, if equalising with the ratios
+    # of the first time point, the equalisation ratios:
+    with asection("Deconvolving first time point and measuring its memory footprint"):
+        (tp_array, equalisation_ratios), footprint = measure_footprint(
+            process, 0, [None, None, None], device=None if devices is None else devices[0]
+        )
+    aprint(f"Measured footprint: {footprint / 1e9:.2f} GB per time point")
+
+    if equalise_mode == "all":
+        equalisation_ratios = [None, None, None]
+
+    mode = "w" + ("" if overwrite else "-")
+    dest_dataset = ZDataset(dest_path, mode, store, parent=dataset)
+    dest_dataset.add_channel(
+        "fused",
+        shape=(len(time_points),) + tp_array.shape,
+        dtype=tp_array.dtype,
+        codec=compression,
+        clevel=compression_level,
+    )
+
+    def write_back(i, tp_array):
+        with asection(f"Saving deconvolved stack for time point {i}, shape:{tp_array.shape}, dtype:{tp_array.dtype}"):
+            dest_dataset.write_stack(channel="fused", time_point=i, stack_array=tp_array)
+
+    write_back(0, tp_array)
+    del tp_array
+
+    scheduler = TimePointScheduler(
+        workers=workers,
+        backend=workersbackend if devices is not None else "loky",
+        devices=devices,
+        stop_at_exception=stop_at_exception,
+        description="Deconvolving views",
+        threads_per_worker=None if devices is not None else 0,
+    )
+    if scheduler.dry_run:
+        aprint("Dry run, remaining time points skipped.")
+    else:
+        scheduler.run(
+            lambda i, device=None: process(i, equalisation_ratios, device=device)[0],
+            range(1, len(time_points)),
+            footprint=footprint,
+            write_back=write_back,
+        )
+
+    # Dataset info:
+    aprint(dest_dataset.info())
+
+    # Check dataset integrity:
+    if check:
+        dest_dataset.check_integrity()
+
+    # close destination dataset:
+    dest_dataset.close()
+
+
+def _load_psf(objective: str, psf_kwargs: dict) -> numpy.ndarray:
+    # PSF of a detection objective, or loaded from a numpy file:
+    if objective == "nikon16x08na":
+        return nikon16x08na(**psf_kwargs)
+    elif objective == "olympus20x10na":
+        return olympus20x10na(**psf_kwargs)
+    elif Path(objective).exists():
+        psf = numpy.load(objective)
+        if PSFGrid.is_grid(psf):
+            raise ValueError(f"PSF grids are not supported by multi-view deconvolution: {objective}")
+        return psf
+    raise RuntimeError(f"Object/path {objective} not found.")
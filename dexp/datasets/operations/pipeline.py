@@ -0,0 +1,557 @@
+import threading
+from os import makedirs
+from os.path import join
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import imageio
+import numpy
+import yaml
+from arbol.arbol import aprint, asection
+
+from dexp.datasets import BaseDataset
+from dexp.optics.psf.standard_psfs import nikon16x08na, olympus20x10na
+from dexp.processing.color.projection import project_image
+from dexp.processing.deconvolution import (
+    PSFGrid,
+    admm_deconvolution,
+    lucy_richardson_deconvolution,
+)
+from dexp.processing.filters.fft_convolve import FFTConvolver
+from dexp.processing.multiview_lightsheet.fusion.simview import SimViewFusion
+from dexp.processing.registration.model.model_io import (
+    from_json,
+    model_list_from_file,
+)
+from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
+from dexp.processing.utils.tile_planner import default_tile_memory_budget, plan_tiles
+from dexp.utils import xpArray
+from dexp.utils.backends import Backend, BestBackend, NumpyBackend
+from dexp.utils.scheduler import TimePointScheduler, resolve_devices
+from dexp.utils.slicing import slice_from_shape
+from dexp.utils.tracing import trace_io
+
+
+class PipelineStep:
+    """
+    Base class of pipeline steps. A step transforms the stacks of a time point, a dictionary from channel names to
+    arrays of the current backend, into new stacks. Stacks stay on the backend between steps. Steps are called with
+    the stacks, the time point of the stacks in the input dataset, e.g. to look up models, and their index in the
+    output, which differ when the slicing does not start at the first time point or has a step.
+
+    Parameters
+    ----------
+    checkpoint : optional path of a Zarr dataset in which the output stacks of this step are saved.
+    """
+
+    name = "step"
+
+    def __init__(self, checkpoint: Optional[str] = None):
+        self.checkpoint = checkpoint
+
+    def __call__(self, stacks: Dict[str, xpArray], time_point: int, index: int) -> Dict[str, xpArray]:
+        raise NotImplementedError
+
+    def __repr__(self) -> str:
+        return f"{self.name}(checkpoint={self.checkpoint})"
+
+
+class FuseStep(PipelineStep):
+    name = "fuse"
+
+    def __init__(
+        self,
+        microscope: str = "simview",
+        equalise: bool = True,
+        equalise_mode: str = "first",
+        zero_level: float = 0,
+        clip_too_high: int = 0,
+        fusion: str = "tg",
+        fusion_bias_strength_i: float = 0.5,
+        fusion_bias_strength_d: float = 0.02,
+        dehaze_size: int = 65,
+        dark_denoise_threshold: int = 0,
+        white_top_hat_size: float = 0,
+        white_top_hat_sampling: int = 4,
+        model_list_filename: Optional[str] = None,
+        pad: bool = False,
+        checkpoint: Optional[str] = None,
+    ):
+        """
+        Fuses the views of a SimView microscope into a single 'fused' channel, see 'dexp fuse'.
+
+        Parameters
+        ----------
+        microscope : microscope type, only 'simview' is supported.
+        equalise_mode : 'first' to compute the equalisation ratios on the first time point and reuse them,
+            'all' to compute them for each time point.
+        model_list_filename : optional file of registration models (one per time point, or a single one),
+            registration is computed for each time point otherwise.
+        other parameters : see SimViewFusion.
+        """
+        super().__init__(checkpoint)
+        if microscope != "simview":
+            raise NotImplementedError(f"Fusion for microscope '{microscope}' is not available in pipelines.")
+        self.equalise = equalise
+        self.equalise_mode = equalise_mode
+        self.zero_level = zero_level
+        self.clip_too_high = clip_too_high
+        self.fusion = fusion
+        self.fusion_bias_strength_i = fusion_bias_strength_i
+        self.fusion_bias_strength_d = fusion_bias_strength_d
+        self.dehaze_size = dehaze_size
+        self.dark_denoise_threshold = dark_denoise_threshold
+        self.white_top_hat_size = white_top_hat_size
+        self.white_top_hat_sampling = white_top_hat_sampling
+        self.pad = pad
+
+        self.models = None
+        if model_list_filename is not None:
+            with NumpyBackend():
+                self.models = model_list_from_file(model_list_filename)
+
+        self._equalisation_ratios = [None, None, None]
+        self._lock = threading.Lock()
+
+    def __call__(self, stacks: Dict[str, xpArray], time_point: int, index: int) -> Dict[str, xpArray]:
+        views = SimViewFusion.validate_views({channel.split("-")[-1]: stack for channel, stack in stacks.items()})
+
+        model = None
+        if self.models is not None:
+            model = self.models[0] if len(self.models) == 1 else self.models[time_point]
+
+        with self._lock:
+            equalisation_ratios = list(self._equalisation_ratios)
+
+        fuse_obj = SimViewFusion(
+            registration_model=model,
+            equalise=self.equalise,
+            equalisation_ratios=equalisation_ratios,
+            zero_level=self.zero_level,
+            clip_too_high=self.clip_too_high,
+            fusion=self.fusion,
+            fusion_bias_exponent=2,
+            fusion_bias_strength_i=self.fusion_bias_strength_i,
+            fusion_bias_strength_d=self.fusion_bias_strength_d,
+            dehaze_before_fusion=True,
+            dehaze_size=self.dehaze_size,
+            dehaze_correct_max_level=True,
+            dark_denoise_threshold=self.dark_denoise_threshold,
+            dark_denoise_size=9,
+            white_top_hat_size=self.white_top_hat_size,
+            white_top_hat_sampling=self.white_top_hat_sampling,
+            butterworth_filter_cutoff=1,
+            flip_camera1=True,
+            pad=self.pad,
+        )
+        fused = fuse_obj(**views)
+
+        if self.equalise_mode == "first":
+            with self._lock:
+                if all(ratio is None for ratio in self._equalisation_ratios):
+                    self._equalisation_ratios = [
+                        None if ratio is None else Backend.to_numpy(ratio) for ratio in fuse_obj._equalisation_ratios
+                    ]
+                    aprint(f"Equalisation ratios of first time point: {self._equalisation_ratios}")
+
+        return {"fused": fused}
+
+
+class DeconvStep(PipelineStep):
+    name = "deconv"
+
+    def __init__(
+        self,
+        method: str = "lr",
+        num_iterations: int = 16,
+        accelerate: bool = False,
+        tolerance: Optional[float] = None,
+        max_correction: int = 16,
+        power: float = 1,
+        blind_spot: int = 0,
+        back_projection: Optional[str] = "tpsf",
+        wb_order: int = 5,
+        psf_objective: str = "nikon16x08na",
+        psf_na: Optional[float] = 0.8,
+        psf_dxy: float = 0.485,
+        psf_dz: float = 2,
+        psf_xy_size: int = 17,
+        psf_z_size: int = 17,
+        tilesize: Optional[int] = None,
+        tile_workers: int = 1,
+        tile_batch_size: int = 1,
+        checkpoint: Optional[str] = None,
+    ):
+        """
+        Deconvolves each channel, see 'dexp deconv'.
+
+        Parameters
+        ----------
+        method : 'lr' for Lucy-Richardson, or 'admm'.
+        psf_objective : 'nikon16x08na', 'olympus20x10na' or path to a PSF saved as a numpy file.
+        tilesize : tile size, tiles are planned to fit in memory and to be FFT-friendly if None.
+        tile_workers : number of tiles processed concurrently.
+        tile_batch_size : number of tiles of the same shape deconvolved together, Lucy-Richardson only.
+        other parameters : see dataset_deconv.
+        """
+        super().__init__(checkpoint)
+        if method not in ("lr", "admm"):
+            raise ValueError(f"Unknown deconvolution mode: {method}")
+        if method == "admm" and tile_batch_size > 1:
+            raise ValueError("Batches of tiles are only supported by Lucy-Richardson deconvolution.")
+        self.method = method
+        self.num_iterations = num_iterations
+        self.accelerate = accelerate
+        self.tolerance = tolerance
+        self.max_correction = max_correction
+        self.power = power
+        self.blind_spot = blind_spot
+        self.back_projection = back_projection
+        self.wb_order = wb_order
+        self.tilesize = tilesize
+        self.tile_workers = tile_workers
+        self.tile_batch_size = tile_batch_size
+
+        psf_kwargs = dict(dxy=psf_dxy, dz=psf_dz, xy_size=psf_xy_size, z_size=psf_z_size)
+        if psf_na is not None:
+            psf_kwargs["NA"] = psf_na
+
+        if psf_objective == "nikon16x08na":
+            self.psf_kernel = nikon16x08na(**psf_kwargs)
+        elif psf_objective == "olympus20x10na":
+            self.psf_kernel = olympus20x10na(**psf_kwargs)
+        elif Path(psf_objective).exists():
+            self.psf_kernel = numpy.load(psf_objective)
+            if PSFGrid.is_grid(self.psf_kernel):
+                raise ValueError("PSF grids are not supported in pipelines, use 'dexp deconv' instead.")
+            psf_z_size = self.psf_kernel.shape[0] + 10
+            psf_xy_size = max(self.psf_kernel.shape[1:]) + 10
+        else:
+            raise RuntimeError(f"Object/path {psf_objective} not found.")
+
+        # transfer functions of the PSF are cached across iterations, tiles and time points:
+        self.convolve = FFTConvolver(mode="reflect", internal_dtype=numpy.float32)
+
+        self.margins = (psf_z_size, psf_xy_size, psf_xy_size)
+        # fft_convolve pads tiles by the PSF size before computing FFTs:
+        self.fft_padding = tuple(2 * (k // 2) + k - 1 for k in self.psf_kernel.shape)
+
+    def _deconv(self, image: xpArray) -> xpArray:
+        if self.method == "lr":
+            return lucy_richardson_deconvolution(
+                image=image,
+                psf=self.psf_kernel,
+                num_iterations=self.num_iterations,
+                max_correction=self.max_correction,
+                power=self.power,
+                blind_spot=self.blind_spot,
+                blind_spot_mode="median+uniform",
+                blind_spot_axis_exclusion=(0,),
+                wb_order=self.wb_order,
+                back_projection=self.back_projection,
+                convolve_method=self.convolve,
+                accelerate=self.accelerate,
+                tolerance=self.tolerance,
+            )
+        return admm_deconvolution(image, psf=self.psf_kernel, iterations=self.num_iterations, derivative=2)
+
+    def __call__(self, stacks: Dict[str, xpArray], time_point: int, index: int) -> Dict[str, xpArray]:
+        results = {}
+        for channel, stack in stacks.items():
+            dtype = numpy.float16 if self.method == "admm" else stack.dtype
+            if self.tilesize is None:
+                tiles, margins = plan_tiles(
+                    stack.shape,
+                    margins=self.margins,
+                    memory_budget=default_tile_memory_budget(self.tile_workers) // self.tile_batch_size,
+                    memory_factor=8,
+                    padding=self.fft_padding,
+                )
+            else:
+                tiles, margins = self.tilesize, self.margins
+
+            with asection(f"Deconvolving channel {channel} of shape: {stack.shape}, tiles: {tiles}"):
+                result = scatter_gather_i2i(
+                    self._deconv,
+                    stack,
+                    tiles=tiles,
+                    margins=margins,
+                    normalise=self.method == "admm",
+                    to_numpy=False,
+                    internal_dtype=dtype,
+                    workers=self.tile_workers,
+                    batch_size=self.tile_batch_size,
+                )
+            results[channel] = result.astype(dtype, copy=False)
+        return results
+
+
+class StabilizeStep(PipelineStep):
+    name = "stabilize"
+
+    def __init__(self, model: str, pad: bool = True, integral: bool = True, checkpoint: Optional[str] = None):
+        """
+        Applies a stabilisation model to each channel, as computed and saved by 'dexp stabilize'.
+
+        Parameters
+        ----------
+        model : path of the stabilisation model JSON file.
+        pad : pad stacks so that they fit in the stabilised frame.
+        integral : True to only apply integral translations.
+        """
+        super().__init__(checkpoint)
+        with open(model) as f:
+            self.model = from_json(f.read())
+        self.pad = pad
+        self.integral = integral
+
+    def __call__(self, stacks: Dict[str, xpArray], time_point: int, index: int) -> Dict[str, xpArray]:
+        if time_point >= len(self.model):
+            raise ValueError(f"No stabilisation model for time point {time_point}, model length: {len(self.model)}")
+        return {
+            channel: self.model.apply(stack, index=time_point, pad=self.pad, integral=self.integral)
+            for channel, stack in stacks.items()
+        }
+
+
+class ProjectionStep(PipelineStep):
+    name = "projrender"
+
+    def __init__(
+        self,
+        output_path: str,
+        axis: int = 0,
+        dir: int = -1,
+        mode: str = "colormax",
+        clim: Optional[Tuple[float, float]] = None,
+        attenuation: float = 0.05,
+        gamma: float = 1.0,
+        dlim: Optional[Tuple[float, float]] = None,
+        colormap: Optional[str] = None,
+        rgb_gamma: float = 1.0,
+        transparency: bool = False,
+        legend_size: float = 1.0,
+        legend_scale: float = 1.0,
+        legend_title: str = "color-coded depth (voxels)",
+        legend_position: str = "bottom_left",
+        legend_alpha: float = 1.0,
+        checkpoint: Optional[str] = None,
+    ):
+        """
+        Renders projections of each channel as PNG frames, see 'dexp projrender'. Stacks are passed through
+        unchanged so that rendering can happen at any point of a pipeline.
+
+        Parameters
+        ----------
+        output_path : folder of the frames, a folder per channel suffixed with the channel name if there are several.
+        other parameters : see project_image.
+        """
+        super().__init__(checkpoint)
+        self.output_path = output_path
+        self.kwargs = dict(
+            axis=axis,
+            dir=dir,
+            mode=mode,
+            clim=None if clim is None else tuple(clim),
+            attenuation=attenuation,
+            attenuation_min_density=0.002,
+            attenuation_filtering=4,
+            gamma=gamma,
+            cmap=colormap,
+            dlim=None if dlim is None else tuple(dlim),
+            rgb_gamma=rgb_gamma,
+            transparency=transparency,
+            legend_size=legend_size,
+            legend_scale=legend_scale,
+            legend_title=legend_title,
+            legend_position=legend_position,
+            legend_alpha=legend_alpha,
+        )
+
+    def __call__(self, stacks: Dict[str, xpArray], time_point: int, index: int) -> Dict[str, xpArray]:
+        for channel, stack in stacks.items():
+            output_path = self.output_path if len(stacks) == 1 else f"{self.output_path}_{channel}"
+            makedirs(output_path, exist_ok=True)
+            filename = join(output_path, f"frame_{index:05}.png")
+            with asection(f"Rendering channel {channel} of time point {time_point} as: {filename}"):
+                # project_image modifies its input, and stacks are passed on to the next steps:
+                projection = project_image(stack.copy(), **self.kwargs)
+                imageio.imwrite(filename, Backend.to_numpy(projection), compress_level=1)
+        return stacks
+
+
+_steps = {step.name: step for step in (FuseStep, DeconvStep, StabilizeStep, ProjectionStep)}
+
+
+def load_pipeline(spec: Union[str, Dict[str, Any]]) -> Tuple[List[PipelineStep], Dict[str, Any]]:
+    """
+    Builds pipeline steps from a specification, for example in YAML:
+
+        output_path: embryo_processed.zarr
+        steps:
+          - fuse:
+              equalise_mode: first
+          - deconv:
+              num_iterations: 8
+              checkpoint: embryo_deconv.zarr
+          - stabilize:
+              model: stabilization_model.json
+          - projrender:
+              output_path: embryo_frames
+              mode: colormax
+
+    Each step is given by its name ('fuse', 'deconv', 'stabilize' or 'projrender') and the arguments of the
+    corresponding step class. Any step can have a 'checkpoint' dataset in which its output is saved.
+
+    Parameters
+    ----------
+    spec : path of a YAML file, or specification already loaded as a dictionary.
+
+    Returns
+    -------
+    List of steps, and the other top level entries of the specification (e.g. 'output_path').
+    """
+    if isinstance(spec, str):
+        with open(spec) as stream:
+            spec = yaml.safe_load(stream)
+
+    spec = dict(spec)
+    steps = []
+    for entry in spec.pop("steps", []):
+        if isinstance(entry, str):
+            name, kwargs = entry, {}
+        elif isinstance(entry, dict) and len(entry) == 1:
+            name, kwargs = next(iter(entry.items()))
+            kwargs = kwargs or {}
+        else:
+            raise ValueError(f"Invalid pipeline step: {entry}, expected a step name or a mapping with a single name.")
+        if name not in _steps:
+            raise ValueError(f"Unknown pipeline step: '{name}', available steps: {list(_steps)}")
+        steps.append(_steps[name](**kwargs))
+
+    if not steps:
+        raise ValueError("Pipeline has no steps!")
+
+    return steps, spec
+
+
+def dataset_pipeline(
+    dataset: BaseDataset,
+    steps: Sequence[PipelineStep],
+    output_path: Optional[str],
+    channels: Sequence[str],
+    slicing=None,
+    store: str = "dir",
+    compression: str = "zstd",
+    compression_level: int = 3,
+    overwrite: bool = False,
+    workers: int = -1,
+    workersbackend: str = "threading",
+    devices: Optional[Sequence[int]] = (0,),
+    check: bool = True,
+    stop_at_exception: bool = True,
+):
+    """
+    Runs a chain of processing steps on each time point of a dataset, e.g. fusion, deconvolution, stabilisation and
+    rendering, within a single worker: stacks stay in memory (on the backend) from one step to the next,
+    and only the final output and the checkpoints of steps are saved.
+
+    Parameters
+    ----------
+    dataset : input dataset
+    steps : processing steps, see load_pipeline.
+    output_path : path of the dataset in which the output of the last step is saved, nothing is saved if None.
+    channels : input channels, all are given to the first step.
+    slicing : selected array slicing
+    store : type of store, can be 'dir', 'ndir', or 'zip'
+    compression : compression codec to be used ('zstd', 'blosclz', 'lz4', 'lz4hc', 'zlib' or 'snappy').
+    compression_level : An integer between 0 and 9 specifying the compression level.
+    overwrite : overwrite output datasets if they already exist
+    workers : number of time points processed concurrently, if -1 then one per device.
+    workersbackend : What backend to spawn workers with, only ‘threading’ keeps the state of steps consistent.
+    devices : CUDA devices to process on, None or empty to process on CPU.
+    check : Checking integrity of written files.
+    stop_at_exception : True to stop as soon as there is an exception during processing.
+    """
+    from dexp.datasets import ZDataset
+
+    channels = list(dataset._selected_channels(channels))
+    arrays = {channel: dataset.get_array(channel) for channel in channels}
+    shape = arrays[channels[0]].shape
+    aprint(f"Slicing with: {slicing}")
+    _, volume_slicing, time_points = slice_from_shape(shape, slicing)
+
+    with asection("Pipeline:"):
+        for step in steps:
+            aprint(step)
+
+    # destination datasets, channels are added once the shape of outputs is known:
+    mode = "w" + ("" if overwrite else "-")
+    destinations = [step.checkpoint for step in steps if step.checkpoint is not None]
+    if output_path is not None:
+        destinations.append(output_path)
+    if len(set(destinations)) != len(destinations):
+        raise ValueError(f"Output and checkpoint datasets must be distinct: {destinations}")
+    dest_datasets = {path: ZDataset(path, mode, store, parent=dataset) for path in destinations}
+
+    # CUDA devices, or None to process on CPU:
+    devices = resolve_devices(devices)
+
+    def process(i, device=None):
+        tp = time_points[i]
+        outputs = {}
+        with asection(f"Processing time point {i}/{len(time_points)} through {len(steps)} steps"):
+            with asection(f"Loading channels {channels}"):
+                stacks = {channel: numpy.asarray(array[tp][volume_slicing]) for channel, array in arrays.items()}
+                trace_io(read=sum(stack.nbytes for stack in stacks.values()))
+
+            if device is None:
+                backend = NumpyBackend()
+            else:
+                backend = BestBackend(device_id=device, exclusive=True, enable_unified_memory=True)
+
+            with backend:
+                stacks = {channel: Backend.to_backend(stack) for channel, stack in stacks.items()}
+                for step in steps:
+                    with asection(f"Step: {step.name}"):
+                        stacks = step(stacks, tp, i)
+                    if step.checkpoint is not None:
+                        # copies, as the next steps may modify stacks in place:
+                        outputs[step.checkpoint] = {
+                            channel: Backend.to_numpy(s, force_copy=True) for channel, s in stacks.items()
+                        }
+                if output_path is not None:
+                    outputs[output_path] = {channel: Backend.to_numpy(s) for channel, s in stacks.items()}
+
+        return outputs
+
+    def write_back(i, outputs):
+        for path, stacks in outputs.items():
+            dest_dataset = dest_datasets[path]
+            for channel, stack in stacks.items():
+                if channel not in dest_dataset.channels():
+                    dest_dataset.add_channel(
+                        channel,
+                        shape=(len(time_points),) + stack.shape,
+                        dtype=stack.dtype,
+                        codec=compression,
+                        clevel=compression_level,
+                    )
+                with asection(f"Saving channel {channel} of time point {i} in {path}, shape: {stack.shape}"):
+                    dest_dataset.write_stack(channel=channel, time_point=i, stack_array=stack)
+
+    # the first time point is processed alone, it sets the state of steps (e.g. equalisation ratios):
+    scheduler = TimePointScheduler(
+        workers=workers,
+        backend=workersbackend,
+        devices=devices,
+        stop_at_exception=stop_at_exception,
+        description="Processing pipeline",
+    )
+    scheduler.run(process, range(len(time_points)), footprint="measure", write_back=write_back)
+
+    for dest_dataset in dest_datasets.values():
+        aprint(dest_dataset.info())
+        if check:
+            dest_dataset.check_integrity()
+        dest_dataset.close()
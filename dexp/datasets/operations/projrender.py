@@ -4,11 +4,11 @@ from typing import Any, Sequence, Tuple
 
 import imageio
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 
 from dexp.datasets import BaseDataset
 from dexp.processing.color.projection import project_image
 from dexp.utils.backends import Backend, BestBackend
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
 
 
 def dataset_projection_rendering(
@@ -64,66 +64,56 @@ def dataset_projection_rendering(
         with asection("Rendering:"):
 
             def process(tp, _clim, device):
-                try:
-                    with asection(f"Rendering Frame     : {tp:05}"):
-
-                        filename = join(channel_output_path, f"frame_{tp:05}.png")
-
-                        if overwrite or not exists(filename):
-
-                            with asection("Loading stack..."):
-                                stack = array[tp].compute()
-
-                            with BestBackend(device, exclusive=True, enable_unified_memory=True):
-                                if _clim is not None:
-                                    aprint(f"Using provided min and max for contrast limits: {_clim}")
-                                    min_value, max_value = (float(strvalue) for strvalue in _clim.split(","))
-                                    _clim = (min_value, max_value)
-
-                                with asection(f"Projecting image of shape: {stack.shape} "):
-                                    projection = project_image(
-                                        stack,
-                                        axis=axis,
-                                        dir=dir,
-                                        mode=mode,
-                                        attenuation=attenuation,
-                                        attenuation_min_density=0.002,
-                                        attenuation_filtering=4,
-                                        gamma=gamma,
-                                        clim=_clim,
-                                        cmap=colormap,
-                                        dlim=dlim,
-                                        rgb_gamma=rgbgamma,
-                                        transparency=transparency,
-                                        legend_size=legendsize,
-                                        legend_scale=legendscale,
-                                        legend_title=legendtitle,
-                                        legend_title_color=legendtitlecolor,
-                                        legend_position=legendposition,
-                                        legend_alpha=legendalpha,
-                                    )
-
-                                with asection(f"Saving frame {tp} as: {filename}"):
-                                    imageio.imwrite(filename, Backend.to_numpy(projection), compress_level=1)
-
-                except Exception as error:
-                    aprint(error)
-                    aprint(f"Error occurred while processing time point {tp} !")
-                    import traceback
-
-                    traceback.print_exc()
-
-                    if stop_at_exception:
-                        raise error
-
-            if workers == -1:
-                workers = len(devices)
-            aprint(f"Number of workers: {workers}")
-
-            if workers > 1:
-                Parallel(n_jobs=workers, backend=workersbackend)(
-                    delayed(process)(tp, clim, devices[tp % len(devices)]) for tp in range(0, nbframes, step)
-                )
-            else:
-                for tp in range(0, nbframes, step):
-                    process(tp, clim, devices[0])
+                with asection(f"Rendering Frame     : {tp:05}"):
+
+                    filename = join(channel_output_path, f"frame_{tp:05}.png")
+
+                    if overwrite or not exists(filename):
+
+                        with asection("Loading stack..."):
+                            stack = array[tp].compute()
+
+                        with BestBackend(device, exclusive=True, enable_unified_memory=True):
+                            if _clim is not None:
+                                aprint(f"Using provided min and max for contrast limits: {_clim}")
+                                min_value, max_value = (float(strvalue) for strvalue in _clim.split(","))
+                                _clim = (min_value, max_value)
+
+                            with asection(f"Projecting image of shape: {stack.shape} "):
+                                projection = project_image(
+                                    stack,
+                                    axis=axis,
+                                    dir=dir,
+                                    mode=mode,
+                                    attenuation=attenuation,
+                                    attenuation_min_density=0.002,
+                                    attenuation_filtering=4,
+                                    gamma=gamma,
+                                    clim=_clim,
+                                    cmap=colormap,
+                                    dlim=dlim,
+                                    rgb_gamma=rgbgamma,
+                                    transparency=transparency,
+                                    legend_size=legendsize,
+                                    legend_scale=legendscale,
+                                    legend_title=legendtitle,
+                                    legend_title_color=legendtitlecolor,
+                                    legend_position=legendposition,
+                                    legend_alpha=legendalpha,
+                                )
+
+                            with asection(f"Saving frame {tp} as: {filename}"):
+                                imageio.imwrite(filename, Backend.to_numpy(projection), compress_level=1)
+
+            scheduler = TimePointScheduler(
+                workers=workers,
+                backend=workersbackend,
+                devices=devices,
+                stop_at_exception=stop_at_exception,
+                description=f"Rendering channel {channel}",
+            )
+            scheduler.run(
+                lambda tp, device: process(tp, clim, device),
+                range(0, nbframes, step),
+                footprint=estimate_footprint(array.shape[1:], "f4", 4),
+            )
@@ -1,19 +1,22 @@
 from typing import List
 
-import dask
 import numpy
 import numpy as np
 from arbol.arbol import aprint, asection
-from dask.distributed import Client
-from dask_cuda import LocalCUDACluster
 
 from dexp.processing.multiview_lightsheet.fusion.simview import SimViewFusion
 from dexp.processing.registration.model.model_io import model_list_to_file
 from dexp.processing.registration.model.translation_registration_model import (
     TranslationRegistrationModel,
 )
-from dexp.utils.backends import Backend, BestBackend
+from dexp.utils.backends import Backend, BestBackend, NumpyBackend
+from dexp.utils.scheduler import (
+    TimePointScheduler,
+    estimate_footprint,
+    resolve_devices,
+)
 from dexp.utils.slicing import slice_from_shape
+from dexp.utils.tracing import trace_io
 
 
 def dataset_register(
@@ -33,6 +36,8 @@ def dataset_register(
     white_top_hat_size,
     white_top_hat_sampling,
     devices,
+    registration_pyramid_factor=1,
+    registration_upsample_factor=1,
     stop_at_exception=True,
 ):
 
@@ -49,79 +54,78 @@ def dataset_register(
     if microscope == "simview":
         views = SimViewFusion.validate_views(views)
 
-    @dask.delayed
-    def process(i):
+    def process(i, device=None):
         tp = time_points[i]
-        try:
-            with asection(f"Loading channels {channel} for time point {i}/{len(time_points)}"):
-                views_tp = {k: np.asarray(view[tp][volume_slicing]) for k, view in views.items()}
-
-            with BestBackend(exclusive=True, enable_unified_memory=True):
-                if microscope == "simview":
-                    fuse_obj = SimViewFusion(
-                        registration_model=None,
-                        equalise=equalise,
-                        equalisation_ratios=[None, None, None],
-                        zero_level=zero_level,
-                        clip_too_high=clip_too_high,
-                        fusion=fusion,
-                        fusion_bias_exponent=2,
-                        fusion_bias_strength_i=fusion_bias_strength_i,
-                        fusion_bias_strength_d=0.0,
-                        dehaze_before_fusion=True,
-                        dehaze_size=dehaze_size,
-                        dehaze_correct_max_level=True,
-                        dark_denoise_threshold=0,
-                        dark_denoise_size=0,
-                        butterworth_filter_cutoff=0.0,
-                        white_top_hat_size=white_top_hat_size,
-                        white_top_hat_sampling=white_top_hat_sampling,
-                        flip_camera1=True,
-                    )
-
-                    C0Lx, C1Lx = fuse_obj.preprocess(**views_tp)
-                    del views_tp
-                    Backend.current().clear_memory_pool()
-                    fuse_obj.compute_registration(
-                        C0Lx,
-                        C1Lx,
-                        mode="projection" if max_proj else "full",
-                        edge_filter=registration_edge_filter,
-                        crop_factor_along_z=0.3,
-                    )
-                    del C0Lx, C1Lx
-                    Backend.current().clear_memory_pool()
-                    model = fuse_obj.registration_model.to_numpy()
-                else:
-                    raise NotImplementedError
-
-            aprint(f"Done processing time point: {i}/{len(time_points)} .")
-
-        except Exception as error:
-            aprint(error)
-            aprint(f"Error occurred while processing time point {i} !")
-            import traceback
-
-            traceback.print_exc()
-
-            if stop_at_exception:
-                raise error
+        with asection(f"Loading channels {channel} for time point {i}/{len(time_points)}"):
+            views_tp = {k: np.asarray(view[tp][volume_slicing]) for k, view in views.items()}
+            trace_io(read=sum(view.nbytes for view in views_tp.values()))
+
+        if device is None:
+            backend = NumpyBackend()
+        else:
+            backend = BestBackend(device_id=device, exclusive=True, enable_unified_memory=True)
+
+        with backend:
+            if microscope == "simview":
+                fuse_obj = SimViewFusion(
+                    registration_model=None,
+                    equalise=equalise,
+                    equalisation_ratios=[None, None, None],
+                    zero_level=zero_level,
+                    clip_too_high=clip_too_high,
+                    fusion=fusion,
+                    fusion_bias_exponent=2,
+                    fusion_bias_strength_i=fusion_bias_strength_i,
+                    fusion_bias_strength_d=0.0,
+                    dehaze_before_fusion=True,
+                    dehaze_size=dehaze_size,
+                    dehaze_correct_max_level=True,
+                    dark_denoise_threshold=0,
+                    dark_denoise_size=0,
+                    butterworth_filter_cutoff=0.0,
+                    white_top_hat_size=white_top_hat_size,
+                    white_top_hat_sampling=white_top_hat_sampling,
+                    flip_camera1=True,
+                )
+
+                C0Lx, C1Lx = fuse_obj.preprocess(**views_tp)
+                del views_tp
+                Backend.current().clear_memory_pool()
+                fuse_obj.compute_registration(
+                    C0Lx,
+                    C1Lx,
+                    mode="projection" if max_proj else "full",
+                    edge_filter=registration_edge_filter,
+                    crop_factor_along_z=0.3,
+                    pyramid_factor=registration_pyramid_factor,
+                    upsample_factor=registration_upsample_factor,
+                )
+                del C0Lx, C1Lx
+                Backend.current().clear_memory_pool()
+                model = fuse_obj.registration_model.to_numpy()
+            else:
+                raise NotImplementedError
+
+        aprint(f"Done processing time point: {i}/{len(time_points)} .")
 
         return model
 
-    cluster = LocalCUDACluster(CUDA_VISIBLE_DEVICES=devices)
-    client = Client(cluster)
-    aprint("Dask Client", client)
-
-    lazy_computations = []
-    for i in range(len(time_points)):
-        lazy_computations.append(process(i))
+    # CUDA devices, or None to process on CPU with a pool of processes:
+    devices = resolve_devices(devices)
 
-    models = dask.compute(*lazy_computations)
+    scheduler = TimePointScheduler(
+        backend="threading" if devices is not None else "loky",
+        devices=devices,
+        stop_at_exception=stop_at_exception,
+        description="Registering views",
+        threads_per_worker=None if devices is not None else 0,
+    )
+    footprint = sum(estimate_footprint(view.shape[1:], numpy.float32, 3) for view in views.values())
+    models = scheduler.run(process, range(len(time_points)), footprint=footprint)
+    models = [model for model in models if model is not None]
 
     mode_model = compute_median_translation(models)
     model_list_to_file(model_path, [mode_model])
-    client.close()
 
 
 def compute_median_translation(models: List[TranslationRegistrationModel]) -> TranslationRegistrationModel:
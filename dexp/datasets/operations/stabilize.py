@@ -1,18 +1,22 @@
+import os
 from typing import Optional, Sequence
 
 import numpy
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 
 from dexp.datasets import BaseDataset
 from dexp.processing.registration.model.model_io import from_json
 from dexp.processing.registration.model.sequence_registration_model import (
     SequenceRegistrationModel,
 )
-from dexp.processing.registration.sequence import image_stabilisation
+from dexp.processing.registration.sequence import (
+    image_stabilisation,
+    image_stabilisation_incremental,
+)
 from dexp.processing.registration.sequence_proj import image_stabilisation_proj_
 from dexp.utils.backends import BestBackend, NumpyBackend
 from dexp.utils.misc import compute_num_workers
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
 
 
 def _compute_model(
@@ -31,11 +35,15 @@ def _compute_model(
     denoise_input_sigma: float,
     log_compression: bool,
     edge_filter: bool,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
     detrend: bool = False,
     maxproj: bool = True,
     device: int = 0,
     workers: int = 1,
     debug_output=None,
+    incremental: bool = False,
+    model_path: Optional[str] = None,
 ) -> SequenceRegistrationModel:
 
     # get channel array:
@@ -50,7 +58,39 @@ def _compute_model(
 
     workers = compute_num_workers(workers, array.shape[0])
 
-    if not maxproj:
+    if incremental:
+        # extends the model previously saved, only the new time points are registered:
+        model = None
+        if model_path is not None and os.path.exists(model_path):
+            with open(model_path) as f:
+                model = from_json(f.read())
+            aprint(f"Extending model of {len(model)} time points from: {model_path}")
+
+        with BestBackend(device, enable_unified_memory=True):
+            model = image_stabilisation_incremental(
+                image=array,
+                axis=0,
+                model=model,
+                max_range=max_range,
+                min_confidence=min_confidence,
+                enable_com=enable_com,
+                quantile=quantile,
+                tolerance=tolerance,
+                order_error=order_error,
+                order_reg=order_reg,
+                alpha_reg=alpha_reg,
+                sigma=phase_correlogram_sigma,
+                denoise_input_sigma=denoise_input_sigma,
+                log_compression=log_compression,
+                edge_filter=edge_filter,
+                pyramid_factor=pyramid_factor,
+                upsample_factor=upsample_factor,
+                internal_dtype=numpy.float16,
+                workers=workers,
+            )
+            model.to_numpy()
+
+    elif not maxproj:
         with BestBackend(device, enable_unified_memory=True):
             model = image_stabilisation(
                 image=array,
@@ -69,6 +109,8 @@ def _compute_model(
                 denoise_input_sigma=denoise_input_sigma,
                 log_compression=log_compression,
                 edge_filter=edge_filter,
+                pyramid_factor=pyramid_factor,
+                upsample_factor=upsample_factor,
                 internal_dtype=numpy.float16,
                 workers=workers,
                 debug_output=debug_output,
@@ -101,6 +143,8 @@ def _compute_model(
                 denoise_input_sigma=denoise_input_sigma,
                 log_compression=log_compression,
                 edge_filter=edge_filter,
+                pyramid_factor=pyramid_factor,
+                upsample_factor=upsample_factor,
                 ndim=ndim - 1,
                 internal_dtype=numpy.float16,
                 debug_output=debug_output,
@@ -135,6 +179,8 @@ def dataset_stabilize(
     denoise_input_sigma: float = 1.5,
     log_compression: bool = True,
     edge_filter: bool = False,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
     pad: bool = True,
     integral: bool = True,
     detrend: bool = False,
@@ -145,6 +191,7 @@ def dataset_stabilize(
     check: bool = True,
     stop_at_exception: bool = True,
     debug_output=None,
+    incremental: bool = False,
 ):
     """
     Takes an input dataset and performs image stabilisation and outputs a stabilised dataset
@@ -174,6 +221,9 @@ def dataset_stabilize(
     log_compression : Applies the function log1p to the images to compress high-intensities
         (usefull when very (too) bright structures are present in the images, such as beads).
     edge_filter : apply sobel edge filter to input images.
+    pyramid_factor : if larger than one, pairwise shifts are first estimated on correlograms downsampled by this
+        factor and then refined at full resolution.
+    upsample_factor : pairwise shifts are estimated with a precision of 1/upsample_factor pixel.
     pad: pad input dataset.
     integral: Set to True to only allow integral translations, False to allow subpixel accurate
         translations (induces blur!).
@@ -184,16 +234,33 @@ def dataset_stabilize(
     device: Sets the CUDA devices id, e.g. 0,1,2
     check: Checking integrity of written file.
     stop_at_exception: True to stop as soon as there is an exception during processing.
+    incremental: stabilises only the time points added to the input dataset since the last (incremental) run, for
+        example during an acquisition. The models saved at the model output path(s) are extended, see
+        'image_stabilisation_incremental', and the new time points are appended to the output dataset. The padding of
+        the output dataset is fixed when it is created, larger shifts of later time points wrap around.
     """
 
     if model_input_path is not None and reference_channel is not None:
         raise ValueError("`model_input_path` and `reference channel` cannot be supplied at the same time.")
 
+    if incremental and (model_input_path is not None or overwrite):
+        raise ValueError("Incremental stabilisation cannot use `model_input_path` nor overwrite the output.")
+
     from dexp.datasets import ZDataset
 
-    mode = "w" + ("" if overwrite else "-")
+    mode = "a" if incremental else "w" + ("" if overwrite else "-")
     dest_dataset = ZDataset(output_path, mode, zarr_store, parent=dataset)
 
+    if incremental:
+        # checked before any model is extended, the padding of existing channels is only known from incremental runs:
+        paddings = dest_dataset.get_metadata().get("stabilization_padding", {})
+        for channel in dataset._selected_channels(channels):
+            if channel in dest_dataset.channels() and channel not in paddings:
+                raise ValueError(
+                    f"Channel {channel} of {output_path} was not created by an incremental stabilisation, "
+                    "incremental mode requires an output dataset created by an incremental run."
+                )
+
     model = None
     if model_input_path is not None:
         with open(model_input_path) as f:
@@ -218,17 +285,22 @@ def dataset_stabilize(
             denoise_input_sigma=denoise_input_sigma,
             log_compression=log_compression,
             edge_filter=edge_filter,
+            pyramid_factor=pyramid_factor,
+            upsample_factor=upsample_factor,
             detrend=detrend,
             maxproj=maxproj,
             device=device,
             workers=workers,
             debug_output=debug_output,
+            incremental=incremental,
+            model_path=model_output_path,
         )
         with open(model_output_path, mode="w") as f:
             f.write(model.to_json())
 
     for channel in dataset._selected_channels(channels):
         if model is None:
+            formatted_path = f"{model_output_path.split('.')[0]}_{channel}.json"
             channel_model = _compute_model(
                 input_dataset=dataset,
                 channel=channel,
@@ -245,13 +317,16 @@ def dataset_stabilize(
                 denoise_input_sigma=denoise_input_sigma,
                 log_compression=log_compression,
                 edge_filter=edge_filter,
+                pyramid_factor=pyramid_factor,
+                upsample_factor=upsample_factor,
                 detrend=detrend,
                 maxproj=maxproj,
                 device=device,
                 workers=workers,
                 debug_output=debug_output,
+                incremental=incremental,
+                model_path=formatted_path,
             )
-            formatted_path = f"{model_output_path.split('.')[0]}_{channel}.json"
             with open(formatted_path, mode="w") as f:
                 f.write(channel_model.to_json())
 
@@ -294,43 +369,57 @@ def dataset_stabilize(
         # Shape of the resulting array:
         padded_shape = (nb_timepoints,) + channel_model.padded_shape(shape[1:])
 
-        dest_dataset.add_channel(
-            name=channel, shape=padded_shape, dtype=dtype, codec=compression_codec, clevel=compression_level
-        )
+        first_timepoint = 0
+        padding = None
+        if incremental:
+            # the padding is fixed when the channel is created, new time points are appended to the channel:
+            paddings = dest_dataset.get_metadata().get("stabilization_padding", {})
+            if channel in dest_dataset.channels():
+                first_timepoint = dest_dataset.nb_timepoints(channel)
+                padding = tuple(tuple(p) for p in paddings[channel])
+                padded_shape = (nb_timepoints,) + dest_dataset.shape(channel)[1:]
+                dest_dataset.resize_timepoints(channel, nb_timepoints)
+            else:
+                padding = channel_model.padding() if pad else tuple((0, 0) for _ in shape[1:])
+                padded_shape = (nb_timepoints,) + tuple(s + pl + pr for s, (pl, pr) in zip(shape[1:], padding))
+                dest_dataset.append_metadata({"stabilization_padding": {**paddings, channel: padding}})
+            aprint(f"Stabilizing time points {first_timepoint} to {nb_timepoints - 1} with padding: {padding}")
+
+        if channel not in dest_dataset.channels():
+            dest_dataset.add_channel(
+                name=channel, shape=padded_shape, dtype=dtype, codec=compression_codec, clevel=compression_level
+            )
 
         # definition of function that processes each time point:
         def process(tp):
-            try:
-                with asection(f"Processing time point: {tp}/{nb_timepoints} ."):
-                    with asection("Loading stack"):
-                        tp_array = array[tp].compute()
+            with asection(f"Processing time point: {tp}/{nb_timepoints} ."):
+                with asection("Loading stack"):
+                    tp_array = array[tp].compute()
 
-                    with NumpyBackend():
-                        with asection("Applying model..."):
+                with NumpyBackend():
+                    with asection("Applying model..."):
+                        if padding is None:
                             tp_array = channel_model.apply(tp_array, index=tp, pad=pad, integral=integral)
+                        else:
+                            tp_array = numpy.pad(tp_array, pad_width=padding)
+                            tp_array = channel_model[tp].apply(tp_array, integral=integral)
 
-                    with asection(
-                        f"Saving stabilized stack for time point {tp}/{nb_timepoints}, shape:{tp_array.shape}, "
-                        + "dtype:{array.dtype}"
-                    ):
-                        dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=tp_array)
-
-            except Exception as error:
-                aprint(error)
-                aprint(f"Error occurred while processing time point {tp}/{nb_timepoints} !")
-                import traceback
-
-                traceback.print_exc()
-                if stop_at_exception:
-                    raise error
+                with asection(
+                    f"Saving stabilized stack for time point {tp}/{nb_timepoints}, shape:{tp_array.shape}, "
+                    + "dtype:{array.dtype}"
+                ):
+                    dest_dataset.write_stack(channel=channel, time_point=tp, stack_array=tp_array)
 
         # start jobs:
-        if workers == 1:
-            for tp in range(0, nb_timepoints):
-                process(tp)
-        else:
-            n_jobs = compute_num_workers(workers, nb_timepoints)
-            Parallel(n_jobs=n_jobs, backend=workers_backend)(delayed(process)(tp) for tp in range(0, nb_timepoints))
+        scheduler = TimePointScheduler(
+            workers=workers,
+            backend=workers_backend,
+            stop_at_exception=stop_at_exception,
+            description=f"Stabilizing channel {channel}",
+        )
+        scheduler.run(
+            process, range(first_timepoint, nb_timepoints), footprint=estimate_footprint(padded_shape[1:], dtype, 3)
+        )
 
     # printout output dataset info:
     aprint(dest_dataset.info())
@@ -3,11 +3,11 @@ from os.path import join
 from typing import Sequence, Union
 
 from arbol.arbol import aprint, asection
-from joblib import Parallel, delayed
 from tifffile import memmap
 
 from dexp.datasets import BaseDataset
 from dexp.io.io import tiff_save
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
 
 
 def dataset_tiff(
@@ -20,7 +20,7 @@ def dataset_tiff(
     one_file_per_first_dim: bool = False,
     clevel: int = 0,
     workers: int = 1,
-    workersbackend: str = "",
+    workersbackend: str = "threading",
     stop_at_exception: bool = True,
 ):
 
@@ -34,54 +34,44 @@ def dataset_tiff(
         arrays = list(array[slicing] for array in arrays)
         aprint("Done slicing.")
 
-    if workers == -1:
-        workers = max(1, os.cpu_count() // abs(workers))
-    aprint(f"Number of workers: {workers}")
-
     if one_file_per_first_dim:
         aprint(f"Saving one TIFF file for each tp (or Z if already sliced) to: {dest_path}.")
 
         os.makedirs(dest_path, exist_ok=True)
 
         def process(tp):
-            try:
-                with asection(f"Saving time point {tp}: "):
-                    for channel, array in zip(selected_channels, arrays):
-                        tiff_file_path = join(dest_path, f"file{tp}_{channel}.tiff")
-                        if overwrite or not os.path.exists(tiff_file_path):
-                            stack = array[tp].compute()
-
-                            if project is not False and type(project) == int:
-                                # project is the axis for projection, but here we are not considering
-                                # the T dimension anymore...
-                                aprint(f"Projecting along axis {project}")
-                                stack = stack.max(axis=project)
-
-                            aprint(
-                                f"Writing time point: {tp} of shape: {stack.shape}, dtype:{stack.dtype} "
-                                + f"as TIFF file: '{tiff_file_path}', with compression: {clevel}"
-                            )
-                            tiff_save(tiff_file_path, stack, compress=clevel)
-                            aprint(f"Done writing time point: {tp} !")
-                        else:
-                            aprint(f"File for time point (or z slice): {tp} already exists.")
-            except Exception as error:
-                aprint(error)
-                aprint(f"Error occurred while processing time point {tp} !")
-                import traceback
-
-                traceback.print_exc()
-
-                if stop_at_exception:
-                    raise error
-
-        if workers > 1:
-            Parallel(n_jobs=workers, backend=workersbackend)(
-                delayed(process)(tp) for tp in range(0, arrays[0].shape[0])
-            )
-        else:
-            for tp in range(0, arrays[0].shape[0]):
-                process(tp)
+            with asection(f"Saving time point {tp}: "):
+                for channel, array in zip(selected_channels, arrays):
+                    tiff_file_path = join(dest_path, f"file{tp}_{channel}.tiff")
+                    if overwrite or not os.path.exists(tiff_file_path):
+                        stack = array[tp].compute()
+
+                        if project is not False and type(project) == int:
+                            # project is the axis for projection, but here we are not considering
+                            # the T dimension anymore...
+                            aprint(f"Projecting along axis {project}")
+                            stack = stack.max(axis=project)
+
+                        aprint(
+                            f"Writing time point: {tp} of shape: {stack.shape}, dtype:{stack.dtype} "
+                            + f"as TIFF file: '{tiff_file_path}', with compression: {clevel}"
+                        )
+                        tiff_save(tiff_file_path, stack, compress=clevel)
+                        aprint(f"Done writing time point: {tp} !")
+                    else:
+                        aprint(f"File for time point (or z slice): {tp} already exists.")
+
+        scheduler = TimePointScheduler(
+            workers=workers,
+            backend=workersbackend,
+            stop_at_exception=stop_at_exception,
+            description="Saving TIFF files",
+        )
+        scheduler.run(
+            process,
+            range(0, arrays[0].shape[0]),
+            footprint=sum(estimate_footprint(array.shape[1:], array.dtype) for array in arrays),
+        )
 
     else:
 
@@ -120,13 +110,15 @@ def dataset_tiff(
 
                     memmap_image[tp] = stack
 
-                if workers > 1:
-                    Parallel(n_jobs=workers, backend=workersbackend)(
-                        delayed(process)(tp) for tp in range(0, array.shape[0])
-                    )
-                else:
-                    for tp in range(0, array.shape[0]):
-                        process(tp)
+                scheduler = TimePointScheduler(
+                    workers=workers,
+                    backend=workersbackend,
+                    stop_at_exception=stop_at_exception,
+                    description=f"Saving channel {channel}",
+                )
+                scheduler.run(
+                    process, range(0, array.shape[0]), footprint=estimate_footprint(array.shape[1:], array.dtype)
+                )
 
                 memmap_image.flush()
                 del memmap_image
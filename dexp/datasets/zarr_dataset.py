@@ -11,13 +11,15 @@ import numpy
 import zarr
 from arbol.arbol import aprint, asection
 from ome_zarr.format import CurrentFormat
-from zarr import Blosc, CopyError, Group, convenience, open_group
+from zarr import Blosc, CopyError, Group, open_group
 
 from dexp.datasets.base_dataset import BaseDataset
 from dexp.datasets.ome_dataset import default_omero_metadata
 from dexp.datasets.stack_iterator import StackIterator
+from dexp.datasets.zarr_passthrough import raw_copy_array
 from dexp.utils.backends import Backend
 from dexp.utils.config import config_blosc
+from dexp.utils.tracing import trace_io
 
 
 class ZDataset(BaseDataset):
@@ -163,6 +165,13 @@ class ZDataset(BaseDataset):
                 elif (item_name.startswith(channel) or item_name.startswith("fused")) and "_projection_" in item_name:
                     self._projections[item_name] = array
 
+    def reload(self) -> None:
+        """
+        Reloads the channels and projections of the dataset, picking up those added by other processes since the
+        dataset was opened.
+        """
+        self._initialise_existing()
+
     def _get_group_for_channel(self, channel: str) -> Union[None, Sequence[Group]]:
         groups = [g for c, g in self._root_group.groups() if c == channel]
         if len(groups) == 0:
@@ -326,6 +335,7 @@ class ZDataset(BaseDataset):
     def write_stack(self, channel: str, time_point: int, stack_array: numpy.ndarray):
         array_in_zarr = self.get_array(channel=channel, wrap_with_dask=False)
         array_in_zarr[time_point] = stack_array
+        trace_io(written=stack_array.nbytes)
 
         for axis in range(stack_array.ndim):
             xp = Backend.get_xp_module()
@@ -343,6 +353,24 @@ class ZDataset(BaseDataset):
             projection_in_zarr = self.get_projection_array(channel=channel, axis=axis, wrap_with_dask=False)
             projection_in_zarr[...] = projection
 
+    def resize_timepoints(self, channel: str, nb_timepoints: int):
+        """Changes the number of time points of a channel and of its projections, for example to append stacks to
+        a dataset that is still being acquired. New time points are filled with the fill value of the channel.
+
+        Parameters
+        ----------
+        channel : name of channel.
+        nb_timepoints : new number of time points.
+        """
+        array = self.get_array(channel, wrap_with_dask=False)
+        aprint(f"Resizing channel: '{channel}' from {array.shape[0]} to {nb_timepoints} time points")
+        array.resize((nb_timepoints,) + array.shape[1:])
+
+        for axis in range(array.ndim - 1):
+            projection = self.get_projection_array(channel=channel, axis=axis, wrap_with_dask=False)
+            if projection is not None:
+                projection.resize((nb_timepoints,) + projection.shape[1:])
+
     def add_channel(
         self,
         name: str,
@@ -436,6 +464,7 @@ class ZDataset(BaseDataset):
         store: str = None,
         add_projections: bool = True,
         overwrite: bool = True,
+        workers: int = -4,
     ):
         """Adds channels from this zarr dataset into an other possibly existing zarr dataset
 
@@ -447,6 +476,8 @@ class ZDataset(BaseDataset):
         store: type of zarr store: 'dir' or 'zip', only usefull if store does not exist yet!
         add_projections: If True the projections are also copied.
         overwrite: overwrite destination (not fully functional for zip stores!)
+        workers: number of threads used to copy the compressed chunks,
+            negative numbers n correspond to: number_of_cores / |n|
 
         """
 
@@ -477,19 +508,14 @@ class ZDataset(BaseDataset):
                 for name, array in source_arrays:
                     if name in self.channels():
                         aprint(f"Fast copying array {name} to {new_name}")
-                        convenience.copy(
-                            source=array, dest=dest_group, name=new_name, if_exists="replace" if overwrite else "raise"
-                        )
+                        self._raw_copy_array(array, dest_group, new_name, overwrite, workers)
 
                         if add_projections:
                             ndim = array.ndim - 1
                             for axis in range(ndim):
                                 proj_array = self.get_projection_array(channel=channel, axis=axis, wrap_with_dask=False)
-                                convenience.copy(
-                                    source=proj_array,
-                                    dest=dest_group,
-                                    name=self._projection_name(new_name, axis),
-                                    if_exists="replace" if overwrite else "raise",
+                                self._raw_copy_array(
+                                    proj_array, dest_group, self._projection_name(new_name, axis), overwrite, workers
                                 )
 
             except (CopyError, NotImplementedError):
@@ -497,6 +523,26 @@ class ZDataset(BaseDataset):
 
         zdataset.close()
 
+    @staticmethod
+    def _raw_copy_array(source: zarr.Array, dest_group: Group, name: str, overwrite: bool, workers: int) -> None:
+        # Creates an array of identical layout and copies the compressed chunks without decoding them:
+        if name in dest_group and not overwrite:
+            raise CopyError(f"Array {name} already exists in destination.")
+
+        dest = dest_group.create(
+            name=name,
+            shape=source.shape,
+            chunks=source.chunks,
+            dtype=source.dtype,
+            compressor=source.compressor,
+            fill_value=source.fill_value,
+            order=source.order,
+            filters=source.filters,
+            overwrite=True,
+        )
+        dest.attrs.update(source.attrs.asdict())
+        raw_copy_array(source, dest, workers=workers)
+
     def get_resolution(self, channel: Optional[str] = None) -> List[float]:
         """
         Gets pixel resolution.
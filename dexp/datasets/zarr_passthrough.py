@@ -0,0 +1,127 @@
+import itertools
+from typing import Any, Iterator, Tuple
+
+import numpy
+import zarr
+from joblib import Parallel, delayed
+
+from dexp.utils.misc import compute_num_workers
+
+
+def is_full_volume_slicing(volume_slicing: Any) -> bool:
+    """Returns True if the given volume slicing (slicing without the time axis) selects the whole volume."""
+    if volume_slicing is Ellipsis:
+        return True
+    if isinstance(volume_slicing, tuple):
+        return all(s is Ellipsis or s == slice(None) for s in volume_slicing)
+    return volume_slicing == slice(None)
+
+
+def raw_copy_compatible(source: Any, dest: Any) -> bool:
+    """
+    Checks if the compressed chunks of the source array can be copied as-is into the destination array.
+    This requires both to be zarr arrays with identical chunking, dtype, codec, filters, fill value and memory order,
+    and a chunking of one along time so that any time point maps to its own set of chunks.
+
+    Parameters
+    ----------
+    source : source array
+    dest : destination array
+
+    Returns
+    -------
+    True if raw chunk passthrough is possible.
+    """
+    if not isinstance(source, zarr.Array) or not isinstance(dest, zarr.Array):
+        return False
+
+    return (
+        source.shape[1:] == dest.shape[1:]
+        and source.chunks == dest.chunks
+        and source.chunks[0] == 1
+        and source.dtype == dest.dtype
+        and source.order == dest.order
+        and source.compressor == dest.compressor
+        and (source.filters or None) == (dest.filters or None)
+        and _same_fill_value(source.fill_value, dest.fill_value)
+    )
+
+
+def raw_copy_time_point(source: zarr.Array, dest: zarr.Array, source_time_point: int, dest_time_point: int) -> int:
+    """
+    Copies the compressed chunks of a time point from one zarr array to another without decoding them.
+    Chunks that are not initialised in the source are removed from the destination so that both read as fill value.
+
+    Parameters
+    ----------
+    source : source zarr array
+    dest : destination zarr array, must be compatible (see raw_copy_compatible)
+    source_time_point : time point to read from the source
+    dest_time_point : time point to write in the destination
+
+    Returns
+    -------
+    Number of compressed bytes copied.
+    """
+    nb_bytes = 0
+    for coords in _chunk_coords(source.cdata_shape[1:]):
+        nb_bytes += _copy_chunk(source, dest, (source_time_point,) + coords, (dest_time_point,) + coords)
+    return nb_bytes
+
+
+def raw_copy_array(source: zarr.Array, dest: zarr.Array, workers: int = -4) -> int:
+    """
+    Copies all compressed chunks from one zarr array to another compatible array, in parallel, without decoding.
+    Unlike raw_copy_time_point, this does not require chunking of one along time, only identical layouts.
+
+    Parameters
+    ----------
+    source : source zarr array
+    dest : destination zarr array of same shape, chunks, dtype and codec
+    workers : number of worker threads, negative numbers n correspond to: number_of_cores / |n|
+
+    Returns
+    -------
+    Number of compressed bytes copied.
+    """
+    if source.shape != dest.shape or source.chunks != dest.chunks:
+        raise ValueError(
+            f"Incompatible arrays for raw copy: {source.shape}/{source.chunks} -> {dest.shape}/{dest.chunks}"
+        )
+
+    all_coords = list(_chunk_coords(source.cdata_shape))
+    n_jobs = compute_num_workers(workers, len(all_coords))
+
+    nb_bytes = Parallel(n_jobs=n_jobs, backend="threading")(
+        delayed(_copy_chunk)(source, dest, coords, coords) for coords in all_coords
+    )
+    return sum(nb_bytes)
+
+
+def _copy_chunk(source: zarr.Array, dest: zarr.Array, source_coords: Tuple[int], dest_coords: Tuple[int]) -> int:
+    source_key = source._chunk_key(source_coords)
+    dest_key = dest._chunk_key(dest_coords)
+    try:
+        data = source.chunk_store[source_key]
+    except KeyError:
+        # uninitialised chunk, we make sure the destination reads as fill value too:
+        try:
+            del dest.chunk_store[dest_key]
+        except (KeyError, NotImplementedError):
+            pass
+        return 0
+    dest.chunk_store[dest_key] = data
+    return len(data)
+
+
+def _chunk_coords(cdata_shape: Tuple[int]) -> Iterator[Tuple[int]]:
+    return itertools.product(*(range(c) for c in cdata_shape))
+
+
+def _same_fill_value(a: Any, b: Any) -> bool:
+    if a is None or b is None:
+        return a is b
+    try:
+        return bool(numpy.array_equal(a, b, equal_nan=True))
+    except TypeError:
+        return bool(numpy.array_equal(a, b))
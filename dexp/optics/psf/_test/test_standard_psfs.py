@@ -0,0 +1,56 @@
+import os
+from pathlib import Path
+
+import numpy
+
+from dexp.optics.psf.microscope_psf import MicroscopePSF
+from dexp.optics.psf.standard_psfs import nikon16x08na
+
+
+def test_psf_disk_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv("DEXP_CACHE_DIR", raising=False)
+    monkeypatch.setenv("HOME", str(tmp_path))
+
+    psf = nikon16x08na(xy_size=9, z_size=7)
+    cached = os.listdir(tmp_path / ".dexp" / "psfs")
+    assert len(cached) == 1
+    assert numpy.isclose(psf.sum(), 1)
+
+    # the same parameters load the cached PSF:
+    assert numpy.array_equal(nikon16x08na(xy_size=9, z_size=7), psf)
+    assert os.listdir(tmp_path / ".dexp" / "psfs") == cached
+
+    # any other parameter gives another PSF:
+    other = nikon16x08na(xy_size=9, z_size=7, NA=0.5)
+    assert len(os.listdir(tmp_path / ".dexp" / "psfs")) == 2
+    assert not numpy.allclose(other, psf)
+
+
+def test_psf_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv("DEXP_CACHE_DIR", str(tmp_path / "cache"))
+    psf = nikon16x08na(xy_size=9, z_size=7)
+    assert len(os.listdir(tmp_path / "cache" / "psfs")) == 1
+
+    # PSFs are still computed when the cache directory cannot be created:
+    (tmp_path / "file").touch()
+    monkeypatch.setenv("DEXP_CACHE_DIR", str(tmp_path / "file"))
+    assert numpy.array_equal(nikon16x08na(xy_size=9, z_size=7), psf)
+
+    # or when there is no home directory:
+    def no_home():
+        raise RuntimeError("Could not determine home directory.")
+
+    monkeypatch.delenv("DEXP_CACHE_DIR")
+    monkeypatch.setattr(Path, "home", no_home)
+    assert numpy.array_equal(nikon16x08na(xy_size=9, z_size=7), psf)
+
+
+def test_psf_bessel_series_vs_integration():
+    psf = MicroscopePSF()
+    rv = numpy.arange(0.0, 1.01, 0.1)
+    pv = numpy.arange(1.0, 3.01, 0.2)
+
+    fast_rz = psf.gLZRParticleScan(rv, pv, zv=-2.0)
+    slow_rz = psf.gLZRParticleScanSlow(rv, pv, zv=-2.0)
+
+    assert numpy.allclose(fast_rz, slow_rz, rtol=1.0e-3, atol=1.0e-3)
@@ -371,13 +371,14 @@ class MicroscopePSF:
         xy = numpy.mgrid[0:xy_size, 0:xy_size] + 0.5
         r_pixel = dxy * numpy.sqrt((xy[1] - c_xy) * (xy[1] - c_xy) + (xy[0] - c_xy) * (xy[0] - c_xy))
 
-        # Create XYZ PSF by interpolation.
-        PSF_xyz = numpy.zeros((PSF_rz.shape[0], xy_size, xy_size))
-        for i in range(PSF_rz.shape[0]):
-            psf_rz_interp = scipy.interpolate.interp1d(rv, PSF_rz[i, :])
-            PSF_xyz[i, :, :] = psf_rz_interp(r_pixel.ravel()).reshape(xy_size, xy_size)
+        # Create XYZ PSF by linear interpolation, the radii being the same for all z, so are the weights:
+        if r_pixel.max() > rv[-1]:
+            raise ValueError("Radius values do not cover the PSF.")
+        index = numpy.clip(numpy.searchsorted(rv, r_pixel.ravel(), side="right") - 1, 0, rv.size - 2)
+        weight = (r_pixel.ravel() - rv[index]) / (rv[index + 1] - rv[index])
+        PSF_xyz = PSF_rz[:, index] * (1.0 - weight) + PSF_rz[:, index + 1] * weight
 
-        return PSF_xyz
+        return PSF_xyz.reshape(PSF_rz.shape[0], xy_size, xy_size)
 
     def slowGL(self, max_rho, rv, zv, pz, wvl, zd):
         """
@@ -422,6 +423,42 @@ class MicroscopePSF:
         t1 = k * a * a / (zd * zd)
         return t1 * (int_r * int_r + int_i * int_i)
 
+    def slowGLScan(self, max_rho, rv, zv, pz, wvl, zd):
+        """
+        Calculate the G-L PSF using integration, like slowGL, but for all radius and z values at once:
+        the integral is evaluated with adaptive vectorised quadrature over all points of the PSF together.
+
+        mp - The microscope parameters dictionary.
+        max_rho - The maximum rho value.
+        rv - A numpy array containing the radius values in microns.
+        zv - z offset values (of the coverslip) in microns, a scalar or an array of the size of pz.
+        pz - Particle z positions above the coverslip in microns, a scalar or an array of the size of zv.
+        wvl - Light wavelength in microns.
+        zd - Actual camera position in microns.
+
+        Returns an array of shape (number of z values, number of radius values).
+        """
+
+        mp = self.parameters
+
+        a = (
+            mp["NA"] * mp["zd0"] / math.sqrt(mp["M"] * mp["M"] + mp["NA"] * mp["NA"])
+        )  # Aperture radius at the back focal plane.
+        k = 2.0 * numpy.pi / wvl
+        ti = numpy.reshape(zv, (-1, 1)) + mp["ti0"]
+        pz = numpy.reshape(pz, (-1, 1))
+
+        b = k * a * numpy.reshape(rv, (1, -1)) * mp["M"] / zd
+
+        def integral_fn(rho):
+            t = scipy.special.jv(0, b * rho) * numpy.exp(1j * self.OPD(rho, ti, pz, wvl, zd)) * rho
+            return numpy.stack([t.real, t.imag])
+
+        integral, _ = scipy.integrate.quad_vec(integral_fn, 0.0, max_rho, norm="max")
+
+        t1 = k * a * a / (zd * zd)
+        return t1 * (integral[0] * integral[0] + integral[1] * integral[1])
+
     def gLZRFocalScanSlow(self, rv, zv, normalize=True, pz=0.0, wvl=0.6, zd=None):
         """
         This is the integration version of gLZRFocalScan.
@@ -444,10 +481,7 @@ class MicroscopePSF:
 
         [scaling_factor, max_rho] = self._configure(wvl)
 
-        psf_rz = numpy.zeros((zv.size, rv.size))
-        for i in range(zv.size):
-            for j in range(rv.size):
-                psf_rz[i, j] = self.slowGL(max_rho, rv[j], zv[i], pz, wvl, zd)
+        psf_rz = self.slowGLScan(max_rho, rv, zv, pz, wvl, zd)
 
         if normalize:
             psf_rz = psf_rz / numpy.max(psf_rz)
@@ -476,10 +510,7 @@ class MicroscopePSF:
 
         [scaling_factor, max_rho] = self._configure(wvl)
 
-        psf_rz = numpy.zeros((pz.size, rv.size))
-        for i in range(pz.size):
-            for j in range(rv.size):
-                psf_rz[i, j] = self.slowGL(max_rho, rv[j], zv, pz[i], wvl, zd)
+        psf_rz = self.slowGLScan(max_rho, rv, zv, pz, wvl, zd)
 
         if normalize:
             psf_rz = psf_rz / numpy.max(psf_rz)
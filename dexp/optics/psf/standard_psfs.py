@@ -1,3 +1,10 @@
+import hashlib
+import json
+import os
+from os.path import exists, join
+from pathlib import Path
+from typing import Optional
+
 import numpy
 from arbol import aprint
 
@@ -16,16 +23,66 @@ def olympus20x10na(xy_size=17, z_size=17, dxy=0.439, dz=1.8, wvl=0.561, NA=1.0):
     )
 
 
-def generate_psf(dxy, dz, xy_size, z_size, M=16, NA=0.8, n=1.33, wd=3000, tl=133.0 * 1.0e3, wvl=561.0):
+# Bumped whenever the PSF model changes, so that PSFs cached by previous versions are not reused:
+_psf_model_version = 1
+
+
+def generate_psf(
+    dxy, dz, xy_size, z_size, M=16, NA=0.8, n=1.33, wd=3000, tl=133.0 * 1.0e3, wvl=561.0, cache: bool = True
+):
     """
     Generates a 3D PSF array.
+    PSFs are memoised on disk in ~/.dexp/psfs, or in the psfs folder of the DEXP_CACHE_DIR environment variable,
+    keyed by all physical parameters, so that the same PSF is only computed once across channels, jobs and sessions.
+    PSFs are computed without caching when the cache directory cannot be determined or written to.
 
     :param dxy: voxel dimension along xy (microns)
     :param dz: voxel dimension along z (microns)
     :param xy_size: size of PSF kernel along x and y (odd integer)
     :param z_size: size of PSF kernel along z (odd integer)
+    :param cache: True to load the PSF from, or save it to, the disk cache.
 
     """
+    parameters = dict(dxy=dxy, dz=dz, xy_size=xy_size, z_size=z_size, M=M, NA=NA, n=n, wd=wd, tl=tl, wvl=wvl)
+
+    cache_path = _psf_cache_path(parameters) if cache else None
+    if cache_path is not None and exists(cache_path):
+        try:
+            psf_xyz_array = numpy.load(cache_path)
+            aprint(f"Loaded cached PSF for parameters: {parameters}")
+            return psf_xyz_array
+        except (OSError, ValueError) as e:
+            aprint(f"Could not load cached PSF from {cache_path}, regenerating it: {e}")
+
+    psf_xyz_array = _generate_psf(**parameters)
+
+    if cache_path is not None:
+        try:
+            # written under a temporary name first, so that concurrent jobs never read a partial file:
+            os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+            temp_path = f"{cache_path}.{os.getpid()}.tmp.npy"
+            numpy.save(temp_path, psf_xyz_array)
+            os.replace(temp_path, cache_path)
+        except OSError as e:
+            aprint(f"Could not cache PSF to {cache_path}: {e}")
+
+    return psf_xyz_array
+
+
+def _psf_cache_path(parameters: dict) -> Optional[str]:
+    cache_dir = os.getenv("DEXP_CACHE_DIR")
+    if cache_dir is None:
+        try:
+            cache_dir = join(Path.home(), ".dexp")
+        except RuntimeError:
+            # no home directory, e.g. in some service environments:
+            return None
+    key = json.dumps({"version": _psf_model_version, **{k: float(v) for k, v in parameters.items()}}, sort_keys=True)
+    digest = hashlib.sha1(key.encode()).hexdigest()
+    return join(cache_dir, "psfs", f"{digest}.npy")
+
+
+def _generate_psf(dxy, dz, xy_size, z_size, M, NA, n, wd, tl, wvl):
 
     psf_gen = MicroscopePSF()
 
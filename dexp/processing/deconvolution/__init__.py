@@ -4,3 +4,4 @@ from dexp.processing.deconvolution.inversion_deconvolution import (
     inversion_deconvolution,
 )
 from dexp.processing.deconvolution.lr_deconvolution import lucy_richardson_deconvolution
+from dexp.processing.deconvolution.psf_grid import PSFGrid
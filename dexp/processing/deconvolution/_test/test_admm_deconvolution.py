@@ -1,8 +1,16 @@
+from functools import reduce
+
 import numpy
+import scipy.fftpack
 from skimage.data import camera
 from skimage.util import random_noise
 
 from dexp.processing.deconvolution.admm_deconvolution import admm_deconvolution
+from dexp.processing.deconvolution.admm_utils import (
+    derivative_axes,
+    first_derivative_func,
+    first_derivative_kernels,
+)
 from dexp.processing.filters.fft_convolve import fft_convolve
 from dexp.processing.filters.kernels.gaussian import gaussian_kernel_nd
 from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
@@ -45,5 +53,84 @@ def _test_admm_deconvolution():
     assert error < 0.001
 
 
+def test_admm_deconvolution_complex_fft_numpy():
+    with NumpyBackend():
+        _test_admm_deconvolution_complex_fft()
+
+
+def test_admm_deconvolution_complex_fft_cupy():
+    try:
+        with CupyBackend():
+            _test_admm_deconvolution_complex_fft()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_admm_deconvolution_complex_fft():
+    xp = Backend.get_xp_module()
+
+    # odd and even sizes, so that half spectra of both parities are covered:
+    rng = numpy.random.default_rng(0)
+    image = rng.uniform(size=(24, 31, 32)).astype(numpy.float32)
+    psf = gaussian_kernel_nd(size=7, ndim=3, sigma=1.5, dtype=numpy.float32)
+
+    image = Backend.to_backend(image)
+    psf = Backend.to_backend(psf)
+
+    deconvolved = admm_deconvolution(image, psf, iterations=5)
+    reference = _complex_fft_admm_deconvolution(image, psf, iterations=5)
+
+    error = float(xp.abs(deconvolved - reference).max())
+    print(f"Error = {error}")
+
+    assert error < 1e-5
+
+
+def _complex_fft_admm_deconvolution(image, psf, rho=0.1, gamma=0.01, iterations=10):
+    # previous implementation, with complex FFTs of full spectra, for first derivatives:
+    xp = Backend.get_xp_module()
+    sp = Backend.get_sp_module()
+
+    def shrink(array):
+        return xp.sign(array) * xp.clip(xp.abs(array) - gamma / rho, 0.0, None)
+
+    backproj = xp.flip(psf)
+
+    original_shape = image.shape
+    pad_width = [(s // 2, s // 2) for s in backproj.shape]
+    image = xp.pad(image, pad_width, mode="reflect")
+    original_slice = tuple(slice(p - 1, p + s - 1) for s, p in zip(original_shape, backproj.shape))
+
+    fsize = tuple(scipy.fftpack.next_fast_len(x) for x in image.shape)
+
+    fDs = [sp.fft.fftn(Backend.to_backend(D), fsize) for D in first_derivative_kernels(image.ndim)]
+    fbackproj = sp.fft.fftn(backproj, fsize)
+    fimage = sp.fft.fftn(image, fsize)
+
+    nume_aux = fbackproj * fimage
+    denom = fbackproj * fbackproj.conj() + rho * reduce(xp.add, (fD.conj() * fD for fD in fDs))
+
+    Daxes = derivative_axes(image.ndim)
+
+    I = xp.zeros(fsize, dtype=numpy.float32)
+    Zs = [xp.zeros(fsize, dtype=numpy.float32) for _ in Daxes]
+    Us = [xp.zeros(fsize, dtype=numpy.float32) for _ in Daxes]
+
+    for _ in range(iterations):
+        V = rho * reduce(xp.add, (first_derivative_func(Z - U, axes, True) for axes, Z, U in zip(Daxes, Zs, Us)))
+        I = sp.fft.ifftn((nume_aux + sp.fft.fftn(V)) / denom).real
+
+        tmps = [first_derivative_func(I, axes, False) for axes in Daxes]
+        Zs = [shrink(tmp + U) for tmp, U in zip(tmps, Us)]
+        for tmp, Z, U in zip(tmps, Zs, Us):
+            U += tmp - Z
+
+    I = I[original_slice]
+    I -= I.min()
+    I /= I.max()
+
+    return I
+
+
 if __name__ == "__main__":
     test_admm_deconvolution_numpy()
@@ -0,0 +1,71 @@
+import copy
+
+import numpy
+from pyotf.otf import HanserPSF
+from pyotf.phaseretrieval import retrieve_phase
+from pyotf.utils import prep_data_for_PR
+
+from dexp.processing.deconvolution.blind_deconvolution import blind_deconvolution
+from dexp.processing.deconvolution.lr_deconvolution import lucy_richardson_deconvolution
+from dexp.processing.filters.fft_convolve import fft_convolve
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_blind_deconvolution_numpy():
+    with NumpyBackend():
+        _test_blind_deconvolution()
+
+
+def test_blind_deconvolution_cupy():
+    try:
+        with CupyBackend():
+            _test_blind_deconvolution()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_blind_deconvolution(length=48, psf_size=17):
+    params = dict(wl=561, na=0.8, ni=1.33, res=150, zres=200)
+
+    # observed PSF without aberrations, pyotf only prepares integer PSFs:
+    observed_psf = HanserPSF(size=psf_size, zsize=psf_size, **params).PSFi
+    observed_psf = (10000 * observed_psf / observed_psf.max()).astype(int)
+
+    # true PSF, with spherical aberration added to the Zernike decomposition of the observed one:
+    phase_retriv = retrieve_phase(prep_data_for_PR(observed_psf), params=params)
+    phase_retriv.fit_to_zernikes(15)
+    initial_psf = _normalised_psf(phase_retriv)
+    phase_retriv = copy.deepcopy(phase_retriv)
+    phase_retriv.zd_result.pcoefs = phase_retriv.zd_result.pcoefs.copy()
+    phase_retriv.zd_result.pcoefs[10] += 1.0
+    true_psf = _normalised_psf(phase_retriv)
+
+    rng = numpy.random.default_rng(0)
+    image = numpy.zeros((length,) * 3, dtype=numpy.float32)
+    image[tuple(rng.integers(4, length - 4, size=(3, 40)))] = rng.uniform(0.5, 1, size=40)
+
+    blurry = fft_convolve(Backend.to_backend(image), Backend.to_backend(true_psf))
+    blurry -= blurry.min()
+    blurry /= blurry.max()
+
+    # the proxies are deconvolved with the true PSF, so that only the PSF fitting is tested, the last call receives
+    # the fitted PSF:
+    psfs = []
+
+    def deconv(image, psf):
+        psfs.append(Backend.to_numpy(psf))
+        return lucy_richardson_deconvolution(image, true_psf, num_iterations=30, padding=psf_size // 2)
+
+    blind_deconvolution(blurry, observed_psf, deconv, params, n_iterations=2, proxy_size=length // 2)
+
+    initial_error = numpy.abs(initial_psf - true_psf).sum()
+    error = numpy.abs(psfs[-1] - true_psf).sum()
+    print(f"PSF error, initial: {initial_error}, fitted: {error}")
+
+    assert error < 0.2
+    assert error < initial_error / 4
+
+
+def _normalised_psf(phase_retriv) -> numpy.ndarray:
+    psf = phase_retriv.generate_zd_psf()
+    return (psf / psf.sum()).astype(numpy.float32)
@@ -43,3 +43,82 @@ def _test_lr_deconvolution():
     print(f"Error = {error}")
 
     assert error < 0.001
+
+
+def test_lr_deconvolution_accelerated_numpy():
+    with NumpyBackend():
+        _test_lr_deconvolution_accelerated()
+
+
+def test_lr_deconvolution_accelerated_cupy():
+    try:
+        with CupyBackend():
+            _test_lr_deconvolution_accelerated()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_lr_deconvolution_accelerated():
+    xp = Backend.get_xp_module()
+
+    image = Backend.to_backend(camera().astype(numpy.float32) / 255)
+    psf = Backend.to_backend(gaussian_kernel_nd(size=9, ndim=2, sigma=2, dtype=numpy.float32))
+    blurry = fft_convolve(image, psf)
+
+    def residual(deconvolved):
+        return float(xp.abs(fft_convolve(deconvolved, psf) - blurry)[16:-16, 16:-16].mean())
+
+    def deconvolve(**kwargs):
+        nb_convolutions = []
+
+        def convolve(image, kernel):
+            nb_convolutions.append(1)
+            return fft_convolve(image, kernel, in_place=False)
+
+        deconvolved = lucy_richardson_deconvolution(
+            blurry, psf, padding=16, normalise_input=False, convolve_method=convolve, **kwargs
+        )
+        return deconvolved, len(nb_convolutions) // 2
+
+    plain, _ = deconvolve(num_iterations=40)
+    accelerated, _ = deconvolve(num_iterations=20, accelerate=True)
+    print(f"Residuals: plain = {residual(plain)}, accelerated = {residual(accelerated)}")
+    assert residual(accelerated) < residual(plain)
+
+    # stops early once converged:
+    converged, nb_iterations = deconvolve(num_iterations=200, accelerate=True, tolerance=1e-3)
+    print(f"Converged after {nb_iterations} iterations")
+    assert nb_iterations < 200
+    assert residual(converged) < residual(plain)
+
+
+def test_lr_deconvolution_batched_numpy():
+    with NumpyBackend():
+        _test_lr_deconvolution_batched()
+
+
+def test_lr_deconvolution_batched_cupy():
+    try:
+        with CupyBackend():
+            _test_lr_deconvolution_batched()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_lr_deconvolution_batched():
+    xp = Backend.get_xp_module()
+    rng = numpy.random.default_rng(0)
+
+    # tiles, or time points, of different intensity ranges:
+    images = rng.uniform(0, 1, size=(3, 16, 48, 48)).astype(numpy.float32)
+    images *= numpy.asarray([1, 10, 100], dtype=numpy.float32)[:, None, None, None]
+    psf = gaussian_kernel_nd(size=7, ndim=3, sigma=1.5, dtype=numpy.float32)
+
+    for kwargs in (dict(), dict(accelerate=True, padding=4)):
+        batched = lucy_richardson_deconvolution(Backend.to_backend(images.copy()), psf, num_iterations=5, **kwargs)
+        assert batched.shape == images.shape
+        for image, batched_image in zip(images, batched):
+            deconvolved = lucy_richardson_deconvolution(
+                Backend.to_backend(image.copy()), psf, num_iterations=5, **kwargs
+            )
+            assert float(xp.abs(batched_image - deconvolved).max()) < 1e-3 * float(deconvolved.max())
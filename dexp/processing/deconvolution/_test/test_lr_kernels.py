@@ -0,0 +1,70 @@
+import numexpr
+import numpy
+
+from dexp.processing.deconvolution.lr_kernels import (
+    _use_numexpr,
+    lr_correct,
+    lr_relative_blur,
+)
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_lr_kernels_numpy():
+    with NumpyBackend():
+        _test_lr_kernels()
+
+    # numexpr is only used when multi-threaded:
+    nthreads = numexpr.set_num_threads(2)
+    try:
+        assert _use_numexpr(numpy.zeros(1, dtype=numpy.float32))
+        with NumpyBackend():
+            _test_lr_kernels()
+    finally:
+        numexpr.set_num_threads(nthreads)
+
+
+def test_lr_kernels_cupy():
+    try:
+        with CupyBackend():
+            _test_lr_kernels()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_lr_kernels():
+    eps = 1e-3
+    rng = numpy.random.default_rng(0)
+    image = rng.random((16, 32, 32), dtype=numpy.float32)
+    convolved = rng.random((16, 32, 32), dtype=numpy.float32) - 0.1
+    convolved[0, 0, :4] = [numpy.nan, numpy.inf, -eps, 0]
+    correction = rng.random((16, 32, 32), dtype=numpy.float32) * 2 - 0.2
+    estimate = rng.random((16, 32, 32), dtype=numpy.float32)
+
+    with numpy.errstate(all="ignore"):
+        expected_blur = numpy.nan_to_num((image + eps) / (convolved + eps))
+        expected_clamped_blur = numpy.clip(expected_blur, 1 / 4, 4)
+        expected_estimate = estimate * numpy.clip(correction, 0, None) ** 0.7
+
+    numerator = Backend.to_backend(image + eps)
+
+    blur = lr_relative_blur(numerator, Backend.to_backend(convolved), eps=eps)
+    assert numpy.allclose(Backend.to_numpy(blur), expected_blur, rtol=1e-5)
+
+    # in place:
+    blur = Backend.to_backend(convolved.copy())
+    blur = lr_relative_blur(numerator, blur, eps=eps, max_correction=4, out=blur)
+    assert numpy.allclose(Backend.to_numpy(blur), expected_clamped_blur, rtol=1e-5)
+
+    # NaN, infinite and zero denominators, identical on all paths:
+    blur = Backend.to_numpy(lr_relative_blur(numerator, Backend.to_backend(convolved), eps=eps))[0, 0, :4]
+    big = numpy.finfo(numpy.float32).max
+    assert numpy.array_equal(blur[:3], [0, 0, big])
+    assert numpy.isfinite(blur[3])
+    blur = Backend.to_numpy(lr_relative_blur(numerator, Backend.to_backend(convolved), eps=eps, max_correction=4))
+    assert numpy.array_equal(blur[0, 0, :4], [1 / 4, 1 / 4, 4, expected_clamped_blur[0, 0, 3]])
+
+    corrected = lr_correct(Backend.to_backend(estimate.copy()), Backend.to_backend(correction.copy()), power=0.7)
+    assert numpy.allclose(Backend.to_numpy(corrected), expected_estimate, rtol=1e-5)
+
+    corrected = lr_correct(Backend.to_backend(estimate.copy()), Backend.to_backend(correction.copy()))
+    assert numpy.allclose(Backend.to_numpy(corrected), estimate * correction)
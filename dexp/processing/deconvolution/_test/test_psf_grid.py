@@ -0,0 +1,78 @@
+import numpy
+from skimage.data import camera
+
+from dexp.processing.deconvolution import PSFGrid, lucy_richardson_deconvolution
+from dexp.processing.filters.fft_convolve import fft_convolve
+from dexp.processing.filters.kernels.gaussian import gaussian_kernel_nd
+from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_psf_grid_interpolation():
+    psfs = numpy.zeros((2, 3, 5, 5), dtype=numpy.float32)
+    for i in range(2):
+        for j in range(3):
+            psfs[i, j, i + 1, j + 1] = 1
+    grid = PSFGrid(psfs)
+    assert PSFGrid.is_grid(psfs) and not PSFGrid.is_grid(psfs[0, 0])
+
+    # cell centers of a 100x90 image are at (25, 75) and (15, 45, 75):
+    assert grid.weights((100, 90), (25, 45)) == {(0, 1): 1.0}
+    assert grid.weights((100, 90), (0, 0)) == {(0, 0): 1.0}
+    weights = grid.weights((100, 90), (50, 30))
+    assert numpy.isclose(sum(weights.values()), 1)
+    assert set(weights) == {(0, 0), (0, 1), (1, 0), (1, 1)}
+
+    psf = grid.psf_at((100, 90), (50, 30))
+    assert numpy.isclose(psf.sum(), 1)
+    assert numpy.isclose(psf[1, 1], 0.25) and numpy.isclose(psf[2, 2], 0.25)
+    # interpolated PSFs are memoized per position:
+    assert grid.psf_at((100, 90), (50, 30)) is psf
+
+
+def test_psf_grid_deconvolution_numpy():
+    with NumpyBackend():
+        _test_psf_grid_deconvolution()
+
+
+def test_psf_grid_deconvolution_cupy():
+    try:
+        with CupyBackend():
+            _test_psf_grid_deconvolution()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_psf_grid_deconvolution():
+    xp = Backend.get_xp_module()
+
+    image = camera().astype(numpy.float32)[:, :256] / 255
+    psfs = numpy.stack([gaussian_kernel_nd(size=15, ndim=2, sigma=sigma, dtype=numpy.float32) for sigma in (1, 3)])
+
+    # the left half of the image is less blurred than the right half:
+    blurry = numpy.concatenate(
+        [
+            Backend.to_numpy(fft_convolve(Backend.to_backend(image), Backend.to_backend(psf)))[
+                :, 128 * i : 128 * (i + 1)
+            ]
+            for i, psf in enumerate(psfs)
+        ],
+        axis=1,
+    )
+    grid = PSFGrid(psfs[numpy.newaxis])
+
+    def deconv(tile, tile_slice):
+        psf = grid.psf_for_tile(blurry.shape, tile_slice)
+        return lucy_richardson_deconvolution(tile, psf, num_iterations=20, padding=8)
+
+    def deconv_average(tile):
+        return lucy_richardson_deconvolution(tile, psfs.mean(axis=0), num_iterations=20, padding=8)
+
+    varying = scatter_gather_i2i(deconv, blurry, tiles=64, margins=16, pass_tile_slice=True, blend_margins=True)
+    uniform = scatter_gather_i2i(deconv_average, blurry, tiles=64, margins=16)
+
+    def error(deconvolved):
+        return float(xp.abs(Backend.to_backend(deconvolved) - Backend.to_backend(image))[16:-16, 16:-16].mean())
+
+    print(f"Error with PSF grid: {error(varying)}, with average PSF: {error(uniform)}")
+    assert error(varying) < error(uniform)
@@ -1,4 +1,4 @@
-from functools import partial, reduce
+from functools import partial
 from typing import Optional
 
 import numpy
@@ -13,6 +13,7 @@ from dexp.processing.deconvolution.admm_utils import (
 )
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
+from dexp.utils.fft import RealFFT
 
 
 def admm_deconvolution(
@@ -25,7 +26,6 @@ def admm_deconvolution(
     internal_dtype: Optional[numpy.dtype] = None,
     display: bool = False,
 ) -> xpArray:
-
     """
     Reference from: http://jamesgregson.ca/tag/admm.html
     """
@@ -46,7 +46,11 @@ def admm_deconvolution(
         viewer = napari.view_image(backend.to_numpy(image), name="original")
 
     def shrink(array: xpArray) -> xpArray:
-        return xp.sign(array) * xp.clip(xp.abs(array) - gamma / rho, 0.0, None)
+        # soft thresholding, in place:
+        magnitude = xp.abs(array, out=work)
+        magnitude -= gamma / rho
+        xp.clip(magnitude, 0.0, None, out=magnitude)
+        return xp.copysign(magnitude, array, out=array)
 
     xp = Backend.get_xp_module()
     sp = Backend.get_sp_module()
@@ -76,50 +80,62 @@ def admm_deconvolution(
     # compute data shape for faster fft
     fsize = tuple(scipy.fftpack.next_fast_len(x) for x in image.shape)
 
-    # create derivative kernels
-    Ds = [backend.to_backend(D) for D in derivative_kernels(image.ndim)]
+    # all arrays are real, so that real-to-complex FFTs and half spectra suffice:
+    rfftn = partial(sp.fft.rfftn, s=fsize)
 
-    # convert derivative kernels to freq space
-    fDs = [sp.fft.fftn(D, fsize) for D in Ds]
-    del Ds
+    # create derivative kernels
+    Ds = [backend.to_backend(D, dtype=internal_dtype) for D in derivative_kernels(image.ndim)]
 
     # convert input to freq space
-    fbackproj = sp.fft.fftn(backproj, fsize, overwrite_x=True)
-    fimage = sp.fft.fftn(image, fsize)
+    fbackproj = rfftn(backproj)
+    fimage = rfftn(image)
+    del image
 
-    # pre-compute auxiliary values following reference
+    # pre-compute auxiliary values following reference, the denominator is real:
     nume_aux = fbackproj * fimage
-    denom = fbackproj * fbackproj.conj() + rho * reduce(xp.add, (fD.conj() * fD for fD in fDs))
-    del fDs
+    del fimage
+    denom = xp.abs(fbackproj) ** 2
+    del fbackproj
+    for D in Ds:
+        denom += rho * xp.abs(rfftn(D)) ** 2
+    del Ds
 
     # compute parameters used for finite difference differenciation (fast diff operator)
-    Daxes = derivative_axes(image.ndim)
+    Daxes = derivative_axes(len(fsize))
 
     zeros = partial(xp.zeros, shape=fsize, dtype=internal_dtype)
 
-    # allocate buffers
+    # allocate buffers, including the spectrum of each iteration:
     I = zeros()  # output image
+    V = zeros()
+    work = zeros()
+    fft = RealFFT(fsize, internal_dtype)
 
     Zs = [zeros() for _ in Daxes]
     Us = [zeros() for _ in Daxes]
 
     for _ in range(iterations):
-        # iterations according to reference
-        # loop operations are done using generators to reduce memory allocation
-        V = rho * reduce(xp.add, (derivative_func(Z - U, axes, True) for axes, Z, U in zip(Daxes, Zs, Us)))
+        # iterations according to reference, computed in place and one derivative at a time to limit memory usage
+        V[...] = 0
+        for axes, Z, U in zip(Daxes, Zs, Us):
+            V += derivative_func(xp.subtract(Z, U, out=work), axes, True)
+        V *= rho
 
-        fV = sp.fft.fftn(V, overwrite_x=True)
-        del V
-        I = sp.fft.ifftn((nume_aux + fV) / denom, overwrite_x=True).real
+        fV = fft.forward(V)
+        fV += nume_aux
+        fV /= denom
+        fft.inverse(out=I)
 
         if display:
             viewer.add_image(backend.to_numpy(I[original_slice]))
 
-        tmps = [derivative_func(I, axes, False) for axes in Daxes]
-        Zs = [shrink(tmp + U) for tmp, U in zip(tmps, Us)]
-
-        for tmp, Z, U in zip(tmps, Zs, Us):
-            U += tmp - Z
+        for axes, Z, U in zip(Daxes, Zs, Us):
+            tmp = derivative_func(I, axes, False)
+            xp.add(tmp, U, out=Z)
+            shrink(Z)
+            U += tmp
+            U -= Z
+            del tmp
 
     # normalization
     I = I[original_slice].astype(original_dtype)
@@ -1,31 +1,95 @@
-from typing import Callable, Dict, Optional
+import copy
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy as np
+import scipy.fft
+from arbol import aprint
 from numpy.typing import ArrayLike
 from pyotf.phaseretrieval import PhaseRetrievalResult, retrieve_phase
 from pyotf.utils import prep_data_for_PR
 from scipy.optimize import minimize
-from toolz import curry
 
-from dexp.processing.filters.fft_convolve import fft_convolve
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
-
-
-@curry
-def _objfun(coefs: ArrayLike, observed: xpArray, deconved: xpArray, psf_fun: Callable) -> float:
-    # TODO: deconved could be pre computed in the freq domain
-
-    backend = Backend.current()
-
-    psf = psf_fun(coefs)
-    psf = backend.to_backend(psf)
-
-    blurred = fft_convolve(deconved, psf, mode="reflect")
-    blurred -= blurred.min()
-    blurred /= blurred.max()
-
-    return ((observed - blurred) ** 2).mean().item()
+from dexp.utils.misc import compute_num_workers
+
+
+class _ProxyObjective:
+    def __init__(
+        self,
+        observed: xpArray,
+        deconved: xpArray,
+        psf_fun: Callable[[ArrayLike], ArrayLike],
+        psf_shape: Tuple[int, ...],
+        workers: int,
+    ):
+        # Error between the observed proxy and the deconvolved proxy blurred with candidate PSFs, the spectrum of the
+        # deconvolved proxy is computed once, so that evaluating a candidate takes a single pair of real FFTs:
+        xp = Backend.get_xp_module()
+        sp = Backend.get_sp_module()
+
+        self._observed = observed
+        self._psf_fun = psf_fun
+        self._workers = workers
+        self._backend = Backend.current()
+        self._values: Dict[bytes, float] = {}
+        self._lock = threading.Lock()
+
+        self._pad = tuple(s // 2 for s in psf_shape)
+        padded = xp.pad(deconved, tuple((p, p) for p in self._pad), mode="reflect")
+        self._fsize = tuple(scipy.fft.next_fast_len(s, real=True) for s in padded.shape)
+        self._fdeconved = sp.fft.rfftn(padded, s=self._fsize)
+        self._crop = tuple(slice(p, p + s) for p, s in zip(self._pad, deconved.shape))
+
+    def __call__(self, coefs: ArrayLike) -> float:
+        key = np.asarray(coefs, dtype=np.float64).tobytes()
+        with self._lock:
+            value = self._values.get(key)
+        if value is None:
+            value = self._evaluate(coefs)
+            with self._lock:
+                self._values[key] = value
+        return value
+
+    def _evaluate(self, coefs: ArrayLike) -> float:
+        xp = Backend.get_xp_module()
+        sp = Backend.get_sp_module()
+
+        psf = Backend.to_backend(self._psf_fun(coefs), dtype=np.float32)
+
+        # transfer function of the candidate, with the PSF center moved to the origin:
+        kernel = xp.zeros(self._fsize, dtype=np.float32)
+        kernel[tuple(slice(0, s) for s in psf.shape)] = psf
+        kernel = xp.roll(kernel, shift=tuple(-p for p in self._pad), axis=tuple(range(psf.ndim)))
+        spectrum = sp.fft.rfftn(kernel)
+        spectrum *= self._fdeconved
+
+        blurred = sp.fft.irfftn(spectrum, s=self._fsize)[self._crop]
+        blurred -= blurred.min()
+        blurred /= blurred.max()
+
+        return ((self._observed - blurred) ** 2).mean().item()
+
+    def gradient(self, coefs: ArrayLike) -> ArrayLike:
+        # Forward differences, with candidates evaluated concurrently. Steps are large enough for single precision:
+        coefs = np.asarray(coefs, dtype=np.float64)
+        steps = 1e-3 * np.maximum(1.0, np.abs(coefs))
+        candidates = [coefs + step * unit for step, unit in zip(steps, np.eye(len(coefs)))]
+
+        def _evaluate(candidate: ArrayLike) -> float:
+            with self._backend.copy(exclusive=False):
+                return self(candidate)
+
+        value = self(coefs)
+        if self._workers > 1:
+            with ThreadPoolExecutor(max_workers=self._workers) as executor:
+                values = list(executor.map(_evaluate, candidates))
+        else:
+            values = [self(candidate) for candidate in candidates]
+
+        return (np.asarray(values) - value) / steps
 
 
 def blind_deconvolution(
@@ -35,8 +99,35 @@ def blind_deconvolution(
     microscope_params: Dict,
     n_iterations: int,
     n_zernikes: int = 15,
+    proxy_size: Optional[int] = 128,
+    workers: int = -1,
     display: bool = False,
 ) -> xpArray:
+    """
+    Deconvolves an image while fitting the PSF, parametrised by the Zernike decomposition of its pupil, to the
+    image. At each iteration the image is deconvolved with the current PSF, and the PSF is then optimised so that
+    the deconvolved image blurred with it matches the observed image.
+    PSF candidates are evaluated on a proxy: the brightest crop of the image, whose size follows a coarse-to-fine
+    schedule (halved at each earlier iteration), the last iteration using crops of at most 'proxy_size' voxels
+    along each axis. The image is deconvolved as a whole only once, with the final PSF.
+
+    Parameters
+    ----------
+    image : image to deconvolve, normalised within [0, 1].
+    observed_psf : observed (measured) PSF used to initialise the Zernike decomposition.
+    deconv_fun : deconvolution function, called with an image and a PSF.
+    microscope_params : microscope parameters for pyotf's phase retrieval (wl, na, ni, res, zres).
+    n_iterations : number of deconvolution and PSF fitting iterations.
+    n_zernikes : number of Zernike modes of the pupil phase and magnitude.
+    proxy_size : maximal size along each axis of the proxy at the last iteration, None to use the whole image.
+    workers : number of threads evaluating PSF candidates concurrently, negative numbers n correspond to:
+        number_of_cores / |n|.
+    display : shows intermediate results with napari.
+
+    Returns
+    -------
+    Deconvolved image.
+    """
 
     if display:
         import napari
@@ -51,11 +142,17 @@ def blind_deconvolution(
     phase_retriv: PhaseRetrievalResult = retrieve_phase(psf, params=microscope_params)
     phase_retriv.fit_to_zernikes(n_zernikes)
 
+    # each thread generates PSFs with its own copy of the phase retrieval result, as it is modified in place:
+    local = threading.local()
+
     def get_psf(coefs: Optional[ArrayLike] = None) -> ArrayLike:
+        if not hasattr(local, "phase_retriv"):
+            local.phase_retriv = copy.deepcopy(phase_retriv)
+        result = local.phase_retriv
         if coefs is not None:
-            phase_retriv.zd_result.pcoefs = coefs[: len(coefs) // 2]
-            phase_retriv.zd_result.mcoefs = coefs[len(coefs) // 2 :]
-        psf = phase_retriv.generate_zd_psf()
+            result.zd_result.pcoefs = coefs[: len(coefs) // 2]
+            result.zd_result.mcoefs = coefs[len(coefs) // 2 :]
+        psf = result.generate_zd_psf()
         return (psf / psf.sum()).astype(image.dtype)
 
     if display:
@@ -68,26 +165,61 @@ def blind_deconvolution(
         viewer.add_image(psf, name="Estimated PSF")
 
     coefs = np.concatenate((phase_retriv.zd_result.pcoefs, phase_retriv.zd_result.mcoefs))
+    workers = compute_num_workers(workers, len(coefs))
 
-    for i in range(n_iterations):
+    for i, shape in enumerate(_proxy_shapes(image.shape, psf.shape, proxy_size, n_iterations)):
+        proxy = _brightest_crop(image, shape)
+        proxy = proxy - proxy.min()
+        proxy /= proxy.max()
 
-        deconv = deconv_fun(image, psf)
+        deconv = deconv_fun(proxy, psf)
 
-        objfun = _objfun(observed=image, deconved=deconv, psf_fun=get_psf)
-        opt_res = minimize(objfun, x0=coefs, method="L-BFGS-B")
+        objfun = _ProxyObjective(proxy, Backend.to_backend(deconv, dtype=np.float32), get_psf, psf.shape, workers)
+        opt_res = minimize(objfun, x0=coefs, jac=objfun.gradient, method="L-BFGS-B")
 
         old_coefs = coefs
         coefs = opt_res.x
         psf = get_psf(coefs)
 
-        # FIXME
-        print(np.square(old_coefs - coefs).mean())
+        aprint(
+            f"Blind deconvolution iteration {i}, proxy of shape: {shape}, error: {opt_res.fun:.3e}, "
+            f"coefficients change: {np.square(old_coefs - coefs).mean():.3e}"
+        )
 
         if display:
             viewer.add_image(backend.to_numpy(deconv), name=f"Deconv i={i}")
             viewer.add_image(psf, name=f"Est. PSF i={i}")
 
+    deconv = deconv_fun(image, psf)
+
     if display:
+        viewer.add_image(backend.to_numpy(deconv), name="Deconv")
         napari.run()
 
     return deconv
+
+
+def _proxy_shapes(
+    shape: Tuple[int, ...], psf_shape: Tuple[int, ...], proxy_size: Optional[int], n_iterations: int
+) -> List[Tuple[int, ...]]:
+    # Coarse-to-fine proxy shapes: halved at each earlier iteration, but never smaller than twice the PSF:
+    final = tuple(s if proxy_size is None else min(s, proxy_size) for s in shape)
+    return [
+        tuple(min(s, max(f >> (n_iterations - 1 - i), 2 * p + 1)) for s, f, p in zip(shape, final, psf_shape))
+        for i in range(n_iterations)
+    ]
+
+
+def _brightest_crop(image: xpArray, shape: Tuple[int, ...]) -> xpArray:
+    # Crop of the given shape with the largest mean intensity, found on a mean-filtered image:
+    xp = Backend.get_xp_module()
+    sp = Backend.get_sp_module()
+
+    if tuple(shape) == image.shape:
+        return image
+
+    means = sp.ndimage.uniform_filter(image.astype(np.float32, copy=False), size=shape, mode="constant")
+    # only centers of crops that fit within the image are valid:
+    valid = tuple(slice(s // 2, n - (s - s // 2) + 1) for s, n in zip(shape, image.shape))
+    center = np.unravel_index(int(xp.argmax(means[valid])), means[valid].shape)
+    return image[tuple(slice(c, c + s) for c, s in zip(center, shape))]
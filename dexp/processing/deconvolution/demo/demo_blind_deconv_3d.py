@@ -32,7 +32,8 @@ def _demo_blind_deconvolution(length_xy=128):
             add_noise=False, length_xy=length_xy, length_z_factor=1, background_strength=0, add_offset=False
         )
 
-    psf = nikon16x08na(xy_size=35, z_size=35)  # , dxy=0.200, dz=0.94)
+    # pyotf's phase retrieval requires voxels smaller than the Abbe limit along xy (351 nm) and wl/2ni along z (211 nm):
+    psf = nikon16x08na(xy_size=35, z_size=35, dxy=0.150, dz=0.200)
     psf = psf.astype(dtype=numpy.float16)
     image = image.astype(dtype=numpy.float16)
 
@@ -50,7 +51,7 @@ def _demo_blind_deconvolution(length_xy=128):
     # NOTE: could not make it work admm deconvolution (yet)
     # deconv = partial(admm_deconvolution, rho=10, gamma=0.01, iterations=iterations, derivative=2)
     deconv = partial(lucy_richardson_deconvolution, num_iterations=50, padding=psf.shape[2] // 2)
-    params = dict(wl=561, na=0.8, ni=1.33, res=485, zres=2000)
+    params = dict(wl=561, na=0.8, ni=1.33, res=150, zres=200)
 
     psf = (10000 * psf).astype(int)
     wrong_psf = psf + (psf * 0.1) * numpy.random.uniform(size=psf.shape)
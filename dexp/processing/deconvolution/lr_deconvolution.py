@@ -2,11 +2,12 @@ import math
 from typing import Optional, Tuple, Union
 
 import numpy
+from arbol import aprint
 
-from dexp.processing.filters.fft_convolve import fft_convolve
+from dexp.processing.deconvolution.lr_kernels import lr_correct, lr_relative_blur
+from dexp.processing.filters.fft_convolve import FFTConvolver
 from dexp.processing.filters.kernels.gaussian import gaussian_kernel_nd
 from dexp.processing.filters.kernels.wiener_butterworth import wiener_butterworth_kernel
-from dexp.processing.utils.nan_to_zero import nan_to_zero
 from dexp.processing.utils.normalise import Normalise
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend, NumpyBackend
@@ -31,16 +32,21 @@ def lucy_richardson_deconvolution(
     blind_spot_mode: str = "median+uniform",
     blind_spot_axis_exclusion: Optional[Union[str, Tuple[int, ...]]] = None,
     eps: float = 1e-12,
-    convolve_method=fft_convolve,
+    convolve_method=None,
     internal_dtype=None,
+    accelerate: bool = False,
+    tolerance: Optional[float] = None,
 ):
     """
     Deconvolves an nD image given a point-spread-function.
+    Several images of the same shape, e.g. tiles or time points, can be deconvolved at once by stacking them along
+    leading batch axes: all are then convolved together with batched FFTs, and each is normalised,
+    initialised and accelerated independently.
 
     Parameters
     ----------
-    image : image to deconvolve
-    psf : point-spread-function (must have the same number of dimensions as image!)
+    image : image to deconvolve, or batch of images stacked along leading axes.
+    psf : point-spread-function (must have the same number of dimensions as image, batch axes excluded!)
     num_iterations : number of iterations
     max_correction : Lucy-Richardson correction will remain clamped within [1/mc, mc] (before back projection)
     power : power to elevate coorection (before back projection)
@@ -52,7 +58,7 @@ def lucy_richardson_deconvolution(
     padding_mode : padding mode (see numpy/cupy pad function)
     normalise_input : This deconvolution code assumes values within [0, 1], by default input images
         are normalised to that range, but if already normalised, then normalisation can be ommited.
-    normalise_minmax : Use the given tuple (min, max) for normalisation
+    normalise_minmax : Use the given tuple (min, max) for normalisation, of all images of a batch.
     clip_output : Clip output to input range, or not
     blind_spot : If zero, blind-spot is disabled. If blind_spot>0 it is active and the integer represents
         the blind-spot kernel support. A value of 3 or 5 are good and help reduce the impact of noise on deconvolution.
@@ -62,8 +68,15 @@ def lucy_richardson_deconvolution(
         For example for a 3D stack where the sampling along z (first axis) is poor,
         use: (0,) so that blind-spot kernel does not extend in z.
     eps: epsilon to avoid dividing by zero
-    convolve_method : convolution method to use
+    convolve_method : convolution method to use, if None an FFTConvolver is used so that the transfer functions
+        of the PSF and back projector are computed once instead of at every iteration.
     internal_dtype : dtype to use internally for computation.
+    accelerate : True to accelerate convergence with Biggs-Andrews vector extrapolation: each update is computed at
+        a point extrapolated along the previous change of the estimate, typically reaching the same result in
+        two to three times fewer iterations.
+    tolerance : if not None, iterations stop once the relative change of the estimate (L1 norm of the change over
+        L1 norm of the estimate) drops below this value, num_iterations is then the maximal number of iterations.
+        For a batch, iterations stop once all images have converged.
 
     Returns
     -------
@@ -73,9 +86,13 @@ def lucy_richardson_deconvolution(
     xp = Backend.get_xp_module()
     sp = Backend.get_sp_module()
 
-    if image.ndim != psf.ndim:
+    if image.ndim < psf.ndim:
         raise ValueError("The image and PSF must have same number of dimensions!")
 
+    # Leading axes of the image that the PSF does not have are batch axes:
+    batch_shape = image.shape[: image.ndim - psf.ndim]
+    axes = tuple(range(len(batch_shape), image.ndim))
+
     if internal_dtype is None:
         internal_dtype = numpy.float32
 
@@ -91,38 +108,40 @@ def lucy_richardson_deconvolution(
             raise ValueError(f"Blind spot size must be an odd integer, blind_spot={blind_spot} is not!")
 
         if "gaussian" in blind_spot_mode:
-            full_kernel = gaussian_kernel_nd(ndim=image.ndim, size=blind_spot, sigma=max(1, blind_spot // 2))
+            full_kernel = gaussian_kernel_nd(ndim=psf.ndim, size=blind_spot, sigma=max(1, blind_spot // 2))
         else:
-            full_kernel = xp.ones(shape=(blind_spot,) * image.ndim, dtype=internal_dtype)
+            full_kernel = xp.ones(shape=(blind_spot,) * psf.ndim, dtype=internal_dtype)
 
         if blind_spot_axis_exclusion is not None:
             c = blind_spot // 2
 
             slicing_n = [
                 slice(None, None, None),
-            ] * image.ndim
+            ] * psf.ndim
             slicing_p = [
                 slice(None, None, None),
-            ] * image.ndim
+            ] * psf.ndim
             for axis in blind_spot_axis_exclusion:
                 slicing_n[axis] = slice(0, c, None)
                 slicing_p[axis] = slice(c + 1, blind_spot, None)
 
-            full_kernel[slicing_n] = 0
-            full_kernel[slicing_p] = 0
+            full_kernel[tuple(slicing_n)] = 0
+            full_kernel[tuple(slicing_p)] = 0
 
         full_kernel /= full_kernel.sum()
         donut_kernel = full_kernel.copy()
-        donut_kernel[(slice(blind_spot // 2, blind_spot // 2 + 1, None),) * image.ndim] = 0
+        donut_kernel[(slice(blind_spot // 2, blind_spot // 2 + 1, None),) * psf.ndim] = 0
         donut_kernel /= donut_kernel.sum()
         # psf_original = psf.copy()
         psf = sp.ndimage.convolve(psf, donut_kernel)
         psf /= psf.sum()
 
+        # Images of a batch are filtered independently:
+        batch_kernel_shape = (1,) * len(batch_shape) + full_kernel.shape
         if "median" in blind_spot_mode:
-            image = sp.ndimage.median_filter(image, footprint=full_kernel)
+            image = sp.ndimage.median_filter(image, footprint=full_kernel.reshape(batch_kernel_shape))
         elif "mean" in blind_spot_mode:
-            image = sp.ndimage.convolve(image, donut_kernel)
+            image = sp.ndimage.convolve(image, donut_kernel.reshape(batch_kernel_shape))
 
         # from napari import Viewer, gui_qt
         # with gui_qt():
@@ -170,37 +189,57 @@ def lucy_richardson_deconvolution(
     #     viewer.add_image(_c(psf_f), name='psf_f', colormap='viridis')
     #     viewer.add_image(_c(back_projector_f), name='back_projector_f', colormap='viridis')
 
-    # Normalisation:
-    normalise = Normalise(
-        image, minmax=normalise_minmax, do_normalise=normalise_input, clip=False, dtype=internal_dtype
-    )
+    # Default convolution, caches the transfer functions of the PSF and back projector:
+    if convolve_method is None:
+        convolve_method = FFTConvolver(mode="reflect")
+
+    # Normalisation, of each image of a batch:
+    items = image.reshape((-1,) + image.shape[len(batch_shape) :]) if batch_shape else image[numpy.newaxis]
+    normalisers = [
+        Normalise(item, minmax=normalise_minmax, do_normalise=normalise_input, clip=False, dtype=internal_dtype)
+        for item in items
+    ]
 
-    image = normalise.forward(image)
+    if batch_shape:
+        image = xp.stack([normalise.forward(item) for normalise, item in zip(normalisers, items)])
+        image = image.reshape(batch_shape + items.shape[1:])
+    else:
+        image = normalisers[0].forward(image)
 
     # Padding:
     if padding > 0:
-        image = numpy.pad(image, pad_width=padding, mode=padding_mode)
+        pad_width = ((0, 0),) * len(batch_shape) + ((padding, padding),) * psf.ndim
+        image = numpy.pad(image, pad_width=pad_width, mode=padding_mode)
 
     # Result array:
-    result = xp.full(image.shape, float(xp.mean(image)), dtype=internal_dtype)
+    if batch_shape:
+        result = xp.empty(image.shape, dtype=internal_dtype)
+        result[...] = xp.mean(image, axis=axes, keepdims=True)
+    else:
+        result = xp.full(image.shape, float(xp.mean(image)), dtype=internal_dtype)
+
+    def _sum(array: xpArray) -> xpArray:
+        # Sums over the axes of the PSF, per image of the batch:
+        return xp.sum(array, axis=axes, keepdims=True) if batch_shape else xp.sum(array)
 
-    # LR iterations:
+    # The numerator of the relative blur does not change between iterations:
+    numerator = image + eps
+
+    # With acceleration, the update is computed at an extrapolated point held in its own buffer:
+    prediction = result.copy() if accelerate else result
+    previous_step = None
+    previous_result = None
+
+    # LR iterations, elementwise steps are done in place and fused to limit passes over memory:
     for i in range(num_iterations):
         # print(f"LR iteration: {i}")
         # Convolution with PSF:
         convolved = convolve_method(
-            result,
+            prediction,
             psf,
         )
-        # convolved = xp.clip(convolved, a_min=0, a_max=None, out=convolved)
-        # Computes relative blur:
-        relative_blur = (image + eps) / (convolved + eps)
-        # replace Nans with zeros, and +inf with very large values:
-        relative_blur = nan_to_zero(relative_blur, copy=False)
-        # Limits max correction:
-        if max_correction is not None:
-            relative_blur[relative_blur > max_correction] = max_correction
-            relative_blur[relative_blur < 1 / max_correction] = 1 / max_correction
+        # Computes relative blur in place, replacing NaNs with zeros and limiting the max correction:
+        relative_blur = lr_relative_blur(numerator, convolved, eps=eps, max_correction=max_correction, out=convolved)
 
         # Back-projection:
         multiplicative_correction = convolve_method(
@@ -209,15 +248,55 @@ def lucy_richardson_deconvolution(
         )
 
         # Multiplicative correction can be optionally elevated to a power:
-        if power != 1.0:
-            multiplicative_correction = xp.clip(multiplicative_correction, 0, None, out=multiplicative_correction)
-            multiplicative_correction **= 1 + (power - 1) / (math.sqrt(1 + i))
-
-        # Apply multiplicative correction:
-        result *= multiplicative_correction
+        exponent = 1.0 if power == 1.0 else 1 + (power - 1) / (math.sqrt(1 + i))
+
+        if accelerate:
+            # Biggs-Andrews extrapolation, the step size is given by the correlation of the last two steps:
+            if exponent != 1.0:
+                multiplicative_correction = xp.clip(multiplicative_correction, 0, None, out=multiplicative_correction)
+                multiplicative_correction **= exponent
+            # step = prediction * correction - prediction, computed in the correction buffer:
+            multiplicative_correction -= 1
+            multiplicative_correction *= prediction
+            step = multiplicative_correction
+            alpha = 0.0
+            if previous_step is not None and batch_shape:
+                alpha = _sum(step * previous_step) / (_sum(previous_step * previous_step) + eps)
+                alpha = xp.clip(alpha, 0.0, 1.0, out=alpha)
+            elif previous_step is not None:
+                alpha = float(xp.vdot(step, previous_step) / (xp.vdot(previous_step, previous_step) + eps))
+                alpha = min(max(alpha, 0.0), 1.0)
+            # The prediction buffer becomes the new estimate, and the previous estimate buffer its change:
+            prediction += step
+            change = xp.subtract(prediction, result, out=result)
+            result = prediction
+            if tolerance is not None:
+                relative_change = float(xp.max(_sum(xp.abs(change)) / (_sum(xp.abs(result)) + eps)))
+            # Extrapolated point, computed in the buffer of the change:
+            change *= alpha
+            change += result
+            prediction = xp.clip(change, 0, None, out=change)
+            previous_step = step
+        else:
+            if tolerance is not None:
+                if previous_result is None:
+                    previous_result = xp.empty_like(result)
+                xp.copyto(previous_result, result)
+            # Apply multiplicative correction:
+            result = lr_correct(result, multiplicative_correction, power=exponent)
+            prediction = result
+            if tolerance is not None:
+                change = xp.subtract(previous_result, result, out=previous_result)
+                relative_change = float(xp.max(_sum(xp.abs(change, out=change)) / (_sum(xp.abs(result)) + eps)))
+
+        # Stops once the estimate does not change anymore:
+        if tolerance is not None and relative_change < tolerance:
+            aprint(f"Lucy-Richardson converged after {i + 1} iterations, relative change: {relative_change:.2e}")
+            break
 
     # Delete intermediates:
-    del multiplicative_correction, relative_blur, back_projector, convolved, psf
+    del multiplicative_correction, relative_blur, back_projector, convolved, psf, numerator
+    del prediction, previous_step, previous_result
 
     # Clips output:
     if clip_output:
@@ -227,11 +306,16 @@ def lucy_richardson_deconvolution(
             result = xp.clip(result, xp.min(image), xp.max(image), out=result)
 
     # Denormalises result:
-    result = normalise.backward(result)
+    if batch_shape:
+        items = result.reshape((-1,) + result.shape[len(batch_shape) :])
+        result = xp.stack([normalise.backward(item) for normalise, item in zip(normalisers, items)])
+        result = result.reshape(batch_shape + items.shape[1:])
+    else:
+        result = normalisers[0].backward(result)
 
     # Removes padding:
     if padding > 0:
-        slicing = (slice(padding, -padding),) * result.ndim
+        slicing = (slice(None),) * len(batch_shape) + (slice(padding, -padding),) * len(axes)
         result = result[slicing]
 
     # converts to original dtype:
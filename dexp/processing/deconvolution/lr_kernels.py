@@ -0,0 +1,154 @@
+from functools import lru_cache
+from typing import Optional
+
+import numexpr
+import numpy
+
+from dexp.utils import xpArray
+from dexp.utils.backends import Backend, CupyBackend
+
+# numexpr only evaluates these floating point types, other dtypes use the NumPy path:
+_numexpr_dtypes = (numpy.float32, numpy.float64)
+
+
+def lr_relative_blur(
+    numerator: xpArray,
+    convolved: xpArray,
+    eps: float = 1e-12,
+    max_correction: Optional[float] = None,
+    out: Optional[xpArray] = None,
+) -> xpArray:
+    """
+    Computes the Lucy-Richardson relative blur: numerator / (convolved + eps), with NaNs replaced by zeros,
+    infinities by the largest finite values, and the result optionally clamped within [1/max_correction,
+    max_correction]. No temporary array is allocated: on GPU all steps are fused in a single elementwise kernel,
+    on CPU they are fused with numexpr when it runs multi-threaded, and otherwise done with in-place NumPy ufuncs.
+
+    Parameters
+    ----------
+    numerator : observed image plus eps, computed once before iterating.
+    convolved : current estimate convolved with the PSF.
+    eps : epsilon to avoid dividing by zero.
+    max_correction : if not None, the relative blur is clamped within [1/max_correction, max_correction].
+    out : output array, can be 'convolved' itself for in-place computation.
+
+    Returns
+    -------
+    Relative blur, written in 'out' if given.
+    """
+    if out is None:
+        out = Backend.get_xp_module(convolved).empty_like(convolved)
+
+    dtype = out.dtype.type
+    big = numpy.finfo(dtype).max
+
+    if isinstance(Backend.current(), CupyBackend):
+        low, high = (-big, big) if max_correction is None else (1 / max_correction, max_correction)
+        _cupy_relative_blur_kernel()(numerator, convolved, dtype(eps), dtype(low), dtype(high), out)
+    elif _use_numexpr(numerator, convolved, out):
+        low, high = (-big, big) if max_correction is None else (1 / max_correction, max_correction)
+        # NaNs are replaced by zeros before clamping, as on the other paths:
+        nan = min(max(0, low), high)
+        # numexpr has no local variables, the ratio is recomputed within each (cache-resident) block:
+        ratio = "(numerator / (convolved + eps))"
+        numexpr.evaluate(
+            f"where({ratio} != {ratio}, nan, where({ratio} > high, high, where({ratio} < low, low, {ratio})))",
+            local_dict=dict(
+                numerator=numerator,
+                convolved=convolved,
+                eps=dtype(eps),
+                low=dtype(low),
+                high=dtype(high),
+                nan=dtype(nan),
+            ),
+            out=out,
+            casting="same_kind",
+        )
+    else:
+        numpy.add(convolved, dtype(eps), out=out)
+        numpy.divide(numerator, out, out=out)
+        if max_correction is None:
+            numpy.nan_to_num(out, copy=False, nan=0, posinf=big, neginf=-big)
+        else:
+            # fmax and fmin ignore NaNs, so that NaNs are clamped like zeros, and infinities like large values:
+            numpy.fmax(out, dtype(1 / max_correction), out=out)
+            numpy.fmin(out, dtype(max_correction), out=out)
+
+    return out
+
+
+def lr_correct(
+    estimate: xpArray,
+    correction: xpArray,
+    power: float = 1.0,
+) -> xpArray:
+    """
+    Applies, in place, the Lucy-Richardson multiplicative correction to the estimate: estimate *= correction,
+    or estimate *= max(correction, 0) ** power if power is not one, in which case the correction array might be
+    overwritten.
+
+    Parameters
+    ----------
+    estimate : current estimate, modified in place.
+    correction : multiplicative correction.
+    power : power to elevate the correction to.
+
+    Returns
+    -------
+    The corrected estimate.
+    """
+    if power == 1.0:
+        estimate *= correction
+        return estimate
+
+    dtype = estimate.dtype.type
+
+    if isinstance(Backend.current(), CupyBackend):
+        _cupy_correct_kernel()(correction, dtype(power), estimate)
+    elif _use_numexpr(estimate, correction):
+        numexpr.evaluate(
+            "estimate * where(correction > 0, correction, 0) ** power",
+            local_dict=dict(estimate=estimate, correction=correction, power=dtype(power)),
+            out=estimate,
+            casting="same_kind",
+        )
+    else:
+        numpy.clip(correction, 0, None, out=correction)
+        numpy.power(correction, dtype(power), out=correction)
+        estimate *= correction
+
+    return estimate
+
+
+def _use_numexpr(*arrays: xpArray) -> bool:
+    # Single-threaded, numexpr is slower than a few in-place NumPy ufuncs. 'numexpr.nthreads' is not updated by
+    # 'numexpr.set_num_threads', the number of threads is queried instead:
+    return numexpr.get_num_threads() > 1 and all(array.dtype.type in _numexpr_dtypes for array in arrays)
+
+
+@lru_cache()
+def _cupy_relative_blur_kernel():
+    import cupy
+
+    return cupy.ElementwiseKernel(
+        "T numerator, T convolved, T eps, T low, T high",
+        "T out",
+        """
+        T ratio = numerator / (convolved + eps);
+        if (isnan(ratio)) ratio = 0;
+        out = ratio > high ? high : (ratio < low ? low : ratio);
+        """,
+        "lr_relative_blur",
+    )
+
+
+@lru_cache()
+def _cupy_correct_kernel():
+    import cupy
+
+    return cupy.ElementwiseKernel(
+        "T correction, T power",
+        "T estimate",
+        "estimate = estimate * pow(correction > 0 ? correction : (T)0, power);",
+        "lr_correct",
+    )
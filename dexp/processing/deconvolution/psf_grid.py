@@ -0,0 +1,108 @@
+import itertools
+import threading
+from typing import Dict, Sequence, Tuple
+
+import numpy
+from numpy.typing import ArrayLike
+
+
+class PSFGrid:
+    def __init__(self, psfs: ArrayLike):
+        """
+        Spatially varying point-spread-function, given as a regular grid of PSFs: the volume is divided into
+        grid cells of equal size, and each PSF is the PSF at the center of its cell, as extracted for example by
+        'dexp extract-psf --grid'. The PSF anywhere else is multi-linearly interpolated between cell centers,
+        and is constant past the outermost centers.
+
+        Parameters
+        ----------
+        psfs : array of shape grid_shape + psf_shape, for example (2, 3, 3, 17, 17, 17) for a grid of 2x3x3 cells
+            with PSFs of size 17x17x17.
+        """
+        psfs = numpy.asarray(psfs, dtype=numpy.float32)
+        if psfs.ndim % 2 != 0:
+            raise ValueError(f"PSF grid must have as many grid as PSF dimensions, got shape: {psfs.shape}")
+
+        ndim = psfs.ndim // 2
+        self.grid_shape = psfs.shape[:ndim]
+        self.psf_shape = psfs.shape[ndim:]
+
+        # each PSF is normalised:
+        sums = psfs.sum(axis=tuple(range(ndim, psfs.ndim)), keepdims=True)
+        self.psfs = psfs / numpy.where(sums == 0, 1, sums)
+
+        self._cache: Dict[Tuple, numpy.ndarray] = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load(path: str) -> "PSFGrid":
+        return PSFGrid(numpy.load(path))
+
+    @staticmethod
+    def is_grid(psfs: ArrayLike) -> bool:
+        """Returns True if the given array is a grid of PSFs, rather than a single PSF."""
+        return numpy.ndim(psfs) >= 4 and numpy.ndim(psfs) % 2 == 0
+
+    def weights(self, shape: Sequence[int], position: Sequence[float]) -> Dict[Tuple[int, ...], float]:
+        """
+        Returns the interpolation weights of the grid cells for a position within a volume.
+
+        Parameters
+        ----------
+        shape : shape of the volume covered by the grid.
+        position : position in voxels within the volume.
+
+        Returns
+        -------
+        Dictionary from grid cell indices to weights, weights sum to one.
+        """
+        per_axis = []
+        for length, cells, x in zip(shape, self.grid_shape, position):
+            # cell centers are at (i + 0.5) * length / cells, positions are clamped between the outermost centers:
+            u = min(max(x * cells / length - 0.5, 0.0), cells - 1.0)
+            i = min(int(u), cells - 2) if cells > 1 else 0
+            t = u - i
+            per_axis.append([(i, 1 - t)] + ([(i + 1, t)] if cells > 1 else []))
+
+        weights = {}
+        for combination in itertools.product(*per_axis):
+            weight = float(numpy.prod([w for _, w in combination]))
+            if weight > 0:
+                weights[tuple(i for i, _ in combination)] = weight
+        return weights
+
+    def psf_at(self, shape: Sequence[int], position: Sequence[float]) -> numpy.ndarray:
+        """
+        Returns the PSF interpolated at a position within a volume. PSFs are memoized per position, so that
+        the same position gives the same array and its transfer functions can be cached by convolvers.
+
+        Parameters
+        ----------
+        shape : shape of the volume covered by the grid.
+        position : position in voxels within the volume.
+
+        Returns
+        -------
+        Normalised PSF.
+        """
+        key = (tuple(shape), tuple(float(x) for x in position))
+        with self._lock:
+            psf = self._cache.get(key)
+        if psf is None:
+            psf = sum(weight * self.psfs[cell] for cell, weight in self.weights(shape, position).items())
+            psf = (psf / psf.sum()).astype(numpy.float32)
+            with self._lock:
+                psf = self._cache.setdefault(key, psf)
+        return psf
+
+    def psf_for_tile(self, shape: Sequence[int], tile_slice: Sequence[slice]) -> numpy.ndarray:
+        """
+        Returns the PSF interpolated at the center of a tile.
+
+        Parameters
+        ----------
+        shape : shape of the volume covered by the grid.
+        tile_slice : slice of the tile in the volume.
+        """
+        center = tuple((s.start + s.stop - 1) / 2 for s in tile_slice)
+        return self.psf_at(shape, center)
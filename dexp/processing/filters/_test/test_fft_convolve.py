@@ -4,7 +4,7 @@ from scipy.ndimage import convolve
 from skimage.data import camera
 from skimage.util import random_noise
 
-from dexp.processing.filters.fft_convolve import fft_convolve
+from dexp.processing.filters.fft_convolve import FFTConvolver, fft_convolve
 from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
 
 
@@ -21,6 +21,46 @@ def test_fft_convolve_cupy():
         print("Cupy module not found! Test passes nevertheless!")
 
 
+def test_fft_convolver_numpy():
+    with NumpyBackend():
+        _test_fft_convolver()
+
+
+def test_fft_convolver_cupy():
+    try:
+        with CupyBackend():
+            _test_fft_convolver()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_fft_convolver():
+    xp = Backend.get_xp_module()
+    rng = numpy.random.default_rng(0)
+    psf = Backend.to_backend(rng.uniform(0, 1, size=(5, 3, 7)).astype(numpy.float32))
+
+    for mode in ("reflect", "edge", "wrap"):
+        convolver = FFTConvolver(mode=mode)
+        for shape in ((20, 30, 25), (20, 30, 25), (11, 30, 25)):
+            image = Backend.to_backend(rng.uniform(0, 1, size=shape).astype(numpy.float32))
+            result = convolver(image, psf)
+            reference_result = fft_convolve(image, psf, mode=mode, in_place=False)
+            assert result.shape == image.shape
+            assert float(xp.abs(result - reference_result).max()) < 1e-5
+
+        # the transfer function of the PSF is computed once per FFT size:
+        assert convolver.misses == 2
+        assert convolver.hits == 1
+
+        # batches of images are convolved along the axes of the kernel, with the same transfer function:
+        images = Backend.to_backend(rng.uniform(0, 1, size=(3, 20, 30, 25)).astype(numpy.float32))
+        result = convolver(images, psf)
+        assert result.shape == images.shape
+        for image, image_result in zip(images, result):
+            assert float(xp.abs(image_result - convolver(image, psf)).max()) < 1e-5
+        assert convolver.misses == 2
+
+
 def _test_fft_convolve():
     image = camera().astype(numpy.float32) / 255
     noisy = random_noise(image, mode="gaussian", var=0.005, seed=0, clip=False)
@@ -1,3 +1,8 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Optional
+
 import numpy
 import scipy.fftpack
 
@@ -79,3 +84,208 @@ def fft_convolve(image1: xpArray, image2: xpArray, mode: str = "reflect", in_pla
     result = result.astype(dtype=original_dtype, copy=False)
 
     return result
+
+
+class FFTConvolver:
+    def __init__(
+        self,
+        mode: str = "reflect",
+        internal_dtype=None,
+        max_cached_transfer_functions: int = 4,
+        fft_workers: Optional[int] = None,
+    ):
+        """
+        FFT based convolution operator that caches the transfer functions (FFTs) of kernels, and reuses
+        its input buffers. Meant for iterative algorithms, such as Lucy-Richardson deconvolution, that repeatedly
+        convolve images of the same shape with the same kernels: a convolution then costs one forward and one
+        inverse FFT instead of two forward and one inverse FFTs. The cache is shared across calls, threads, tiles
+        and time points, as long as the shape of images and kernels stay the same. Same results as fft_convolve.
+        Can be used as a drop-in replacement for fft_convolve: convolver(image, kernel).
+        Images can have leading batch axes in addition to the axes of the kernel, for example a stack of tiles of
+        the same shape: all are then convolved at once with batched FFTs along the axes of the kernel.
+
+        Parameters
+        ----------
+        mode : padding mode, see fft_convolve.
+        internal_dtype : internal dtype for computation, dtype of the first image if None.
+        max_cached_transfer_functions : maximal number of cached transfer functions, the least recently used
+            are evicted first. Transfer functions are as large as the padded images, one per kernel
+            and image shape.
+        fft_workers : number of threads used by scipy.fft on CPU (NumPy backend) for each FFT, negative numbers
+            count from the number of cores, scipy's default (one thread) if None. Multi-threaded FFTs benefit
+            most from batches of images.
+        """
+        self.mode = mode
+        self.internal_dtype = internal_dtype
+        self.max_cached_transfer_functions = max_cached_transfer_functions
+        self.fft_workers = fft_workers
+        self.hits = 0
+        self.misses = 0
+        self._transfer_functions = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def __getstate__(self):
+        # caches, buffers and locks are not sent to other processes:
+        state = self.__dict__.copy()
+        for key in ("_transfer_functions", "_lock", "_local"):
+            del state[key]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._transfer_functions = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def clear(self) -> None:
+        """Frees cached transfer functions and the buffer of the calling thread."""
+        with self._lock:
+            self._transfer_functions.clear()
+        self._local.__dict__.clear()
+
+    def __call__(self, image: xpArray, kernel: xpArray) -> xpArray:
+        """
+        Convolves an image with a kernel.
+
+        Parameters
+        ----------
+        image : image to convolve, or batch of images stacked along leading axes.
+        kernel : kernel, its transfer function is cached.
+
+        Returns
+        -------
+        Convolved image: image ○ kernel
+        """
+        sp = Backend.get_sp_module()
+
+        if image.ndim < kernel.ndim:
+            raise ValueError("Dimensions do not match.")
+        elif image.dtype != kernel.dtype:
+            raise ValueError("Two images must have same dtype!")
+
+        internal_dtype = image.dtype if self.internal_dtype is None else self.internal_dtype
+        if isinstance(Backend.current(), NumpyBackend):
+            internal_dtype = numpy.float32
+        internal_dtype = numpy.dtype(internal_dtype)
+
+        original_dtype = image.dtype
+        image = Backend.to_backend(image, dtype=internal_dtype, force_copy=False)
+
+        # Leading batch axes are neither padded nor transformed:
+        batch_shape = image.shape[: image.ndim - kernel.ndim]
+        axes = tuple(range(len(batch_shape), image.ndim))
+        kernel_shape = (1,) * len(batch_shape) + kernel.shape
+
+        if self.mode != "wrap":
+            pad_width = tuple((k // 2, k // 2) for k in kernel_shape)
+        else:
+            pad_width = ((0, 0),) * image.ndim
+        padded_shape = tuple(s + left + right for s, (left, right) in zip(image.shape, pad_width))
+        fsize = batch_shape + tuple(
+            scipy.fftpack.next_fast_len(p + k - 1) for p, k in zip(padded_shape[len(batch_shape) :], kernel.shape)
+        )
+
+        # The padded image is written in a zero-filled buffer of the FFT size, so no padding is allocated:
+        buffer = self._buffer(fsize, padded_shape, internal_dtype)
+        _pad_into(buffer, image, pad_width, self.mode)
+
+        # only scipy.fft can use several threads:
+        fft_kwargs = {}
+        if self.fft_workers is not None and isinstance(Backend.current(), NumpyBackend):
+            fft_kwargs["workers"] = self.fft_workers
+
+        spectrum = sp.fft.rfftn(buffer, axes=axes, **fft_kwargs)
+        spectrum *= self._transfer_function(kernel, fsize[len(batch_shape) :], internal_dtype)
+        result = sp.fft.irfftn(spectrum, s=fsize[len(batch_shape) :], axes=axes, overwrite_x=True, **fft_kwargs)
+        del spectrum
+
+        # same cropping as fft_convolve: centered full convolution, without padding:
+        result = result[
+            tuple(
+                slice((k - 1) // 2 + left, (k - 1) // 2 + left + s)
+                for s, k, (left, _) in zip(image.shape, kernel_shape, pad_width)
+            )
+        ]
+
+        return result.astype(dtype=original_dtype, copy=False)
+
+    def _buffer(self, fsize, padded_shape, dtype) -> xpArray:
+        # Each thread has its own buffer, only the last one is kept. Outside of the padded image buffers must
+        # stay zero, so buffers are not shared between padded shapes:
+        key = (fsize, padded_shape, dtype.str, _device_key())
+        if getattr(self._local, "key", None) != key:
+            self._local.buffer = None
+            self._local.buffer = Backend.get_xp_module().zeros(fsize, dtype=dtype)
+            self._local.key = key
+        return self._local.buffer
+
+    def _transfer_function(self, kernel: xpArray, fsize, dtype) -> xpArray:
+        kernel_numpy = Backend.to_numpy(kernel)
+        digest = hashlib.blake2b(kernel_numpy.tobytes(), digest_size=16).hexdigest()
+        key = (kernel.shape, kernel_numpy.dtype.str, digest, fsize, dtype.str, _device_key())
+
+        with self._lock:
+            transfer_function = self._transfer_functions.get(key)
+            if transfer_function is not None:
+                self._transfer_functions.move_to_end(key)
+                self.hits += 1
+                return transfer_function
+
+        sp = Backend.get_sp_module()
+        transfer_function = sp.fft.rfftn(Backend.to_backend(kernel, dtype=dtype), fsize)
+
+        with self._lock:
+            self.misses += 1
+            self._transfer_functions[key] = transfer_function
+            while len(self._transfer_functions) > self.max_cached_transfer_functions:
+                self._transfer_functions.popitem(last=False)
+        return transfer_function
+
+
+def _device_key():
+    # Arrays of different CUDA devices cannot be mixed:
+    return getattr(Backend.current(), "device_id", None)
+
+
+def _pad_into(buffer: xpArray, image: xpArray, pad_width, mode: str) -> None:
+    # Pads an image into the corner of a buffer, like numpy.pad, but without allocating the padded image.
+    # Axes are padded one after the other, so that corners are filled like numpy.pad does:
+    xp = Backend.get_xp_module()
+    ndim = image.ndim
+    region = tuple(slice(0, s + left + right) for s, (left, right) in zip(image.shape, pad_width))
+
+    supported = {"reflect": 1, "symmetric": 0, "edge": 0, "constant": 0}
+    if mode not in supported or any(
+        max(left, right) > s - supported[mode] for s, (left, right) in zip(image.shape, pad_width)
+    ):
+        buffer[region] = xp.pad(image, pad_width=pad_width, mode=mode)
+        return
+
+    center = tuple(slice(left, left + s) for s, (left, _) in zip(image.shape, pad_width))
+    buffer[center] = image
+
+    for axis, (s, (left, right)) in enumerate(zip(image.shape, pad_width)):
+
+        def index(axis_slice):
+            return tuple(axis_slice if j == axis else (region[j] if j < axis else center[j]) for j in range(ndim))
+
+        end = left + s
+        if left > 0:
+            if mode == "reflect":
+                buffer[index(slice(0, left))] = xp.flip(buffer[index(slice(left + 1, 2 * left + 1))], axis)
+            elif mode == "symmetric":
+                buffer[index(slice(0, left))] = xp.flip(buffer[index(slice(left, 2 * left))], axis)
+            elif mode == "edge":
+                buffer[index(slice(0, left))] = buffer[index(slice(left, left + 1))]
+            else:
+                buffer[index(slice(0, left))] = 0
+        if right > 0:
+            if mode == "reflect":
+                buffer[index(slice(end, end + right))] = xp.flip(buffer[index(slice(end - 1 - right, end - 1))], axis)
+            elif mode == "symmetric":
+                buffer[index(slice(end, end + right))] = xp.flip(buffer[index(slice(end - right, end))], axis)
+            elif mode == "edge":
+                buffer[index(slice(end, end + right))] = buffer[index(slice(end - 1, end))]
+            else:
+                buffer[index(slice(end, end + right))] = 0
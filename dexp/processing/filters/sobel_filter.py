@@ -1,3 +1,5 @@
+from typing import Optional, Sequence
+
 import numpy
 
 from dexp.processing.utils.normalise import Normalise
@@ -13,6 +15,7 @@ def sobel_filter(
     normalise_input: bool = True,
     in_place_normalisation: bool = False,
     internal_dtype=None,
+    axes: Optional[Sequence[int]] = None,
 ):
     """
     Computes the Sobel magnitude filter response for a given image.
@@ -43,6 +46,8 @@ def sobel_filter(
     normalise_input : True to normalise input image between 0 and 1 before applying filter
     in_place_normalisation : If True then input image can be modified during normalisation.
     internal_dtype : dtype for internal computation.
+    axes : axes along which gradients are computed and smoothed, all axes if None. For example, the axes of the
+        images of a batch stacked along the first axis.
 
     Returns
     -------
@@ -53,7 +58,6 @@ def sobel_filter(
         internal_dtype = numpy.float32
 
     xp = Backend.get_xp_module(image)
-    sp = Backend.get_sp_module(image)
     ndim = image.ndim
 
     if internal_dtype is None:
@@ -75,9 +79,12 @@ def sobel_filter(
 
     sobel_image = xp.zeros_like(image)
 
-    for i in range(ndim):
-        sobel_one_axis = xp.absolute(sp.ndimage.sobel(image, axis=i))
-        sobel_image += sobel_one_axis ** exponent
+    if axes is None:
+        axes = tuple(range(ndim))
+
+    for i in axes:
+        sobel_one_axis = xp.absolute(_sobel(image, axis=i, axes=axes))
+        sobel_image += sobel_one_axis**exponent
 
     if exponent == 1:
         pass
@@ -87,3 +94,17 @@ def sobel_filter(
     sobel_image = sobel_image.astype(dtype=original_dtype, copy=False)
 
     return sobel_image
+
+
+def _sobel(image, axis: int, axes: Sequence[int]):
+    # Sobel derivative along one axis, smoothed along the other given axes only:
+    sp = Backend.get_sp_module(image)
+
+    if len(axes) == image.ndim:
+        return sp.ndimage.sobel(image, axis=axis)
+
+    output = sp.ndimage.correlate1d(image, [-1, 0, 1], axis=axis)
+    for other_axis in axes:
+        if other_axis != axis:
+            output = sp.ndimage.correlate1d(output, [1, 2, 1], axis=other_axis)
+    return output
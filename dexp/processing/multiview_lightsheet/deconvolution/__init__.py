@@ -0,0 +1,3 @@
+from dexp.processing.multiview_lightsheet.deconvolution.multiview_lr_deconvolution import (
+    multiview_lucy_richardson_deconvolution,
+)
@@ -0,0 +1,55 @@
+import numpy
+from skimage.data import camera
+
+from dexp.processing.deconvolution import lucy_richardson_deconvolution
+from dexp.processing.filters.fft_convolve import FFTConvolver, fft_convolve
+from dexp.processing.filters.kernels.gaussian import gaussian_kernel_nd
+from dexp.processing.multiview_lightsheet.deconvolution import (
+    multiview_lucy_richardson_deconvolution,
+)
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_multiview_lr_deconvolution_numpy():
+    with NumpyBackend():
+        _test_multiview_lr_deconvolution()
+
+
+def test_multiview_lr_deconvolution_cupy():
+    try:
+        with CupyBackend():
+            _test_multiview_lr_deconvolution()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_multiview_lr_deconvolution():
+    xp = Backend.get_xp_module()
+
+    image = Backend.to_backend(camera().astype(numpy.float32)[128:384, 128:384] / 255)
+
+    # each view is blurred along a different axis:
+    psfs = [gaussian_kernel_nd(size=17, ndim=2, sigma=sigma, dtype=numpy.float32) for sigma in ((4, 0.5), (0.5, 4))]
+    views = [fft_convolve(image, psf) for psf in psfs]
+
+    convolve = FFTConvolver(mode="reflect", max_cached_transfer_functions=4)
+    joint = multiview_lucy_richardson_deconvolution(
+        [view.copy() for view in views], psfs, num_iterations=10, padding=8, convolve_method=convolve
+    )
+    assert joint.shape == image.shape and joint.dtype == image.dtype
+
+    # the transfer functions of each view are computed once (symmetric PSFs are their own back projectors):
+    assert convolve.misses == 2 and convolve.hits == 4 * 10 - 2
+
+    # same number of passes over the views:
+    single = lucy_richardson_deconvolution(views[0].copy(), psfs[0], num_iterations=20, padding=8)
+    fused = lucy_richardson_deconvolution(
+        (views[0] + views[1]) / 2, (psfs[0] + psfs[1]) / 2, num_iterations=20, padding=8
+    )
+
+    def error(deconvolved):
+        return float(xp.abs(deconvolved - image)[16:-16, 16:-16].mean())
+
+    print(f"Error joint: {error(joint)}, single view: {error(single)}, fused then deconvolved: {error(fused)}")
+    assert error(joint) < error(single)
+    assert error(joint) < error(fused)
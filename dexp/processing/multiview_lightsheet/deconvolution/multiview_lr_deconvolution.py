@@ -0,0 +1,144 @@
+from typing import Optional, Sequence, Tuple
+
+import numpy
+from arbol import aprint
+
+from dexp.processing.deconvolution.lr_kernels import lr_correct, lr_relative_blur
+from dexp.processing.filters.fft_convolve import FFTConvolver
+from dexp.processing.utils.normalise import Normalise
+from dexp.utils import xpArray
+from dexp.utils.backends import Backend, NumpyBackend
+
+
+def multiview_lucy_richardson_deconvolution(
+    views: Sequence[xpArray],
+    psfs: Sequence[xpArray],
+    num_iterations: int = 10,
+    max_correction: Optional[float] = None,
+    padding: int = 0,
+    padding_mode: str = "edge",
+    normalise_input: bool = True,
+    normalise_minmax: Optional[Tuple[float, float]] = None,
+    clip_output: bool = False,
+    eps: float = 1e-12,
+    convolve_method=None,
+    internal_dtype=None,
+    tolerance: Optional[float] = None,
+) -> xpArray:
+    """
+    Jointly deconvolves registered views of the same sample, each given with its own point-spread-function,
+    into a single image. Updates follow an ordered-subset schedule: each iteration goes through all views, and
+    the estimate is corrected after each view (sub-iteration) instead of after averaging the corrections of all
+    views, so that it needs about as many times fewer iterations as there are views.
+
+    Parameters
+    ----------
+    views : registered views, all of the same shape.
+    psfs : point-spread-functions of the views, in the same order and with the same number of dimensions.
+    num_iterations : number of iterations, each one going through all views.
+    max_correction : Lucy-Richardson correction will remain clamped within [1/mc, mc].
+    padding : padding (see numpy/cupy pad function)
+    padding_mode : padding mode (see numpy/cupy pad function)
+    normalise_input : This deconvolution code assumes values within [0, 1], by default the views are jointly
+        normalised to that range, so that their relative intensities are preserved.
+    normalise_minmax : Use the given tuple (min, max) for normalisation.
+    clip_output : Clip output to the input range, or not.
+    eps : epsilon to avoid dividing by zero.
+    convolve_method : convolution method to use, if None an FFTConvolver caching the transfer functions of the
+        PSFs and back projectors of all views is used.
+    internal_dtype : dtype to use internally for computation.
+    tolerance : if not None, iterations stop once the relative change of the estimate over one iteration drops
+        below this value, num_iterations is then the maximal number of iterations.
+
+    Returns
+    -------
+    Deconvolved image, with the dtype of the first view.
+    """
+    xp = Backend.get_xp_module()
+
+    if len(views) == 0 or len(views) != len(psfs):
+        raise ValueError(f"One PSF per view is required, got {len(views)} views and {len(psfs)} PSFs.")
+
+    shape = views[0].shape
+    for view, psf in zip(views, psfs):
+        if view.shape != shape:
+            raise ValueError(f"All views must have the same shape, got {view.shape} and {shape}.")
+        if view.ndim != psf.ndim:
+            raise ValueError("The views and PSFs must have same number of dimensions!")
+
+    if internal_dtype is None or isinstance(Backend.current(), NumpyBackend):
+        internal_dtype = numpy.float32
+
+    original_dtype = views[0].dtype
+    views = [Backend.to_backend(view, dtype=internal_dtype) for view in views]
+    psfs = [Backend.to_backend(psf, dtype=internal_dtype) for psf in psfs]
+    psfs = [psf / psf.sum() for psf in psfs]
+    back_projectors = [xp.flip(psf) for psf in psfs]
+
+    # Default convolution, caches the transfer functions of all PSFs and back projectors:
+    if convolve_method is None:
+        convolve_method = FFTConvolver(mode="reflect", max_cached_transfer_functions=max(4, 2 * len(views)))
+
+    # Views are normalised jointly:
+    if normalise_minmax is None and normalise_input:
+        normalise_minmax = (min(float(xp.min(view)) for view in views), max(float(xp.max(view)) for view in views))
+    normalise = Normalise(
+        views[0], minmax=normalise_minmax, do_normalise=normalise_input, clip=False, dtype=internal_dtype
+    )
+    views = [normalise.forward(view) for view in views]
+
+    # Padding:
+    if padding > 0:
+        views = [numpy.pad(view, pad_width=padding, mode=padding_mode) for view in views]
+
+    # The numerators of the relative blurs do not change between iterations:
+    numerators = [view + eps for view in views]
+
+    # The estimate starts from the average of the views:
+    result = xp.zeros_like(views[0])
+    for view in views:
+        result += view
+    result /= len(views)
+    low, high = min(float(xp.min(view)) for view in views), max(float(xp.max(view)) for view in views)
+    del views
+
+    previous_result = None
+    for i in range(num_iterations):
+        if tolerance is not None:
+            if previous_result is None:
+                previous_result = xp.empty_like(result)
+            xp.copyto(previous_result, result)
+
+        # One sub-iteration per view, each one correcting the estimate:
+        for numerator, psf, back_projector in zip(numerators, psfs, back_projectors):
+            convolved = convolve_method(result, psf)
+            relative_blur = lr_relative_blur(
+                numerator, convolved, eps=eps, max_correction=max_correction, out=convolved
+            )
+            multiplicative_correction = convolve_method(relative_blur, back_projector)
+            result = lr_correct(result, multiplicative_correction)
+
+        # Stops once the estimate does not change anymore:
+        if tolerance is not None:
+            change = xp.subtract(previous_result, result, out=previous_result)
+            relative_change = float(xp.sum(xp.abs(change, out=change)) / (xp.sum(xp.abs(result)) + eps))
+            if relative_change < tolerance:
+                aprint(f"Multi-view deconvolution converged after {i + 1} iterations, change: {relative_change:.2e}")
+                break
+
+    # Delete intermediates:
+    del numerators, previous_result
+
+    # Clips output:
+    if clip_output:
+        result = xp.clip(result, low, high, out=result)
+
+    # Denormalises result:
+    result = normalise.backward(result)
+
+    # Removes padding:
+    if padding > 0:
+        result = result[(slice(padding, -padding),) * result.ndim]
+
+    # converts to original dtype:
+    return result.astype(original_dtype, copy=False)
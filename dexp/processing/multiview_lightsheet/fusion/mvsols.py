@@ -274,6 +274,8 @@ def msols_fuse_1C2L(
                 max_residual_shift=registration_max_residual_shift,
                 edge_filter=registration_edge_filter,
                 registration_method=registration_method,
+                # tiles of the same shape are registered together, only possible with projections:
+                batch_size=16 if registration_mode == "projection" else 1,
                 save_memory=huge_dataset_mode,
             )
 
@@ -355,7 +357,7 @@ def msols_fuse_1C2L(
         sigma = illumination_correction_sigma
         length = C1Lx.shape[1]
         correction = xp.linspace(-length // 2, length // 2, num=length)
-        correction = xp.exp(-(correction ** 2) / (2 * sigma * sigma))
+        correction = xp.exp(-(correction**2) / (2 * sigma * sigma))
         correction = 1.0 / correction
         correction = correction.astype(dtype=internal_dtype)
         C1Lx *= correction[xp.newaxis, :, xp.newaxis]
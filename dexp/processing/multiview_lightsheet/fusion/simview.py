@@ -282,7 +282,14 @@ class SimViewFusion(BaseFusion):
         )
 
     def compute_registration(
-        self, C0Lx: xpArray, C1Lx: xpArray, mode: str, edge_filter: bool, crop_factor_along_z: float
+        self,
+        C0Lx: xpArray,
+        C1Lx: xpArray,
+        mode: str,
+        edge_filter: bool,
+        crop_factor_along_z: float,
+        pyramid_factor: int = 1,
+        upsample_factor: int = 1,
     ) -> None:
         C0Lx = Backend.to_backend(C0Lx)
         C1Lx = Backend.to_backend(C1Lx)
@@ -292,10 +299,13 @@ class SimViewFusion(BaseFusion):
         C0Lx_c = C0Lx[crop:-crop]
         C1Lx_c = C1Lx[crop:-crop]
 
+        registration_kwargs = dict(
+            edge_filter=edge_filter, pyramid_factor=pyramid_factor, upsample_factor=upsample_factor
+        )
         if mode == "projection":
-            self._registration_model = register_translation_proj_nd(C0Lx_c, C1Lx_c, edge_filter=edge_filter)
+            self._registration_model = register_translation_proj_nd(C0Lx_c, C1Lx_c, **registration_kwargs)
         elif mode == "full":
-            self._registration_model = register_translation_nd(C0Lx_c, C1Lx_c, edge_filter=edge_filter)
+            self._registration_model = register_translation_nd(C0Lx_c, C1Lx_c, **registration_kwargs)
         else:
             raise NotImplementedError
 
@@ -0,0 +1,52 @@
+import numpy
+from skimage.data import camera
+
+from dexp.processing.optimization.grid_search import j_invariant_grid_search
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_grid_search_numpy():
+    with NumpyBackend():
+        _test_grid_search()
+
+
+def test_grid_search_cupy():
+    try:
+        with CupyBackend():
+            _test_grid_search()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _test_grid_search():
+    sp = Backend.get_sp_module()
+
+    rng = numpy.random.default_rng(0)
+    image = camera().astype(numpy.float32) / 255
+    noisy = Backend.to_backend(image + 0.1 * rng.standard_normal(image.shape, dtype=numpy.float32))
+
+    shapes = []
+
+    def denoise(image, sigma):
+        shapes.append(image.shape)
+        return sp.ndimage.gaussian_filter(image, sigma=sigma)
+
+    def mse(x, y):
+        return ((x - y) ** 2).mean().item()
+
+    grid = {"sigma": [0.1, 0.5, 1.0, 2.0, 4.0, 8.0, 16.0, 32.0]}
+
+    Backend.get_xp_module().random.seed(0)
+    best = j_invariant_grid_search(noisy, denoise, mse, grid, proportion_mask=0.05)
+    assert len(shapes) == 8 and all(shape == image.shape for shape in shapes)
+
+    # successive halving, concurrently: 8 candidates on 128x128, 4 on 256x256 and 2 on the whole image:
+    shapes.clear()
+    Backend.get_xp_module().random.seed(0)
+    best_halving = j_invariant_grid_search(
+        noisy, denoise, mse, grid, proportion_mask=0.05, workers=2, min_crop_size=128
+    )
+    assert sorted(shapes) == sorted([(128, 128)] * 8 + [(256, 256)] * 4 + [image.shape] * 2)
+
+    print(f"Best parameters: {best}, with successive halving: {best_halving}")
+    assert best == best_halving
@@ -1,11 +1,15 @@
 import itertools
-from typing import Callable, Dict
+import math
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
 
 import numpy
+from arbol import aprint, asection
 from numpy.typing import ArrayLike
 
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
+from dexp.utils.misc import compute_num_workers
 
 
 def j_invariant_grid_search(
@@ -15,8 +19,36 @@ def j_invariant_grid_search(
     grid=Dict[str, ArrayLike],
     proportion_mask: float = 0.01,
     median_window: int = 3,
+    workers: int = 1,
+    min_crop_size: Optional[int] = None,
+    keep_fraction: float = 0.5,
     display: bool = False,
 ) -> Dict[str, float]:
+    """
+    Finds the parameters of a restoration function (denoising, deconvolution, ...) that minimise a J-invariant
+    loss: a random subset of voxels is replaced by the median of their neighbourhood, and the loss is measured
+    between the restored and the original values of these voxels.
+
+    Parameters
+    ----------
+    image : image to restore.
+    function : restoration function, called with an image and the parameters as keyword arguments.
+    loss_fun : loss function, called with the restored and original values of the masked voxels.
+    grid : dictionary of parameter names to the values to try, all combinations are evaluated.
+    proportion_mask : proportion of masked voxels.
+    median_window : size of the median filter giving the values of masked voxels.
+    workers : number of parameter combinations evaluated concurrently, negative numbers n correspond to:
+        number_of_cores / |n|.
+    min_crop_size : if not None, successive halving is used: all combinations are first evaluated on a central crop
+        of at most this size along each axis, only the best fraction is kept, and the crop size doubles at each
+        round until the best combinations are evaluated on the whole image.
+    keep_fraction : fraction of the combinations kept after each round of successive halving.
+    display : shows the masked image and all estimations with napari.
+
+    Returns
+    -------
+    Dictionary of the optimal parameters.
+    """
 
     backend = Backend.current()
     xp = Backend.get_xp_module()
@@ -24,39 +56,84 @@ def j_invariant_grid_search(
 
     image = backend.to_backend(image)
 
+    # the median image and the mask are computed once for all combinations and crops:
     median = sp.ndimage.median_filter(image, size=median_window)
     mask = xp.random.uniform(size=image.shape) < proportion_mask
 
     # overwrite the values of the mask with median
     masked = image.copy()
     masked[mask] = median[mask]
+    del median
 
     if display:
         import napari
 
         viewer = napari.view_image(backend.to_numpy(image), name="original")
-        viewer.add_image(backend.to_numpy(median), name="median")
-        viewer.add_image(backend.to_numpy(masked), name="mask")
-        viewer.add_image(backend.to_numpy(mask), name="masked")
+        viewer.add_image(backend.to_numpy(masked), name="masked")
+        viewer.add_image(backend.to_numpy(mask), name="mask")
 
-    history = []
-    # compute grid search over possible values
-    for params in itertools.product(*grid.values()):
-        params = {k: p for k, p in zip(grid.keys(), params)}
+    candidates = [dict(zip(grid.keys(), params)) for params in itertools.product(*grid.values())]
+    workers = compute_num_workers(workers, len(candidates))
+
+    def evaluate(crop: Tuple[slice, ...], params: Dict) -> Tuple[float, Optional[xpArray]]:
         # predict results
-        estimation = function(masked, **params)
+        estimation = function(masked[crop], **params)
         # compute loss function
-        loss = loss_fun(estimation[mask], image[mask])
+        crop_mask = mask[crop]
+        loss = loss_fun(estimation[crop_mask], image[crop][crop_mask])
         loss = numpy.nan_to_num(loss, nan=1e12)
+        # estimations are as large as the crop, they are only kept around for display:
+        return loss, (backend.to_numpy(estimation) if display else None)
+
+    def evaluate_concurrently(crop: Tuple[slice, ...], params: Dict) -> Tuple[float, Optional[xpArray]]:
+        # backends are thread-local, each worker thread enters a non-exclusive copy of the caller's backend:
+        with backend.copy(exclusive=False):
+            return evaluate(crop, params)
 
-        name = f"{params}: loss={loss:0.3f}"
-        if display:
-            viewer.add_image(backend.to_numpy(estimation), name=name)
-        print(name)
-        history.append((loss, params))
+    history = []
+    for shape in _crop_shapes(image.shape, min_crop_size, len(candidates), keep_fraction):
+        crop = tuple(slice((s - c) // 2, (s - c) // 2 + c) for s, c in zip(image.shape, shape))
+        with asection(f"Evaluating {len(candidates)} parameter combinations on a crop of shape: {shape}"):
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = list(executor.map(lambda params: evaluate_concurrently(crop, params), candidates))
+            else:
+                # lazily evaluated, so that only one estimation is alive at a time:
+                results = (evaluate(crop, params) for params in candidates)
+
+            history = []
+            for params, (loss, estimation) in zip(candidates, results):
+                name = f"{params}: loss={loss:0.3f}"
+                if display:
+                    viewer.add_image(estimation, name=f"{shape} {name}")
+                aprint(name)
+                history.append((loss, params))
+            del results
+
+        # keeps the best combinations for the next round:
+        history.sort(key=lambda x: x[0])
+        candidates = [params for _, params in history[: max(1, math.ceil(len(history) * keep_fraction))]]
 
     if display:
         napari.run()
 
     # return optimal (minimum)
     return min(history, key=lambda x: x[0])[1]
+
+
+def _crop_shapes(
+    shape: Tuple[int, ...], min_crop_size: Optional[int], nb_candidates: int, keep_fraction: float
+) -> List[Tuple[int, ...]]:
+    # Crop shapes of the rounds of successive halving, doubling in size until the whole image, rounds stop early
+    # once a single candidate is left:
+    if min_crop_size is None:
+        return [tuple(shape)]
+
+    shapes = []
+    size = min_crop_size
+    while True:
+        shapes.append(tuple(min(s, size) for s in shape))
+        if shapes[-1] == tuple(shape) or nb_candidates == 1:
+            return shapes
+        nb_candidates = max(1, math.ceil(nb_candidates * keep_fraction))
+        size *= 2
@@ -0,0 +1,46 @@
+import numpy
+from skimage.data import camera
+
+from dexp.processing.registration.sequence import image_stabilisation_incremental
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_register_sequence_incremental_numpy():
+    with NumpyBackend():
+        register_sequence_incremental()
+
+
+def test_register_sequence_incremental_cupy():
+    try:
+        with CupyBackend():
+            register_sequence_incremental()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def register_sequence_incremental(length=24):
+    rng = numpy.random.default_rng(0)
+    drift = numpy.cumsum(rng.uniform(-1.5, 1.5, size=(length, 2)), axis=0)
+    drift -= drift[0]
+
+    image = camera().astype(numpy.float32)[::2, ::2] / 255
+    sequence = numpy.stack(
+        list(numpy.roll(image, shift=tuple(int(round(s)) for s in shift), axis=(0, 1)) for shift in drift)
+    )
+    sequence += 0.05 * rng.random(sequence.shape, dtype=numpy.float32)
+    sequence = Backend.to_backend(sequence)
+
+    # the sequence grows, the model is extended twice:
+    model = image_stabilisation_incremental(sequence[: length // 2], axis=0)
+    first_shifts = list(m.shift_vector.copy() for m in model.model_list)
+    model = image_stabilisation_incremental(sequence, axis=0, model=model)
+
+    assert len(model) == length
+    # the models of the earlier frames are left unchanged:
+    for m, shift in zip(model.model_list, first_shifts):
+        assert (m.shift_vector == shift).all()
+
+    shifts = numpy.stack(list(Backend.to_numpy(m.shift_vector) for m in model.model_list))
+    error = numpy.abs(shifts + numpy.round(drift)).mean()
+    print(f"Mean error: {error}")
+    assert error < 1
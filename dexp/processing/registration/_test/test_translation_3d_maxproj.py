@@ -1,5 +1,6 @@
 from pytest import approx
 
+from dexp.datasets.synthetic_datasets import generate_fusion_test_data
 from dexp.processing.registration.demo.demo_translation_3d_proj import (
     _register_translation_3d_proj,
 )
@@ -7,6 +8,11 @@ from dexp.processing.registration.translation_2d import (
     register_translation_2d_dexp,
     register_translation_2d_skimage,
 )
+from dexp.processing.registration.translation_nd_proj import (
+    register_translation_proj_nd,
+    register_translation_proj_nd_spectra,
+    translation_proj_nd_spectra,
+)
 from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
 
 
@@ -31,3 +37,30 @@ def register_translation_3d_maxproj(method, length_xy=128):
     assert shifts[0] == approx(-1, abs=0.5)
     assert shifts[1] == approx(-5, abs=0.5)
     assert shifts[2] == approx(13, abs=0.5)
+
+
+def test_register_translation_3d_maxproj_spectra_numpy():
+    with NumpyBackend():
+        register_translation_3d_maxproj_spectra()
+
+
+def test_register_translation_3d_maxproj_spectra_cupy():
+    try:
+        with CupyBackend():
+            register_translation_3d_maxproj_spectra()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def register_translation_3d_maxproj_spectra(length_xy=128):
+    _, _, _, _, image1, image2 = generate_fusion_test_data(
+        add_noise=False, shift=(1, 5, -13), volume_fraction=0.5, length_xy=length_xy, length_z_factor=1
+    )
+
+    # registering precomputed spectra gives the same model as registering the images:
+    model = register_translation_proj_nd(image1, image2)
+    spectra_model = register_translation_proj_nd_spectra(
+        translation_proj_nd_spectra(image1), translation_proj_nd_spectra(image2)
+    )
+    assert Backend.to_numpy(spectra_model.shift_vector) == approx(Backend.to_numpy(model.shift_vector))
+    assert float(spectra_model.confidence) == approx(float(model.confidence))
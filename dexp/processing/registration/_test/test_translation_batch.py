@@ -0,0 +1,65 @@
+import numpy
+from pytest import approx
+from scipy.ndimage import gaussian_filter
+from scipy.ndimage import shift as nd_shift
+
+from dexp.processing.registration.translation_nd import (
+    register_translation_nd,
+    register_translation_nd_batch,
+)
+from dexp.processing.registration.translation_nd_proj import (
+    register_translation_proj_nd,
+    register_translation_proj_nd_batch,
+)
+from dexp.processing.registration.warp_nd import register_warp_nd
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_register_translation_batch_numpy():
+    with NumpyBackend():
+        _register_translation_batch()
+
+
+def test_register_translation_batch_cupy():
+    try:
+        with CupyBackend():
+            _register_translation_batch()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _pairs(rng, batch_size, shape):
+    # pairs of images shifted by random integral shifts:
+    images_a, images_b = [], []
+    for _ in range(batch_size):
+        image = gaussian_filter(rng.uniform(0, 1, size=shape), sigma=2).astype(numpy.float32)
+        images_a.append(nd_shift(image, rng.integers(-6, 7, size=len(shape)), order=0))
+        images_b.append(image)
+    return Backend.to_backend(numpy.stack(images_a)), Backend.to_backend(numpy.stack(images_b))
+
+
+def _register_translation_batch():
+    rng = numpy.random.default_rng(0)
+
+    # batches give the same registrations as pairs registered one by one:
+    images_a, images_b = _pairs(rng, 5, (96, 80))
+    shifts, confidences = register_translation_nd_batch(images_a, images_b)
+    for image_a, image_b, shift, confidence in zip(images_a, images_b, shifts, confidences):
+        model = register_translation_nd(image_a, image_b)
+        assert Backend.to_numpy(shift) == approx(Backend.to_numpy(model.shift_vector))
+        assert float(confidence) == approx(float(model.confidence), abs=1e-4)
+
+    images_a, images_b = _pairs(rng, 4, (48, 64, 56))
+    shifts, confidences = register_translation_proj_nd_batch(images_a, images_b)
+    for image_a, image_b, shift, confidence in zip(images_a, images_b, shifts, confidences):
+        model = register_translation_proj_nd(image_a, image_b)
+        assert Backend.to_numpy(shift) == approx(Backend.to_numpy(model.shift_vector))
+        assert float(confidence) == approx(float(model.confidence), abs=1e-4)
+
+    # tiles of the same shape are registered in batches:
+    image_a, image_b = _pairs(rng, 1, (96, 128, 112))
+    model = register_warp_nd(image_a[0], image_b[0], chunks=32, margins=8)
+    model_batch = register_warp_nd(image_a[0], image_b[0], chunks=32, margins=8, batch_size=16)
+    assert model_batch.vector_field.shape == model.vector_field.shape
+    assert Backend.to_numpy(model_batch.vector_field) == approx(Backend.to_numpy(model.vector_field))
+    assert Backend.to_numpy(model_batch.confidence) == approx(Backend.to_numpy(model.confidence), abs=1e-4)
@@ -0,0 +1,50 @@
+import numpy
+from pytest import approx
+from scipy.ndimage import fourier_shift, gaussian_filter
+
+from dexp.processing.registration.translation_nd import register_translation_nd
+from dexp.utils.backends import Backend, CupyBackend, NumpyBackend
+
+
+def test_register_translation_nd_multiscale_numpy():
+    with NumpyBackend():
+        _register_translation_nd_multiscale()
+
+
+def test_register_translation_nd_multiscale_cupy():
+    try:
+        with CupyBackend():
+            _register_translation_nd_multiscale()
+    except ModuleNotFoundError:
+        print("Cupy module not found! Test passes nevertheless!")
+
+
+def _register_translation_nd_multiscale():
+    rng = numpy.random.default_rng(0)
+    image = gaussian_filter(rng.uniform(0, 1, size=(320, 288)), sigma=3)
+    image = (image - image.min()) / (image.max() - image.min())
+
+    true_shift = numpy.array([9.3, -14.6])
+    shifted = numpy.fft.ifftn(fourier_shift(numpy.fft.fftn(image), true_shift)).real
+
+    crop = (slice(32, -32), slice(32, -32))
+    image_a = Backend.to_backend(shifted[crop].astype(numpy.float32))
+    image_b = Backend.to_backend(image[crop].astype(numpy.float32))
+
+    model = register_translation_nd(image_a, image_b)
+    integral_shift = Backend.to_numpy(model.shift_vector)
+    print(model)
+    assert integral_shift == approx(numpy.round(true_shift))
+
+    # coarse-to-fine registration finds the same integral shift:
+    for pyramid_factor in (2, 4):
+        model = register_translation_nd(image_a, image_b, pyramid_factor=pyramid_factor)
+        print(model)
+        assert Backend.to_numpy(model.shift_vector) == approx(integral_shift)
+        assert model.confidence > 0.5
+
+    # subpixel refinement, with and without coarse-to-fine registration:
+    for pyramid_factor in (1, 4):
+        model = register_translation_nd(image_a, image_b, pyramid_factor=pyramid_factor, upsample_factor=20)
+        print(model)
+        assert Backend.to_numpy(model.shift_vector) == approx(true_shift, abs=0.15)
@@ -1,7 +1,11 @@
-from typing import List, Optional, Tuple
+import itertools
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Sequence, Tuple
 
 import dask
 import numpy
+import scipy.sparse
 from arbol import aprint, asection
 from dask.array import Array
 from joblib import Parallel, delayed
@@ -13,12 +17,17 @@ from dexp.processing.registration.model.translation_registration_model import (
     TranslationRegistrationModel,
 )
 from dexp.processing.registration.translation_nd_proj import (
-    register_translation_proj_nd,
+    register_translation_proj_nd_spectra_batch,
+    translation_proj_nd_spectra,
 )
 from dexp.processing.utils.center_of_mass import center_of_mass
-from dexp.processing.utils.linear_solver import linsolve
+from dexp.processing.utils.linear_solver import sparse_linsolve
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend, NumpyBackend
+from dexp.utils.misc import compute_num_workers
+
+# parameters of the preprocessing of the frames, see 'translation_proj_nd_spectra':
+_spectra_parameters = ("denoise_input_sigma", "gamma", "log_compression", "edge_filter")
 
 
 def image_stabilisation(
@@ -60,8 +69,12 @@ def image_stabilisation(
     order_reg: order for linear solver regularisation term.
     alpha_reg: multiplicative coefficient for regularisation term.
     detrend: removes linear detrend from stabilized image.
+    debug_output: if not None, path prefix of the plots of the pairwise confidences and of the shift vectors.
+    workers: number of threads computing pairwise registrations, negative numbers n correspond to:
+        number_of_cores / |n|.
     internal_dtype : internal dtype for computation
     **kwargs: argument passthrough to the pairwise registration method, see 'register_translation_nd'.
+        Frames are preprocessed and transformed once, and kept in a cache bounded to about 'max_range' frames.
 
     Returns
     -------
@@ -105,34 +118,21 @@ def image_stabilisation(
                         uv_set.add(atuple)
 
         with asection(f"Computing pairwise registrations for {len(uv_set)} (u,v) pairs..."):
-
-            def _compute_model(pair: Tuple[int, int]) -> Optional[TranslationRegistrationModel]:
-                u, v = pair
-                if image_sequence:
-                    image_u = image_sequence[u]
-                    image_v = image_sequence[v]
-                elif isinstance(image, Array):
-                    image_u = dask.array.take(image, u, axis=axis)
-                    image_v = dask.array.take(image, v, axis=axis)
-                else:
-                    image_u = xp.take(image, u, axis=axis)
-                    image_v = xp.take(image, v, axis=axis)
-                model = _pairwise_registration(
-                    u,
-                    v,
-                    image_u,
-                    image_v,
-                    mode,
-                    min_confidence,
-                    enable_com,
-                    quantile,
-                    bounding_box,
-                    internal_dtype,
-                    **kwargs,
-                )
-                return model
-
-            pairwise_models = Parallel(n_jobs=workers)(delayed(_compute_model)(pair) for pair in uv_set)
+            pairwise_models = _register_pairs(
+                image,
+                axis,
+                list(uv_set),
+                image_sequence=image_sequence,
+                max_range=max_range,
+                mode=mode,
+                min_confidence=min_confidence,
+                enable_com=enable_com,
+                quantile=quantile,
+                bounding_box=bounding_box,
+                workers=workers,
+                internal_dtype=internal_dtype,
+                **kwargs,
+            )
             pairwise_models = [model for model in pairwise_models if model is not None]
 
         nb_models = len(pairwise_models)
@@ -174,9 +174,11 @@ def image_stabilisation(
 
                     for d in range(ndim):
 
-                        # instantiates system to solve with zeros:
-                        a = xp.zeros((nb_models + 1, length), dtype=xp.float32)
+                        # instantiates the right-hand side of the system with zeros, the matrix is built sparse:
                         y = xp.zeros((nb_models + 1,), dtype=xp.float32)
+                        rows = xp.repeat(xp.arange(nb_models + 1), 2)[:-1]
+                        columns = xp.zeros((2 * nb_models + 1,), dtype=xp.int64)
+                        values = xp.zeros((2 * nb_models + 1,), dtype=xp.float32)
 
                         # iterates through all pairwise registrations:
                         zero_vector = None
@@ -193,8 +195,8 @@ def image_stabilisation(
 
                             # Each pairwise registration defines a constraint that is added to the matrix:
                             y[tp] = vector.copy()
-                            a[tp, u] = +1
-                            a[tp, v] = -1
+                            columns[2 * tp : 2 * tp + 2] = u, v
+                            values[2 * tp : 2 * tp + 2] = +1, -1
 
                             # For each time point we collect the average confidence of all the pairwise_registrations:
                             translation_models[u].confidence += confidence
@@ -204,13 +206,14 @@ def image_stabilisation(
 
                         # Forces solution to have no displacement for first time point:
                         y[-1] = 0
-                        a[-1, 0] = 1
+                        columns[-1] = 0
+                        values[-1] = 1
 
-                        # move matrix to sparse domain (much faster!):
-                        a = sp.sparse.coo_matrix(a)
+                        # sparse incidence matrix, with a pair of non-zero entries per pairwise registration:
+                        a = sp.sparse.csr_matrix((values, (rows, columns)), shape=(nb_models + 1, length))
 
-                        # solve system:
-                        x_opt = linsolve(
+                        # solve system, in time linear in the sequence length:
+                        x_opt = sparse_linsolve(
                             a, y, tolerance=tolerance, order_error=order_error, order_reg=order_reg, alpha_reg=alpha_reg
                         )
 
@@ -247,34 +250,276 @@ def image_stabilisation(
             # image_b = Backend.to_backend(image_b, dtype=internal_dtype)
 
 
-def _pairwise_registration(
-    u, v, image_u, image_v, mode, min_confidence, enable_com, quantile, bounding_box, internal_dtype, **kwargs
-):
-    image_u = Backend.to_backend(image_u, dtype=internal_dtype)
-    image_v = Backend.to_backend(image_v, dtype=internal_dtype)
+def image_stabilisation_incremental(
+    image: xpArray,
+    axis: int,
+    model: Optional[SequenceRegistrationModel] = None,
+    max_range: int = 7,
+    min_confidence: float = 0.5,
+    enable_com: bool = False,
+    quantile: float = 0.5,
+    bounding_box: bool = False,
+    tolerance: float = 1e-7,
+    order_error: float = 2.0,
+    order_reg: float = 1.0,
+    alpha_reg: float = 0.1,
+    workers: int = 1,
+    internal_dtype=None,
+    **kwargs,
+) -> SequenceRegistrationModel:
+    """
+    Extends a translation sequence stabilisation model to the frames of an image sequence that it does not cover yet,
+    for example to stabilise a dataset while it is being acquired. Each new frame is registered against the
+    'max_range - 1' frames before it, and the shifts of the new frames are solved for with the shifts of the earlier
+    frames fixed. The cost per new frame therefore does not depend on the length of the sequence.
+    New frames without any accepted registration against an earlier frame keep the shift of the previous frame.
 
-    if mode == "translation":
-        model = register_translation_proj_nd(image_u, image_v, _display_phase_correlation=False, **kwargs)
-        model.u = u
-        model.v = v
-        confidence = model.overall_confidence()
-
-        if confidence < min_confidence:
-            if enable_com:
-                offset_mode = f"p={quantile * 100}"
-                com_u = center_of_mass(
-                    image_u, mode="full", projection_type="max-min", offset_mode=offset_mode, bounding_box=bounding_box
-                )
-                com_v = center_of_mass(
-                    image_v, mode="full", projection_type="max-min", offset_mode=offset_mode, bounding_box=bounding_box
+    Parameters
+    ----------
+    image: image sequence to stabilise, its first frames being the ones covered by the model.
+    axis: sequence axis along which to stabilise image.
+    model: model of the first frames of the sequence, None to start a new model whose first frame is not shifted.
+    max_range: maximal distance, in time points, between pairs of images to registrate.
+    min_confidence: minimal confidence to accept a pairwise registration
+    enable_com: enable center of mass fallback when standard registration fails.
+    quantile: quantile to cut-off background in center-of-mass calculation
+    bounding_box: if True, the center of mass of the bounding box of non-zero pixels is returned.
+    tolerance: tolerance for linear solver.
+    order_error: order for linear solver error term.
+    order_reg: order for linear solver regularisation term.
+    alpha_reg: multiplicative coefficient for regularisation term.
+    workers: number of threads computing pairwise registrations, negative numbers n correspond to:
+        number_of_cores / |n|.
+    internal_dtype : internal dtype for computation
+    **kwargs: argument passthrough to the pairwise registration method, see 'register_translation_nd'.
+
+    Returns
+    -------
+    Sequence registration model of the whole sequence, the models of the frames covered by the given model are
+    left unchanged.
+
+    """
+    assert 0 <= axis < image.ndim
+    length = image.shape[axis]
+    ndim = image.ndim - 1
+
+    if model is None or len(model) == 0:
+        model_list = [TranslationRegistrationModel(numpy.zeros((ndim,), dtype=numpy.float32), confidence=0.0)]
+    elif all(isinstance(m, TranslationRegistrationModel) for m in model.model_list):
+        model_list = list(model.model_list)
+    else:
+        raise ValueError("Only translation sequence models can be extended.")
+
+    start = len(model_list)
+    if start > length:
+        raise ValueError(f"The model covers more frames ({start}) than the image sequence ({length}).")
+
+    pairs = list((v - scale, v) for v in range(start, length) for scale in range(1, max_range) if v - scale >= 0)
+    if len(pairs) == 0:
+        return SequenceRegistrationModel(model_list=model_list)
+
+    with asection(f"Registering {length - start} new frames with {len(pairs)} (u,v) pairs..."):
+        pairwise_models = _register_pairs(
+            image,
+            axis,
+            pairs,
+            image_sequence=None,
+            max_range=max_range,
+            mode="translation",
+            min_confidence=min_confidence,
+            enable_com=enable_com,
+            quantile=quantile,
+            bounding_box=bounding_box,
+            workers=workers,
+            internal_dtype=internal_dtype,
+            **kwargs,
+        )
+        pairwise_models = [pairwise_model for pairwise_model in pairwise_models if pairwise_model is not None]
+        aprint(f"Number of models obtained: {len(pairwise_models)} for {length - start} new frames")
+
+    with asection("Solving for the shifts of the new frames"):
+        # Each pairwise registration defines a constraint x_u - x_v = shift, frames without any constraint with an
+        # earlier frame are constrained to the position of the previous frame:
+        us = [pairwise_model.u for pairwise_model in pairwise_models]
+        vs = [pairwise_model.v for pairwise_model in pairwise_models]
+        shifts = [Backend.to_numpy(pairwise_model.shift_vector) for pairwise_model in pairwise_models]
+        for v in sorted(set(range(start, length)) - set(vs)):
+            aprint(f"No accepted registration for frame {v}, keeping the shift of the previous frame.")
+            us.append(v - 1)
+            vs.append(v)
+            shifts.append(numpy.zeros((ndim,)))
+
+        us, vs, shifts = numpy.asarray(us), numpy.asarray(vs), numpy.stack(shifts).astype(numpy.float64)
+
+        # positions of the earlier frames are fixed, their constraints are moved to the right-hand side:
+        fixed_positions = numpy.stack(list(-Backend.to_numpy(m.shift_vector) for m in model_list)).astype(numpy.float64)
+        fixed_u = us < start
+        shifts[fixed_u] -= fixed_positions[us[fixed_u]]
+
+        # sparse incidence matrix of the new frames:
+        nb_equations = len(us)
+        rows = numpy.concatenate([numpy.arange(nb_equations)[~fixed_u], numpy.arange(nb_equations)])
+        columns = numpy.concatenate([us[~fixed_u] - start, vs - start])
+        values = numpy.concatenate([numpy.ones(numpy.count_nonzero(~fixed_u)), -numpy.ones(nb_equations)])
+        a = scipy.sparse.csr_matrix((values, (rows, columns)), shape=(nb_equations, length - start))
+
+        positions = numpy.stack(
+            list(
+                sparse_linsolve(
+                    a,
+                    shifts[:, d],
+                    # warm start from the position of the last fixed frame:
+                    x0=numpy.full(length - start, fixed_positions[-1, d]),
+                    tolerance=tolerance,
+                    order_error=order_error,
+                    order_reg=order_reg,
+                    alpha_reg=alpha_reg,
                 )
-                model = TranslationRegistrationModel(shift_vector=com_u - com_v, confidence=min_confidence)
-                model.u = u
-                model.v = v
-            else:
-                model = None
+                for d in range(ndim)
+            ),
+            axis=-1,
+        )
+
+    # confidence of each frame is the average confidence of its pairwise registrations:
+    confidences = {}
+    for pairwise_model in pairwise_models:
+        for index in (pairwise_model.u, pairwise_model.v):
+            confidences.setdefault(index, []).append(pairwise_model.overall_confidence())
+
+    if model is None or len(model) == 0:
+        model_list[0].confidence = numpy.asarray(numpy.mean(confidences.get(0, [0.0])))
+
+    for index, position in enumerate(positions, start=start):
+        model_list.append(
+            TranslationRegistrationModel(
+                shift_vector=-position.astype(numpy.float32), confidence=numpy.mean(confidences.get(index, [0.0]))
+            )
+        )
+
+    return SequenceRegistrationModel(model_list=model_list)
+
+
+def _register_pairs(
+    image: xpArray,
+    axis: int,
+    pairs: Sequence[Tuple[int, int]],
+    image_sequence: Optional[Sequence[xpArray]],
+    max_range: int,
+    mode: str,
+    min_confidence: float,
+    enable_com: bool,
+    quantile: float,
+    bounding_box: bool,
+    workers: int,
+    internal_dtype,
+    **kwargs,
+) -> List[Optional[TranslationRegistrationModel]]:
+    # Registers the given pairs of frames, returns the models in the same order, None for rejected registrations:
+    xp = Backend.get_xp_module()
+    backend = Backend.current()
+    workers = compute_num_workers(workers, len(pairs))
+
+    # preprocessing parameters apply to the frames, the remaining ones to the pairwise registrations:
+    spectra_kwargs = {key: kwargs.pop(key) for key in _spectra_parameters if key in kwargs}
+
+    # Each frame is registered against up to 2 * (max_range - 1) others, its preprocessed spectra are kept
+    # in a LRU cache bounded to the sliding window of frames, so that each frame is transformed only once:
+    cache = OrderedDict()
+    cache_size = max_range + 2 * workers
+    lock = threading.Lock()
+
+    def _load_frame(index: int) -> xpArray:
+        if image_sequence:
+            frame = image_sequence[index]
+        elif isinstance(image, Array):
+            frame = dask.array.take(image, index, axis=axis)
+        else:
+            frame = xp.take(image, index, axis=axis)
+        return Backend.to_backend(frame, dtype=internal_dtype)
+
+    def _get_spectra(index: int) -> Tuple:
+        with lock:
+            if index in cache:
+                cache.move_to_end(index)
+                return cache[index]
+
+        # computed outside of the lock, concurrent misses for the same frame are rare and harmless:
+        spectra = translation_proj_nd_spectra(_load_frame(index), **spectra_kwargs)
+
+        with lock:
+            cache[index] = spectra
+            while len(cache) > cache_size:
+                cache.popitem(last=False)
+        return spectra
+
+    def _compute_models(batch: Sequence[Tuple[int, int]]) -> List[Optional[TranslationRegistrationModel]]:
+        # backends are thread-local, each worker thread enters a non-exclusive copy of the caller's backend:
+        with backend.copy(exclusive=False):
+            return _batch_registration(
+                batch,
+                [_get_spectra(u) for u, _ in batch],
+                [_get_spectra(v) for _, v in batch],
+                _load_frame,
+                mode,
+                min_confidence,
+                enable_com,
+                quantile,
+                bounding_box,
+                **kwargs,
+            )
+
+    # pairs are registered in order so that consecutive registrations share frames, the pairs of each frame
+    # with the following ones are registered together in a batch:
+    sorted_pairs = sorted(pairs)
+    batches = [list(batch) for _, batch in itertools.groupby(sorted_pairs, key=lambda pair: pair[0])]
+    models = Parallel(n_jobs=workers, backend="threading")(delayed(_compute_models)(batch) for batch in batches)
+    models = dict(zip(sorted_pairs, (model for batch_models in models for model in batch_models)))
+    return [models[pair] for pair in pairs]
+
+
+def _batch_registration(
+    pairs, spectra_u, spectra_v, load_frame, mode, min_confidence, enable_com, quantile, bounding_box, **kwargs
+):
+    if mode == "translation":
+        shift_vectors, confidences = register_translation_proj_nd_spectra_batch(spectra_u, spectra_v, **kwargs)
+        return [
+            _pairwise_registration(
+                u,
+                v,
+                TranslationRegistrationModel(shift_vector=shift_vector, confidence=confidence),
+                load_frame,
+                min_confidence,
+                enable_com,
+                quantile,
+                bounding_box,
+            )
+            for (u, v), shift_vector, confidence in zip(pairs, shift_vectors, confidences)
+        ]
 
     else:
         raise ValueError(f"Unsupported sequence stabilisation mode: {mode}")
 
+
+def _pairwise_registration(u, v, model, load_frame, min_confidence, enable_com, quantile, bounding_box):
+    model.u = u
+    model.v = v
+    confidence = model.overall_confidence()
+
+    if confidence < min_confidence:
+        if enable_com:
+            image_u = load_frame(u)
+            image_v = load_frame(v)
+            offset_mode = f"p={quantile * 100}"
+            com_u = center_of_mass(
+                image_u, mode="full", projection_type="max-min", offset_mode=offset_mode, bounding_box=bounding_box
+            )
+            com_v = center_of_mass(
+                image_v, mode="full", projection_type="max-min", offset_mode=offset_mode, bounding_box=bounding_box
+            )
+            model = TranslationRegistrationModel(shift_vector=com_u - com_v, confidence=min_confidence)
+            model.u = u
+            model.v = v
+        else:
+            model = None
+
     return model
@@ -1,4 +1,5 @@
 from functools import reduce
+from typing import Any, Tuple
 
 import numpy
 from arbol import aprint
@@ -22,6 +23,8 @@ def register_translation_nd(
     decimate: int = 16,
     quantile: float = 0.999,
     sigma: float = 1.5,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
     force_numpy: bool = False,
     internal_dtype=None,
     _display_phase_correlation: bool = False,
@@ -46,6 +49,10 @@ def register_translation_nd(
     decimate : How much to decimate when computing floor level
     quantile : Quantile to use for robust min and max
     sigma : sigma for Gaussian smoothing of phase correlogram
+    pyramid_factor : if larger than one, the shift is first estimated on a correlogram downsampled by this factor
+        along each axis, and then refined at full resolution on a small window around the predicted peak.
+    upsample_factor : if larger than one, the shift is refined to a precision of 1/upsample_factor pixel
+        with a local upsampled DFT of the cross-power spectrum around the peak.
     force_numpy : Forces output model to be allocated with numpy arrays.
     internal_dtype : internal dtype for computation
 
@@ -56,56 +63,373 @@ def register_translation_nd(
     Translation-only registration model
 
     """
-    xp = Backend.get_xp_module()
-    sp = Backend.get_sp_module()
-
     if not image_a.dtype == image_b.dtype:
         raise ValueError("Arrays must have the same dtype")
 
+    internal_dtype = _resolve_internal_dtype(image_a, internal_dtype)
+
+    preprocessing = dict(
+        denoise_input_sigma=denoise_input_sigma,
+        gamma=gamma,
+        log_compression=log_compression,
+        edge_filter=edge_filter,
+        internal_dtype=internal_dtype,
+    )
+    image_a = _preprocess_image(image_a, **preprocessing)
+    image_b = _preprocess_image(image_b, **preprocessing)
+
+    # Compute the phase correlation:
+    shift_vector, confidence, (raw_correlation, correlation, masked_correlation) = _register_spectra(
+        _windowed_spectrum(image_a),
+        _windowed_spectrum(image_b),
+        internal_dtype,
+        max_range_ratio=max_range_ratio,
+        decimate=decimate,
+        quantile=quantile,
+        sigma=sigma,
+        pyramid_factor=pyramid_factor,
+        upsample_factor=upsample_factor,
+    )
+
+    if _display_phase_correlation:
+        # DO NOT DELETE, INSTRUMENTATION CODE FOR DEBUGGING
+        from napari import Viewer, gui_qt
+
+        with gui_qt():
+            aprint(f"shift = {shift_vector}, confidence = {confidence} ")
+
+            def _c(array):
+                return Backend.to_numpy(array)
+
+            viewer = Viewer()
+            viewer.add_image(_c(image_a), name="image_a")
+            viewer.add_image(_c(image_b), name="image_b")
+            viewer.add_image(_c(raw_correlation), name="raw_correlation", colormap="viridis")
+            viewer.add_image(_c(correlation), name="correlation", colormap="viridis")
+            viewer.add_image(
+                _c(masked_correlation), name="masked_correlation", colormap="bop orange", blending="additive"
+            )
+            viewer.grid.enabled = True
+            viewer.grid.shape = (2, 3)
+
+    return TranslationRegistrationModel(shift_vector=shift_vector, confidence=confidence, force_numpy=force_numpy)
+
+
+def translation_nd_spectrum(
+    image: xpArray,
+    denoise_input_sigma: float = 1.5,
+    gamma: float = 1,
+    log_compression: bool = True,
+    edge_filter: bool = True,
+    internal_dtype=None,
+) -> Tuple[xpArray, Any]:
+    """
+    Preprocesses an image as 'register_translation_nd' does and computes its windowed spectrum,
+    to be registered with 'register_translation_nd_spectra'.
+
+    Parameters
+    ----------
+    image : image to transform
+    denoise_input_sigma, gamma, log_compression, edge_filter : preprocessing, see 'register_translation_nd'.
+    internal_dtype : internal dtype for computation
+
+    Returns
+    -------
+    Spectrum of the image, and internal dtype to register it with.
+
+    """
+    internal_dtype = _resolve_internal_dtype(image, internal_dtype)
+    image = _preprocess_image(
+        image,
+        denoise_input_sigma=denoise_input_sigma,
+        gamma=gamma,
+        log_compression=log_compression,
+        edge_filter=edge_filter,
+        internal_dtype=internal_dtype,
+    )
+    return _windowed_spectrum(image), internal_dtype
+
+
+def register_translation_nd_spectra(
+    spectrum_a: xpArray,
+    spectrum_b: xpArray,
+    max_range_ratio: float = 0.9,
+    decimate: int = 16,
+    quantile: float = 0.999,
+    sigma: float = 1.5,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
+    force_numpy: bool = False,
+    internal_dtype=numpy.float32,
+) -> TranslationRegistrationModel:
+    """
+    Registers two nD images given by their spectra, as computed by 'translation_nd_spectrum', using just a
+    translation-only model. The model is the same as the one of 'register_translation_nd' on the images,
+    but only costs a cross-power spectrum and an inverse FFT.
+
+    Parameters
+    ----------
+    spectrum_a : Spectrum of the first image to register
+    spectrum_b : Spectrum of the second image to register
+    max_range_ratio : maximal range for correlation.
+    decimate : How much to decimate when computing floor level
+    quantile : Quantile to use for robust min and max
+    sigma : sigma for Gaussian smoothing of phase correlogram
+    pyramid_factor, upsample_factor : coarse-to-fine and subpixel refinement, see 'register_translation_nd'.
+    force_numpy : Forces output model to be allocated with numpy arrays.
+    internal_dtype : internal dtype for computation, as returned with the spectra.
+
+    Returns
+    -------
+    Translation-only registration model
+
+    """
+    if spectrum_a.shape != spectrum_b.shape:
+        raise ValueError("Spectra must have the same shape")
+
+    shift_vector, confidence, _ = _register_spectra(
+        spectrum_a,
+        spectrum_b,
+        internal_dtype,
+        max_range_ratio=max_range_ratio,
+        decimate=decimate,
+        quantile=quantile,
+        sigma=sigma,
+        pyramid_factor=pyramid_factor,
+        upsample_factor=upsample_factor,
+    )
+
+    return TranslationRegistrationModel(shift_vector=shift_vector, confidence=confidence, force_numpy=force_numpy)
+
+
+def register_translation_nd_batch(
+    images_a: xpArray,
+    images_b: xpArray,
+    denoise_input_sigma: float = 1.5,
+    gamma: float = 1,
+    log_compression: bool = True,
+    edge_filter: bool = True,
+    max_range_ratio: float = 0.9,
+    decimate: int = 16,
+    quantile: float = 0.999,
+    sigma: float = 1.5,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
+    internal_dtype=None,
+) -> Tuple[xpArray, xpArray]:
+    """
+    Registers pairs of nD images, stacked along the first axis, using just a translation-only model.
+    Each pair gets the same shift vector and confidence as with 'register_translation_nd', but the whole batch
+    is preprocessed, transformed and correlated at once, which removes the per-pair overhead that dominates
+    for many small images such as tiles or projections.
+
+    Parameters
+    ----------
+    images_a : First images to register, stacked along the first axis
+    images_b : Second images to register, stacked along the first axis
+    denoise_input_sigma, gamma, log_compression, edge_filter : preprocessing, see 'register_translation_nd'.
+    max_range_ratio, decimate, quantile, sigma : phase correlation parameters, see 'register_translation_nd'.
+    pyramid_factor, upsample_factor : coarse-to-fine and subpixel refinement, see 'register_translation_nd'.
+    internal_dtype : internal dtype for computation
+
+    Returns
+    -------
+    Array of the shift vectors of the pairs, one per row, and array of their confidences.
+
+    """
+    if images_a.shape != images_b.shape:
+        raise ValueError("Batches of images must have the same shape")
+
+    if not images_a.dtype == images_b.dtype:
+        raise ValueError("Arrays must have the same dtype")
+
+    internal_dtype = _resolve_internal_dtype(images_a, internal_dtype)
+
+    preprocessing = dict(
+        denoise_input_sigma=denoise_input_sigma,
+        gamma=gamma,
+        log_compression=log_compression,
+        edge_filter=edge_filter,
+        internal_dtype=internal_dtype,
+        batch=True,
+    )
+    spectra_a = _windowed_spectrum(_preprocess_image(images_a, **preprocessing), batch=True)
+    spectra_b = _windowed_spectrum(_preprocess_image(images_b, **preprocessing), batch=True)
+
+    return register_translation_nd_spectra_batch(
+        spectra_a,
+        spectra_b,
+        max_range_ratio=max_range_ratio,
+        decimate=decimate,
+        quantile=quantile,
+        sigma=sigma,
+        pyramid_factor=pyramid_factor,
+        upsample_factor=upsample_factor,
+        internal_dtype=internal_dtype,
+    )
+
+
+def register_translation_nd_spectra_batch(
+    spectra_a: xpArray,
+    spectra_b: xpArray,
+    max_range_ratio: float = 0.9,
+    decimate: int = 16,
+    quantile: float = 0.999,
+    sigma: float = 1.5,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
+    internal_dtype=numpy.float32,
+) -> Tuple[xpArray, xpArray]:
+    """
+    Registers pairs of nD images given by their spectra, as computed by 'translation_nd_spectrum' and stacked
+    along the first axis, using just a translation-only model. Each pair gets the same shift vector and confidence
+    as with 'register_translation_nd_spectra', with a single batched cross-power spectrum and inverse FFT.
+
+    Parameters
+    ----------
+    spectra_a : Spectra of the first images to register, stacked along the first axis
+    spectra_b : Spectra of the second images to register, stacked along the first axis
+    max_range_ratio, decimate, quantile, sigma : phase correlation parameters, see 'register_translation_nd'.
+    pyramid_factor, upsample_factor : coarse-to-fine and subpixel refinement, see 'register_translation_nd'.
+    internal_dtype : internal dtype for computation, as returned with the spectra.
+
+    Returns
+    -------
+    Array of the shift vectors of the pairs, one per row, and array of their confidences.
+
+    """
+    if spectra_a.shape != spectra_b.shape:
+        raise ValueError("Spectra must have the same shape")
+
+    shift_vectors, confidences, _ = _register_spectra_batch(
+        spectra_a,
+        spectra_b,
+        internal_dtype,
+        max_range_ratio=max_range_ratio,
+        decimate=decimate,
+        quantile=quantile,
+        sigma=sigma,
+        pyramid_factor=pyramid_factor,
+        upsample_factor=upsample_factor,
+    )
+
+    return shift_vectors, confidences
+
+
+def _register_spectra(spectrum_a, spectrum_b, internal_dtype, **kwargs):
+    # Single pair version of '_register_spectra_batch':
+    shift_vectors, confidences, correlograms = _register_spectra_batch(
+        spectrum_a[None], spectrum_b[None], internal_dtype, **kwargs
+    )
+    return shift_vectors[0], confidences[0], tuple(correlogram[0] for correlogram in correlograms)
+
+
+def _register_spectra_batch(
+    spectra_a,
+    spectra_b,
+    internal_dtype,
+    max_range_ratio: float,
+    decimate: int,
+    quantile: float,
+    sigma: float,
+    pyramid_factor: int = 1,
+    upsample_factor: int = 1,
+):
+    # Returns the shift vectors and confidences of the peaks of the phase correlations of pairs of spectra stacked
+    # along the first axis, and the raw, cropped and masked correlograms for debugging:
+    xp = Backend.get_xp_module(spectra_a)
+
+    cross_power = _cross_power_spectrum(spectra_a, spectra_b)
+    shape = cross_power.shape[1:]
+
+    if pyramid_factor > 1:
+        # The correlogram of the low frequencies is the full resolution one downsampled:
+        coarse_shape = tuple(max(1, s // pyramid_factor) for s in shape)
+        raw_correlation = _correlogram(_crop_spectrum(cross_power, coarse_shape), internal_dtype)
+        sigma = sigma / pyramid_factor
+    else:
+        raw_correlation = _correlogram(cross_power, internal_dtype)
+
+    shift_vectors, confidences, correlation, masked_correlation = _correlation_peaks(
+        raw_correlation, max_range_ratio=max_range_ratio, decimate=decimate, quantile=quantile, sigma=sigma
+    )
+
+    if pyramid_factor > 1 or upsample_factor > 1:
+        factors = tuple(s / c for s, c in zip(shape, raw_correlation.shape[1:]))
+        shift_vectors = xp.stack(
+            [
+                _refine_shift(R, shift_vector, factors, upsample_factor)
+                for R, shift_vector in zip(cross_power, shift_vectors)
+            ]
+        )
+
+    return shift_vectors, confidences, (raw_correlation, correlation, masked_correlation)
+
+
+def _resolve_internal_dtype(image, internal_dtype):
     if internal_dtype is None:
-        internal_dtype = image_a.dtype
+        internal_dtype = image.dtype
 
     if type(Backend.current()) is NumpyBackend:
-        internal_dtype = xp.float32
+        internal_dtype = numpy.float32
 
-    image_a = Backend.to_backend(image_a, dtype=internal_dtype)
-    image_b = Backend.to_backend(image_b, dtype=internal_dtype)
+    return internal_dtype
+
+
+def _preprocess_image(
+    image, denoise_input_sigma, gamma, log_compression, edge_filter, internal_dtype, batch: bool = False
+):
+    # Images of a batch are stacked along the first axis, which is not filtered:
+    xp = Backend.get_xp_module()
+    sp = Backend.get_sp_module()
+
+    image = Backend.to_backend(image, dtype=internal_dtype)
+    axes = tuple(range(1, image.ndim)) if batch else None
 
     if denoise_input_sigma is not None and denoise_input_sigma > 0:
-        image_a = sp.ndimage.gaussian_filter(image_a, sigma=denoise_input_sigma)
-        image_b = sp.ndimage.gaussian_filter(image_b, sigma=denoise_input_sigma)
+        if batch:
+            denoise_input_sigma = (0,) + (denoise_input_sigma,) * len(axes)
+        image = sp.ndimage.gaussian_filter(image, sigma=denoise_input_sigma)
 
     if log_compression is not None and log_compression:
-        image_a = xp.log1p(image_a)
-        image_b = xp.log1p(image_b)
+        image = xp.log1p(image)
 
     if gamma is not None and gamma != 1:
-        image_a **= gamma
-        image_b **= gamma
+        image **= gamma
 
     if edge_filter is not None and edge_filter:
-        image_a = sobel_filter(image_a, exponent=1, normalise_input=False)
-        image_b = sobel_filter(image_b, exponent=1, normalise_input=False)
+        image = sobel_filter(image, exponent=1, normalise_input=False, axes=axes)
 
-    # Compute the phase correlation:
-    raw_correlation = _phase_correlation(image_a, image_b, internal_dtype)
-    correlation = raw_correlation
+    return image
+
+
+def _correlation_peaks(raw_correlations, max_range_ratio: float, decimate: int, quantile: float, sigma: float):
+    # Returns the shift vectors and confidences of the peaks of phase correlograms stacked along the first axis,
+    # and the cropped and masked correlograms for debugging:
+    xp = Backend.get_xp_module()
+    sp = Backend.get_sp_module()
+
+    correlation = raw_correlations
+    batch_size, shape = correlation.shape[0], correlation.shape[1:]
+    batch_slice = (slice(None),)
+    broadcast_shape = (batch_size,) + (1,) * len(shape)
 
     # Max range is computed from max_range_ratio:
-    max_ranges = tuple(int(0.5 * max_range_ratio * s) for s in correlation.shape)
+    max_ranges = tuple(int(0.5 * max_range_ratio * s) for s in shape)
     # print(f"max_ranges={max_ranges}")
 
     # We estimate the noise floor of the correlation:
-    center = tuple(s // 2 for s in correlation.shape)
-    empty_region = correlation[tuple(slice(0, c - r) for c, r in zip(center, max_ranges))]
-    noise_floor_level = xp.quantile(empty_region.ravel()[::decimate].astype(numpy.float32), q=quantile)
-    if xp.isnan(noise_floor_level):
-        noise_floor_level = xp.mean(empty_region.ravel()[::decimate])
+    center = tuple(s // 2 for s in shape)
+    empty_region = correlation[batch_slice + tuple(slice(0, c - r) for c, r in zip(center, max_ranges))]
+    empty_region = empty_region.reshape(batch_size, -1)[:, ::decimate]
+    noise_floor_level = xp.quantile(empty_region.astype(numpy.float32), q=quantile, axis=1)
+    noise_floor_level = xp.where(xp.isnan(noise_floor_level), xp.mean(empty_region, axis=1), noise_floor_level)
+    noise_floor_level = noise_floor_level.astype(correlation.dtype, copy=False).reshape(broadcast_shape)
     # print(f"noise_floor_level={noise_floor_level}")
 
     # Roll the array and crop it to restrict ourself to the search region:
     correlation = correlation[
-        tuple(slice(max(c - r, 0), min(c + r, s)) for c, r, s in zip(center, max_ranges, correlation.shape))
+        batch_slice + tuple(slice(max(c - r, 0), min(c + r, s)) for c, r, s in zip(center, max_ranges, shape))
     ]
 
     # Use that floor to clip anything below:
@@ -114,46 +438,27 @@ def register_translation_nd(
 
     # Denoise cropped correlation image:
     if sigma > 0:
-        correlation = sp.ndimage.gaussian_filter(correlation, sigma=sigma, mode="wrap")
+        correlation = sp.ndimage.gaussian_filter(correlation, sigma=(0,) + (sigma,) * len(shape), mode="wrap")
 
     # Use the max as quickly computed proxy for the real center:
-    max_correlation_flat_index = xp.argmax(correlation, axis=None)
-    rough_shift = xp.unravel_index(max_correlation_flat_index, correlation.shape)
-    max_correlation = correlation[rough_shift]
+    flat_correlation = correlation.reshape(batch_size, -1)
+    max_correlation_flat_indices = xp.argmax(flat_correlation, axis=1)
+    rough_shifts = xp.stack(xp.unravel_index(max_correlation_flat_indices, correlation.shape[1:]), axis=1)
+    max_correlations = flat_correlation[xp.arange(batch_size), max_correlation_flat_indices]
 
-    # Compute the signed shift vector:
-    shift_vector = xp.array(tuple(int(rs) - r for rs, r in zip(rough_shift, max_ranges)))
+    # Compute the signed shift vectors:
+    shift_vectors = rough_shifts - xp.asarray(max_ranges)
 
-    # Compute confidence:
+    # Compute confidences:
     masked_correlation = correlation.copy()
-    mask_size = tuple(max(8, int(s ** 0.9) // 8) for s in masked_correlation.shape)
-    masked_correlation[tuple(slice(rs - s, rs + s) for rs, s in zip(rough_shift, mask_size))] = 0
-    background_correlation_max = xp.max(masked_correlation)
+    mask_size = tuple(max(8, int(s**0.9) // 8) for s in masked_correlation.shape[1:])
+    for index, rough_shift in enumerate(Backend.to_numpy(rough_shifts).tolist()):
+        masked_correlation[(index,) + tuple(slice(rs - s, rs + s) for rs, s in zip(rough_shift, mask_size))] = 0
+    background_correlation_max = xp.max(masked_correlation.reshape(batch_size, -1), axis=1)
     epsilon = 1e-6
-    confidence = (max_correlation - background_correlation_max) / (epsilon + max_correlation)
+    confidences = (max_correlations - background_correlation_max) / (epsilon + max_correlations)
 
-    if _display_phase_correlation:
-        # DO NOT DELETE, INSTRUMENTATION CODE FOR DEBUGGING
-        from napari import Viewer, gui_qt
-
-        with gui_qt():
-            aprint(f"shift = {shift_vector}, confidence = {confidence} ")
-
-            def _c(array):
-                return Backend.to_numpy(array)
-
-            viewer = Viewer()
-            viewer.add_image(_c(image_a), name="image_a")
-            viewer.add_image(_c(image_b), name="image_b")
-            viewer.add_image(_c(raw_correlation), name="raw_correlation", colormap="viridis")
-            viewer.add_image(_c(correlation), name="correlation", colormap="viridis")
-            viewer.add_image(
-                _c(masked_correlation), name="masked_correlation", colormap="bop orange", blending="additive"
-            )
-            viewer.grid.enabled = True
-            viewer.grid.shape = (2, 3)
-
-    return TranslationRegistrationModel(shift_vector=shift_vector, confidence=confidence, force_numpy=force_numpy)
+    return shift_vectors, confidences, correlation, masked_correlation
 
 
 def _center_of_mass(image):
@@ -181,20 +486,76 @@ def _center_of_mass(image):
             return tuple(s / 2 for s in image.shape)
 
 
-def _phase_correlation(image_a, image_b, internal_dtype=numpy.float32, epsilon: float = 1e-6, window: float = 0.5):
-    xp = Backend.get_xp_module(image_a)
+def _windowed_spectrum(image, window: float = 0.5, batch: bool = False):
+    # Images of a batch are stacked along the first axis, and transformed separately:
+    xp = Backend.get_xp_module(image)
+    axes = tuple(range(1 if batch else 0, image.ndim))
 
     if window > 0:
-        window_axis = tuple(xp.hanning(s) ** window for s in image_a.shape)
+        window_axis = tuple(xp.hanning(image.shape[axis]) ** window for axis in axes)
         window = reduce(xp.multiply, xp.ix_(*window_axis))
-        image_a *= window
-        image_b *= window
+        image *= window
+
+    return xp.fft.fftn(image, axes=axes).astype(numpy.complex64, copy=False)
+
+
+def _cross_power_spectrum(G_a, G_b, epsilon: float = 1e-6):
+    xp = Backend.get_xp_module(G_a)
 
-    G_a = xp.fft.fftn(image_a).astype(numpy.complex64, copy=False)
-    G_b = xp.fft.fftn(image_b).astype(numpy.complex64, copy=False)
-    conj_b = xp.conj(G_b)
-    R = G_a * conj_b
+    R = G_a * xp.conj(G_b)
     R /= xp.absolute(R) + epsilon
-    r = xp.fft.ifftn(R).real.astype(internal_dtype, copy=False)
-    r = xp.fft.fftshift(r)
+    return R
+
+
+def _correlogram(R, internal_dtype=numpy.float32):
+    # Correlograms of cross-power spectra stacked along the first axis:
+    xp = Backend.get_xp_module(R)
+    axes = tuple(range(1, R.ndim))
+
+    r = xp.fft.ifftn(R, axes=axes).real.astype(internal_dtype, copy=False)
+    r = xp.fft.fftshift(r, axes=axes)
     return r
+
+
+def _crop_spectrum(R, shape):
+    # Keeps the lowest frequencies of spectra stacked along the first axis, their inverse FFTs are then
+    # downsampled versions of the original ones:
+    xp = Backend.get_xp_module(R)
+
+    indices = tuple(
+        xp.concatenate((xp.arange(0, (c + 1) // 2), xp.arange(s - c // 2, s))) for s, c in zip(R.shape[1:], shape)
+    )
+    return R[(slice(None),) + xp.ix_(*indices)]
+
+
+def _refine_shift(R, shift_vector, factors, upsample_factor: int = 1):
+    # Refines a shift predicted from a downsampled correlogram by searching the peak of the full resolution
+    # correlogram within a window of the size of the downsampling factors around the prediction, and then to
+    # subpixel precision on a grid upsampled around that peak. Both are local DFTs of the cross-power spectrum:
+    predicted = tuple(float(s) * f for s, f in zip(shift_vector, factors))
+    radii = tuple(int(numpy.ceil(f)) if f > 1 else 0 for f in factors)
+    offsets = tuple(numpy.arange(round(p) - r, round(p) + r + 1) for p, r in zip(predicted, radii))
+    shift = _local_correlation_peak(R, offsets)
+
+    if upsample_factor > 1:
+        size = int(numpy.ceil(1.5 * upsample_factor))
+        grid = (numpy.arange(size) - size // 2) / upsample_factor
+        shift = _local_correlation_peak(R, tuple(s + grid for s in shift))
+
+    return Backend.to_backend(numpy.asarray(shift))
+
+
+def _local_correlation_peak(R, offsets):
+    # Position of the maximum of the correlogram evaluated at the given offsets (one sequence per axis),
+    # as separable matrix DFTs of the cross-power spectrum:
+    xp = Backend.get_xp_module(R)
+
+    correlation = R
+    for axis, axis_offsets in enumerate(offsets):
+        frequencies = xp.fft.fftfreq(R.shape[axis]).astype(numpy.float32)
+        axis_offsets = Backend.to_backend(numpy.asarray(axis_offsets, dtype=numpy.float32))
+        kernel = xp.exp((2j * numpy.pi) * xp.outer(axis_offsets, frequencies)).astype(numpy.complex64, copy=False)
+        correlation = xp.moveaxis(xp.tensordot(kernel, correlation, axes=([1], [axis])), 0, axis)
+
+    peak = numpy.unravel_index(int(xp.argmax(correlation.real)), correlation.shape)
+    return tuple(float(o[p]) for o, p in zip(offsets, peak))
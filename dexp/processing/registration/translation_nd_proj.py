@@ -1,9 +1,14 @@
-from typing import Callable
+from typing import Any, Callable, Sequence, Tuple
 
 from dexp.processing.registration.model.translation_registration_model import (
     TranslationRegistrationModel,
 )
 from dexp.processing.registration.translation_2d import register_translation_2d_dexp
+from dexp.processing.registration.translation_nd import (
+    register_translation_nd_batch,
+    register_translation_nd_spectra_batch,
+    translation_nd_spectrum,
+)
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
 
@@ -75,29 +80,9 @@ def register_translation_proj_nd(
             iap2, ibp2, force_numpy=force_numpy, internal_dtype=internal_dtype, **kwargs
         ).get_shift_and_confidence()
 
-        # print(shifts_p0)
-        # print(shifts_p1)
-        # print(shifts_p2)
-
-        if drop_worse:
-            worse_index = xp.argmin(xp.asarray([confidence_p0, confidence_p1, confidence_p2]))
-
-            if worse_index == 0:
-                shifts = xp.asarray([0.5 * (shifts_p1[0] + shifts_p2[0]), shifts_p2[1], shifts_p1[1]])
-                confidence = (confidence_p1 * confidence_p2) ** 0.5
-            elif worse_index == 1:
-                shifts = xp.asarray([shifts_p2[0], 0.5 * (shifts_p0[0] + shifts_p2[1]), shifts_p0[1]])
-                confidence = (confidence_p0 * confidence_p2) ** 0.5
-            elif worse_index == 2:
-                shifts = xp.asarray([shifts_p1[0], shifts_p0[0], 0.5 * (shifts_p0[1] + shifts_p1[1])])
-                confidence = (confidence_p0 * confidence_p1) ** 0.5
-
-        else:
-            shifts_p0 = xp.asarray([0, shifts_p0[0], shifts_p0[1]])
-            shifts_p1 = xp.asarray([shifts_p1[0], 0, shifts_p1[1]])
-            shifts_p2 = xp.asarray([shifts_p2[0], shifts_p2[1], 0])
-            shifts = (shifts_p0 + shifts_p1 + shifts_p2) / 2
-            confidence = (confidence_p0 * confidence_p1 * confidence_p2) ** 0.33
+        shifts, confidence = _combine_projection_shifts(
+            (shifts_p0, shifts_p1, shifts_p2), (confidence_p0, confidence_p1, confidence_p2), drop_worse
+        )
 
         # if confidence>0.1:
         #     print(f"shift={shifts}, confidence={confidence}")
@@ -122,11 +107,242 @@ def register_translation_proj_nd(
     return model
 
 
+def translation_proj_nd_spectra(
+    image: xpArray,
+    denoise_input_sigma: float = 1.5,
+    gamma: float = 1,
+    log_compression: bool = True,
+    edge_filter: bool = True,
+    internal_dtype=None,
+) -> Tuple[Tuple[xpArray, Any], ...]:
+    """
+    Computes the spectra of the preprocessed projections of a nD (n=2 or 3) image, so that an image registered
+    against many others, as in sequence stabilisation, is projected, preprocessed and transformed only once.
+    See 'register_translation_proj_nd_spectra'.
+
+    Parameters
+    ----------
+    image : image to transform
+    denoise_input_sigma, gamma, log_compression, edge_filter : preprocessing, see 'register_translation_nd'.
+    internal_dtype : Internal dtype for computation
+
+    Returns
+    -------
+    Tuple of (spectrum, internal dtype) pairs, one per projection.
+
+    """
+    xp = Backend.get_xp_module()
+
+    image = Backend.to_backend(image)
+
+    if image.ndim == 2:
+        projections = (_preprocess_image(image, in_place=False, dtype=internal_dtype),)
+    elif image.ndim == 3:
+        projections = tuple(_project_preprocess_image(image, axis=axis, dtype=xp.float32) for axis in range(3))
+    else:
+        raise ValueError(f"Unsupported number of dimensions ({image.ndim}) for registration.")
+
+    return tuple(
+        translation_nd_spectrum(
+            projection,
+            denoise_input_sigma=denoise_input_sigma,
+            gamma=gamma,
+            log_compression=log_compression,
+            edge_filter=edge_filter,
+            internal_dtype=internal_dtype,
+        )
+        for projection in projections
+    )
+
+
+def register_translation_proj_nd_spectra(
+    spectra_a: Sequence[Tuple[xpArray, Any]],
+    spectra_b: Sequence[Tuple[xpArray, Any]],
+    drop_worse: bool = True,
+    force_numpy: bool = False,
+    **kwargs,
+) -> TranslationRegistrationModel:
+    """
+    Registers two nD (n=2 or 3) images given by the spectra of their projections, as computed by
+    'translation_proj_nd_spectra', using just a translation-only model. The model is the same as the one of
+    'register_translation_proj_nd' with the default 2D registration method.
+
+    Parameters
+    ----------
+    spectra_a : Spectra of the projections of the first image to register
+    spectra_b : Spectra of the projections of the second image to register
+    drop_worse: drops the worst 2D registrations before combining the projection
+        registration vectors to a full nD registration vector.
+    force_numpy : Forces output model to be allocated with numpy arrays.
+    kwargs : additional parameters passed to 'register_translation_nd_spectra'.
+
+    Returns
+    -------
+    Translation-only registration model
+
+    """
+    shifts, confidences = register_translation_proj_nd_spectra_batch(
+        [spectra_a], [spectra_b], drop_worse=drop_worse, **kwargs
+    )
+
+    return TranslationRegistrationModel(shift_vector=shifts[0], confidence=confidences[0], force_numpy=force_numpy)
+
+
+def register_translation_proj_nd_batch(
+    images_a: xpArray,
+    images_b: xpArray,
+    drop_worse: bool = True,
+    internal_dtype=None,
+    **kwargs,
+) -> Tuple[xpArray, xpArray]:
+    """
+    Registers pairs of nD (n=2 or 3) images, stacked along the first axis, using just a translation-only model.
+    Each pair gets the same shift vector and confidence as with 'register_translation_proj_nd' and the default 2D
+    registration method, but the projections of the whole batch are registered at once with
+    'register_translation_nd_batch'.
+
+    Parameters
+    ----------
+    images_a : First images to register, stacked along the first axis
+    images_b : Second images to register, stacked along the first axis
+    drop_worse: drops the worst 2D registrations before combining the projection
+        registration vectors to a full nD registration vector.
+    internal_dtype : Internal dtype for computation
+    kwargs : additional parameters passed to 'register_translation_nd_batch'.
+
+    Returns
+    -------
+    Array of the shift vectors of the pairs, one per row, and array of their confidences.
+
+    """
+    xp = Backend.get_xp_module()
+
+    if images_a.shape != images_b.shape:
+        raise ValueError("Batches of images must have the same shape")
+
+    images_a = Backend.to_backend(images_a)
+    images_b = Backend.to_backend(images_b)
+
+    if images_a.ndim == 3:
+        projections_a = (_preprocess_image(images_a, in_place=False, dtype=internal_dtype, batch=True),)
+        projections_b = (_preprocess_image(images_b, in_place=False, dtype=internal_dtype, batch=True),)
+    elif images_a.ndim == 4:
+        projections_a = tuple(
+            _project_preprocess_image(images_a, axis=axis, dtype=xp.float32, batch=True) for axis in range(3)
+        )
+        projections_b = tuple(
+            _project_preprocess_image(images_b, axis=axis, dtype=xp.float32, batch=True) for axis in range(3)
+        )
+    else:
+        raise ValueError(f"Unsupported number of dimensions ({images_a.ndim - 1}) for registration.")
+
+    shifts_and_confidences = tuple(
+        register_translation_nd_batch(projection_a, projection_b, internal_dtype=internal_dtype, **kwargs)
+        for projection_a, projection_b in zip(projections_a, projections_b)
+    )
+
+    if len(shifts_and_confidences) == 1:
+        return shifts_and_confidences[0]
+    return _combine_projection_shifts(*zip(*shifts_and_confidences), drop_worse)
+
+
+def register_translation_proj_nd_spectra_batch(
+    spectra_a: Sequence[Sequence[Tuple[xpArray, Any]]],
+    spectra_b: Sequence[Sequence[Tuple[xpArray, Any]]],
+    drop_worse: bool = True,
+    **kwargs,
+) -> Tuple[xpArray, xpArray]:
+    """
+    Registers pairs of nD (n=2 or 3) images given by the spectra of their projections, as computed by
+    'translation_proj_nd_spectra' for each image, using just a translation-only model. Each pair gets the same
+    shift vector and confidence as with 'register_translation_proj_nd_spectra', but the spectra of each projection
+    are stacked and registered at once with 'register_translation_nd_spectra_batch'.
+
+    Parameters
+    ----------
+    spectra_a : Spectra of the projections of the first images to register, one sequence per image
+    spectra_b : Spectra of the projections of the second images to register, one sequence per image
+    drop_worse: drops the worst 2D registrations before combining the projection
+        registration vectors to a full nD registration vector.
+    kwargs : additional parameters passed to 'register_translation_nd_spectra_batch'.
+
+    Returns
+    -------
+    Array of the shift vectors of the pairs, one per row, and array of their confidences.
+
+    """
+    xp = Backend.get_xp_module()
+
+    if len(spectra_a) != len(spectra_b):
+        raise ValueError("There must be as many first and second images")
+
+    nb_projections = len(spectra_a[0])
+    if any(len(spectra) != nb_projections for spectra in tuple(spectra_a) + tuple(spectra_b)):
+        raise ValueError("Images must have the same number of dimensions")
+
+    shifts_and_confidences = []
+    for index in range(nb_projections):
+        # all spectra of a projection share the internal dtype of the first one:
+        internal_dtype = spectra_a[0][index][1]
+        shifts_and_confidences.append(
+            register_translation_nd_spectra_batch(
+                xp.stack([spectra[index][0] for spectra in spectra_a]),
+                xp.stack([spectra[index][0] for spectra in spectra_b]),
+                internal_dtype=internal_dtype,
+                **kwargs,
+            )
+        )
+
+    if nb_projections == 1:
+        return shifts_and_confidences[0]
+    return _combine_projection_shifts(*zip(*shifts_and_confidences), drop_worse)
+
+
+def _combine_projection_shifts(projection_shifts, projection_confidences, drop_worse: bool):
+    # Combines the 2D registrations of the projections along axis 0, 1 and 2 into a 3D shift vector and confidence,
+    # shifts and confidences can have leading batch dimensions:
+    xp = Backend.get_xp_module()
+
+    shifts_p0, shifts_p1, shifts_p2 = (xp.asarray(shifts) for shifts in projection_shifts)
+    confidence_p0, confidence_p1, confidence_p2 = (xp.asarray(confidence) for confidence in projection_confidences)
+
+    if drop_worse:
+        # shifts and confidences obtained when dropping the projection along axis 0, 1, or 2:
+        candidate_shifts = xp.stack(
+            [
+                xp.stack([0.5 * (shifts_p1[..., 0] + shifts_p2[..., 0]), shifts_p2[..., 1], shifts_p1[..., 1]], -1),
+                xp.stack([shifts_p2[..., 0], 0.5 * (shifts_p0[..., 0] + shifts_p2[..., 1]), shifts_p0[..., 1]], -1),
+                xp.stack([shifts_p1[..., 0], shifts_p0[..., 0], 0.5 * (shifts_p0[..., 1] + shifts_p1[..., 1])], -1),
+            ]
+        )
+        candidate_confidences = xp.stack(
+            [
+                (confidence_p1 * confidence_p2) ** 0.5,
+                (confidence_p0 * confidence_p2) ** 0.5,
+                (confidence_p0 * confidence_p1) ** 0.5,
+            ]
+        )
+
+        worse_index = xp.argmin(xp.stack([confidence_p0, confidence_p1, confidence_p2]), axis=0)
+        shifts = xp.take_along_axis(candidate_shifts, worse_index[None, ..., None], axis=0)[0]
+        confidence = xp.take_along_axis(candidate_confidences, worse_index[None, ...], axis=0)[0]
+
+    else:
+        zeros = xp.zeros_like(shifts_p0[..., 0])
+        shifts_p0 = xp.stack([zeros, shifts_p0[..., 0], shifts_p0[..., 1]], -1)
+        shifts_p1 = xp.stack([shifts_p1[..., 0], zeros, shifts_p1[..., 1]], -1)
+        shifts_p2 = xp.stack([shifts_p2[..., 0], shifts_p2[..., 1], zeros], -1)
+        shifts = (shifts_p0 + shifts_p1 + shifts_p2) / 2
+        confidence = (confidence_p0 * confidence_p1 * confidence_p2) ** 0.33
+
+    return shifts, confidence
+
+
 def _project_preprocess_image(
-    image, axis: int, smoothing: float = 0, quantile: int = None, gamma: float = 1, dtype=None
+    image, axis: int, smoothing: float = 0, quantile: int = None, gamma: float = 1, dtype=None, batch: bool = False
 ):
-    image_projected = _project_image(image, axis=axis)
-    image_projected_processed = _preprocess_image(image_projected, quantile=quantile, dtype=dtype)
+    image_projected = _project_image(image, axis=axis + 1 if batch else axis)
+    image_projected_processed = _preprocess_image(image_projected, quantile=quantile, dtype=dtype, batch=batch)
 
     return image_projected_processed
 
@@ -138,11 +354,31 @@ def _project_image(image, axis: int):
     return projection
 
 
-def _preprocess_image(image, quantile: float = 0.01, in_place: bool = True, dtype=None):
+def _preprocess_image(image, quantile: float = 0.01, in_place: bool = True, dtype=None, batch: bool = False):
+    # Images of a batch are stacked along the first axis, and normalised separately:
     xp = Backend.get_xp_module()
 
     processed_image = Backend.to_backend(image, dtype=dtype, force_copy=not in_place)
 
+    if batch:
+        values = processed_image.reshape(processed_image.shape[0], -1)
+        if quantile is None:
+            min_value = values.min(axis=1)
+            max_value = values.max(axis=1)
+        else:
+            min_value = xp.percentile(values, q=100 * quantile, axis=1)
+            max_value = xp.percentile(values, q=100 * (1 - quantile), axis=1)
+
+        # images with a null range are left untouched:
+        broadcast_shape = (-1,) + (1,) * (processed_image.ndim - 1)
+        alpha = (max_value - min_value).reshape(broadcast_shape)
+        valid = alpha > 0
+        processed_image -= xp.where(valid, min_value.reshape(broadcast_shape), 0)
+        processed_image /= xp.where(valid, alpha, 1)
+        processed_image = xp.where(valid, xp.clip(processed_image, 0, 1), processed_image)
+
+        return processed_image
+
     if quantile is None:
         min_value = processed_image.min()
         max_value = processed_image.max()
@@ -7,6 +7,7 @@ from dexp.processing.registration.model.warp_registration_model import (
 )
 from dexp.processing.registration.translation_nd_proj import (
     register_translation_proj_nd,
+    register_translation_proj_nd_batch,
 )
 from dexp.processing.utils.scatter_gather_i2v import scatter_gather_i2v
 from dexp.utils import xpArray
@@ -20,6 +21,7 @@ def register_warp_nd(
     chunks: Union[int, Tuple[int, ...]],
     margins: Union[int, Tuple[int, ...]] = None,
     registration_method=register_translation_proj_nd,
+    batch_size: int = 1,
     force_numpy: bool = False,
     **kwargs,
 ) -> WarpRegistrationModel:
@@ -34,6 +36,9 @@ def register_warp_nd(
     chunks : Chunk sizes to divide image into
     margins : Margins to add along each dimension per chunk
     registration_method : registration method to use per tile, must return a TranslationRegistrationModel.
+    batch_size : if larger than one, tiles of the same shape are registered together in batches of at most this size
+        with 'register_translation_proj_nd_batch', which removes the per-tile overhead that dominates for many small
+        tiles. Only available with the default registration method.
     force_numpy: Forces output model to be allocated with numpy arrays.
     all additional kwargs are passed to the registration method (by default register_translation_maxproj_nd)
 
@@ -47,13 +52,24 @@ def register_warp_nd(
 
     xp = Backend.get_xp_module()
 
+    if batch_size > 1 and registration_method is not register_translation_proj_nd:
+        raise ValueError("Tiles can only be registered in batches with the default registration method")
+
     def f(x, y):
         model = registration_method(x, y, force_numpy=force_numpy, **kwargs)
         aprint(f"model: {model} {'' if model.confidence > 0.3 else '(LOW QUALITY!)'}")
         shift, confidence = model.get_shift_and_confidence()
         return xp.asarray(shift), xp.asarray(confidence)
 
-    vector_field, confidence = scatter_gather_i2v(f, (image_a, image_b), tiles=chunks, margins=margins)
+    def f_batch(x, y):
+        shifts, confidences = register_translation_proj_nd_batch(x, y, **kwargs)
+        for shift, confidence in zip(shifts, confidences):
+            aprint(f"shift: {shift}, confidence: {confidence} {'' if confidence > 0.3 else '(LOW QUALITY!)'}")
+        return shifts, confidences
+
+    vector_field, confidence = scatter_gather_i2v(
+        f if batch_size == 1 else f_batch, (image_a, image_b), tiles=chunks, margins=margins, batch_size=batch_size
+    )
 
     model = WarpRegistrationModel(vector_field=vector_field, confidence=confidence, force_numpy=force_numpy)
 
@@ -1,7 +1,10 @@
+import numpy
 import pytest
+import scipy.sparse
 from arbol import aprint, asection
 
-from dexp.processing.utils.linear_solver import linsolve
+from dexp.processing.utils.linear_solver import linsolve, sparse_linsolve
+from dexp.utils.backends import NumpyBackend
 from dexp.utils.backends.backend import Backend
 from dexp.utils.testing.testing import execute_both_backends
 
@@ -35,3 +38,34 @@ def _run_solver(w=37, h=41, noise=1e-2, **kwargs):
     aprint(f"error : {xp.absolute(x - x_gt)} ")
 
     return mean_abs_error
+
+
+@pytest.mark.parametrize("method", ["direct", "lsqr"])
+@pytest.mark.parametrize("order_error, order_reg", [(2, 2), (2, 1), (1, 1)])
+def test_sparse_linear_solver(method: str, order_error: float, order_reg: float) -> None:
+    rng = numpy.random.default_rng(42)
+
+    # incidence matrix of pairwise differences, as in sequence stabilisation:
+    length = 100
+    pairs = [(u, u + s) for s in range(1, 4) for u in range(length - s)]
+    rows = numpy.repeat(numpy.arange(len(pairs)), 2)
+    a = scipy.sparse.csr_matrix(
+        (numpy.tile([1, -1], len(pairs)), (rows, numpy.ravel(pairs))), shape=(len(pairs), length)
+    )
+    x_gt = numpy.cumsum(rng.normal(size=length))
+    y = a @ x_gt + 0.1 * rng.normal(size=len(pairs))
+
+    def objective(x):
+        error = numpy.mean(numpy.abs(a @ x - y) ** order_error) ** (1 / order_error)
+        return error + 0.1 * numpy.mean(numpy.abs(x) ** order_reg) ** (1 / order_reg)
+
+    kwargs = dict(order_error=order_error, order_reg=order_reg, alpha_reg=0.1)
+    x = sparse_linsolve(a, y, method=method, tolerance=1e-10, **kwargs)
+    with NumpyBackend():
+        x_dense = linsolve(a.toarray(), y, tolerance=1e-7, **kwargs)
+
+    # same objective as the dense solver, at least as well minimised:
+    assert objective(x) <= objective(x_dense) + 1e-4
+
+    # warm starts from the solution can only improve it:
+    assert objective(sparse_linsolve(a, y, x0=x, method=method, tolerance=1e-10, **kwargs)) <= objective(x) + 1e-6
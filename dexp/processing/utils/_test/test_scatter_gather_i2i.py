@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from arbol import aprint
 
 from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
@@ -7,8 +8,9 @@ from dexp.utils.testing.testing import execute_both_backends
 from dexp.utils.timeit import timeit
 
 
+@pytest.mark.parametrize("workers", [1, 4])
 @execute_both_backends
-def test_scatter_gather_i2i(ndim=3, length_xy=128, splits=4, filter_size=7):
+def test_scatter_gather_i2i(workers, ndim=3, length_xy=128, splits=4, filter_size=7):
     sp = Backend.get_sp_module()
     rng = np.random.default_rng()
 
@@ -25,7 +27,9 @@ def test_scatter_gather_i2i(ndim=3, length_xy=128, splits=4, filter_size=7):
         result_ref = 0 * image + 17
 
     with timeit("scatter_gather(f)"):
-        result = scatter_gather_i2i(f, image, tiles=(length_xy // splits,) * ndim, margins=filter_size // 2)
+        result = scatter_gather_i2i(
+            f, image, tiles=(length_xy // splits,) * ndim, margins=filter_size // 2, workers=workers
+        )
 
     image = Backend.to_numpy(image)
     result_ref = Backend.to_numpy(result_ref)
@@ -35,3 +39,57 @@ def test_scatter_gather_i2i(ndim=3, length_xy=128, splits=4, filter_size=7):
     aprint(f"Error = {error}")
 
     assert error < 0.0001
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@execute_both_backends
+def test_scatter_gather_i2i_batched(workers, filter_size=7):
+    sp = Backend.get_sp_module()
+    rng = np.random.default_rng(0)
+
+    # tiles at the borders have different shapes:
+    image = rng.uniform(0, 1, size=(100, 100, 50)).astype(np.float32)
+
+    def f(x):
+        return sp.ndimage.uniform_filter(x, size=filter_size)
+
+    batch_shapes = []
+
+    def f_batched(x):
+        batch_shapes.append(x.shape)
+        return sp.ndimage.uniform_filter(x, size=(1,) + (filter_size,) * (x.ndim - 1))
+
+    margins = filter_size // 2
+    result_ref = scatter_gather_i2i(f, image, tiles=20, margins=margins)
+    result = scatter_gather_i2i(f_batched, image, tiles=20, margins=margins, workers=workers, batch_size=4)
+
+    assert np.allclose(Backend.to_numpy(result), Backend.to_numpy(result_ref), atol=1e-6)
+    # 75 tiles of 12 different shapes:
+    assert len(batch_shapes) == 24
+    assert sum(shape[0] for shape in batch_shapes) == 75
+    assert max(shape[0] for shape in batch_shapes) == 4
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@execute_both_backends
+def test_scatter_gather_i2i_blended(workers):
+    xp = Backend.get_xp_module()
+    rng = np.random.default_rng(0)
+    image = rng.uniform(0, 1, size=(60, 50, 40)).astype(np.float32)
+
+    # blending does not change results that do not depend on tiles:
+    result = scatter_gather_i2i(lambda x: x, image, tiles=16, margins=4, workers=workers, blend_margins=True)
+    assert np.allclose(Backend.to_numpy(result), image, atol=1e-6)
+
+    # results that depend on the tile position transition smoothly from tile to tile:
+    def f(x, tile_slice):
+        return xp.full_like(x, float(tile_slice[0].start))
+
+    result = scatter_gather_i2i(
+        f, image, tiles=16, margins=4, workers=workers, pass_tile_slice=True, blend_margins=True
+    )
+    profile = Backend.to_numpy(result)[:, 25, 20]
+    steps = np.diff(profile)
+    assert np.all(steps >= -1e-5)
+    # instead of jumps of 16 at tile boundaries:
+    assert steps.max() < 3
@@ -1,4 +1,5 @@
 import numpy as np
+import pytest
 from arbol import aprint
 
 from dexp.processing.utils.scatter_gather_i2v import scatter_gather_i2v
@@ -7,8 +8,9 @@ from dexp.utils.testing.testing import execute_both_backends
 from dexp.utils.timeit import timeit
 
 
+@pytest.mark.parametrize("workers", [1, 4])
 @execute_both_backends
-def test_scatter_gather_i2v(ndim=3, length_xy=128, splits=4):
+def test_scatter_gather_i2v(workers, ndim=3, length_xy=128, splits=4):
     xp = Backend.get_xp_module()
     rng = np.random.default_rng()
 
@@ -20,7 +22,7 @@ def test_scatter_gather_i2v(ndim=3, length_xy=128, splits=4):
 
     with timeit("scatter_gather(f)"):
         chunks = (length_xy // splits,) * ndim
-        result1, result2 = scatter_gather_i2v(f, (image1, image2), tiles=chunks, margins=8)
+        result1, result2 = scatter_gather_i2v(f, (image1, image2), tiles=chunks, margins=8, workers=workers)
 
     assert result1.ndim == ndim + 1
     assert result2.ndim == ndim + 1
@@ -40,3 +42,37 @@ def test_scatter_gather_i2v(ndim=3, length_xy=128, splits=4):
     error = np.linalg.norm(result2.ravel(), ord=1) / result2.size
     aprint(f"Error = {error}")
     assert error < 0.001
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+@execute_both_backends
+def test_scatter_gather_i2v_batched(workers):
+    xp = Backend.get_xp_module()
+    rng = np.random.default_rng(0)
+
+    # tiles at the borders have different shapes:
+    image1 = rng.uniform(0, 1, size=(100, 100, 50)).astype(np.float32)
+    image2 = rng.uniform(0, 1, size=(100, 100, 50)).astype(np.float32)
+
+    def f(x, y):
+        return xp.stack([x.min(), x.max()]), xp.stack([y.mean()])
+
+    batch_shapes = []
+
+    def f_batched(x, y):
+        batch_shapes.append(x.shape)
+        x = x.reshape(x.shape[0], -1)
+        y = y.reshape(y.shape[0], -1)
+        return xp.stack([x.min(axis=1), x.max(axis=1)], axis=1), y.mean(axis=1, keepdims=True)
+
+    results_ref = scatter_gather_i2v(f, (image1, image2), tiles=20, margins=3)
+    results = scatter_gather_i2v(f_batched, (image1, image2), tiles=20, margins=3, workers=workers, batch_size=4)
+
+    for result, result_ref in zip(results, results_ref):
+        assert result.shape == result_ref.shape
+        assert np.allclose(Backend.to_numpy(result), Backend.to_numpy(result_ref), atol=1e-6)
+
+    # 75 tiles of 12 different shapes:
+    assert len(batch_shapes) == 24
+    assert sum(shape[0] for shape in batch_shapes) == 75
+    assert max(shape[0] for shape in batch_shapes) == 4
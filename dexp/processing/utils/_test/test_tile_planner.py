@@ -0,0 +1,48 @@
+import numpy as np
+import scipy.fftpack
+
+from dexp.processing.utils.scatter_gather_i2i import scatter_gather_i2i
+from dexp.processing.utils.tile_planner import plan_tiles
+from dexp.utils.backends import Backend
+from dexp.utils.testing.testing import execute_both_backends
+
+
+def test_plan_tiles():
+    shape = (300, 2048, 2048)
+    margins = (17, 9, 9)
+    padding = (32, 16, 16)
+    budget = int(2e9)
+
+    tiles, planned_margins = plan_tiles(shape, margins, budget, memory_factor=8, padding=padding)
+    assert planned_margins == margins
+
+    padded = []
+    for tile, length, margin, pad in zip(tiles, shape, margins, padding):
+        if tile >= length:
+            padded.append(scipy.fftpack.next_fast_len(length + pad))
+        else:
+            # split axes have FFT-friendly padded tiles, so no FFT padding is wasted:
+            assert scipy.fftpack.next_fast_len(tile + 2 * margin + pad) == tile + 2 * margin + pad
+            padded.append(tile + 2 * margin + pad)
+
+    assert 8 * 4 * np.prod(padded, dtype=np.int64) <= budget
+
+
+def test_plan_tiles_small_budget():
+    tiles, _ = plan_tiles((64, 64, 64), 4, memory_budget=4 * 4 * 24**3)
+    assert all(tile < 64 for tile in tiles)
+
+
+@execute_both_backends
+def test_scatter_gather_i2i_auto_tiles(length_xy=96, filter_size=7):
+    sp = Backend.get_sp_module()
+    image = np.random.default_rng(0).uniform(0, 1, size=(length_xy,) * 3).astype(np.float32)
+
+    def f(x):
+        return sp.ndimage.uniform_filter(x, size=filter_size)
+
+    result_ref = Backend.to_numpy(f(Backend.to_backend(image)))
+    result = scatter_gather_i2i(f, image, tiles="auto", margins=filter_size, memory_budget=4 * 4 * 48**3)
+
+    error = np.abs(Backend.to_numpy(result) - result_ref).mean()
+    assert error < 0.0001
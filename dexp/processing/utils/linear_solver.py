@@ -1,8 +1,10 @@
 from typing import Optional, Sequence, Tuple
 
 import numpy
+import scipy.sparse
 from arbol import aprint
 from scipy.optimize import minimize
+from scipy.sparse.linalg import lsqr, spsolve
 
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
@@ -74,3 +76,101 @@ def linsolve(
         )
 
     return Backend.to_backend(result.x)
+
+
+def sparse_linsolve(
+    a,
+    y: xpArray,
+    x0: Optional[xpArray] = None,
+    tolerance: float = 1e-6,
+    order_error: float = 1,
+    order_reg: float = 1,
+    alpha_reg: float = 1e-1,
+    method: str = "direct",
+    max_irls_iterations: int = 64,
+    irls_tolerance: float = 1e-5,
+    eps: float = 1e-3,
+    maxiter: Optional[int] = None,
+) -> numpy.ndarray:
+    """
+    Sparse counterpart of 'linsolve', minimising the same objective:
+
+        mean(|a @ x - y|^order_error)^(1/order_error) + alpha_reg * mean(|x|^order_reg)^(1/order_reg)
+
+    for orders within [1, 2], with iteratively reweighted least-squares (IRLS): each iteration solves a weighted
+    least-squares problem whose weights are derived from the residuals and values of the previous solution.
+    The matrix is never densified, and the cost of each iteration grows linearly with the number of variables
+    for banded systems such as the ones of sequence stabilisation.
+
+    Parameters
+    ----------
+    a : sparse (or dense) matrix of the system, converted to a scipy sparse matrix.
+    y : right-hand side of the system.
+    x0 : initial solution, to warm start IRLS (and LSQR). If None, IRLS starts from the least-squares solution.
+    tolerance : tolerance of the LSQR solves.
+    order_error : order of the error term, within [1, 2].
+    order_reg : order of the regularisation term, within [1, 2].
+    alpha_reg : multiplicative coefficient for regularisation term.
+    method : least-squares solver, 'direct' solves the sparse normal equations with a sparse LU decomposition,
+        'lsqr' uses scipy's iterative LSQR solver, which benefits from warm starts but converges slowly on
+        ill-conditioned systems.
+    max_irls_iterations : maximal number of IRLS iterations.
+    irls_tolerance : IRLS stops once the relative change of the solution drops below this value.
+    eps : residuals and values smaller than this are weighted as if of this magnitude.
+    maxiter : maximal number of iterations of each LSQR solve.
+
+    Returns
+    -------
+    Solution as a numpy array.
+    """
+    for order in (order_error, order_reg):
+        if not 1 <= order <= 2:
+            raise ValueError(f"Orders must be within [1, 2], got: {order}")
+    if method not in ("direct", "lsqr"):
+        raise ValueError(f"Unsupported method: {method}")
+
+    if not scipy.sparse.issparse(a):
+        a = Backend.to_numpy(a)
+    a = scipy.sparse.csr_matrix(a, dtype=numpy.float64)
+    y = Backend.to_numpy(y).astype(numpy.float64, copy=False)
+    nb_equations, nb_variables = a.shape
+
+    x = None if x0 is None else Backend.to_numpy(x0).astype(numpy.float64)
+
+    # without regularisation, a least-squares error only needs a single solve:
+    nb_iterations = 1 if order_error == 2 and alpha_reg == 0 else max_irls_iterations
+
+    for i in range(nb_iterations):
+        if x is None:
+            # regularised least-squares solution:
+            weights_error = numpy.full(nb_equations, 1 / nb_equations)
+            weights_reg = numpy.full(nb_variables, alpha_reg / nb_variables)
+        else:
+            weights_error = _irls_weights(a @ x - y, order_error, eps)
+            weights_reg = alpha_reg * _irls_weights(x, order_reg, eps)
+
+        if method == "direct":
+            weighted_a = scipy.sparse.diags(weights_error) @ a
+            normal_matrix = (a.T @ weighted_a + scipy.sparse.diags(weights_reg)).tocsc()
+            new_x = spsolve(normal_matrix, weighted_a.T @ y)
+        else:
+            sqrt_weights_error = numpy.sqrt(weights_error)
+            system = scipy.sparse.vstack(
+                [scipy.sparse.diags(sqrt_weights_error) @ a, scipy.sparse.diags(numpy.sqrt(weights_reg))]
+            )
+            rhs = numpy.concatenate([sqrt_weights_error * y, numpy.zeros(nb_variables)])
+            new_x = lsqr(system, rhs, atol=tolerance, btol=tolerance, iter_lim=maxiter, x0=x)[0]
+
+        change = numpy.inf if x is None else numpy.linalg.norm(new_x - x) / max(numpy.linalg.norm(new_x), eps)
+        x = new_x
+        if change < irls_tolerance:
+            break
+
+    return x
+
+
+def _irls_weights(values: numpy.ndarray, order: float, eps: float) -> numpy.ndarray:
+    # Weights of the quadratic surrogate of the term mean(|values|^order)^(1/order), which has the same gradient:
+    magnitudes = numpy.maximum(numpy.abs(values), eps)
+    mean = max(numpy.mean(magnitudes**order), eps**order)
+    return mean ** (1 / order - 1) * magnitudes ** (order - 2) / values.size
@@ -1,22 +1,30 @@
-from typing import Callable, Optional, Sequence, Tuple, Union
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Iterable, List, Optional, Sequence, Tuple, Union
 
 import numpy
 
 from dexp.processing.utils.nd_slice import nd_split_slices, remove_margin_slice
 from dexp.processing.utils.normalise import Normalise
+from dexp.processing.utils.tile_planner import default_tile_memory_budget, plan_tiles
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
+from dexp.utils.misc import compute_num_workers
 
 
 def scatter_gather_i2i(
     function: Callable,
     image: xpArray,
-    tiles: Union[int, Tuple[int, ...]],
+    tiles: Union[int, Tuple[int, ...], str],
     margins: Optional[Union[int, Tuple[int, ...]]] = None,
     normalise: bool = False,
     clip: bool = False,
     to_numpy: bool = True,
     internal_dtype: Optional[numpy.dtype] = None,
+    workers: int = 1,
+    memory_budget: Optional[int] = None,
+    batch_size: int = 1,
+    pass_tile_slice: bool = False,
+    blend_margins: bool = False,
 ) -> xpArray:
     """
     Image-2-image scatter-gather.
@@ -31,6 +39,8 @@ def scatter_gather_i2i(
     function : unary function
     image : input image (can be any backend, numpy )
     tiles : tile sizes to cut input image into, can be a single integer or a tuple of integers.
+        If 'auto', tile sizes are planned so that tiles with margins have FFT-friendly sizes and fit the memory
+        budget (see plan_tiles).
     margins : margins to add to each tile, can be a single integer or a tuple of integers.
         if None, no margins are added.
     normalise : normalises  the input image.
@@ -38,6 +48,20 @@ def scatter_gather_i2i(
     to_numpy : should the result be a numpy array? Very usefull when the compute backend
         cannot hold the whole input and output images in memory.
     internal_dtype : internal dtype for computation
+    workers : number of tiles processed concurrently by a pool of threads, negative numbers n correspond to:
+        number_of_cores / |n|. With more than one worker the next tiles are loaded while others are computed,
+        and results are written back as soon as they are ready. The function must be thread-safe.
+    memory_budget : optional budget in bytes that bounds the number of tiles in flight,
+        a tile is estimated to require 4 times the size of its input (with margins) in the internal dtype.
+        Also used to plan tiles when tiles is 'auto', by default a fraction of the backend's free memory.
+    batch_size : maximal number of tiles of the same shape (margins included) that are stacked along a new leading
+        axis and passed together to the function, which must then accept such batches (for example
+        lucy_richardson_deconvolution). Batches amortise per-call overheads and let FFTs process several tiles at
+        once, which pays off for many small tiles. If 1, tiles are passed one at a time.
+    pass_tile_slice : if True the function is also given the slice of the tile in the image, margins included,
+        or the list of slices of the tiles of a batch, e.g. to use position-dependent parameters.
+    blend_margins : if True the overlapping margins of neighbouring tiles are blended with linear weights
+        instead of being cropped, avoiding seams when the function varies from tile to tile.
 
     Returns
     -------
@@ -48,6 +72,15 @@ def scatter_gather_i2i(
     if internal_dtype is None:
         internal_dtype = image.dtype
 
+    if type(tiles) == str and tiles == "auto":
+        nb_workers = compute_num_workers(workers, int(numpy.prod(image.shape, dtype=numpy.int64)))
+        if memory_budget is None:
+            tile_memory_budget = default_tile_memory_budget(nb_workers)
+        else:
+            tile_memory_budget = memory_budget // nb_workers
+        tile_memory_budget //= batch_size
+        tiles, margins = plan_tiles(image.shape, margins, tile_memory_budget, dtype=internal_dtype)
+
     if type(tiles) == int:
         tiles = (tiles,) * image.ndim
 
@@ -81,21 +114,158 @@ def scatter_gather_i2i(
     # Number of tiles:
     number_of_tiles = len(tile_slices)
 
+    # The function is optionally given the slice of its tile, or the slices of the tiles of its batch:
+    def call(image_tile: xpArray, tile_slice: Any) -> xpArray:
+        if pass_tile_slice:
+            return function(image_tile, tile_slice)
+        return function(image_tile)
+
     if number_of_tiles == 1:
         # If there is only one tile, let's not be complicated about it:
-        result = norm.backward(function(norm.forward(image)))
+        result = norm.backward(call(norm.forward(image), tile_slices[0]))
         if to_numpy:
             result = Backend.to_numpy(result, dtype=internal_dtype)
         else:
             result = Backend.to_backend(result, dtype=internal_dtype)
-    else:
+    elif workers == 1 and batch_size == 1 and not pass_tile_slice and not blend_margins:
         _scatter_gather_loop(
             norm.backward, function, image, internal_dtype, norm.forward, result, shape, slices, to_numpy
         )
+    else:
+        xp = Backend.get_xp_module()
+
+        if blend_margins:
+            # Tiles are accumulated with weights that ramp down across their margins, and normalised at the end:
+            result_xp = numpy if to_numpy else Backend.get_xp_module(image)
+            accumulated = result_xp.zeros(shape, dtype=numpy.float32)
+            weights = result_xp.zeros(shape, dtype=numpy.float32)
+
+        def process(batch: Sequence[Tuple[Tuple[slice, ...], Tuple[slice, ...]]]) -> xpArray:
+            if batch_size == 1:
+                ((tile_slice, _),) = batch
+                image_tiles = Backend.to_backend(image[tile_slice], dtype=internal_dtype)
+                image_tiles = norm.backward(call(norm.forward(image_tiles), tile_slice))
+            else:
+                image_tiles = xp.stack(
+                    [Backend.to_backend(image[tile_slice], dtype=internal_dtype) for tile_slice, _ in batch]
+                )
+                image_tiles = norm.backward(call(norm.forward(image_tiles), [tile_slice for tile_slice, _ in batch]))
+            if to_numpy:
+                return Backend.to_numpy(image_tiles, dtype=internal_dtype)
+            return Backend.to_backend(image_tiles, dtype=internal_dtype)
+
+        def gather(batch: Sequence[Tuple[Tuple[slice, ...], Tuple[slice, ...]]], image_tiles: xpArray) -> None:
+            if batch_size == 1:
+                image_tiles = (image_tiles,)
+            for (tile_slice, tile_slice_no_margins), image_tile in zip(batch, image_tiles):
+                if blend_margins:
+                    weight = _blending_weights(shape, tile_slice, tile_slice_no_margins, result_xp)
+                    accumulated[tile_slice] += image_tile * weight
+                    weights[tile_slice] += weight
+                else:
+                    remove_margin_slice_tuple = remove_margin_slice(shape, tile_slice, tile_slice_no_margins)
+                    result[tile_slice_no_margins] = image_tile[remove_margin_slice_tuple]
+
+        if batch_size == 1:
+            batches = [[tile_slices] for tile_slices in slices]
+        else:
+            batches = _batch_tiles(list(slices), batch_size)
+
+        if workers == 1:
+            for batch in batches:
+                gather(batch, process(batch))
+        else:
+            batch_memory_budget = None if memory_budget is None else memory_budget // batch_size
+            max_in_flight = _max_tiles_in_flight(tile_slices, workers, batch_memory_budget, internal_dtype)
+            _concurrent_tile_loop(process, batches, gather, max_in_flight)
+
+        if blend_margins:
+            accumulated /= weights
+            result[...] = accumulated.astype(internal_dtype, copy=False)
 
     return result
 
 
+def _batch_tiles(
+    slices: Sequence[Tuple[Tuple[slice, ...], Tuple[slice, ...]]], batch_size: int
+) -> List[List[Tuple[Tuple[slice, ...], Tuple[slice, ...]]]]:
+    # Groups tiles by shape, margins included, so that tiles of a batch can be stacked:
+    groups = {}
+    for tile_slice, tile_slice_no_margins in slices:
+        tile_shape = tuple(s.stop - s.start for s in tile_slice)
+        groups.setdefault(tile_shape, []).append((tile_slice, tile_slice_no_margins))
+    return [group[i : i + batch_size] for group in groups.values() for i in range(0, len(group), batch_size)]
+
+
+def _blending_weights(
+    shape: Tuple[int, ...], tile_slice: Tuple[slice, ...], tile_slice_no_margins: Tuple[slice, ...], xp: Any
+) -> xpArray:
+    # Separable weights of a tile, ramping linearly from zero to one across the overlap with each neighbour:
+    weight = None
+    for axis, (length, with_margins, without_margins) in enumerate(zip(shape, tile_slice, tile_slice_no_margins)):
+        x = numpy.arange(with_margins.start, with_margins.stop, dtype=numpy.float32) + 0.5
+        axis_weight = numpy.ones_like(x)
+        left_margin = without_margins.start - with_margins.start
+        right_margin = with_margins.stop - without_margins.stop
+        if without_margins.start > 0 and left_margin > 0:
+            axis_weight *= numpy.clip((x - with_margins.start) / (2 * left_margin), 0, 1)
+        if without_margins.stop < length and right_margin > 0:
+            axis_weight *= numpy.clip((with_margins.stop - x) / (2 * right_margin), 0, 1)
+        axis_weight = axis_weight.reshape((-1,) + (1,) * (len(shape) - axis - 1))
+        weight = axis_weight if weight is None else weight * axis_weight
+    return xp.asarray(weight)
+
+
+def _max_tiles_in_flight(
+    tile_slices: Sequence[Tuple[slice, ...]],
+    workers: int,
+    memory_budget: Optional[int],
+    internal_dtype: numpy.dtype,
+) -> int:
+    max_in_flight = compute_num_workers(workers, len(tile_slices))
+    if memory_budget is not None:
+        tile_size = max(numpy.prod([s.stop - s.start for s in tile_slice]) for tile_slice in tile_slices)
+        tile_footprint = 4 * tile_size * numpy.dtype(internal_dtype).itemsize
+        max_in_flight = max(1, min(max_in_flight, int(memory_budget // tile_footprint)))
+    return max_in_flight
+
+
+def _concurrent_tile_loop(
+    process: Callable[[Any], Any],
+    items: Iterable[Any],
+    gather: Callable[[Any, Any], None],
+    max_in_flight: int,
+) -> None:
+    # Processes items in a pool of threads with at most 'max_in_flight' items loaded or computed at any time,
+    # results are gathered in the calling thread as soon as they are ready.
+    # Backends are thread-local, so each worker thread enters a non-exclusive copy of the caller's backend:
+    backend = Backend.current()
+
+    def _process(item: Any) -> Any:
+        with backend.copy(exclusive=False):
+            return process(item)
+
+    items = iter(items)
+    with ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        in_flight = {}
+        for item in items:
+            in_flight[executor.submit(_process, item)] = item
+            if len(in_flight) >= max_in_flight:
+                break
+        try:
+            while in_flight:
+                done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    item = in_flight.pop(future)
+                    gather(item, future.result())
+                    next_item = next(items, None)
+                    if next_item is not None:
+                        in_flight[executor.submit(_process, next_item)] = next_item
+        finally:
+            for future in in_flight:
+                future.cancel()
+
+
 def _scatter_gather_loop(
     denorm_fun: Callable,
     function: Callable,
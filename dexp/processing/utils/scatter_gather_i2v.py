@@ -1,9 +1,14 @@
 import math
-from typing import Callable, Optional, Tuple, Union
+from typing import Callable, List, Optional, Sequence, Tuple, Union
 
 import numpy as np
 
 from dexp.processing.utils.nd_slice import nd_split_slices
+from dexp.processing.utils.scatter_gather_i2i import (
+    _batch_tiles,
+    _concurrent_tile_loop,
+    _max_tiles_in_flight,
+)
 from dexp.utils import xpArray
 from dexp.utils.backends import Backend
 
@@ -15,6 +20,9 @@ def scatter_gather_i2v(
     margins: Optional[Union[int, Tuple[int, ...]]] = None,
     to_numpy: bool = True,
     internal_dtype: Optional[np.dtype] = None,
+    workers: int = 1,
+    memory_budget: Optional[int] = None,
+    batch_size: int = 1,
 ) -> xpArray:
     """
     Image-2-vector scatter-gather.
@@ -32,6 +40,12 @@ def scatter_gather_i2v(
     to_numpy : should the result be a numpy array? Very usefull when the compute backend
         cannot hold the whole input and output images in memory.
     internal_dtype : internal dtype for computation
+    workers : number of tiles processed concurrently by a pool of threads, negative numbers n correspond to:
+        number_of_cores / |n|. The function must be thread-safe.
+    memory_budget : optional budget in bytes that bounds the number of tiles in flight.
+    batch_size : maximal number of tiles of the same shape (margins included) that are stacked along a new leading
+        axis and passed together to the function, which must then return arrays with a leading batch axis,
+        one vector per tile (for example register_translation_proj_nd_batch). If 1, tiles are passed one at a time.
 
     Returns
     -------
@@ -68,14 +82,10 @@ def scatter_gather_i2v(
 
     # We compute the slices objects to cut the input image into batches:
     tile_slices = list(nd_split_slices(shape, chunks=tiles, margins=margins))
-    tile_slices_no_margins = list(nd_split_slices(shape, chunks=tiles))
 
     # We compute the shape at the tile level:
     tile_shape = tuple(math.ceil(s / c) for s, c in zip(shape, tiles))
 
-    # Zipping together slices with and without margins:
-    slices = zip(tile_slices, tile_slices_no_margins)
-
     # Number of tiles:
     number_of_tiles = len(tile_slices)
 
@@ -88,21 +98,49 @@ def scatter_gather_i2v(
             results = tuple(Backend.to_backend(result, dtype=dtype) for result in results)
         results_stacked_reshaped = tuple(xp.reshape(result, newshape=(1,) * ndim + result.shape) for result in results)
     else:
-        results_lists = None
-        for tile_slice, tile_slice_no_margins in slices:
-            image_tiles = tuple(image[tile_slice] for image in images)
-            image_tiles = tuple(Backend.to_backend(image_tile, dtype=internal_dtype) for image_tile in image_tiles)
-            results = function(*image_tiles)
-            if to_numpy:
-                results = tuple(Backend.to_numpy(result, dtype=image.dtype) for result in results)
+
+        def process(batch: Sequence[Tuple[Tuple[slice, ...], int]]) -> List[Tuple[xpArray, ...]]:
+            if batch_size == 1:
+                ((tile_slice, _),) = batch
+                image_tiles = tuple(image[tile_slice] for image in images)
+                image_tiles = tuple(Backend.to_backend(image_tile, dtype=internal_dtype) for image_tile in image_tiles)
+                tile_results = (function(*image_tiles),)
             else:
-                results = tuple(Backend.to_backend(result, dtype=image.dtype) for result in results)
+                image_tiles = tuple(
+                    xp.stack([Backend.to_backend(image[tile_slice], dtype=internal_dtype) for tile_slice, _ in batch])
+                    for image in images
+                )
+                # results have a leading batch axis, they are split into the results of each tile:
+                tile_results = tuple(zip(*function(*image_tiles)))
+            if to_numpy:
+                return [
+                    tuple(Backend.to_numpy(result, dtype=image.dtype) for result in results) for results in tile_results
+                ]
+            return [
+                tuple(Backend.to_backend(result, dtype=image.dtype) for result in results) for results in tile_results
+            ]
+
+        # batches of tiles, each tile given with its index:
+        if batch_size == 1:
+            batches = [[(tile_slice, index)] for index, tile_slice in enumerate(tile_slices)]
+        else:
+            batches = _batch_tiles(list(zip(tile_slices, range(number_of_tiles))), batch_size)
+
+        tile_results = [None] * number_of_tiles
 
-            if results_lists is None:
-                results_lists = tuple([] for _ in results)
+        def gather(batch: Sequence[Tuple[Tuple[slice, ...], int]], results: List[Tuple[xpArray, ...]]) -> None:
+            for (_, index), tile_result in zip(batch, results):
+                tile_results[index] = tile_result
+
+        if workers == 1:
+            for batch in batches:
+                gather(batch, process(batch))
+        else:
+            batch_memory_budget = None if memory_budget is None else memory_budget // batch_size
+            max_in_flight = _max_tiles_in_flight(tile_slices, workers, batch_memory_budget, internal_dtype)
+            _concurrent_tile_loop(process, batches, gather, max_in_flight)
 
-            for result, results_list in zip(results, results_lists):
-                results_list.append(result)
+        results_lists = tuple(list(results) for results in zip(*tile_results))
 
         rxps = tuple(Backend.get_xp_module(results_list[0]) for results_list in results_lists)
         results_stacked = tuple(rxp.stack(results_list) for rxp, results_list in zip(rxps, results_lists))
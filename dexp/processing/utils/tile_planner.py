@@ -0,0 +1,158 @@
+import itertools
+import math
+import operator
+from functools import reduce
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy
+import scipy.fftpack
+from arbol import aprint
+
+from dexp.utils.backends import Backend
+
+
+def plan_tiles(
+    shape: Sequence[int],
+    margins: Union[int, Sequence[int]],
+    memory_budget: int,
+    dtype: numpy.dtype = numpy.float32,
+    memory_factor: float = 4.0,
+    padding: Union[int, Sequence[int]] = 0,
+    fast_len: Callable[[int], int] = scipy.fftpack.next_fast_len,
+) -> Tuple[Tuple[int, ...], Tuple[int, ...]]:
+    """
+    Plans per-axis tile sizes for scatter-gather computations so that each tile, once extended with its margins
+    and padded for FFTs, has a size that is fast to transform, fits in the memory budget, and so that the
+    total padded volume over all tiles is minimal.
+
+    A tile of size t along an axis of length s is read with margins m on both sides (unless it covers the whole
+    axis) and is then padded by the function, e.g. fft_convolve pads by the kernel size, so that FFTs are
+    computed on length fast_len(t + 2m + padding). Tile sizes are chosen so that t + 2m + padding is itself a
+    fast length, wasting no FFT work.
+
+    Parameters
+    ----------
+    shape : shape of the image to tile.
+    margins : per-axis halo required by the function (e.g. half the PSF size), can be a single integer.
+    memory_budget : memory available for processing a single tile, in bytes.
+    dtype : dtype of the padded tile during computation.
+    memory_factor : memory model of the function, number of padded tiles alive at the same time.
+    padding : per-axis padding added by the function before FFTs, can be a single integer.
+    fast_len : function returning the smallest FFT-friendly length larger or equal to a given length,
+        defaults to the one used by fft_convolve.
+
+    Returns
+    -------
+    Tuple of per-axis tile sizes and per-axis margins, to be passed to scatter_gather_i2i.
+    """
+    ndim = len(shape)
+    margins = _per_axis(margins, ndim)
+    padding = _per_axis(padding, ndim)
+
+    max_padded_volume = memory_budget / (memory_factor * numpy.dtype(dtype).itemsize)
+
+    candidates = [_axis_candidates(s, m, p, fast_len) for s, m, p in zip(shape, margins, padding)]
+
+    best = None
+    for combination in itertools.product(*candidates):
+        padded_volume = _prod(padded for _, _, padded in combination)
+        if padded_volume > max_padded_volume:
+            continue
+        total_volume = _prod(nb_tiles * padded for _, nb_tiles, padded in combination)
+        nb_tiles = _prod(nb for _, nb, _ in combination)
+        key = (total_volume, nb_tiles)
+        if best is None or key < best[0]:
+            best = (key, combination)
+
+    if best is None:
+        # nothing fits, we use the smallest tiles available:
+        combination = tuple(axis_candidates[0] for axis_candidates in candidates)
+        padded_volume = _prod(padded for _, _, padded in combination)
+        aprint(
+            f"Warning: no tiling of shape {tuple(shape)} fits the memory budget of {memory_budget / 1e9:.3f} GB, "
+            f"smallest tiles need {padded_volume * memory_factor * numpy.dtype(dtype).itemsize / 1e9:.3f} GB."
+        )
+    else:
+        combination = best[1]
+
+    tiles = tuple(tile for tile, _, _ in combination)
+    aprint(
+        f"Planned tiles: {tiles} with margins: {margins} for shape: {tuple(shape)}, "
+        f"padded tile shape: {tuple(padded for _, _, padded in combination)}"
+    )
+    return tiles, margins
+
+
+def default_tile_memory_budget(workers: int = 1) -> int:
+    """
+    Returns a default memory budget for a single tile on the current backend: half of the free device memory for
+    CupyBackend, and a quarter of the available host memory otherwise, shared between concurrent workers.
+
+    Parameters
+    ----------
+    workers : number of tiles processed concurrently.
+
+    Returns
+    -------
+    Memory budget in bytes.
+    """
+    from dexp.utils.backends import CupyBackend
+
+    backend = Backend.current()
+    if isinstance(backend, CupyBackend):
+        budget = 0.5 * backend.cupy_device.mem_info[0]
+    else:
+        from dexp.utils.scheduler import available_memory
+
+        budget = 0.25 * available_memory()
+    return int(budget / max(1, workers))
+
+
+def _axis_candidates(length: int, margin: int, padding: int, fast_len: Callable[[int], int]) -> List[Tuple[int, ...]]:
+    # Lists (tile, number of tiles, padded length) candidates along one axis, keeping only those for which no
+    # other candidate has both a smaller padded length and a smaller total padded length:
+    candidates = {}
+
+    # A single tile covering the whole axis needs no margins:
+    padded = fast_len(length + padding)
+    candidates[padded] = (length, 1, padded)
+
+    # Tiles smaller than their margins are not worth it:
+    min_tile = max(1, margin)
+    for nb_tiles in range(2, max(2, math.ceil(length / min_tile)) + 1):
+        tile = math.ceil(length / nb_tiles)
+        padded = fast_len(tile + 2 * margin + padding)
+        # we grow the tile to use all of the FFT length, as long as this does not change the number of tiles:
+        tile = min(padded - 2 * margin - padding, math.ceil(length / (nb_tiles - 1)) - 1)
+        if tile < 1:
+            continue
+        nb_tiles = math.ceil(length / tile)
+        padded = fast_len(tile + 2 * margin + padding)
+        candidate = (tile, nb_tiles, padded)
+        if padded not in candidates or nb_tiles * padded < _cost(candidates[padded]):
+            candidates[padded] = candidate
+
+    pareto = []
+    for padded in sorted(candidates):
+        candidate = candidates[padded]
+        if not pareto or _cost(candidate) < _cost(pareto[-1]):
+            pareto.append(candidate)
+    return pareto
+
+
+def _cost(candidate: Tuple[int, ...]) -> int:
+    _, nb_tiles, padded = candidate
+    return nb_tiles * padded
+
+
+def _per_axis(value: Optional[Union[int, Sequence[int]]], ndim: int) -> Tuple[int, ...]:
+    if value is None:
+        return (0,) * ndim
+    if isinstance(value, (int, numpy.integer)):
+        return (int(value),) * ndim
+    return tuple(int(v) for v in value)
+
+
+def _prod(values) -> int:
+    # math.prod requires Python 3.8:
+    return reduce(operator.mul, values, 1)
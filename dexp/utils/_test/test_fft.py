@@ -0,0 +1,22 @@
+import numpy
+from numpy.testing import assert_allclose
+
+from dexp.utils.backends import Backend
+from dexp.utils.fft import RealFFT
+from dexp.utils.testing import execute_both_backends
+
+
+@execute_both_backends
+def test_real_fft():
+    xp = Backend.get_xp_module()
+
+    array = Backend.to_backend(numpy.random.default_rng(0).uniform(size=(12, 15, 16)).astype(numpy.float32))
+    fft = RealFFT(array.shape, array.dtype)
+
+    spectrum = fft.forward(array)
+    assert spectrum is fft.spectrum
+    assert_allclose(Backend.to_numpy(spectrum), numpy.fft.rfftn(Backend.to_numpy(array)), rtol=1e-4, atol=1e-4)
+
+    out = xp.empty_like(array)
+    assert fft.inverse(out=out) is out
+    assert_allclose(Backend.to_numpy(out), Backend.to_numpy(array), atol=1e-5)
@@ -0,0 +1,27 @@
+import time
+
+import numpy
+
+from dexp.utils.memory import MemoryTracker, measure_footprint
+
+
+def _allocate(nbytes):
+    array = numpy.ones(nbytes, dtype=numpy.uint8)
+    time.sleep(0.05)
+    return int(array.sum())
+
+
+def test_measure_footprint():
+    nbytes = 128 * 1024**2
+    result, footprint = measure_footprint(_allocate, nbytes)
+    assert result == nbytes
+    assert footprint > 0.75 * nbytes
+
+
+def test_memory_tracker_watch():
+    with MemoryTracker() as tracker:
+        record = tracker.watch()
+        _allocate(64 * 1024**2)
+        tracker.unwatch(record)
+    assert record["peak_host"] >= tracker.baseline_host
+    assert tracker.peak_host >= record["peak_host"]
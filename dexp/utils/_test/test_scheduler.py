@@ -0,0 +1,90 @@
+import random
+import threading
+import time
+
+import numpy
+import pytest
+import scipy.fft
+
+from dexp.utils.scheduler import TimePointScheduler, estimate_footprint
+
+
+def test_estimate_footprint():
+    assert estimate_footprint((2, 3, 4), "uint16") == 48
+    assert estimate_footprint((2, 3, 4), "float32", factor=2.5) == 240
+
+
+def test_scheduler_memory_budget_and_ordered_write_back():
+    lock = threading.Lock()
+    state = {"running": 0, "max_running": 0}
+    written = []
+
+    def process(tp):
+        with lock:
+            state["running"] += 1
+            state["max_running"] = max(state["max_running"], state["running"])
+        time.sleep(random.uniform(0.001, 0.01))
+        with lock:
+            state["running"] -= 1
+        return tp * 2
+
+    scheduler = TimePointScheduler(workers=8, memory_budget=300)
+    scheduler.run(process, range(20), footprint=100, write_back=lambda tp, result: written.append((tp, result)))
+
+    assert state["max_running"] <= 3
+    assert written == [(tp, tp * 2) for tp in range(20)]
+
+
+def test_scheduler_retries_and_devices():
+    attempts = {}
+    lock = threading.Lock()
+
+    def process(tp, device):
+        with lock:
+            attempts[tp] = attempts.get(tp, 0) + 1
+        time.sleep(0.001)
+        if tp % 3 == 0 and attempts[tp] == 1:
+            raise RuntimeError("transient failure")
+        return device
+
+    scheduler = TimePointScheduler(devices=(0, 1), max_retries=1)
+    results = scheduler.run(process, range(10))
+
+    assert set(results) == {0, 1}
+    assert attempts[3] == 2
+
+
+def test_scheduler_stop_at_exception():
+    def process(tp):
+        if tp == 2:
+            raise ValueError("failure")
+        return tp
+
+    with pytest.raises(ValueError):
+        TimePointScheduler(workers=2).run(process, range(5))
+
+    results = TimePointScheduler(workers=2, stop_at_exception=False).run(process, range(5))
+    assert results == [0, 1, None, 3, 4]
+
+
+def test_scheduler_threads_per_worker():
+    results = TimePointScheduler(workers=1, threads_per_worker=3).run(lambda tp: scipy.fft.get_workers(), range(3))
+    assert results == [3, 3, 3]
+
+
+def test_scheduler_measured_footprint_and_dry_run():
+    def process(tp):
+        array = numpy.ones(64 * 1024**2, dtype=numpy.uint8)
+        time.sleep(0.02)
+        return int(array[tp])
+
+    written = []
+    scheduler = TimePointScheduler(workers=8, memory_budget=3 * 64 * 1024**2)
+    results = scheduler.run(process, range(6), footprint="measure")
+    assert results == [1] * 6
+
+    results = TimePointScheduler(dry_run=True).run(
+        process, range(6), footprint="measure", write_back=lambda tp, result: written.append(tp)
+    )
+    assert len(results) == 1
+    assert written == [0]
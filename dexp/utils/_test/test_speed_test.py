@@ -1,5 +1,61 @@
+import json
+import tempfile
+from os.path import join
+
+from numcodecs import blosc
+
+from dexp.utils.config import config_blosc
 from dexp.utils.speed_test import perform_speed_test
 
 
-def test_backend_context():
-    perform_speed_test()
+def test_speed_test():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        output_path = join(tmpdir, "speedtest.json")
+        results = perform_speed_test(
+            path=tmpdir,
+            shape=(16, 64, 64),
+            nb_time_points=2,
+            chunks=(None, (1, 8, 32, 32)),
+            codecs=("zstd",),
+            clevels=(1, 3),
+            blosc_threads=(1,),
+            workers=(1, 2),
+            output_path=output_path,
+        )
+
+        assert len(results) == 2 * 2 * 2
+        for result in results:
+            for key in (
+                "encode",
+                "encode_best",
+                "decode",
+                "decode_best",
+                "write",
+                "read_cold",
+                "read_warm",
+                "storage_read_cold",
+                "storage_read_warm",
+            ):
+                assert result[key] > 0
+
+        with open(output_path) as f:
+            report = json.load(f)
+        assert report["results"] == results
+
+
+def test_speed_test_default_blosc_threads():
+    config_blosc()
+    default_threads = blosc.get_nthreads()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        results = perform_speed_test(
+            path=tmpdir,
+            shape=(8, 32, 32),
+            nb_time_points=1,
+            codecs=("zstd",),
+            blosc_threads=(default_threads + 1, 0),
+            repeats=3,
+        )
+
+    # the default configuration is not measured with the threads set by the previous one:
+    assert [result["blosc_threads"] for result in results] == [default_threads + 1, default_threads]
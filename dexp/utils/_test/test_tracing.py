@@ -0,0 +1,40 @@
+import json
+from os.path import join
+
+from arbol import asection
+
+from dexp.utils.scheduler import TimePointScheduler
+from dexp.utils.tracing import is_tracing, trace_io, tracing
+
+
+def test_tracing(tmpdir):
+    def process(tp):
+        # asection is imported before tracing is enabled, as in all dexp modules:
+        with asection(f"Loading time point {tp}"):
+            trace_io(read=100)
+        with asection(f"Saving time point {tp}, shape: (1, 2)"):
+            trace_io(written=10)
+        return tp
+
+    path = join(str(tmpdir), "trace.json")
+    with tracing(path=path) as tracer:
+        with asection("Processing"):
+            TimePointScheduler(workers=2).run(process, range(4))
+    assert not is_tracing()
+
+    names = [span["name"] for span in tracer.spans]
+    assert "Processing" in names
+    assert "Loading time point 3" in names
+
+    rows = {row["stage"]: row for row in tracer.summary()}
+    assert rows["Loading time point"]["count"] == 4
+    assert rows["Loading time point"]["bytes_read"] == 400
+    assert rows["Saving time point"]["bytes_written"] == 40
+    assert rows["Processing"]["total"] >= rows["Processing"]["self"]
+
+    with open(path) as f:
+        trace = json.load(f)
+    events = [event for event in trace["traceEvents"] if event["ph"] == "X"]
+    assert len(events) == len(tracer.spans)
+    assert {event["args"]["time_point"] for event in events if event["name"].startswith("Loading")} == {0, 1, 2, 3}
+    assert all(event["args"]["backend"] == "NumpyBackend" for event in events)
@@ -0,0 +1,95 @@
+import os
+import subprocess
+import sys
+import time
+from os.path import join
+
+from dexp.utils.work_queue import WorkQueue
+
+_node_script = """
+import os, sys, time
+from dexp.utils.scheduler import TimePointScheduler
+from dexp.utils.work_queue import WorkQueue
+
+queue_path, output_path = sys.argv[1:]
+
+def process(tp):
+    time.sleep(0.05)
+    return tp
+
+def write_back(tp, result):
+    open(os.path.join(output_path, f"{tp}-{os.getpid()}"), "w").close()
+
+with WorkQueue(queue_path, poll_interval=0.1) as queue:
+    TimePointScheduler(workers=2, queue=queue).run(process, range(12), write_back=write_back)
+"""
+
+
+def test_work_queue(tmpdir):
+    path = join(str(tmpdir), "output.zarr")
+    with WorkQueue.next_to(path) as node1, WorkQueue.next_to(path) as node2:
+        assert node1.path == path + ".queue"
+
+        assert node1.claim(0)
+        assert not node2.claim(0)
+        assert node2.claim(1)
+
+        node1.complete(0, duration=1.0)
+        assert node2.is_done(0)
+        assert not node2.claim(0)
+        assert node2.manifest(0)["owner"] == node1.owner
+        assert node2.manifest(0)["duration"] == 1.0
+        assert node1.done(range(3)) == [0]
+
+        # released tasks can be claimed again:
+        node2.release(1)
+        assert node1.claim(1)
+
+
+def test_work_queue_stale_claims(tmpdir):
+    path = str(tmpdir)
+    with WorkQueue(path) as dead, WorkQueue(path, stale_timeout=10) as alive:
+        assert dead.claim(0)
+        assert not alive.claim(0)
+
+        # the claim is not kept alive anymore:
+        claim_path = join(path, "0.claim")
+        past = time.time() - 60
+        os.utime(claim_path, (past, past))
+        assert alive.claim(0)
+
+        # the previous owner cannot release a claim that was taken over:
+        dead.release(0)
+        assert os.path.exists(claim_path)
+
+
+def test_work_queue_once(tmpdir):
+    path = str(tmpdir)
+    calls = []
+
+    def create():
+        calls.append(1)
+        return "created"
+
+    with WorkQueue(path) as node1, WorkQueue(path) as node2:
+        assert node1.once("create", create) == "created"
+        assert node2.once("create", create) == "created"
+    assert len(calls) == 1
+
+
+def test_work_queue_processes(tmpdir):
+    queue_path = join(str(tmpdir), "queue")
+    output_path = join(str(tmpdir), "output")
+    os.makedirs(output_path)
+
+    nodes = [
+        subprocess.Popen([sys.executable, "-c", _node_script, queue_path, output_path], stdout=subprocess.DEVNULL)
+        for _ in range(3)
+    ]
+    assert all(node.wait(timeout=120) == 0 for node in nodes)
+
+    # each time point is written exactly once:
+    written = sorted(int(name.split("-")[0]) for name in os.listdir(output_path))
+    assert written == list(range(12))
+    tasks = [f"Processing-{tp}" for tp in range(12)]
+    assert WorkQueue(queue_path).done(tasks) == tasks
@@ -10,6 +10,7 @@ from dask.array import Array
 
 from dexp.utils import xpArray
 from dexp.utils.backends.backend import Backend
+from dexp.utils.memory import track_memory_pool, untrack_memory_pool
 
 
 class CupyBackend(Backend):
@@ -159,6 +160,7 @@ class CupyBackend(Backend):
                 self.mempool = cp.cuda.MemoryPool(cp.cuda.memory.malloc_managed if self.enable_unified_memory else None)
             self._previous_allocator = cp.cuda.memory._get_thread_local_allocator()
             cp.cuda.memory._set_thread_local_allocator(self.mempool.malloc)
+            track_memory_pool(self.mempool)
 
         else:
             cp.cuda.memory._set_thread_local_allocator(None)
@@ -170,6 +172,8 @@ class CupyBackend(Backend):
 
         # unset allocation:
         self.clear_memory_pool()
+        if self.mempool is not None:
+            untrack_memory_pool(self.mempool)
 
         if self._previous_allocator is not None:
             from cupy.cuda import memory
@@ -1,3 +1,8 @@
+from typing import Tuple
+
+import numpy
+
+from dexp.utils import xpArray
 from dexp.utils.backends import Backend, CupyBackend
 
 
@@ -20,3 +25,86 @@ def clear_fft_plan_cache() -> None:
 
     cache.set_size(prev_size)
     cache.set_memsize(prev_mem)
+
+
+class RealFFT:
+    """
+    Real-to-complex FFTs over all axes of arrays of a given shape, computed into a preallocated half spectrum so that
+    iterative algorithms do not allocate a new spectrum at each iteration. On GPU, the cuFFT plans are created once.
+    Only NumPy < 2.0, whose FFTs cannot write into a given array, computes spectra in temporary arrays that are then
+    copied.
+    """
+
+    def __init__(self, shape: Tuple[int, ...], dtype: numpy.dtype = numpy.float32):
+        """
+        Parameters
+        ----------
+        shape : shape of the real arrays.
+        dtype : dtype of the real arrays, float32 or float64.
+        """
+        xp = Backend.get_xp_module()
+
+        self.shape = tuple(shape)
+        self.dtype = numpy.dtype(dtype)
+        complex_dtype = numpy.result_type(self.dtype, numpy.complex64)
+        self.spectrum = xp.empty(self.shape[:-1] + (self.shape[-1] // 2 + 1,), dtype=complex_dtype)
+
+        self._plans = None
+        if isinstance(Backend.current(), CupyBackend):
+            from cupyx.scipy.fftpack import get_fft_plan
+
+            self._plans = (
+                get_fft_plan(xp.empty(self.shape, dtype=self.dtype), value_type="R2C"),
+                get_fft_plan(self.spectrum, shape=self.shape, value_type="C2R"),
+            )
+
+    def forward(self, array: xpArray) -> xpArray:
+        """
+        Computes the half spectrum of a real array.
+
+        Parameters
+        ----------
+        array : real array of the given shape and dtype.
+
+        Returns
+        -------
+        The preallocated half spectrum, overwritten at each call.
+        """
+        if self._plans is not None:
+            from cupy.cuda import cufft
+
+            self._plans[0].fft(array, self.spectrum, cufft.CUFFT_FORWARD)
+        elif _numpy_fft_supports_out():
+            numpy.fft.rfftn(array, out=self.spectrum)
+        else:
+            self.spectrum[...] = Backend.get_sp_module().fft.rfftn(array)
+        return self.spectrum
+
+    def inverse(self, out: xpArray) -> xpArray:
+        """
+        Computes the real array of the half spectrum, which is overwritten.
+
+        Parameters
+        ----------
+        out : real array of the given shape and dtype, written into.
+
+        Returns
+        -------
+        The 'out' array.
+        """
+        if self._plans is not None:
+            from cupy.cuda import cufft
+
+            self._plans[1].fft(self.spectrum, out, cufft.CUFFT_INVERSE)
+            # cuFFT does not normalise inverse transforms:
+            out /= out.size
+        elif _numpy_fft_supports_out():
+            numpy.fft.irfftn(self.spectrum, s=self.shape, out=out)
+        else:
+            out[...] = Backend.get_sp_module().fft.irfftn(self.spectrum, s=self.shape, overwrite_x=True)
+        return out
+
+
+def _numpy_fft_supports_out() -> bool:
+    # NumPy's FFTs accept an 'out' argument since 2.0, and no longer compute single precision in double precision:
+    return numpy.lib.NumpyVersion(numpy.__version__) >= "2.0.0"
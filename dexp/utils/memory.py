@@ -0,0 +1,126 @@
+import threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+def host_memory_usage() -> int:
+    """Returns the resident memory of the current process, in bytes."""
+    import psutil
+
+    return psutil.Process().memory_info().rss
+
+
+def backend_memory_usage() -> int:
+    """Returns the memory used by the memory pools of the CuPy backends entered in this process, in bytes."""
+    try:
+        import cupy
+
+        return cupy.get_default_memory_pool().used_bytes() + _tracked_pools_usage()
+    except ImportError:
+        return 0
+
+
+class MemoryTracker:
+    def __init__(self, interval: float = 0.01):
+        """
+        Samples the host memory of the current process, and the memory pool usage of the backend when CuPy is
+        present, in a background thread, and keeps track of peaks. Peaks can also be followed over arbitrary
+        intervals, e.g. for each traced section or each time point, with 'watch' and 'unwatch'.
+        Use as a context manager.
+
+        Parameters
+        ----------
+        interval : sampling interval in seconds.
+        """
+        self.interval = interval
+        self.baseline_host = 0
+        self.peak_host = 0
+        self.peak_backend = 0
+        self._watched: List[Dict[str, int]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def __enter__(self) -> "MemoryTracker":
+        self.baseline_host = self.peak_host = host_memory_usage()
+        self.peak_backend = backend_memory_usage()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="dexp-memory-tracker", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stop.set()
+        self._thread.join()
+        self.sample()
+
+    def watch(self) -> Dict[str, int]:
+        """Starts following peaks, returns a record updated with 'peak_host' and 'peak_backend' until unwatched."""
+        record = dict(peak_host=host_memory_usage(), peak_backend=backend_memory_usage())
+        with self._lock:
+            self._watched.append(record)
+        return record
+
+    def unwatch(self, record: Dict[str, int]) -> Dict[str, int]:
+        """Stops following peaks for the given record, and returns it."""
+        self.sample()
+        with self._lock:
+            self._watched = [r for r in self._watched if r is not record]
+        return record
+
+    def sample(self) -> None:
+        host = host_memory_usage()
+        backend = backend_memory_usage()
+        with self._lock:
+            self.peak_host = max(self.peak_host, host)
+            self.peak_backend = max(self.peak_backend, backend)
+            for record in self._watched:
+                record["peak_host"] = max(record["peak_host"], host)
+                record["peak_backend"] = max(record["peak_backend"], backend)
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.sample()
+
+
+def measure_footprint(function: Callable[..., Any], *args, **kwargs) -> Tuple[Any, int]:
+    """
+    Runs a function and measures its memory footprint: the peak increase in host memory of the current process
+    plus the peak memory used by backend memory pools during the call.
+
+    Parameters
+    ----------
+    function : function to call
+    args, kwargs : arguments of the function
+
+    Returns
+    -------
+    Result of the function and its footprint in bytes.
+    """
+    with MemoryTracker() as tracker:
+        backend_baseline = tracker.peak_backend
+        result = function(*args, **kwargs)
+    footprint = (tracker.peak_host - tracker.baseline_host) + max(0, tracker.peak_backend - backend_baseline)
+    return result, footprint
+
+
+# CuPy backends with their own memory pools register them here while entered so that their usage is accounted:
+_pools = []
+_pools_lock = threading.Lock()
+
+
+def track_memory_pool(pool: Any) -> None:
+    with _pools_lock:
+        _pools.append(pool)
+
+
+def untrack_memory_pool(pool: Any) -> None:
+    with _pools_lock:
+        for i, p in enumerate(_pools):
+            if p is pool:
+                del _pools[i]
+                break
+
+
+def _tracked_pools_usage() -> int:
+    with _pools_lock:
+        return sum(pool.used_bytes() for pool in _pools)
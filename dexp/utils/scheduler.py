@@ -0,0 +1,434 @@
+import os
+import time
+import traceback
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy
+from arbol import aprint, asection
+
+from dexp.utils.memory import measure_footprint
+from dexp.utils.misc import compute_num_workers
+from dexp.utils.tracing import is_tracing, trace_context
+from dexp.utils.work_queue import WorkQueue
+
+
+def estimate_footprint(shape: Sequence[int], dtype: Any, factor: float = 1.0) -> int:
+    """
+    Estimates the host memory footprint of a task as a multiple of the size of an array.
+
+    Parameters
+    ----------
+    shape : shape of the array (typically a stack)
+    dtype : dtype of the array
+    factor : how many such arrays are alive at the same time during the task.
+
+    Returns
+    -------
+    Footprint in bytes.
+    """
+    return int(factor * numpy.prod(shape, dtype=numpy.float64) * numpy.dtype(dtype).itemsize)
+
+
+def available_memory() -> int:
+    """Returns the amount of host memory currently available, in bytes."""
+    import psutil
+
+    return psutil.virtual_memory().available
+
+
+def resolve_devices(devices: Optional[Sequence[int]]) -> Optional[Tuple[int, ...]]:
+    """
+    Returns the CUDA devices to process on, or None if processing must happen on CPU because no devices were
+    requested or CuPy is not available.
+
+    Parameters
+    ----------
+    devices : requested CUDA device ids, None or empty for CPU processing.
+
+    Returns
+    -------
+    Tuple of device ids, or None for CPU processing.
+    """
+    from dexp.utils.backends.cupy_backend import is_cupy_available
+
+    if not devices:
+        aprint("No CUDA devices requested, processing on CPU.")
+        return None
+    if not is_cupy_available():
+        aprint("CuPy is not available, processing on CPU.")
+        return None
+    return tuple(devices)
+
+
+def limit_threads(nb_threads: int) -> None:
+    """
+    Limits the number of threads used by blosc and by OpenMP/BLAS libraries in the current process.
+    Meant to be called at the start of worker processes so that concurrent workers do not oversubscribe cores.
+
+    Parameters
+    ----------
+    nb_threads : number of threads per worker.
+    """
+    from numcodecs import blosc
+
+    for variable in _THREAD_VARIABLES:
+        os.environ[variable] = str(nb_threads)
+    blosc.use_threads = nb_threads > 1
+    blosc.set_nthreads(nb_threads)
+
+
+_THREAD_VARIABLES = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+# Default for dry runs, see set_dry_run:
+_dry_run = False
+
+
+def set_dry_run(dry_run: bool) -> None:
+    """
+    Sets whether schedulers perform dry runs by default: only the first time point is processed and its
+    measured memory footprint is reported.
+
+    Parameters
+    ----------
+    dry_run : True to perform dry runs.
+    """
+    global _dry_run
+    _dry_run = dry_run
+
+
+class TimePointScheduler:
+    def __init__(
+        self,
+        workers: int = -1,
+        backend: str = "threading",
+        memory_budget: Optional[int] = None,
+        devices: Optional[Sequence[int]] = None,
+        max_retries: int = 0,
+        stop_at_exception: bool = True,
+        description: str = "Processing",
+        threads_per_worker: Optional[int] = None,
+        dry_run: Optional[bool] = None,
+        queue: Optional[WorkQueue] = None,
+    ):
+        """
+        Runs per-time-point tasks concurrently while keeping the sum of their estimated memory footprints
+        below a budget. Results can be handed back in time-point order to a write-back function, failed tasks
+        are retried, and progress is reported as tasks complete.
+
+        Parameters
+        ----------
+        workers : maximal number of concurrent tasks, negative numbers n correspond to: number_of_cores / |n|.
+            If devices are given and workers is -1, one worker per device is used.
+        backend : What backend to spawn workers with, can be ‘loky’ (multi-process) or ‘threading’ (multi-thread)
+        memory_budget : memory budget in bytes, if None 80% of the currently available host memory is used.
+        devices : optional list of device ids, each task receives the least busy device via the keyword argument
+            'device'. Exclusive access to a device is left to the backend (see CupyBackend's 'exclusive' option)
+            so that loading and saving of other tasks can overlap with compute.
+        max_retries : number of times a failed task is retried before giving up.
+        stop_at_exception : True to stop as soon as a task has failed (after retries).
+        description : description used when reporting progress.
+        threads_per_worker : if not None, number of threads each task may use for FFTs (scipy.fft), blosc and
+            OpenMP/BLAS libraries. Zero divides the cores evenly between workers. Best used with process backends.
+        dry_run : if True, only the first task is processed, its memory footprint is measured and the number of
+            workers that would fit in the memory budget is reported. If None, the default set with set_dry_run.
+        queue : optional work queue shared with other processes, possibly on other nodes, running the same command.
+            Tasks are then claimed from the queue before being processed and marked as completed once processed
+            (and written back), tasks claimed by other processes are skipped, and 'run' returns once all tasks are
+            completed by any process. Tasks are identified in the queue by the description and the task itself.
+        """
+        self.workers = workers
+        self.backend = backend
+        self.memory_budget = memory_budget
+        self.devices = None if devices is None else list(devices)
+        self.max_retries = max_retries
+        self.stop_at_exception = stop_at_exception
+        self.description = description
+        self.threads_per_worker = threads_per_worker
+        self.dry_run = _dry_run if dry_run is None else dry_run
+        self.queue = queue
+
+    def run(
+        self,
+        process: Callable[..., Any],
+        tasks: Sequence[Any],
+        footprint: Union[int, Callable[[Any], int], str] = 0,
+        write_back: Optional[Callable[[Any, Any], None]] = None,
+    ) -> List[Any]:
+        """
+        Runs the given function on all tasks.
+
+        Parameters
+        ----------
+        process : function called with a task (typically a time point), and the keyword argument 'device'
+            if devices were given. Must raise on failure so that it can be retried.
+        tasks : tasks to process, in order.
+        footprint : estimated memory footprint in bytes of a task, or function that returns it for a given task.
+            If 'measure', the first task is processed alone while its peak memory usage is measured, and the
+            measurement is used for the remaining tasks.
+        write_back : optional function called in the calling thread with each task and its result, strictly in
+            task order. The footprint of a task is only released once its result is written back.
+
+        Returns
+        -------
+        List of results in task order, None for failed tasks and for tasks processed by other processes.
+        Results handed to write_back are not retained.
+        """
+        tasks = list(tasks)
+        nb_tasks = len(tasks)
+        if nb_tasks == 0:
+            return []
+
+        workers = self.workers
+        if self.devices is not None and workers == -1:
+            workers = len(self.devices)
+        workers = compute_num_workers(workers, nb_tasks)
+
+        budget = int(0.8 * available_memory()) if self.memory_budget is None else int(self.memory_budget)
+
+        if is_tracing():
+            process = _TimePointTraced(process)
+
+        queue = self.queue
+        queue_keys = [f"{self.description}-{task}" for task in tasks]
+
+        results: List[Any] = [None] * nb_tasks
+        completed = [False] * nb_tasks
+        failed = [False] * nb_tasks
+        # written back (if needed) and marked as completed in the queue (if any):
+        finished = [False] * nb_tasks
+        # completed or claimed by other processes:
+        skipped = [False] * nb_tasks
+        # claimed by other processes, claimed again later in case these processes died:
+        deferred: List[int] = []
+        held = [0] * nb_tasks
+        nb_completed = 0
+        start = time.time()
+        pending = deque((index, 0) for index in range(nb_tasks))
+
+        def claim(index: int) -> bool:
+            if queue is None or queue.claim(queue_keys[index]):
+                return True
+            skipped[index] = True
+            if not queue.is_done(queue_keys[index]):
+                deferred.append(index)
+            return False
+
+        def finish(index: int) -> None:
+            if finished[index]:
+                return
+            finished[index] = True
+            if write_back is not None and results[index] is not None:
+                with trace_context(time_point=tasks[index]):
+                    write_back(tasks[index], results[index])
+                results[index] = None
+            if queue is not None:
+                if failed[index]:
+                    queue.release(queue_keys[index])
+                else:
+                    queue.complete(queue_keys[index])
+
+        if footprint == "measure" or self.dry_run:
+            # Runs the first task alone to measure its footprint:
+            first = None
+            while pending and first is None:
+                index, _ = pending.popleft()
+                if claim(index):
+                    first = index
+            measured = 0
+            if first is not None:
+                kwargs = {} if self.devices is None else {"device": self.devices[0]}
+                try:
+                    with asection(f"{self.description}: measuring memory footprint of task {tasks[first]}"):
+                        results[first], measured = measure_footprint(process, tasks[first], **kwargs)
+                except Exception as error:
+                    aprint(f"Error occurred while processing task {tasks[first]}: {error}")
+                    aprint("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+                    if self.stop_at_exception:
+                        if queue is not None:
+                            queue.release(queue_keys[first])
+                        raise error
+                    failed[first] = True
+                aprint(
+                    f"{self.description}: measured footprint: {measured / 1e9:.2f} GB per task, "
+                    f"{max(1, budget // max(1, measured))} tasks fit in the memory budget of {budget / 1e9:.2f} GB"
+                )
+                completed[first] = True
+                nb_completed = 1
+                finish(first)
+            if footprint == "measure":
+                footprint = measured
+            if self.dry_run:
+                aprint(f"{self.description}: dry run, remaining tasks skipped.")
+                return [] if first is None else [results[first]]
+
+        if not callable(footprint) and footprint > 0:
+            # no point in having more workers than tasks that fit in memory:
+            workers = max(1, min(workers, budget // footprint))
+        aprint(f"{self.description}: {nb_tasks} tasks, {workers} workers, memory budget: {budget / 1e9:.2f} GB")
+
+        footprint_fun = footprint if callable(footprint) else (lambda _: footprint)
+
+        nb_threads = None
+        if self.threads_per_worker is not None:
+            nb_threads = self.threads_per_worker or max(1, (os.cpu_count() or 1) // workers)
+            aprint(f"Threads per worker: {nb_threads}")
+            process = _ThreadLimited(process, nb_threads)
+
+        in_flight: Dict[Future, Tuple[int, int, Optional[int]]] = {}
+        device_load = None if self.devices is None else {device: 0 for device in self.devices}
+        reserved = 0
+        next_write_back = 0
+
+        executor = self._executor(workers, nb_threads)
+        try:
+            while pending or in_flight or deferred:
+                if not pending and not in_flight:
+                    # Remaining tasks are being processed by other processes, we wait for them to complete and
+                    # claim again those that were abandoned:
+                    time.sleep(queue.poll_interval)
+                    pending.extend((index, 0) for index in deferred if not queue.is_done(queue_keys[index]))
+                    deferred.clear()
+                    continue
+
+                # Admission of new tasks, we always admit at least one task to guarantee progress:
+                while pending and len(in_flight) < workers:
+                    index, attempt = pending[0]
+                    task_footprint = int(footprint_fun(tasks[index]))
+                    if reserved + task_footprint > budget and in_flight:
+                        break
+                    pending.popleft()
+                    if attempt == 0 and not claim(index):
+                        continue
+                    if task_footprint > budget:
+                        aprint(
+                            f"Warning: estimated footprint of task {tasks[index]} ({task_footprint / 1e9:.2f} GB) "
+                            f"exceeds the memory budget ({budget / 1e9:.2f} GB)!"
+                        )
+                    kwargs = {}
+                    device = None
+                    if device_load is not None:
+                        device = min(device_load, key=device_load.get)
+                        device_load[device] += 1
+                        kwargs["device"] = device
+                    future = executor.submit(process, tasks[index], **kwargs)
+                    in_flight[future] = (index, attempt, device)
+                    held[index] = task_footprint
+                    reserved += task_footprint
+
+                if not in_flight:
+                    continue
+
+                done, _ = wait(in_flight.keys(), return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, attempt, device = in_flight.pop(future)
+                    if device is not None:
+                        device_load[device] -= 1
+                    try:
+                        results[index] = future.result()
+                    except Exception as error:
+                        aprint(f"Error occurred while processing task {tasks[index]} (attempt {attempt + 1}): {error}")
+                        aprint("".join(traceback.format_exception(type(error), error, error.__traceback__)))
+                        if attempt < self.max_retries:
+                            reserved -= held[index]
+                            held[index] = 0
+                            pending.appendleft((index, attempt + 1))
+                            continue
+                        if self.stop_at_exception:
+                            raise error
+                        failed[index] = True
+
+                    completed[index] = True
+                    nb_completed += 1
+                    # tasks skipped by the ordered write-back, because they were claimed by another process that
+                    # died, are written back right away:
+                    if write_back is None or index < next_write_back:
+                        finish(index)
+                        reserved -= held[index]
+                        held[index] = 0
+
+                    elapsed = time.time() - start
+                    eta = elapsed * (nb_tasks - nb_completed) / nb_completed
+                    aprint(
+                        f"{self.description}: {nb_completed}/{nb_tasks} done ({100 * nb_completed // nb_tasks}%), "
+                        f"elapsed: {elapsed:.1f}s, remaining: {eta:.1f}s"
+                    )
+
+                # Ordered write-back, tasks processed by other processes are skipped:
+                while (
+                    write_back is not None
+                    and next_write_back < nb_tasks
+                    and (completed[next_write_back] or skipped[next_write_back])
+                ):
+                    if completed[next_write_back]:
+                        finish(next_write_back)
+                        reserved -= held[next_write_back]
+                        held[next_write_back] = 0
+                    next_write_back += 1
+
+        finally:
+            for future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=True)
+            if queue is not None:
+                # claims of tasks that were not completed, e.g. after an exception, are left to other processes:
+                for index in range(nb_tasks):
+                    if not finished[index]:
+                        queue.release(queue_keys[index])
+
+        if queue is not None:
+            nb_skipped = sum(skipped[index] and not completed[index] for index in range(nb_tasks))
+            aprint(f"{self.description}: {nb_completed} tasks processed here, {nb_skipped} by other processes.")
+
+        return results
+
+    def _executor(self, workers: int, nb_threads: Optional[int] = None):
+        # A single worker does not justify spawning a process:
+        if workers > 1 and self.backend in ("loky", "multiprocessing", "processes"):
+            from joblib.externals.loky import get_reusable_executor
+
+            # environment variables must be set before OpenMP/BLAS libraries are loaded in the workers:
+            env = None if nb_threads is None else {variable: str(nb_threads) for variable in _THREAD_VARIABLES}
+            return _NonClosingExecutor(get_reusable_executor(max_workers=workers, env=env))
+        return ThreadPoolExecutor(max_workers=workers)
+
+
+class _ThreadLimited:
+    # Picklable wrapper that limits the number of threads used by a task, FFT workers are thread-local in scipy.
+    # Process-wide limits are only applied in worker processes, never in the calling process:
+    def __init__(self, function: Callable[..., Any], nb_threads: int):
+        self.function = function
+        self.nb_threads = nb_threads
+        self.parent_pid = os.getpid()
+
+    def __call__(self, *args, **kwargs) -> Any:
+        import scipy.fft
+
+        if os.getpid() != self.parent_pid:
+            limit_threads(self.nb_threads)
+        with scipy.fft.set_workers(self.nb_threads):
+            return self.function(*args, **kwargs)
+
+
+class _TimePointTraced:
+    # Attaches the task (typically a time point) to the sections traced while processing it:
+    def __init__(self, function: Callable[..., Any]):
+        self.function = function
+
+    def __call__(self, task: Any, **kwargs) -> Any:
+        with trace_context(time_point=task):
+            return self.function(task, **kwargs)
+
+
+class _NonClosingExecutor:
+    # Reusable process executors are shared and must not be shut down between runs:
+    def __init__(self, executor):
+        self._executor = executor
+
+    def submit(self, *args, **kwargs) -> Future:
+        return self._executor.submit(*args, **kwargs)
+
+    def shutdown(self, wait: bool = True) -> None:
+        pass
@@ -1,57 +1,229 @@
+import itertools
+import json
+import os
+import platform
+import shutil
+import tempfile
+import time
 from os.path import join
+from typing import Dict, List, Optional, Sequence, Tuple
 
+import numpy
 from arbol import aprint, asection
+from joblib import Parallel, delayed
+from numcodecs import Blosc, blosc
 
 
-def perform_speed_test():
-
-    import os
-
-    cwd = os.getcwd()
-    with asection(f"Measuring write/read at current path: {cwd}"):
-        import subprocess
-
-        filename = "zz__speedtestfile__zz"
-        filepath = join(cwd, filename)
-
-        from sys import platform
-
-        if platform == "linux" or platform == "linux2" or platform == "darwin":
-            with asection("Write speed:"):
-                result = subprocess.run(
-                    ["time", "sh", "-c", f'dd if=/dev/zero of="{filepath}" bs=4194304 count=256 && sync'],
-                    capture_output=True,
-                )
-                # aprint(result.stdout.decode("utf-8").split('\n'))
-                aprint(result.stderr.decode("utf-8").split("\n")[2])
-
-            with asection("Read speed:"):
-                result = subprocess.run(
-                    ["time", "sh", "-c", f'dd if="{filepath}" of=/dev/null bs=4194304 count=256 && sync'],
-                    capture_output=True,
-                )
-                # aprint(result.stdout.decode("utf-8").split('\n'))
-                aprint(result.stderr.decode("utf-8").split("\n")[2])
-
-            with asection("Read speed with cache clearing:"):
-                # clear cache:
-                return_code = os.system("sync; echo 3 > /proc/sys/vm/drop_caches")
-                if return_code != 0:
-                    aprint("you must be root to clear the cache!")
-
-                result = subprocess.run(
-                    ["time", "sh", "-c", f'dd if="{filepath}" of=/dev/null bs=4194304 count=256 && sync'],
-                    capture_output=True,
-                )
-                # aprint(result.stdout.decode("utf-8").split('\n'))
-                aprint(result.stderr.decode("utf-8").split("\n")[2])
-
-        elif platform == "win32":
-            aprint(f"Not implemented yet for operating system: {platform}")
-        else:
-            aprint(f"Unknown operating system: {platform}")
-
-        try:
-            os.remove(filepath)
-        except:  # noqa
-            aprint(f"Could not delete file: {filepath}")
+def perform_speed_test(
+    path: Optional[str] = None,
+    shape: Tuple[int, ...] = (64, 512, 512),
+    nb_time_points: int = 4,
+    dtype: str = "uint16",
+    chunks: Sequence[Optional[Tuple[int, ...]]] = (None,),
+    codecs: Sequence[str] = ("zstd", "lz4"),
+    clevels: Sequence[int] = (3,),
+    blosc_threads: Sequence[int] = (0,),
+    workers: Sequence[int] = (1,),
+    repeats: int = 5,
+    output_path: Optional[str] = None,
+) -> List[Dict]:
+    """
+    Measures the throughput of dexp's zarr I/O by writing and reading synthetic stacks through ZDataset.
+
+    Every combination of chunk shape, codec, compression level, number of blosc threads and number of concurrent
+    workers is measured. For each configuration we report, in MB/s of uncompressed data: encoding and decoding
+    throughput (in memory, median and best of repeated timings of one chunk), end-to-end write throughput,
+    end-to-end read throughput with cold and warm page cache, and raw storage read throughput (compressed bytes)
+    with cold and warm page cache.
+    The page cache is dropped per file with posix_fadvise, no root privileges are needed.
+
+    Parameters
+    ----------
+    path : directory in which the temporary datasets are written, current directory if None.
+    shape : shape of a single stack.
+    nb_time_points : number of stacks written and read per configuration.
+    dtype : dtype of synthetic stacks.
+    chunks : chunk shapes (including time) to test, None stands for dexp's default chunks.
+    codecs : compression codecs to test ('zstd', 'blosclz', 'lz4', 'lz4hc', 'zlib' or 'snappy').
+    clevels : compression levels to test.
+    blosc_threads : numbers of blosc threads to test, zero stands for dexp's default.
+    workers : numbers of concurrent workers (threads) reading or writing stacks to test.
+    repeats : number of timings of encoding and decoding.
+    output_path : if not None, results are saved as JSON to this file.
+
+    Returns
+    -------
+    List of dictionaries, one per configuration, with the measured throughputs.
+    """
+    from dexp.datasets import ZDataset
+    from dexp.utils.config import config_blosc
+
+    if path is None:
+        path = os.getcwd()
+
+    stacks = _synthetic_stacks(shape, nb_time_points, dtype)
+    stack_nbytes = stacks[0].nbytes
+
+    results = []
+    with asection(f"Measuring zarr write/read throughput at path: {path}"):
+        configurations = list(itertools.product(chunks, codecs, clevels, blosc_threads, workers))
+        for chunk, codec, clevel, nb_blosc_threads, nb_workers in configurations:
+            tmpdir = tempfile.mkdtemp(prefix="dexp_speedtest_", dir=path)
+            try:
+                with asection(
+                    f"chunks={chunk}, codec={codec}, clevel={clevel}, "
+                    f"blosc threads={nb_blosc_threads}, workers={nb_workers}"
+                ):
+                    dataset = ZDataset(join(tmpdir, "speedtest.zarr"), mode="w", store="dir")
+                    array = dataset.add_channel(
+                        "speedtest",
+                        shape=(nb_time_points,) + tuple(shape),
+                        dtype=dtype,
+                        chunks=chunk,
+                        codec=codec,
+                        clevel=clevel,
+                    )
+                    # each configuration starts from dexp's default, whatever the previous one set:
+                    config_blosc()
+                    if nb_blosc_threads > 0:
+                        blosc.set_nthreads(nb_blosc_threads)
+
+                    result = dict(
+                        chunks=list(array.chunks),
+                        codec=codec,
+                        clevel=clevel,
+                        blosc_threads=blosc.get_nthreads(),
+                        workers=nb_workers,
+                    )
+                    result.update(_measure_codec(stacks[0], array.chunks[1:], codec, clevel, repeats))
+
+                    def _write(tp: int) -> None:
+                        dataset.write_stack("speedtest", tp, stacks[tp])
+
+                    def _read(tp: int) -> None:
+                        dataset.get_stack("speedtest", tp)[...]
+
+                    total_nbytes = stack_nbytes * nb_time_points
+                    elapsed = _timed_parallel(_write, nb_time_points, nb_workers)
+                    result["write"] = _mb_per_s(total_nbytes, elapsed)
+
+                    prefix = array.path + "/"
+                    keys = [
+                        key
+                        for key in array.chunk_store.keys()
+                        if key.startswith(prefix) and not key[len(prefix) :].startswith(".")
+                    ]
+                    stored_nbytes = sum(len(array.chunk_store[key]) for key in keys)
+                    result["compression_ratio"] = total_nbytes / max(1, stored_nbytes)
+
+                    result["cache_dropped"] = _drop_page_cache(tmpdir)
+                    result["read_cold"] = _mb_per_s(total_nbytes, _timed_parallel(_read, nb_time_points, nb_workers))
+                    result["read_warm"] = _mb_per_s(total_nbytes, _timed_parallel(_read, nb_time_points, nb_workers))
+
+                    def _read_raw(i: int) -> None:
+                        array.chunk_store[keys[i]]
+
+                    _drop_page_cache(tmpdir)
+                    elapsed = _timed_parallel(_read_raw, len(keys), nb_workers)
+                    result["storage_read_cold"] = _mb_per_s(stored_nbytes, elapsed)
+                    elapsed = _timed_parallel(_read_raw, len(keys), nb_workers)
+                    result["storage_read_warm"] = _mb_per_s(stored_nbytes, elapsed)
+
+                    dataset.close()
+                    aprint(", ".join(f"{k}={_format(v)}" for k, v in result.items()))
+                    results.append(result)
+            finally:
+                shutil.rmtree(tmpdir, ignore_errors=True)
+
+    # restores default blosc configuration:
+    config_blosc()
+
+    if output_path is not None:
+        report = dict(
+            host=platform.node(),
+            platform=platform.platform(),
+            cpu_count=os.cpu_count(),
+            path=os.path.abspath(path),
+            shape=list(shape),
+            nb_time_points=nb_time_points,
+            dtype=str(dtype),
+            results=results,
+        )
+        with open(output_path, mode="w") as f:
+            json.dump(report, f, indent=2)
+        aprint(f"Speed test results saved to: {output_path}")
+
+    return results
+
+
+def _synthetic_stacks(shape: Tuple[int, ...], nb_time_points: int, dtype: str) -> List[numpy.ndarray]:
+    # Noisy background with a few bright and smooth structures, roughly as compressible as microscopy data:
+    rng = numpy.random.default_rng(42)
+    structure = numpy.ones(shape=(1,) * len(shape), dtype=numpy.float32)
+    for axis, length in enumerate(shape):
+        profile = numpy.cos(numpy.linspace(0, 4 * numpy.pi, length, dtype=numpy.float32)) ** 8
+        structure = structure * profile.reshape((-1,) + (1,) * (len(shape) - axis - 1))
+    stacks = []
+    for _ in range(nb_time_points):
+        stack = 100 + 1000 * structure + rng.normal(0, 10, size=shape).astype(numpy.float32)
+        stacks.append(numpy.clip(stack, 0, None).astype(dtype))
+    return stacks
+
+
+def _measure_codec(
+    stack: numpy.ndarray, chunk: Tuple[int, ...], codec: str, clevel: int, repeats: int
+) -> Dict[str, float]:
+    compressor = Blosc(cname=codec, clevel=clevel, shuffle=Blosc.BITSHUFFLE)
+    chunk_array = numpy.ascontiguousarray(stack[tuple(slice(0, c) for c in chunk)])
+
+    encode_times, decode_times = [], []
+    for _ in range(max(1, repeats)):
+        start = time.perf_counter()
+        encoded = compressor.encode(chunk_array)
+        encode_times.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        compressor.decode(encoded)
+        decode_times.append(time.perf_counter() - start)
+
+    # the median is representative, the best timing is the least perturbed by other activity:
+    nbytes = chunk_array.nbytes
+    return dict(
+        encode=_mb_per_s(nbytes, float(numpy.median(encode_times))),
+        encode_best=_mb_per_s(nbytes, min(encode_times)),
+        decode=_mb_per_s(nbytes, float(numpy.median(decode_times))),
+        decode_best=_mb_per_s(nbytes, min(decode_times)),
+    )
+
+
+def _timed_parallel(function, n: int, workers: int) -> float:
+    start = time.perf_counter()
+    if workers == 1:
+        for i in range(n):
+            function(i)
+    else:
+        Parallel(n_jobs=workers, backend="threading")(delayed(function)(i) for i in range(n))
+    return time.perf_counter() - start
+
+
+def _drop_page_cache(path: str) -> bool:
+    # Flushes and evicts the given files from the OS page cache so that the next read hits the storage:
+    if not hasattr(os, "posix_fadvise"):
+        return False
+    for root, _, files in os.walk(path):
+        for filename in files:
+            fd = os.open(join(root, filename), os.O_RDONLY)
+            try:
+                os.fsync(fd)
+                os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+            finally:
+                os.close(fd)
+    return True
+
+
+def _mb_per_s(nbytes: int, elapsed_time: float) -> float:
+    return nbytes / 1e6 / max(elapsed_time, 1e-9)
+
+
+def _format(value) -> str:
+    return f"{value:.1f}" if isinstance(value, float) else str(value)
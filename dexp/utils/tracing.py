@@ -0,0 +1,298 @@
+import json
+import os
+import re
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+import arbol
+import arbol.arbol
+from arbol import aprint
+
+from dexp.utils.memory import MemoryTracker
+
+# Original arbol section context manager, traced sections delegate to it:
+_asection = arbol.arbol.asection
+
+# Active tracer, None when tracing is disabled:
+_tracer: Optional["Tracer"] = None
+
+
+class Tracer:
+    def __init__(self, memory: bool = True):
+        """
+        Records arbol sections (asection blocks) as timed, nested spans with their thread, process, backend,
+        time point, number of bytes read and written, and peak memory usage. Spans can be saved as a Chrome trace
+        (viewable in Perfetto or chrome://tracing) and summarised per stage.
+        Only sections executed in the current process are recorded, thread pools included.
+
+        Parameters
+        ----------
+        memory : True to record the peak host memory of the process, and backend memory pool usage, per section.
+            Memory is sampled in a background thread until the tracer is stopped.
+        """
+        self.spans: List[Dict[str, Any]] = []
+        self.start = time.perf_counter()
+        self.memory = MemoryTracker().__enter__() if memory else None
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def stop(self) -> None:
+        """Stops memory sampling, if any."""
+        if self.memory is not None:
+            self.memory.__exit__(None, None, None)
+
+    def open(self, name: str) -> Dict[str, Any]:
+        from dexp.utils.backends import Backend
+
+        stack = self._stack()
+        span = dict(
+            name=name,
+            start=time.perf_counter() - self.start,
+            pid=os.getpid(),
+            tid=threading.get_ident(),
+            thread=threading.current_thread().name,
+            depth=len(stack),
+            backend=type(Backend.current()).__name__,
+            args=dict(getattr(self._local, "context", {})),
+            bytes_read=0,
+            bytes_written=0,
+            children_duration=0.0,
+        )
+        if self.memory is not None:
+            span["memory"] = self.memory.watch()
+        stack.append(span)
+        return span
+
+    def close(self, span: Dict[str, Any]) -> None:
+        span["duration"] = time.perf_counter() - self.start - span["start"]
+        if self.memory is not None:
+            record = self.memory.unwatch(span.pop("memory"))
+            span["peak_host_memory"] = record["peak_host"]
+            span["peak_backend_memory"] = record["peak_backend"]
+        stack = self._stack()
+        stack.pop()
+        if stack:
+            parent = stack[-1]
+            parent["bytes_read"] += span["bytes_read"]
+            parent["bytes_written"] += span["bytes_written"]
+            parent["children_duration"] += span["duration"]
+        with self._lock:
+            self.spans.append(span)
+
+    def add_io(self, read: int = 0, written: int = 0) -> None:
+        stack = self._stack()
+        if stack:
+            stack[-1]["bytes_read"] += int(read)
+            stack[-1]["bytes_written"] += int(written)
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Returns the recorded spans in the Chrome trace event format."""
+        events = []
+        threads = {}
+        for span in sorted(self.spans, key=lambda s: s["start"]):
+            threads[(span["pid"], span["tid"])] = span["thread"]
+            args = dict(span["args"])
+            args.update(
+                backend=span["backend"],
+                bytes_read=span["bytes_read"],
+                bytes_written=span["bytes_written"],
+            )
+            for key in ("peak_host_memory", "peak_backend_memory"):
+                if key in span:
+                    args[key] = span[key]
+            events.append(
+                dict(
+                    name=span["name"],
+                    cat=_stage(span["name"]),
+                    ph="X",
+                    ts=span["start"] * 1e6,
+                    dur=span["duration"] * 1e6,
+                    pid=span["pid"],
+                    tid=span["tid"],
+                    args=args,
+                )
+            )
+        for (pid, tid), thread_name in threads.items():
+            events.append(dict(name="thread_name", ph="M", pid=pid, tid=tid, args=dict(name=thread_name)))
+        return dict(traceEvents=events, displayTimeUnit="ms")
+
+    def save_chrome_trace(self, path: str) -> None:
+        """Saves the recorded spans as a Chrome trace JSON file, to be opened with Perfetto or chrome://tracing."""
+        with open(path, mode="w") as f:
+            json.dump(self.to_chrome_trace(), f)
+        aprint(f"Trace saved to: {path}")
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """
+        Aggregates spans per stage, a stage being a section header without its numbers and details.
+
+        Returns
+        -------
+        List of rows sorted by decreasing self time, each with the stage name, number of occurences,
+        total and self time in seconds (self time excludes nested sections), bytes read and written
+        within the stage (nested sections included), and peak host and backend memory in bytes.
+        """
+        stages = {}
+        for span in self.spans:
+            row = stages.setdefault(
+                _stage(span["name"]),
+                dict(count=0, total=0.0, self=0.0, bytes_read=0, bytes_written=0, peak_host=0, peak_backend=0),
+            )
+            row["peak_host"] = max(row["peak_host"], span.get("peak_host_memory", 0))
+            row["peak_backend"] = max(row["peak_backend"], span.get("peak_backend_memory", 0))
+            row["count"] += 1
+            row["total"] += span["duration"]
+            row["self"] += max(0.0, span["duration"] - span["children_duration"])
+            row["bytes_read"] += span["bytes_read"]
+            row["bytes_written"] += span["bytes_written"]
+        rows = [dict(stage=stage, **row) for stage, row in stages.items()]
+        return sorted(rows, key=lambda r: r["self"], reverse=True)
+
+    def print_summary(self) -> None:
+        """Prints per-stage totals as a table."""
+        rows = self.summary()
+        width = max([len(row["stage"]) for row in rows] + [5])
+        aprint(
+            f"{'stage':<{width}} {'count':>6} {'total (s)':>10} {'self (s)':>10} "
+            f"{'read (MB)':>10} {'written (MB)':>12} {'peak (MB)':>10} {'pool (MB)':>10}"
+        )
+        for row in rows:
+            aprint(
+                f"{row['stage']:<{width}} {row['count']:>6} {row['total']:>10.2f} {row['self']:>10.2f} "
+                f"{row['bytes_read'] / 1e6:>10.1f} {row['bytes_written'] / 1e6:>12.1f} "
+                f"{row['peak_host'] / 1e6:>10.1f} {row['peak_backend'] / 1e6:>10.1f}"
+            )
+
+    def _stack(self) -> List[Dict[str, Any]]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+
+def enable_tracing(memory: bool = True) -> Tracer:
+    """
+    Enables tracing of arbol sections, in dexp and in any module using arbol's asection.
+
+    Parameters
+    ----------
+    memory : True to also record peak memory usage per section.
+
+    Returns
+    -------
+    The tracer recording sections from now on.
+    """
+    global _tracer
+    _install()
+    _tracer = Tracer(memory=memory)
+    return _tracer
+
+
+def disable_tracing() -> Optional[Tracer]:
+    """
+    Disables tracing.
+
+    Returns
+    -------
+    The tracer that was recording sections, if any.
+    """
+    global _tracer
+    tracer, _tracer = _tracer, None
+    if tracer is not None:
+        tracer.stop()
+    return tracer
+
+
+def is_tracing() -> bool:
+    return _tracer is not None
+
+
+@contextmanager
+def tracing(path: Optional[str] = None, summary: bool = True, memory: bool = True):
+    """
+    Context manager that traces all sections executed within it.
+
+    Parameters
+    ----------
+    path : if not None, the Chrome trace is saved to this file on exit.
+    summary : True to print per-stage totals on exit.
+    memory : True to also record peak memory usage per section.
+    """
+    tracer = enable_tracing(memory=memory)
+    try:
+        yield tracer
+    finally:
+        disable_tracing()
+        if path is not None:
+            tracer.save_chrome_trace(path)
+        if summary:
+            with _asection("Trace summary:"):
+                tracer.print_summary()
+
+
+@contextmanager
+def trace_context(**kwargs):
+    """
+    Attaches the given arguments (e.g. time_point=3) to all sections opened within this context in the current
+    thread. Does nothing if tracing is disabled.
+    """
+    tracer = _tracer
+    if tracer is None:
+        yield
+        return
+    previous = getattr(tracer._local, "context", {})
+    tracer._local.context = {**previous, **kwargs}
+    try:
+        yield
+    finally:
+        tracer._local.context = previous
+
+
+def trace_io(read: int = 0, written: int = 0) -> None:
+    """
+    Accounts bytes read or written to the innermost open section of the current thread.
+    Does nothing if tracing is disabled.
+
+    Parameters
+    ----------
+    read : number of bytes read
+    written : number of bytes written
+    """
+    tracer = _tracer
+    if tracer is not None:
+        tracer.add_io(read=read, written=written)
+
+
+@contextmanager
+def _traced_asection(section_header: str, file=None):
+    tracer = _tracer
+    if tracer is None:
+        with _asection(section_header, file=file):
+            yield
+        return
+    span = tracer.open(section_header)
+    try:
+        with _asection(section_header, file=file):
+            yield
+    finally:
+        tracer.close(span)
+
+
+def _install() -> None:
+    # Modules bind asection when imported, so we also replace it in modules that are already loaded:
+    arbol.arbol.asection = _traced_asection
+    arbol.asection = _traced_asection
+    for module in list(sys.modules.values()):
+        if getattr(module, "asection", None) is _asection:
+            try:
+                setattr(module, "asection", _traced_asection)
+            except (AttributeError, TypeError):
+                pass
+
+
+def _stage(name: str) -> str:
+    # Section headers contain numbers, shapes and paths, we keep what comes before them:
+    stage = re.split(r"[:\d(\[{'\"]", name, maxsplit=1)[0]
+    return stage.strip(" ,.-") or name
@@ -0,0 +1,270 @@
+import json
+import os
+import pickle
+import re
+import socket
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from arbol import aprint
+
+
+class WorkQueue:
+    def __init__(
+        self,
+        path: str,
+        stale_timeout: float = 600.0,
+        heartbeat_interval: Optional[float] = None,
+        poll_interval: float = 5.0,
+    ):
+        """
+        Work queue stored as plain files in a directory of a shared filesystem, so that several dexp processes,
+        possibly on different nodes and started with the same command, can split tasks (typically time points)
+        between them without any extra service.
+
+        A process claims a task by atomically creating a claim file (O_CREAT | O_EXCL), and marks it complete
+        by writing a done file, the completion manifest, holding who processed the task and when.
+        Claims held by a process are kept alive by a heartbeat thread that touches them, claims that have not been
+        touched for longer than the stale timeout belong to processes that died and are taken over by others.
+        Completed tasks are never processed again: a command that was interrupted resumes where it stopped when
+        started again, delete the queue directory to start over.
+
+        Parameters
+        ----------
+        path : directory of the queue, created if needed, see 'next_to' for the conventional location.
+        stale_timeout : time in seconds after which a claim that is not kept alive is considered abandoned.
+        heartbeat_interval : time in seconds between heartbeats, a quarter of the stale timeout if None.
+        poll_interval : time in seconds between checks when waiting for tasks claimed by other processes.
+        """
+        self.path = path
+        self.stale_timeout = stale_timeout
+        self.heartbeat_interval = stale_timeout / 4 if heartbeat_interval is None else heartbeat_interval
+        self.poll_interval = poll_interval
+        self.owner = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:8]}"
+
+        os.makedirs(path, exist_ok=True)
+
+        self._held: Dict[str, str] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat: Optional[threading.Thread] = None
+
+    @staticmethod
+    def next_to(dest_path: str, **kwargs) -> "WorkQueue":
+        """
+        Returns the work queue conventionally associated with an output dataset: the directory '<dest_path>.queue'.
+
+        Parameters
+        ----------
+        dest_path : path of the output dataset.
+        kwargs : other arguments of WorkQueue.
+        """
+        return WorkQueue(dest_path.rstrip("/\\") + ".queue", **kwargs)
+
+    def __enter__(self) -> "WorkQueue":
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """Stops heart-beating and releases the claims still held, their tasks will be processed by others."""
+        self._stop.set()
+        if self._heartbeat is not None:
+            self._heartbeat.join()
+            self._heartbeat = None
+        for key in list(self._held):
+            self._release(key)
+        _remove(os.path.join(self.path, f".clock.{self.owner}"))
+
+    def claim(self, task: Any) -> bool:
+        """
+        Tries to claim a task.
+
+        Parameters
+        ----------
+        task : task to claim, identified by its string representation.
+
+        Returns
+        -------
+        True if the task is now held by this process, False if it is completed or held by another live process.
+        """
+        key = _key(task)
+        claim_path = self._claim_path(key)
+        while not self.is_done(task):
+            content = json.dumps(dict(owner=self.owner, host=socket.gethostname(), pid=os.getpid(), time=time.time()))
+            try:
+                fd = os.open(claim_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if not self._take_over(claim_path):
+                    return False
+                continue
+            with os.fdopen(fd, "w") as f:
+                f.write(content)
+            with self._lock:
+                self._held[key] = content
+            self._start_heartbeat()
+            return True
+        return False
+
+    def complete(self, task: Any, **info) -> None:
+        """
+        Marks a task as completed and releases its claim.
+
+        Parameters
+        ----------
+        task : completed task.
+        info : additional information saved in the completion manifest.
+        """
+        key = _key(task)
+        manifest = dict(task=str(task), owner=self.owner, host=socket.gethostname(), pid=os.getpid(), time=time.time())
+        manifest.update(info)
+        _write_atomically(self._done_path(key), json.dumps(manifest).encode())
+        self._release(key)
+
+    def release(self, task: Any) -> None:
+        """Releases the claim on a task without completing it, so that it can be claimed again."""
+        self._release(_key(task))
+
+    def is_done(self, task: Any) -> bool:
+        return os.path.exists(self._done_path(_key(task)))
+
+    def manifest(self, task: Any) -> Optional[Dict[str, Any]]:
+        """Returns the completion manifest of a task, None if the task is not completed."""
+        try:
+            with open(self._done_path(_key(task))) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def done(self, tasks: Sequence[Any]) -> List[Any]:
+        """Returns the completed tasks among the given ones."""
+        return [task for task in tasks if self.is_done(task)]
+
+    def wait(self, tasks: Sequence[Any]) -> None:
+        """Waits until all given tasks are completed, by this process or by others."""
+        while any(not self.is_done(task) for task in tasks):
+            time.sleep(self.poll_interval)
+
+    def once(self, name: str, function: Callable[[], Any]) -> Any:
+        """
+        Calls a function in a single process, e.g. to create the output dataset. Other processes wait until
+        the call is completed, and all processes return its result, which must be picklable.
+        If the process calling the function dies, another one calls it after the stale timeout.
+
+        Parameters
+        ----------
+        name : name of the call, unique within the queue.
+        function : function called without arguments.
+
+        Returns
+        -------
+        Result of the function.
+        """
+        task = f"once-{name}"
+        result_path = os.path.join(self.path, _key(task) + ".result")
+        while not self.is_done(task):
+            if self.claim(task):
+                aprint(f"Work queue: calling '{name}' for all processes")
+                try:
+                    result = function()
+                    _write_atomically(result_path, pickle.dumps(result))
+                except Exception:
+                    self.release(task)
+                    raise
+                self.complete(task)
+                return result
+            aprint(f"Work queue: waiting for another process to complete '{name}'")
+            time.sleep(self.poll_interval)
+        with open(result_path, "rb") as f:
+            return pickle.load(f)
+
+    def _claim_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".claim")
+
+    def _done_path(self, key: str) -> str:
+        return os.path.join(self.path, key + ".done")
+
+    def _release(self, key: str) -> None:
+        with self._lock:
+            content = self._held.pop(key, None)
+        if content is not None and _read(self._claim_path(key)) == content:
+            _remove(self._claim_path(key))
+
+    def _take_over(self, claim_path: str) -> bool:
+        # Takes over a stale claim, returns True if the claim file was removed and can be created again:
+        content = _read(claim_path)
+        try:
+            age = self._filesystem_time() - os.stat(claim_path).st_mtime
+        except FileNotFoundError:
+            return True
+        if content is None or age < self.stale_timeout:
+            return False
+        # Renaming is atomic, only one process takes the stale claim. We check that it is the claim we judged
+        # stale, and not a fresh claim made in the meantime by another process that took it over first:
+        taken = f"{claim_path}.{self.owner}"
+        try:
+            os.rename(claim_path, taken)
+        except FileNotFoundError:
+            return True
+        if _read(taken) != content:
+            os.rename(taken, claim_path)
+            return False
+        _remove(taken)
+        aprint(f"Work queue: took over stale claim '{os.path.basename(claim_path)}' ({content}), age: {age:.0f}s")
+        return True
+
+    def _filesystem_time(self) -> float:
+        # Nodes' clocks can differ, we compare modification times to the current time of the filesystem server:
+        clock_path = os.path.join(self.path, f".clock.{self.owner}")
+        with open(clock_path, "w"):
+            pass
+        return os.stat(clock_path).st_mtime
+
+    def _start_heartbeat(self) -> None:
+        with self._lock:
+            if self._heartbeat is not None:
+                return
+            self._stop.clear()
+            self._heartbeat = threading.Thread(target=self._beat, name="dexp-work-queue-heartbeat", daemon=True)
+            self._heartbeat.start()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.heartbeat_interval):
+            with self._lock:
+                keys = list(self._held)
+            for key in keys:
+                try:
+                    os.utime(self._claim_path(key))
+                except FileNotFoundError:
+                    pass
+
+
+def _key(task: Any) -> str:
+    return re.sub(r"[^\w.-]", "_", str(task))
+
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _write_atomically(path: str, content: bytes) -> None:
+    temporary_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary_path, "wb") as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temporary_path, path)
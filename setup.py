@@ -54,6 +54,7 @@ REQUIRED = [
     "blosc",
     "seaborn",
     "ome-zarr",
+    "psutil",
 ]
 
 # What packages are optional?